@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Enum, ForeignKey, UniqueConstraint, Index
+from sqlalchemy import Column, Integer, BigInteger, String, Text, DateTime, Enum, ForeignKey, UniqueConstraint, Index, JSON, func
 from sqlalchemy.orm import relationship, Mapped, mapped_column
 from datetime import datetime
 from app.database import Base
@@ -80,4 +80,13 @@ class BookingEvent(Base):
     event_type = Column(String(30))  
     created_at = Column(DateTime, default=datetime.utcnow)
 
-    booking = relationship("Booking", back_populates="events")
\ No newline at end of file
+    booking = relationship("Booking", back_populates="events")
+
+class EtlOutbox(Base):
+    """Change log para el ETL: cada escritura del API agrega una fila en la misma transacción."""
+    __tablename__ = "etl_outbox"
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True)
+    entity: Mapped[str] = mapped_column(String(30), nullable=False)
+    op: Mapped[str] = mapped_column(String(10), nullable=False)
+    key: Mapped[dict] = mapped_column(JSON, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), nullable=False, index=True)
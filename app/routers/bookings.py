@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app import models
 from app.schemas import BookingCreate, BookingOut
+from app.utils.outbox import record_change
 
 router = APIRouter(prefix="/bookings", tags=["bookings"])
 
@@ -36,6 +37,9 @@ def create_booking(payload: BookingCreate, db: Session = Depends(get_db)):
     db.flush()
     evt = models.BookingEvent(booking_id=booking.id, event_type="created")
     db.add(evt)
+    db.flush()
+    record_change(db, "bookings", id=booking.id)
+    record_change(db, "booking_events", id=evt.id)
     db.commit()
     db.refresh(booking)
     return booking
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app import models, schemas
 from app.utils.pagination import get_pagination_params, paginate_with_schema
+from app.utils.outbox import record_change
 
 router = APIRouter(prefix="/chats", tags=["chats"])
 
@@ -11,8 +12,10 @@ def create_chat(payload: schemas.ChatCreate, db: Session = Depends(get_db)):
     c = models.Chat(type=payload.type, title=payload.title)
     db.add(c)
     db.flush()
+    record_change(db, "chats", id=c.id)
     for uid in payload.members:
         db.add(models.ChatMember(chat_id=c.id, user_id=uid))
+        record_change(db, "members", chat_id=c.id, user_id=uid)
     db.commit()
     db.refresh(c)
     return c
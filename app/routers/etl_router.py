@@ -1,41 +1,58 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException
 from typing import Dict, Any
 from temporalio.client import Client
 from temporalio.exceptions import WorkflowAlreadyStartedError
-import os
 from datetime import datetime
 
+from app.temporal.client import connect
+from app.temporal import queues
+from app.temporal.oltp import check_source
+
 router = APIRouter(prefix="/etl", tags=["etl"])
 
 async def _client() -> Client:
-    target = os.getenv("TEMPORAL_TARGET", "temporal:7233")
-    namespace = os.getenv("TEMPORAL_NAMESPACE", "default")
-    return await Client.connect(target, namespace=namespace)
+    # Mismo data converter (orjson + compresión) que el worker
+    return await connect()
+
+def _source_config(source: str) -> Dict[str, Any]:
+    # "api": extracción vía REST; "db": lectura directa de la base OLTP (o réplica, ETL_OLTP_URL)
+    try:
+        return {"extract_source": check_source(source)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def _queue_config() -> Dict[str, Any]:
+    # Las colas de actividades viajan en el input del workflow (replay determinista)
+    return {"extract_task_queue": queues.EXTRACT_TASK_QUEUE, "load_task_queue": queues.LOAD_TASK_QUEUE}
 
 @router.post("/full")
-async def launch_full(page_size: int = 250, parallel: int = 8) -> Dict[str, Any]:
+async def launch_full(page_size: int = 250, parallel: int = 8, source: str = "api", refresh: str = "upsert") -> Dict[str, Any]:
+    # refresh="shadow": hechos cargados en tablas sombra y reemplazados de una vez al final
+    if refresh not in ("upsert", "shadow"):
+        raise HTTPException(status_code=400, detail="refresh debe ser 'upsert' o 'shadow'")
+    cfg = {"page_size": page_size, "parallel": parallel, "refresh": refresh, **_source_config(source), **_queue_config()}
     client = await _client()
     wid = f"etl-full-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}"
     handle = await client.start_workflow(
         "EtlWorkflow",
-        args=[{"page_size": page_size, "parallel": parallel}],
+        args=[cfg],
         id=wid,
-        task_queue="etl-task-queue",
+        task_queue=queues.WORKFLOW_TASK_QUEUE,
     )
     return {"workflow_id": handle.id, "run_id": handle.run_id}
 
 @router.post("/incremental")
-async def launch_incremental(page_size: int = 250, parallel: int = 8, since: str | None = None) -> Dict[str, Any]:
+async def launch_incremental(page_size: int = 250, parallel: int = 8, since: str | None = None, source: str = "api") -> Dict[str, Any]:
+    cfg = {"page_size": page_size, "parallel": parallel, **_source_config(source), **_queue_config()}
     client = await _client()
     wid = f"etl-incr-{datetime.utcnow().strftime('%Y%m%d-%H%M')}"
-    cfg = {"page_size": page_size, "parallel": parallel}
     if since:
         cfg["since"] = since
     handle = await client.start_workflow(
         "EtlIncrementalWorkflow",
         args=[cfg],
         id=wid,
-        task_queue="etl-task-queue",
+        task_queue=queues.WORKFLOW_TASK_QUEUE,
     )
     return {"workflow_id": handle.id, "run_id": handle.run_id}
 
@@ -46,10 +63,27 @@ async def backfill_messages(chat_id: int, start_page: int = 1, end_page: int = 1
     try:
         handle = await client.start_workflow(
             "BackfillMessagesWorkflow",
-            args=[{"chat_id": chat_id, "start_page": start_page, "end_page": end_page, "page_size": page_size}],
+            args=[{"chat_id": chat_id, "start_page": start_page, "end_page": end_page, "page_size": page_size, **_queue_config()}],
             id=wid,
-            task_queue="etl-task-queue",
+            task_queue=queues.WORKFLOW_TASK_QUEUE,
         )
     except WorkflowAlreadyStartedError:
         handle = client.get_workflow_handle(wid)
-    return {"workflow_id": handle.id, "run_id": handle.run_id}
\ No newline at end of file
+    return {"workflow_id": handle.id, "run_id": handle.run_id}
+
+@router.post("/cdc")
+async def launch_cdc(batch_size: int = 5000, follow: bool = False, poll_seconds: int = 30, consumer: str = "warehouse") -> Dict[str, Any]:
+    # Un solo consumidor por offset: id fijo, si ya corre se devuelve el existente
+    client = await _client()
+    wid = f"etl-cdc-{consumer}"
+    cfg = {"consumer": consumer, "batch_size": batch_size, "follow": follow, "poll_seconds": poll_seconds, **_queue_config()}
+    try:
+        handle = await client.start_workflow(
+            "EtlCdcWorkflow",
+            args=[cfg],
+            id=wid,
+            task_queue=queues.WORKFLOW_TASK_QUEUE,
+        )
+    except WorkflowAlreadyStartedError:
+        handle = client.get_workflow_handle(wid)
+    return {"workflow_id": handle.id, "run_id": handle.run_id}
@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app import models, schemas
 from app.utils.pagination import get_pagination_params, paginate_with_schema
+from app.utils.outbox import record_change
 from app.websocket_manager import manager
 
 router = APIRouter(prefix="/chats/{chat_id}/messages", tags=["messages"])
@@ -18,6 +19,8 @@ async def send_message(chat_id: int, payload: schemas.MessageCreate, db: Session
         reply_to_id=payload.reply_to_id,
     )
     db.add(m)
+    db.flush()
+    record_change(db, "messages", id=m.id)
     db.commit()
     db.refresh(m)
     
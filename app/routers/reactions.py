@@ -3,6 +3,7 @@ from sqlalchemy.orm import Session
 from app.database import get_db
 from app import models, schemas
 from app.utils.pagination import get_pagination_params, paginate_with_schema
+from app.utils.outbox import record_change, DELETE
 
 router = APIRouter(
     prefix="/messages/{message_id}/reactions",
@@ -24,6 +25,7 @@ def add_reaction(
         emoji=payload.emoji
     )
     db.add(reaction)
+    record_change(db, "reactions", message_id=message_id, user_id=payload.user_id, emoji=payload.emoji)
     db.commit()
     db.refresh(reaction) 
 
@@ -59,6 +61,8 @@ def remove_reaction(
         .filter_by(message_id=message_id, user_id=user_id, emoji=emoji)
         .delete()
     )
+    if count:
+        record_change(db, "reactions", DELETE, message_id=message_id, user_id=user_id, emoji=emoji)
     db.commit()
 
     if count == 0:
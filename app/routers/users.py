@@ -4,6 +4,7 @@ from app.database import get_db
 from app import models, schemas
 from app.utils.pagination import get_pagination_params, paginate
 from app.utils.pagination import get_pagination_params, paginate_with_schema
+from app.utils.outbox import record_change
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -13,6 +14,8 @@ def create_user(payload: schemas.UserCreate, db: Session = Depends(get_db)):
         raise HTTPException(409, detail="handle already exists")
     u = models.User(handle=payload.handle, display_name=payload.display_name)
     db.add(u)
+    db.flush()
+    record_change(db, "users", id=u.id)
     db.commit()
     db.refresh(u)
     return u
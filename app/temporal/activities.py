@@ -2,40 +2,129 @@ from __future__ import annotations
 import os
 import logging
 import asyncio
-from typing import Any, Dict, List, Tuple, Optional
+import functools
+from typing import Any, AsyncIterator, Dict, List, Tuple, Optional
 
 import httpx
 from temporalio import activity
+from temporalio.exceptions import ApplicationError
 
-import psycopg2
-import psycopg2.extras
-import dateutil.parser as dtp
 from datetime import datetime, date, timedelta
 from decimal import Decimal
 
+from app.temporal import staging, http_client, oltp, cdc, records, columnar, loader, warehouse, rollups, matviews, snapshots, shadow as shadow_tables
+from app.temporal.limiter import API_LIMITER, DW_LIMITER
+from app.temporal.runtime import run_in_db_thread
+from app.temporal.paginated import iter_pages, map_bounded
+from app.temporal.pipeline import Pipeline, rebatch
+from app.temporal.records import MessageRecord, ReactionRecord, BookingRecord, BookingEventRecord
+from app.temporal.columnar import ColumnBatch
+
 # Configurar logging estructurado
 logger = logging.getLogger(__name__)
 
 API_BASE_URL = os.getenv("API_BASE_URL", "http://api:8000")
-WAREHOUSE_URL = os.getenv("WAREHOUSE_URL", "postgresql://postgres:tes$a5410@dw:5432/warehouse")
+# Filas por lote de staging de las actividades stage_* (cada lote = una transacción de load_staged)
+STAGE_ROWS = int(os.getenv("ETL_STAGE_ROWS", "5000"))
+WAREHOUSE_URL = warehouse.WAREHOUSE_URL
 
 
 def _pg():
-    """Crea una conexión a PostgreSQL."""
-    return psycopg2.connect(WAREHOUSE_URL)
+    """Conexión al warehouse desde el pool compartido. Devolver con _release(conn) en un finally."""
+    return warehouse.acquire()
+
+
+def _release(conn) -> None:
+    warehouse.release(conn)
+
+
+def _dw_limited(fn):
+    """
+    Convierte una función síncrona de warehouse (psycopg2) en corrutina: adquiere un permiso
+    del limitador adaptativo y corre la función en el pool de hilos de DB, sin bloquear el
+    event loop que comparten el resto de actividades, heartbeats y fetches HTTP.
+    """
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        async with DW_LIMITER.slot():
+            return await run_in_db_thread(fn, *args, **kwargs)
+    return wrapper
+
+
+async def _api_get(client: httpx.AsyncClient, url: str, params: Dict[str, Any] | None = None) -> httpx.Response:
+    """GET al API a través del limitador adaptativo: 429/5xx y errores de conexión reducen la concurrencia."""
+    async with API_LIMITER.slot() as slot:
+        r = await client.get(url, params=params)
+        if r.status_code == 429 or r.status_code >= 500:
+            slot.overload(f"http_{r.status_code}")
+        return r
+
+
+async def _api_post(client: httpx.AsyncClient, url: str, json: Any = None) -> httpx.Response:
+    """POST al API a través del limitador adaptativo."""
+    async with API_LIMITER.slot() as slot:
+        r = await client.post(url, json=json)
+        if r.status_code == 429 or r.status_code >= 500:
+            slot.overload(f"http_{r.status_code}")
+        return r
+
+
+def _api_pages(
+    client: httpx.AsyncClient,
+    url: str,
+    page_size: int,
+    params: Dict[str, Any] | None = None,
+    first_page: int = 1,
+    ordered: bool = True,
+):
+    """
+    Itera (page, data) de un endpoint paginado del API: tras la primera página el resto
+    se pide en paralelo (acotado por ETL_PAGE_CONCURRENCY y por el limitador del API).
+    """
+    async def fetch(page: int) -> Dict[str, Any]:
+        r = await _api_get(client, url, params={**(params or {}), "page": page, "page_size": page_size})
+        r.raise_for_status()
+        return records.loads(r.content)
+    return iter_pages(fetch, first_page=first_page, ordered=ordered)
+
+
+async def _fetch_items(
+    client: httpx.AsyncClient,
+    url: str,
+    page_size: int,
+    params: Dict[str, Any] | None = None,
+) -> List[Dict[str, Any]]:
+    """
+    Todos los items de un endpoint paginado. Se acumulan en orden de llegada (no de página):
+    el destino son upserts por clave, así que el orden no importa y no hay bloqueo por la página más lenta.
+    """
+    items: List[Dict[str, Any]] = []
+    async for _page, data in _api_pages(client, url, page_size, params, ordered=False):
+        items.extend(data.get("items", []))
+        activity.heartbeat()
+    return items
 
 
 def _parse_ts(value: Any) -> datetime | None:
     """Parsea un valor a datetime, retorna None si no es posible."""
-    if not value:
-        return None
-    try:
-        dt = dtp.parse(value) if isinstance(value, str) else value
-        if isinstance(dt, datetime):
-            return dt
-    except (ValueError, TypeError) as e:
-        logger.warning(f"Error parsing timestamp {value}: {e}")
-    return None
+    return records.parse_ts(value)
+
+
+def _transform_batch(entity: str, cls: type, items: List[Dict[str, Any]], **kwargs: Any) -> Any:
+    """
+    Transformación de un lote dentro de los pipelines: columnar (NumPy, ETL_COLUMNAR) o
+    registros tipados por fila. `kwargs` solo aplica al camino columnar (p.ej. chat_id).
+    """
+    if columnar.enabled():
+        return columnar.TRANSFORMS[entity](items, **kwargs)
+    return records.build(cls, items)
+
+
+def _dw_rows(batch: Any, cls: type, *row_args: Any) -> List[Tuple[Any, ...]]:
+    """Filas del warehouse desde un ColumnBatch, registros o dicts."""
+    if isinstance(batch, ColumnBatch):
+        return batch.rows()
+    return [r.row(*row_args) for r in records.build(cls, batch)]
 
 
 def _to_json_safe(val):
@@ -71,109 +160,84 @@ def _validate_chat(c: Dict[str, Any]) -> bool:
     return True
 
 
-def _validate_message(m: Dict[str, Any]) -> bool:
-    """Valida que un mensaje tenga los campos requeridos."""
-    if not m.get("id"):
-        logger.warning(f"Message sin ID: {m}")
-        return False
-    if not m.get("chat_id"):
-        logger.warning(f"Message {m.get('id')} sin chat_id")
-        return False
-    if not m.get("body"):
-        logger.warning(f"Message {m.get('id')} sin body")
-    if not m.get("created_at"):
-        logger.warning(f"Message {m.get('id')} sin created_at")
-        return False
-    return True
-
-
-def _validate_booking(b: Dict[str, Any]) -> bool:
-    """Valida que un booking tenga los campos requeridos."""
-    if not b.get("id"):
-        logger.warning(f"Booking sin ID: {b}")
-        return False
-    if not b.get("status"):
-        logger.warning(f"Booking {b.get('id')} sin status")
-        return False
-    if not b.get("created_at"):
-        logger.warning(f"Booking {b.get('id')} sin created_at")
-        return False
-    return True
-
-
-@activity.defn(name="extract_users")
-async def extract_users(page_size: int = 250) -> List[Dict[str, Any]]:
+async def _extract_users(page_size: int = 250) -> List[Dict[str, Any]]:
     """Extrae usuarios desde la API con paginación."""
-    items: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(timeout=30) as client:
-        page = 1
-        while True:
-            r = await client.get(f"{API_BASE_URL}/users", params={"page": page, "page_size": page_size})
-            r.raise_for_status()
-            data = r.json()
-            items.extend(data["items"])
-            if page >= data["total_pages"]:
-                break
-            page += 1
-            activity.heartbeat()
+    async with http_client.client() as client:
+        items = await _fetch_items(client, f"{API_BASE_URL}/users", page_size)
     logger.info(f"Extracted {len(items)} users")
     return _to_json_safe(items)
 
 
-@activity.defn(name="extract_chats_and_members")
-async def extract_chats_and_members(page_size: int = 250) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+@activity.defn(name="extract_users")
+async def extract_users(page_size: int = 250, source: str = "api") -> Dict[str, Any]:
+    """
+    Extrae usuarios (del API o, con source='db', directo de la base OLTP) y los deja en staging.
+    Retorna solo la referencia (claim-check).
+    """
+    if oltp.check_source(source) == "db":
+        users = _to_json_safe(await oltp.fetch_all("users"))
+    else:
+        users = await _extract_users(page_size)
+    return await asyncio.to_thread(staging.put_rows, "users", users)
+
+
+async def _extract_chats_and_members(page_size: int = 250) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
     """Extrae chats y sus miembros desde la API."""
-    chats: List[Dict[str, Any]] = []
-    members: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(timeout=30) as client:
-        page = 1
-        while True:
-            r = await client.get(f"{API_BASE_URL}/chats", params={"page": page, "page_size": page_size})
-            r.raise_for_status()
-            data = r.json()
-            chats.extend(data["items"])
-            if page >= data["total_pages"]:
-                break
-            page += 1
-            activity.heartbeat()
-        for c in chats:
-            cid = c["id"]
-            page = 1
-            while True:
-                r = await client.get(f"{API_BASE_URL}/chats/{cid}/members", params={"page": page, "page_size": page_size})
-                r.raise_for_status()
-                data = r.json()
-                members.extend(data["items"])
-                if page >= data["total_pages"]:
-                    break
-                page += 1
-                activity.heartbeat()
+    async with http_client.client() as client:
+        chats = await _fetch_items(client, f"{API_BASE_URL}/chats", page_size)
+        # Miembros de varios chats en paralelo (acotado)
+        per_chat = await map_bounded(
+            lambda c: _fetch_items(client, f"{API_BASE_URL}/chats/{c['id']}/members", page_size),
+            chats,
+        )
+    members = [m for chat_members in per_chat for m in chat_members]
     logger.info(f"Extracted {len(chats)} chats and {len(members)} members")
     return _to_json_safe(chats), _to_json_safe(members)
 
 
+@activity.defn(name="extract_chats_and_members")
+async def extract_chats_and_members(page_size: int = 250, source: str = "api") -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    Extrae chats y miembros (API o base OLTP) y los deja en staging. Retorna (ref_chats, ref_members).
+    Con source='db' los miembros salen de una sola consulta en lugar de paginar por chat.
+    """
+    if oltp.check_source(source) == "db":
+        chats = _to_json_safe(await oltp.fetch_all("chats"))
+        members = _to_json_safe(await oltp.fetch_all("members"))
+    else:
+        chats, members = await _extract_chats_and_members(page_size)
+    return (
+        await asyncio.to_thread(staging.put_rows, "chats", chats),
+        await asyncio.to_thread(staging.put_rows, "members", members),
+    )
+
+
+@activity.defn(name="read_staged_column")
+async def read_staged_column(ref: Any, column: str) -> List[Any]:
+    """Lee una sola columna de un lote en staging (p.ej. los ids de chats para el fan-out)."""
+    return _to_json_safe(await asyncio.to_thread(staging.get_column, ref, column))
+
+
+@activity.defn(name="drop_staged")
+async def drop_staged(refs: List[Any]) -> int:
+    """Elimina los lotes de staging de una corrida ya terminada."""
+    removed = await asyncio.to_thread(staging.drop, refs)
+    logger.info(f"Dropped {removed} staged batches")
+    return removed
+
+
 @activity.defn(name="extract_messages_for_chat")
 async def extract_messages_for_chat(chat_id: int, page_size: int = 250) -> List[Dict[str, Any]]:
     """Extrae mensajes de un chat específico."""
-    msgs: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(timeout=60) as client:
-        page = 1
-        while True:
-            r = await client.get(f"{API_BASE_URL}/chats/{chat_id}/messages",
-                                 params={"page": page, "page_size": page_size})
-            r.raise_for_status()
-            data = r.json()
-            msgs.extend(data["items"])
-            if page >= data["total_pages"]:
-                break
-            page += 1
-            activity.heartbeat()
+    async with http_client.client() as client:
+        msgs = await _fetch_items(client, f"{API_BASE_URL}/chats/{chat_id}/messages", page_size)
     return _to_json_safe(msgs)
 
 
 @activity.defn(name="transform_users")
-async def transform_users(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Transforma y valida usuarios."""
+async def transform_users(users_in: Any) -> Any:
+    """Transforma y valida usuarios. Acepta y devuelve lista o referencia de staging."""
+    users = await asyncio.to_thread(staging.get_rows, users_in)
     valid_users = []
     for u in users:
         if not _validate_user(u):
@@ -184,14 +248,14 @@ async def transform_users(users: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
             u["created_at"] = u["created_at"].isoformat()
         valid_users.append(u)
     logger.info(f"Transformed {len(valid_users)}/{len(users)} users")
-    return _to_json_safe(valid_users)
+    return await asyncio.to_thread(staging.restage, users_in, _to_json_safe(valid_users))
 
 
 @activity.defn(name="transform_chats_members")
-async def transform_chats_members(
-    chats: List[Dict[str, Any]], members: List[Dict[str, Any]]
-) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
-    """Transforma y valida chats y miembros."""
+async def transform_chats_members(chats_in: Any, members_in: Any) -> Tuple[Any, Any]:
+    """Transforma y valida chats y miembros. Acepta y devuelve listas o referencias de staging."""
+    chats = await asyncio.to_thread(staging.get_rows, chats_in)
+    members = await asyncio.to_thread(staging.get_rows, members_in)
     valid_chats = []
     for c in chats:
         if not _validate_chat(c):
@@ -210,80 +274,76 @@ async def transform_chats_members(
         valid_members.append(m)
     
     logger.info(f"Transformed {len(valid_chats)}/{len(chats)} chats and {len(valid_members)}/{len(members)} members")
-    return _to_json_safe(valid_chats), _to_json_safe(valid_members)
+    return (
+        await asyncio.to_thread(staging.restage, chats_in, _to_json_safe(valid_chats)),
+        await asyncio.to_thread(staging.restage, members_in, _to_json_safe(valid_members)),
+    )
 
 
 @activity.defn(name="transform_messages")
 async def transform_messages(msgs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Transforma y valida mensajes."""
-    valid_msgs = []
-    for m in msgs:
-        if not _validate_message(m):
-            continue
-        body = m.get("body") or ""
-        m["message_length"] = len(body)
-        if isinstance(m.get("created_at"), (datetime, date)):
-            m["created_at"] = m["created_at"].isoformat()
-        if isinstance(m.get("edited_at"), (datetime, date)):
-            m["edited_at"] = m["edited_at"].isoformat()
-        valid_msgs.append(m)
-    logger.info(f"Transformed {len(valid_msgs)}/{len(msgs)} messages")
-    return _to_json_safe(valid_msgs)
+    """Transforma y valida mensajes (vía MessageRecord). Los pipelines usan los registros directamente."""
+    recs = records.build(MessageRecord, msgs)
+    logger.info(f"Transformed {len(recs)}/{len(msgs)} messages")
+    return [m.to_dict() for m in recs]
 
 
 @activity.defn(name="transform_reactions")
 async def transform_reactions(recs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Transforma y valida reacciones."""
-    valid_recs = []
-    for r in recs:
-        if not r.get("message_id") or not r.get("user_id"):
-            logger.warning(f"Reaction sin message_id o user_id: {r}")
-            continue
-        if isinstance(r.get("created_at"), (datetime, date)):
-            r["created_at"] = r["created_at"].isoformat()
-        r["emoji"] = (r.get("emoji") or "").strip()
-        if not r["emoji"]:
-            logger.warning(f"Reaction sin emoji: {r}")
-            continue
-        valid_recs.append(r)
+    """Transforma y valida reacciones (vía ReactionRecord)."""
+    valid_recs = records.build(ReactionRecord, recs)
     logger.info(f"Transformed {len(valid_recs)}/{len(recs)} reactions")
-    return _to_json_safe(valid_recs)
+    return [r.to_dict() for r in valid_recs]
 
 
-@activity.defn(name="load_dimensions")
-async def load_dimensions(
-    users: List[Dict[str, Any]], chats: List[Dict[str, Any]], members: List[Dict[str, Any]]
-) -> None:
-    """Carga dimensiones (users, chats, members) en el warehouse."""
+def _load_facts(
+    entity: str, batch: Any, cls: type, row_args: Tuple[Any, ...], page_size: int, shadow: bool = False,
+) -> Dict[str, int]:
+    """
+    Carga un lote de hechos en una transacción (o en la tabla sombra con `shadow`).
+    Devuelve {"loaded", "quarantined", "changed"}: las filas que fallan solas quedan en
+    etl_quarantine y el resto del lote se confirma igual (loader.upsert); "changed" son las
+    insertadas o actualizadas (decide qué vistas materializadas refrescar al final).
+    """
+    if not batch:
+        return {"loaded": 0, "quarantined": 0, "changed": 0}
     conn = _pg()
     conn.autocommit = False
     try:
         with conn.cursor() as cur:
-            # Crear tablas si no existen (con foreign keys)
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS dim_users(
-              user_id INT PRIMARY KEY,
-              handle TEXT NOT NULL,
-              display_name TEXT NOT NULL,
-              created_at TIMESTAMPTZ NOT NULL
-            );
-            CREATE TABLE IF NOT EXISTS dim_chats(
-              chat_id INT PRIMARY KEY,
-              type TEXT NOT NULL,
-              title TEXT,
-              created_at TIMESTAMPTZ NOT NULL
-            );
-            CREATE TABLE IF NOT EXISTS bridge_chat_members(
-              chat_id INT NOT NULL,
-              user_id INT NOT NULL,
-              role TEXT NOT NULL,
-              joined_at TIMESTAMPTZ NOT NULL,
-              PRIMARY KEY(chat_id, user_id),
-              FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
-              FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE
-            );
-            """)
-        
+            rows = _dw_rows(batch, cls, *row_args)
+            stats = loader.upsert(cur, entity, rows, page_size=page_size, shadow=shadow)
+        conn.commit()
+        quarantined = stats.get("quarantined", 0)
+        logger.info(f"Loaded {len(rows) - quarantined} {entity}" + (f" ({quarantined} quarantined)" if quarantined else ""))
+        changed = stats.get("inserted", 0) + stats.get("updated", 0)
+        return {"loaded": len(rows) - quarantined, "quarantined": quarantined, "changed": changed}
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"Error loading {entity}: {e}", exc_info=True)
+        raise
+    finally:
+        _release(conn)
+
+
+# Para los pipelines: carga de un lote con los conteos de cuarentena, fuera del event loop
+_load_facts_limited = _dw_limited(_load_facts)
+
+
+@activity.defn(name="load_dimensions")
+@_dw_limited
+def load_dimensions(users: Any, chats: Any, members: Any) -> Dict[str, Dict[str, int]]:
+    """
+    Carga dimensiones (users, chats, members) en el warehouse. Acepta listas o referencias de staging.
+    Devuelve los conteos {"inserted", "updated", "unchanged"} por dimensión.
+    """
+    users = staging.get_rows(users)
+    chats = staging.get_rows(chats)
+    members = staging.get_rows(members)
+    stats: Dict[str, Dict[str, int]] = {}
+    conn = _pg()
+    conn.autocommit = False
+    try:
         with conn.cursor() as cur:
             if users:
                 rows = []
@@ -298,18 +358,7 @@ async def load_dimensions(
                         u.get("display_name") or "",
                         created_at
                     ))
-                psycopg2.extras.execute_batch(
-                    cur,
-                    """INSERT INTO dim_users(user_id, handle, display_name, created_at)
-                       VALUES (%s,%s,%s,%s)
-                       ON CONFLICT (user_id) DO UPDATE
-                       SET handle=EXCLUDED.handle,
-                           display_name=EXCLUDED.display_name,
-                           created_at=EXCLUDED.created_at""",
-                    rows,
-                    page_size=1000
-                )
-                logger.info(f"Loaded {len(rows)} users")
+                stats["users"] = loader.upsert(cur, "users", rows, page_size=1000)
             
             if chats:
                 rows = []
@@ -324,18 +373,7 @@ async def load_dimensions(
                         c.get("title"),
                         created_at
                     ))
-                psycopg2.extras.execute_batch(
-                    cur,
-                    """INSERT INTO dim_chats(chat_id, type, title, created_at)
-                       VALUES (%s,%s,%s,%s)
-                       ON CONFLICT (chat_id) DO UPDATE
-                       SET type=EXCLUDED.type,
-                           title=EXCLUDED.title,
-                           created_at=EXCLUDED.created_at""",
-                    rows,
-                    page_size=1000
-                )
-                logger.info(f"Loaded {len(rows)} chats")
+                stats["chats"] = loader.upsert(cur, "chats", rows, page_size=1000)
             
             if members:
                 rows = []
@@ -350,183 +388,42 @@ async def load_dimensions(
                         m.get("role") or "member",
                         joined_at
                     ))
-                psycopg2.extras.execute_batch(
-                    cur,
-                    """INSERT INTO bridge_chat_members(chat_id, user_id, role, joined_at)
-                       VALUES (%s,%s,%s,%s)
-                       ON CONFLICT (chat_id, user_id) DO UPDATE
-                       SET role=EXCLUDED.role,
-                           joined_at=EXCLUDED.joined_at""",
-                    rows,
-                    page_size=2000
-                )
-                logger.info(f"Loaded {len(rows)} members")
+                stats["members"] = loader.upsert(cur, "members", rows, page_size=2000)
         
         conn.commit()
+        return stats
     except Exception as e:
         conn.rollback()
         logger.error(f"Error loading dimensions: {e}", exc_info=True)
         raise
     finally:
-        conn.close()
+        _release(conn)
 
 
 @activity.defn(name="load_messages")
-async def load_messages(msgs: List[Dict[str, Any]]) -> int:
-    """Carga mensajes en el warehouse."""
-    if not msgs:
-        return 0
-    conn = _pg()
-    conn.autocommit = False
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS fact_messages(
-              message_id INT PRIMARY KEY,
-              chat_id INT NOT NULL,
-              sender_id INT,
-              body TEXT NOT NULL,
-              message_length INT NOT NULL,
-              created_at TIMESTAMPTZ NOT NULL,
-              created_day DATE NOT NULL,
-              created_hour SMALLINT NOT NULL,
-              edited_at TIMESTAMPTZ,
-              reply_to_id INT,
-              FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
-              FOREIGN KEY (sender_id) REFERENCES dim_users(user_id) ON DELETE SET NULL
-            );
-            CREATE INDEX IF NOT EXISTS idx_fact_messages_chat_date 
-              ON fact_messages(chat_id, created_day);
-            CREATE INDEX IF NOT EXISTS idx_fact_messages_sender_date 
-              ON fact_messages(sender_id, created_day) WHERE sender_id IS NOT NULL;
-            CREATE INDEX IF NOT EXISTS idx_fact_messages_created_at 
-              ON fact_messages(created_at);
-            """)
-            
-            def row(m):
-                created_at = _parse_ts(m.get("created_at"))
-                if not created_at:
-                    logger.warning(f"Message {m.get('id')} sin created_at válido, usando ahora")
-                    created_at = datetime.utcnow()
-                created_day = created_at.date()
-                created_hour = created_at.hour
-                edited_at = _parse_ts(m.get("edited_at")) if m.get("edited_at") else None
-                body = m.get("body") or ""
-                return (
-                    m["id"],
-                    m["chat_id"],
-                    m.get("sender_id"),
-                    body,
-                    len(body),
-                    created_at,
-                    created_day,
-                    created_hour,
-                    edited_at,
-                    m.get("reply_to_id")
-                )
-            
-            rows = [row(m) for m in msgs]
-            psycopg2.extras.execute_batch(
-                cur,
-                """INSERT INTO fact_messages
-                   (message_id, chat_id, sender_id, body, message_length, created_at,
-                    created_day, created_hour, edited_at, reply_to_id)
-                   VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                   ON CONFLICT (message_id) DO UPDATE SET
-                     body=EXCLUDED.body,
-                     message_length=EXCLUDED.message_length,
-                     created_at=EXCLUDED.created_at,
-                     created_day=EXCLUDED.created_day,
-                     created_hour=EXCLUDED.created_hour,
-                     edited_at=EXCLUDED.edited_at,
-                     reply_to_id=EXCLUDED.reply_to_id""",
-                rows,
-                page_size=5000
-            )
-        conn.commit()
-        logger.info(f"Loaded {len(rows)} messages")
-        return len(rows)
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error loading messages: {e}", exc_info=True)
-        raise
-    finally:
-        conn.close()
+@_dw_limited
+def load_messages(msgs: List[Any], shadow: bool = False) -> int:
+    """
+    Carga mensajes en el warehouse. Acepta dicts (payload de la actividad) o MessageRecord.
+    `shadow`: agregar a la tabla sombra de un full refresh en lugar de hacer upsert en la viva.
+    Devuelve las filas cargadas, sin las que quedaron en cuarentena.
+    """
+    return _load_facts("messages", msgs, MessageRecord, (), 5000, shadow)["loaded"]
 
 
 @activity.defn(name="load_reactions")
-async def load_reactions(chat_id: int, reactions: List[Dict[str, Any]]) -> int:
-    """Carga reacciones en el warehouse."""
-    if not reactions:
-        return 0
-    conn = _pg()
-    conn.autocommit = False
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS fact_reactions(
-              message_id INT NOT NULL,
-              chat_id INT NOT NULL,
-              user_id INT NOT NULL,
-              emoji TEXT NOT NULL,
-              created_at TIMESTAMPTZ NOT NULL,
-              created_day DATE NOT NULL,
-              created_hour SMALLINT NOT NULL,
-              PRIMARY KEY (message_id, user_id, emoji),
-              FOREIGN KEY (message_id) REFERENCES fact_messages(message_id) ON DELETE CASCADE,
-              FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
-              FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE
-            );
-            CREATE INDEX IF NOT EXISTS idx_fact_reactions_chat_date 
-              ON fact_reactions(chat_id, created_day);
-            CREATE INDEX IF NOT EXISTS idx_fact_reactions_message 
-              ON fact_reactions(message_id);
-            """)
-            
-            def row(r):
-                ts = _parse_ts(r.get("created_at"))
-                if not ts:
-                    logger.warning(f"Reaction sin created_at válido, usando ahora")
-                    ts = datetime.utcnow()
-                return (
-                    r["message_id"],
-                    chat_id,
-                    r["user_id"],
-                    r.get("emoji") or "",
-                    ts,
-                    ts.date(),
-                    ts.hour
-                )
-            
-            rows = [row(r) for r in reactions]
-            psycopg2.extras.execute_batch(
-                cur,
-                """INSERT INTO fact_reactions
-                   (message_id, chat_id, user_id, emoji, created_at, created_day, created_hour)
-                   VALUES (%s,%s,%s,%s,%s,%s,%s)
-                   ON CONFLICT (message_id, user_id, emoji) DO UPDATE SET
-                     created_at=EXCLUDED.created_at,
-                     created_day=EXCLUDED.created_day,
-                     created_hour=EXCLUDED.created_hour""",
-                rows,
-                page_size=5000
-            )
-        conn.commit()
-        logger.info(f"Loaded {len(rows)} reactions for chat {chat_id}")
-        return len(rows)
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error loading reactions: {e}", exc_info=True)
-        raise
-    finally:
-        conn.close()
+@_dw_limited
+def load_reactions(chat_id: int, reactions: List[Any], shadow: bool = False) -> int:
+    """Carga reacciones en el warehouse (o en la tabla sombra con `shadow`). Acepta dicts o ReactionRecord."""
+    return _load_facts("reactions", reactions, ReactionRecord, (chat_id,), 5000, shadow)["loaded"]
 
 
 @activity.defn(name="get_chat_meta")
 async def get_chat_meta(chat_id: int) -> Dict[str, Any]:
     """Obtiene metadata de un chat (total de páginas de mensajes)."""
-    async with httpx.AsyncClient(timeout=10) as client:
-        r = await client.get(
+    async with http_client.client() as client:
+        r = await _api_get(
+            client,
             f"{API_BASE_URL}/chats/{chat_id}/messages",
             params={"page": 1, "page_size": 1},
         )
@@ -535,252 +432,197 @@ async def get_chat_meta(chat_id: int) -> Dict[str, Any]:
         return {"total_pages": data.get("total_pages", 1)}
 
 
-@activity.defn(name="etl_messages_page")
-async def etl_messages_page(chat_id: int, page: int, page_size: int = 250) -> int:
-    """ETL de una página de mensajes. (Mantenido para compatibilidad)"""
-    async with httpx.AsyncClient(timeout=60) as client:
-        r = await client.get(
-            f"{API_BASE_URL}/chats/{chat_id}/messages",
-            params={"page": page, "page_size": page_size},
-        )
-        r.raise_for_status()
-        data = r.json()
-        msgs = data.get("items", [])
-    if not msgs:
-        return 0
-    msgs = await transform_messages(msgs)
-    inserted = await load_messages(msgs)
-    return inserted
+def _checkpoint() -> Dict[str, Any]:
+    """
+    Último checkpoint enviado con activity.heartbeat() por un intento anterior.
+    Vacío en el primer intento. Permite reanudar en vez de reprocesar desde la página 1.
+    """
+    details = activity.info().heartbeat_details
+    if details and isinstance(details[0], dict):
+        return dict(details[0])
+    return {}
+
+
+async def _api_page_items(
+    client: httpx.AsyncClient,
+    url: str,
+    page_size: int,
+    cp: Dict[str, Any],
+    what: str,
+    strict: bool = False,
+) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Source de los pipelines por entidad: (page, items) en orden de página, desde la página
+    siguiente al checkpoint `cp` y hasta la primera página vacía.
+    Por cada página descargada hace heartbeat del último checkpoint (mantiene viva la
+    actividad) y guarda total_pages en `cp`. Si el API falla a mitad de camino termina sin
+    error: lo ya cargado queda registrado en el checkpoint. Con `strict` (full refresh con
+    tablas sombra, donde una entidad incompleta reemplazaría a la viva) el error se propaga:
+    Temporal reintenta desde el checkpoint y, si se agotan los intentos, no hay swap.
+    """
+    page = int(cp.get("page", 0))
+    pages = _api_pages(client, url, page_size, first_page=page + 1)
+    try:
+        async for page, data in pages:
+            items = data.get("items", [])
+            if not items:
+                return
+            cp["total_pages"] = int(data.get("total_pages", 1))
+            activity.heartbeat(dict(cp))
+            yield page, items
+    except (httpx.HTTPError, ValueError) as e:
+        logger.error(f"Error fetching {what} after page {page}: {e}", exc_info=True)
+        if strict:
+            raise
+    finally:
+        await pages.aclose()
 
 
-@activity.defn(name="etl_messages_chat")
-async def etl_messages_chat(chat_id: int, page_size: int = 1000) -> Dict[str, Any]:
+async def _oltp_page_items(
+    entity: str,
+    page_size: int,
+    cp: Dict[str, Any],
+    params: Tuple[Any, ...] = (),
+) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
     """
-    ETL de TODOS los mensajes de un chat completo.
-    Reduce drásticamente el número de actividades en el workflow.
-    Retorna: {"messages_loaded": int, "total_pages": int}
+    Equivalente a _api_page_items para source='db': lee la base OLTP con un cursor del lado
+    del servidor. A diferencia del API, un error de la base se propaga (Temporal reintenta
+    desde el checkpoint).
     """
-    all_msgs: List[Dict[str, Any]] = []
-    total_pages = 0
-    
-    async with httpx.AsyncClient(timeout=300) as client:  # Timeout más largo para chats grandes
-        page = 1
-        while True:
-            try:
-                r = await client.get(
-                    f"{API_BASE_URL}/chats/{chat_id}/messages",
-                    params={"page": page, "page_size": page_size},
-                )
-                r.raise_for_status()
-                data = r.json()
-                items = data.get("items", [])
-                if not items:
-                    break
-                all_msgs.extend(items)
-                total_pages = int(data.get("total_pages", 1))
-                if page >= total_pages:
-                    break
-                page += 1
-                activity.heartbeat()  # Heartbeat durante paginación larga
-            except Exception as e:
-                logger.error(f"Error fetching messages for chat {chat_id}, page {page}: {e}")
-                break
-    
-    if not all_msgs:
-        logger.info(f"No messages found for chat {chat_id}")
-        return {"messages_loaded": 0, "total_pages": 0}
-    
-    # Transformar y cargar todos los mensajes
-    msgs = await transform_messages(all_msgs)
-    inserted = await load_messages(msgs)
-    
-    logger.info(f"Loaded {inserted} messages from chat {chat_id} ({total_pages} pages)")
-    return {"messages_loaded": inserted, "total_pages": total_pages}
+    pages = oltp.iter_pages(entity, page_size, params, first_page=int(cp.get("page", 0)) + 1)
+    try:
+        async for page, rows in pages:
+            cp["total_pages"] = page
+            activity.heartbeat(dict(cp))
+            yield page, rows
+    finally:
+        await pages.aclose()
+
+
+def _entity_pages(
+    client: httpx.AsyncClient,
+    source: str,
+    entity: str,
+    url: str,
+    page_size: int,
+    cp: Dict[str, Any],
+    what: str,
+    params: Tuple[Any, ...] = (),
+    strict: bool = False,
+) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Source de páginas (page, items) de una entidad según el backend de extracción ('api' o 'db').
+    `strict`: un error del API falla la actividad en lugar de cortar la entidad (la base OLTP
+    siempre propaga sus errores).
+    """
+    if oltp.check_source(source) == "db":
+        return _oltp_page_items(entity, page_size, cp, params)
+    return _api_page_items(client, url, page_size, cp, what, strict)
 
 
-@activity.defn(name="etl_reactions_chat")
-async def etl_reactions_chat(chat_id: int, page_size: int = 1000) -> Dict[str, Any]:
+def _stage_checkpoint(first_page: int = 1, **extra: int) -> Dict[str, Any]:
     """
-    ETL de TODAS las reacciones de un chat completo.
-    Procesa todos los mensajes del chat y obtiene sus reacciones en paralelo.
-    Reduce drásticamente el número de actividades en el workflow.
-    Retorna: {"reactions_loaded": int, "messages_processed": int}
+    Checkpoint de las actividades stage_*: {"page", "refs", "rows", "total_pages"} más los
+    contadores de `extra`. Un reintento conserva las referencias ya guardadas y sigue después
+    de la última página en staging (o desde `first_page`).
     """
-    logger.info(f"Starting etl_reactions_chat for chat {chat_id}")
-    activity.heartbeat()
-    
-    # Primero obtener todos los mensajes del chat
-    all_msgs: List[Dict[str, Any]] = []
-    
-    try:
-        async with httpx.AsyncClient(timeout=300) as client:
-            page = 1
-            while True:
-                try:
-                    logger.debug(f"Fetching messages page {page} for chat {chat_id}")
-                    r = await client.get(
-                        f"{API_BASE_URL}/chats/{chat_id}/messages",
-                        params={"page": page, "page_size": page_size},
-                    )
-                    r.raise_for_status()
-                    data = r.json()
-                    items = data.get("items", [])
-                    if not items:
-                        break
-                    all_msgs.extend(items)
-                    total_pages = int(data.get("total_pages", 1))
-                    logger.debug(f"Chat {chat_id}: page {page}/{total_pages}, total messages so far: {len(all_msgs)}")
-                    if page >= total_pages:
-                        break
-                    page += 1
-                    activity.heartbeat()  # Heartbeat después de cada página
-                except Exception as e:
-                    logger.error(f"Error fetching messages for reactions, chat {chat_id}, page {page}: {e}", exc_info=True)
-                    break
-    except Exception as e:
-        logger.error(f"Fatal error fetching messages for chat {chat_id}: {e}", exc_info=True)
-        raise
-    
-    if not all_msgs:
-        logger.info(f"No messages found for chat {chat_id}, skipping reactions")
-        return {"reactions_loaded": 0, "messages_processed": 0}
-    
-    logger.info(f"Found {len(all_msgs)} messages in chat {chat_id}, fetching reactions...")
-    activity.heartbeat()
-    
-    # Obtener reacciones en paralelo para todos los mensajes
-    all_reactions: List[Dict[str, Any]] = []
-    
-    async def fetch_reactions_for_message(mid: int) -> List[Dict[str, Any]]:
-        """Obtiene todas las reacciones de un mensaje (paginado)."""
-        reactions = []
-        reaction_page_size = 250  # Máximo permitido por la API (MAX_PAGE_SIZE)
-        
-        try:
-            async with httpx.AsyncClient(timeout=60) as client:  # Timeout más corto por mensaje
-                rpage = 1
-                while True:
-                    try:
-                        rr = await client.get(
-                            f"{API_BASE_URL}/messages/{mid}/reactions",
-                            params={"page": rpage, "page_size": reaction_page_size}
-                        )
-                        # Manejar específicamente errores 422 (page_size demasiado grande)
-                        if rr.status_code == 422:
-                            # Intentar con page_size más pequeño
-                            logger.debug(f"422 error for message {mid}, retrying with smaller page_size")
-                            rr = await client.get(
-                                f"{API_BASE_URL}/messages/{mid}/reactions",
-                                params={"page": rpage, "page_size": 100}
-                            )
-                        
-                        rr.raise_for_status()
-                        rdata = rr.json()
-                        items = rdata.get("items", [])
-                        if not items:
-                            break
-                        reactions.extend(items)
-                        if rpage >= rdata.get("total_pages", 1):
-                            break
-                        rpage += 1
-                    except httpx.HTTPStatusError as e:
-                        if e.response.status_code == 422:
-                            logger.warning(f"422 Unprocessable Entity for message {mid}, page {rpage}. Skipping this message.")
-                        else:
-                            logger.warning(f"HTTP error {e.response.status_code} fetching reactions for message {mid}, page {rpage}: {e}")
-                        break
-                    except Exception as e:
-                        logger.warning(f"Error fetching reactions for message {mid}, page {rpage}: {e}")
-                        break
-        except Exception as e:
-            logger.warning(f"Fatal error fetching reactions for message {mid}: {e}")
-        return reactions
-    
-    # Procesar mensajes en lotes paralelos (máximo 20 a la vez para evitar saturación)
-    batch_size = 20
-    message_ids = [m["id"] for m in all_msgs]
-    total_batches = (len(message_ids) + batch_size - 1) // batch_size
-    
-    logger.info(f"Processing {len(message_ids)} messages in {total_batches} batches of {batch_size}")
-    
-    for i in range(0, len(message_ids), batch_size):
-        batch = message_ids[i:i + batch_size]
-        batch_num = (i // batch_size) + 1
-        logger.debug(f"Processing batch {batch_num}/{total_batches} for chat {chat_id} ({len(batch)} messages)")
-        
-        try:
-            tasks = [fetch_reactions_for_message(mid) for mid in batch]
-            batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for idx, result in enumerate(batch_results):
-                if isinstance(result, Exception):
-                    logger.warning(f"Error fetching reactions batch {batch_num}, message {batch[idx]}: {result}")
-                elif isinstance(result, list):
-                    all_reactions.extend(result)
-            
-            logger.debug(f"Batch {batch_num}/{total_batches} completed: {len(all_reactions)} total reactions so far")
-        except Exception as e:
-            logger.error(f"Error processing batch {batch_num} for chat {chat_id}: {e}", exc_info=True)
-        
-        # Heartbeat después de cada batch para mantener la actividad viva
-        activity.heartbeat()
-    
-    logger.info(f"Finished fetching reactions for chat {chat_id}: {len(all_reactions)} reactions from {len(all_msgs)} messages")
-    activity.heartbeat()
-    
-    if not all_reactions:
-        logger.info(f"No reactions found for chat {chat_id}")
-        return {"reactions_loaded": 0, "messages_processed": len(all_msgs)}
-    
-    # Transformar y cargar todas las reacciones
-    logger.info(f"Transforming and loading {len(all_reactions)} reactions for chat {chat_id}")
-    activity.heartbeat()
-    
+    prev = _checkpoint()
+    cp: Dict[str, Any] = {
+        "page": max(int(prev.get("page", 0)), first_page - 1),
+        "refs": list(prev.get("refs", [])),
+        "rows": int(prev.get("rows", 0)),
+        "total_pages": int(prev.get("total_pages", 0)),
+    }
+    cp.update({k: int(prev.get(k, v)) for k, v in extra.items()})
+    return cp
+
+
+async def _until_page(
+    pages: AsyncIterator[Tuple[int, List[Dict[str, Any]]]], last_page: Optional[int],
+) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+    """Corta el source de páginas después de `last_page` (None: hasta el final)."""
     try:
-        all_reactions = await transform_reactions(all_reactions)
-        inserted = await load_reactions(chat_id, all_reactions)
-        
-        logger.info(f"Successfully loaded {inserted} reactions from {len(all_msgs)} messages in chat {chat_id}")
-        return {"reactions_loaded": inserted, "messages_processed": len(all_msgs)}
-    except Exception as e:
-        logger.error(f"Error transforming/loading reactions for chat {chat_id}: {e}", exc_info=True)
-        raise
+        async for page, items in pages:
+            if last_page is not None and page > last_page:
+                return
+            yield page, items
+    finally:
+        await pages.aclose()
 
 
-@activity.defn(name="etl_reactions_page")
-async def etl_reactions_page(chat_id: int, page: int, page_size: int = 250) -> int:
+async def _stage_pages(
+    entity: str,
+    pages: AsyncIterator[Tuple[int, List[Dict[str, Any]]]],
+    cp: Dict[str, Any],
+    processed: Optional[Dict[int, int]] = None,
+) -> Dict[str, Any]:
     """
-    ETL de reacciones para una página de mensajes.
-    Optimizado: procesa múltiples mensajes en paralelo y usa batch más grande.
+    Sink de las actividades stage_*: agrupa las páginas en lotes de ~STAGE_ROWS filas (solo
+    páginas completas), guarda cada lote en staging y hace heartbeat del checkpoint con su
+    referencia. La transformación y la carga las hace load_staged en la cola de load.
+    `processed`: mensajes leídos por página (reacciones), se suman a "messages_processed"
+    cuando su página queda guardada. Devuelve el checkpoint final ("page": última página
+    guardada; menor que la pedida si el source se terminó antes).
     """
-    # Aumentar page_size para mensajes si es muy pequeño (optimización)
-    effective_page_size = max(page_size, 500)  # Mínimo 500 mensajes por batch
-    
-    async with httpx.AsyncClient(timeout=60) as client:
-        rm = await client.get(
-            f"{API_BASE_URL}/chats/{chat_id}/messages",
-            params={"page": page, "page_size": effective_page_size},
+    async def put(item):
+        last_page, rows = item
+        ref = await asyncio.to_thread(staging.put_rows, entity, _to_json_safe(rows))
+        cp["refs"].append(ref)
+        cp["rows"] += len(rows)
+        cp["page"] = last_page
+        if processed is not None:
+            for page in [p for p in processed if p <= last_page]:
+                cp["messages_processed"] += processed.pop(page)
+        activity.heartbeat(dict(cp))
+
+    await Pipeline(entity, rebatch(pages, STAGE_ROWS)).run(put, sink_name="stage")
+    logger.info(f"Staged {cp['rows']} {entity} in {len(cp['refs'])} batches ({cp['total_pages']} pages)")
+    return cp
+
+
+@activity.defn(name="stage_messages_chat")
+async def stage_messages_chat(
+    chat_id: int,
+    page_size: int = 1000,
+    source: str = "api",
+    first_page: int = 1,
+    last_page: Optional[int] = None,
+    strict: bool = False,
+) -> Dict[str, Any]:
+    """
+    Extrae TODOS los mensajes de un chat (o las páginas first_page..last_page, para backfill)
+    y los deja en staging por lotes; los carga load_staged en la cola de load.
+    Checkpoint por heartbeat: {"page", "refs", "rows", "total_pages"}.
+    `source`: 'api' (default) o 'db' (lectura directa de la base OLTP).
+    `strict`: un error del API falla la actividad (full refresh con tablas sombra).
+    Retorna: {"refs": [...], "rows": int, "total_pages": int, "page": int}
+    """
+    cp = _stage_checkpoint(first_page)
+    if cp["refs"]:
+        logger.info(f"Resuming stage_messages_chat for chat {chat_id} at page {cp['page'] + 1} ({cp['rows']} already staged)")
+    async with http_client.client() as client:
+        pages = _entity_pages(
+            client, source, "messages", f"{API_BASE_URL}/chats/{chat_id}/messages",
+            page_size, cp, f"messages for chat {chat_id}", (chat_id,), strict,
         )
-        rm.raise_for_status()
-        mdata = rm.json()
-        msgs = mdata.get("items", [])
-    
-    if not msgs:
-        return 0
-    
-    # Obtener reacciones en paralelo para todos los mensajes
-    all_reactions: List[Dict[str, Any]] = []
+        return await _stage_pages("messages", _until_page(pages, last_page), cp)
+
+
+async def _fetch_reactions_for_message(mid: int, strict: bool = False) -> List[Dict[str, Any]]:
+    """
+    Obtiene todas las reacciones de un mensaje (paginado). Un error corta el mensaje con un
+    warning; con `strict` se propaga (el full refresh no puede perder reacciones en silencio).
+    """
+    reactions = []
+    reaction_page_size = 250  # Máximo permitido por la API (MAX_PAGE_SIZE)
     
-    async def fetch_reactions_for_message(mid: int) -> List[Dict[str, Any]]:
-        """Obtiene todas las reacciones de un mensaje (paginado)."""
-        reactions = []
-        reaction_page_size = 250  # Máximo permitido por la API (MAX_PAGE_SIZE)
-        
-        async with httpx.AsyncClient(timeout=60) as client:
+    try:
+        async with http_client.client() as client:
             rpage = 1
             while True:
                 try:
-                    rr = await client.get(
+                    rr = await _api_get(
+                        client,
                         f"{API_BASE_URL}/messages/{mid}/reactions",
                         params={"page": rpage, "page_size": reaction_page_size}
                     )
@@ -788,13 +630,14 @@ async def etl_reactions_page(chat_id: int, page: int, page_size: int = 250) -> i
                     if rr.status_code == 422:
                         # Intentar con page_size más pequeño
                         logger.debug(f"422 error for message {mid}, retrying with smaller page_size")
-                        rr = await client.get(
+                        rr = await _api_get(
+                            client,
                             f"{API_BASE_URL}/messages/{mid}/reactions",
                             params={"page": rpage, "page_size": 100}
                         )
                     
                     rr.raise_for_status()
-                    rdata = rr.json()
+                    rdata = records.loads(rr.content)
                     items = rdata.get("items", [])
                     if not items:
                         break
@@ -803,40 +646,87 @@ async def etl_reactions_page(chat_id: int, page: int, page_size: int = 250) -> i
                         break
                     rpage += 1
                 except httpx.HTTPStatusError as e:
+                    if strict:
+                        raise
                     if e.response.status_code == 422:
                         logger.warning(f"422 Unprocessable Entity for message {mid}, page {rpage}. Skipping this message.")
                     else:
                         logger.warning(f"HTTP error {e.response.status_code} fetching reactions for message {mid}, page {rpage}: {e}")
                     break
                 except Exception as e:
-                    logger.warning(f"Error fetching reactions for message {mid}: {e}")
+                    if strict:
+                        raise
+                    logger.warning(f"Error fetching reactions for message {mid}, page {rpage}: {e}")
                     break
-        return reactions
+    except Exception as e:
+        if strict:
+            raise
+        logger.warning(f"Fatal error fetching reactions for message {mid}: {e}")
+    return reactions
+
+
+@activity.defn(name="stage_reactions_chat")
+async def stage_reactions_chat(
+    chat_id: int,
+    page_size: int = 1000,
+    source: str = "api",
+    first_page: int = 1,
+    last_page: Optional[int] = None,
+    strict: bool = False,
+) -> Dict[str, Any]:
+    """
+    Extrae TODAS las reacciones de un chat y las deja en staging por lotes (las carga
+    load_staged en la cola de load). Por página de mensajes baja las reacciones en paralelo.
+    Con source='db' las páginas son de reacciones (un JOIN en la base OLTP, sin una llamada
+    HTTP por mensaje) y messages_processed cuenta los mensajes con reacciones.
+    `strict`: un error del API (también el de las reacciones de un mensaje) falla la actividad.
+    Checkpoint por heartbeat: {"page", "refs", "rows", "total_pages", "messages_processed"}.
+    Retorna: {"refs": [...], "rows": int, "total_pages": int, "page": int, "messages_processed": int}
+    """
+    cp = _stage_checkpoint(first_page, messages_processed=0)
+    logger.info(f"Starting stage_reactions_chat for chat {chat_id} at page {cp['page'] + 1}")
+    activity.heartbeat(dict(cp))
+    processed: Dict[int, int] = {}
     
-    # Procesar mensajes en lotes paralelos (máximo 20 a la vez para no saturar)
+    # Procesar mensajes en lotes paralelos (máximo 20 a la vez para evitar saturación)
     batch_size = 20
-    message_ids = [m["id"] for m in msgs]
     
-    for i in range(0, len(message_ids), batch_size):
-        batch = message_ids[i:i + batch_size]
-        tasks = [fetch_reactions_for_message(mid) for mid in batch]
-        batch_results = await asyncio.gather(*tasks, return_exceptions=True)
-        
-        for result in batch_results:
-            if isinstance(result, Exception):
-                logger.warning(f"Error fetching reactions batch: {result}")
-            elif isinstance(result, list):
-                all_reactions.extend(result)
-        
-        activity.heartbeat()
+    async def api_reactions(pages):
+        async for page, msgs in pages:
+            page_reactions: List[Dict[str, Any]] = []
+            message_ids = [m["id"] for m in msgs]
+            for i in range(0, len(message_ids), batch_size):
+                batch = message_ids[i:i + batch_size]
+                batch_results = await asyncio.gather(
+                    *(_fetch_reactions_for_message(mid, strict) for mid in batch), return_exceptions=True
+                )
+                for idx, result in enumerate(batch_results):
+                    if isinstance(result, Exception) and strict:
+                        raise result
+                    if isinstance(result, Exception):
+                        logger.warning(f"Error fetching reactions for message {batch[idx]}: {result}")
+                    elif isinstance(result, list):
+                        page_reactions.extend(result)
+                # Heartbeat después de cada batch (mismo checkpoint: la página aún no se guardó)
+                activity.heartbeat(dict(cp))
+            processed[page] = len(msgs)
+            yield page, page_reactions
     
-    if not all_reactions:
-        return 0
+    async def db_reactions(pages):
+        # source='db': la página ya trae las reacciones del chat
+        async for page, reactions in pages:
+            processed[page] = len({r["message_id"] for r in reactions})
+            yield page, reactions
     
-    all_reactions = await transform_reactions(all_reactions)
-    inserted = await load_reactions(chat_id, all_reactions)
-    logger.info(f"Processed {len(msgs)} messages, loaded {inserted} reactions for chat {chat_id}, page {page}")
-    return inserted
+    async with http_client.client() as client:
+        if oltp.check_source(source) == "db":
+            pages = db_reactions(_oltp_page_items("reactions", page_size, cp, (chat_id,)))
+        else:
+            pages = api_reactions(_api_page_items(
+                client, f"{API_BASE_URL}/chats/{chat_id}/messages", page_size, cp,
+                f"messages for reactions, chat {chat_id}", strict,
+            ))
+        return await _stage_pages("reactions", _until_page(pages, last_page), cp, processed)
 
 
 # --- Booking activities ---
@@ -881,8 +771,8 @@ async def create_booking_from_message(message: Dict[str, Any]) -> int:
         "status": "PENDING",
     }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(f"{API_BASE_URL}/bookings", json=_to_json_safe(payload))
+    async with http_client.client() as client:
+        r = await _api_post(client, f"{API_BASE_URL}/bookings", json=_to_json_safe(payload))
         r.raise_for_status()
         data = r.json()
 
@@ -902,360 +792,284 @@ async def send_booking_confirmation(chat_id: int, booking_id: int) -> None:
         "body": body,
     }
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(f"{API_BASE_URL}/chats/{chat_id}/messages", json=_to_json_safe(payload))
+    async with http_client.client() as client:
+        r = await _api_post(client, f"{API_BASE_URL}/chats/{chat_id}/messages", json=_to_json_safe(payload))
         r.raise_for_status()
 
 # ---------- Bookings (ETL) ----------
 @activity.defn(name="extract_bookings")
-async def extract_bookings(page_size: int = 250) -> List[Dict[str, Any]]:
+async def extract_bookings(page_size: int = 250) -> Dict[str, Any]:
     """
     Extrae bookings desde la API.
-    NOTA: Para grandes volúmenes, usa etl_bookings que procesa directamente.
+    NOTA: Para grandes volúmenes, usa stage_bookings + load_staged (lotes acotados).
     """
-    items: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(timeout=30) as client:
-        page = 1
-        while True:
-            r = await client.get(f"{API_BASE_URL}/bookings", params={"page": page, "page_size": page_size})
-            r.raise_for_status()
-            data = r.json()
-            items.extend(data["items"])
-            if page >= data["total_pages"]:
-                break
-            page += 1
-            activity.heartbeat()
+    async with http_client.client() as client:
+        items = await _fetch_items(client, f"{API_BASE_URL}/bookings", page_size)
     logger.info(f"Extracted {len(items)} bookings")
-    return _to_json_safe(items)
+    return await asyncio.to_thread(staging.put_rows, "bookings", _to_json_safe(items))
 
 
-@activity.defn(name="etl_bookings")
-async def etl_bookings(page_size: int = 1000) -> Dict[str, Any]:
+@activity.defn(name="stage_bookings")
+async def stage_bookings(
+    page_size: int = 1000,
+    source: str = "api",
+    strict: bool = False,
+    first_page: int = 1,
+    last_page: Optional[int] = None,
+) -> Dict[str, Any]:
     """
-    ETL completo de bookings: extrae, transforma y carga directamente.
-    Evita el problema de límite de tamaño de Temporal al no retornar todos los datos.
-    Retorna solo un resumen: {"bookings_loaded": int}
+    Extrae los bookings (todos, o las páginas first_page..last_page) y los deja en staging por
+    lotes de ~STAGE_ROWS filas: el historial de Temporal solo ve las referencias y la carga la
+    hace load_staged en la cola de load. Checkpoint por heartbeat {"page", "refs", "rows",
+    "total_pages"}; un reintento continúa después de la última página guardada.
+    `source`: 'api' (default) o 'db' (base OLTP).
+    `strict`: un error del API falla la actividad (full refresh con tablas sombra).
+    Retorna: {"refs": [...], "rows": int, "total_pages": int, "page": int}
     """
-    logger.info("Starting etl_bookings")
-    activity.heartbeat()
-    
-    # Extraer bookings página por página y procesar en lotes
-    all_bookings: List[Dict[str, Any]] = []
-    total_pages = 0
-    processed_count = 0
-    batch_size = 5000  # Procesar en lotes de 5000 para evitar problemas de memoria
-    
-    async with httpx.AsyncClient(timeout=300) as client:
-        page = 1
-        while True:
-            try:
-                logger.debug(f"Fetching bookings page {page}")
-                r = await client.get(f"{API_BASE_URL}/bookings", params={"page": page, "page_size": page_size})
-                r.raise_for_status()
-                data = r.json()
-                items = data.get("items", [])
-                if not items:
-                    break
-                all_bookings.extend(items)
-                total_pages = int(data.get("total_pages", 1))
-                logger.debug(f"Bookings page {page}/{total_pages}, total so far: {len(all_bookings)}")
-                
-                # Procesar en lotes para evitar problemas de memoria y límite de tamaño
-                if len(all_bookings) >= batch_size:
-                    batch = all_bookings[:batch_size]
-                    all_bookings = all_bookings[batch_size:]
-                    
-                    # Transformar y cargar el lote
-                    batch = await transform_bookings(batch)
-                    inserted = await load_bookings(batch)
-                    processed_count += inserted
-                    logger.info(f"Processed batch: {inserted} bookings loaded (total so far: {processed_count})")
-                    activity.heartbeat()
-                
-                if page >= total_pages:
-                    break
-                page += 1
-                activity.heartbeat()
-            except Exception as e:
-                logger.error(f"Error fetching bookings page {page}: {e}", exc_info=True)
-                break
-    
-    # Procesar el último lote si queda algo
-    if all_bookings:
-        logger.info(f"Processing final batch of {len(all_bookings)} bookings")
-        all_bookings = await transform_bookings(all_bookings)
-        inserted = await load_bookings(all_bookings)
-        processed_count += inserted
-        activity.heartbeat()
-    
-    logger.info(f"Successfully loaded {processed_count} bookings from {total_pages} pages")
-    return {"bookings_loaded": processed_count}
+    cp = _stage_checkpoint(first_page)
+    logger.info(f"Starting stage_bookings at page {cp['page'] + 1}")
+    activity.heartbeat(dict(cp))
+    async with http_client.client() as client:
+        pages = _entity_pages(client, source, "bookings", f"{API_BASE_URL}/bookings", page_size, cp, "bookings", (), strict)
+        return await _stage_pages("bookings", _until_page(pages, last_page), cp)
 
 
 @activity.defn(name="transform_bookings")
-async def transform_bookings(bookings: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Convierte fechas y normaliza campos de bookings."""
-    valid_bookings = []
-    for b in bookings:
-        if not _validate_booking(b):
-            continue
-        if isinstance(b.get("created_at"), (datetime, date)):
-            b["created_at"] = b["created_at"].isoformat()
-        if isinstance(b.get("booking_date"), (datetime, date)):
-            b["booking_date"] = b["booking_date"].isoformat()
-        valid_bookings.append(b)
+async def transform_bookings(bookings_in: Any) -> Any:
+    """Convierte fechas y normaliza campos de bookings. Acepta y devuelve lista o referencia de staging."""
+    bookings = await asyncio.to_thread(staging.get_rows, bookings_in)
+    valid_bookings = records.build(BookingRecord, bookings)
     logger.info(f"Transformed {len(valid_bookings)}/{len(bookings)} bookings")
-    return _to_json_safe(valid_bookings)
+    return await asyncio.to_thread(staging.restage, bookings_in, [b.to_dict() for b in valid_bookings])
 
 
 @activity.defn(name="load_bookings")
-async def load_bookings(bookings: List[Dict[str, Any]]) -> int:
-    """Carga los bookings en la tabla fact_bookings del warehouse."""
-    if not bookings:
-        return 0
-    conn = _pg()
-    conn.autocommit = False
-    try:
-        with conn.cursor() as cur:
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS fact_bookings(
-              booking_id INT PRIMARY KEY,
-              chat_id INT NOT NULL,
-              user_id INT NOT NULL,
-              message_id INT,
-              booking_type TEXT,
-              booking_date TIMESTAMPTZ,
-              status TEXT NOT NULL,
-              created_at TIMESTAMPTZ NOT NULL,
-              created_day DATE NOT NULL,
-              created_hour SMALLINT NOT NULL,
-              FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
-              FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE,
-              FOREIGN KEY (message_id) REFERENCES fact_messages(message_id) ON DELETE SET NULL
-            );
-            CREATE INDEX IF NOT EXISTS idx_fact_bookings_date_status 
-              ON fact_bookings(created_day, status);
-            CREATE INDEX IF NOT EXISTS idx_fact_bookings_chat 
-              ON fact_bookings(chat_id);
-            """)
-            
-            def row(b):
-                created = _parse_ts(b.get("created_at"))
-                if not created:
-                    logger.warning(f"Booking {b.get('id')} sin created_at válido, usando ahora")
-                    created = datetime.utcnow()
-                return (
-                    b["id"],
-                    b.get("chat_id"),
-                    b.get("user_id"),
-                    b.get("message_id"),
-                    b.get("booking_type"),
-                    _parse_ts(b.get("booking_date")),
-                    b.get("status") or "PENDING",
-                    created,
-                    created.date(),
-                    created.hour
-                )
-            
-            rows = [row(b) for b in bookings]
-            psycopg2.extras.execute_batch(
-                cur,
-                """INSERT INTO fact_bookings
-                   (booking_id, chat_id, user_id, message_id, booking_type, booking_date,
-                    status, created_at, created_day, created_hour)
-                   VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s,%s)
-                   ON CONFLICT (booking_id) DO UPDATE SET
-                     booking_type=EXCLUDED.booking_type,
-                     booking_date=EXCLUDED.booking_date,
-                     status=EXCLUDED.status,
-                     created_at=EXCLUDED.created_at,
-                     created_day=EXCLUDED.created_day,
-                     created_hour=EXCLUDED.created_hour""",
-                rows,
-                page_size=2000
-            )
-        conn.commit()
-        logger.info(f"Loaded {len(rows)} bookings")
-        return len(rows)
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error loading bookings: {e}", exc_info=True)
-        raise
-    finally:
-        conn.close()
+@_dw_limited
+def load_bookings(bookings: Any, shadow: bool = False) -> int:
+    """
+    Carga los bookings en la tabla fact_bookings del warehouse (o en su sombra con `shadow`).
+    Acepta lista, referencia de staging o BookingRecord.
+    """
+    return _load_facts("bookings", staging.get_rows(bookings), BookingRecord, (), 2000, shadow)["loaded"]
 
 
 # ---------- Booking Events (ETL) ----------
 @activity.defn(name="extract_booking_events")
-async def extract_booking_events(page_size: int = 250) -> List[Dict[str, Any]]:
+async def extract_booking_events(page_size: int = 250) -> Dict[str, Any]:
     """
     Extrae eventos de reservas desde la API.
-    NOTA: Para grandes volúmenes, usa etl_booking_events que procesa directamente.
+    NOTA: Para grandes volúmenes, usa stage_booking_events + load_staged (lotes acotados).
     """
-    items: List[Dict[str, Any]] = []
-    async with httpx.AsyncClient(timeout=30) as client:
-        page = 1
-        while True:
-            r = await client.get(f"{API_BASE_URL}/booking-events", params={"page": page, "page_size": page_size})
-            r.raise_for_status()
-            data = r.json()
-            items.extend(data["items"])
-            if page >= data["total_pages"]:
-                break
-            page += 1
-            activity.heartbeat()
+    async with http_client.client() as client:
+        items = await _fetch_items(client, f"{API_BASE_URL}/booking-events", page_size)
     logger.info(f"Extracted {len(items)} booking events")
-    return _to_json_safe(items)
+    return await asyncio.to_thread(staging.put_rows, "booking_events", _to_json_safe(items))
 
 
-@activity.defn(name="etl_booking_events")
-async def etl_booking_events(page_size: int = 1000) -> Dict[str, Any]:
+@activity.defn(name="stage_booking_events")
+async def stage_booking_events(
+    page_size: int = 1000,
+    source: str = "api",
+    strict: bool = False,
+    first_page: int = 1,
+    last_page: Optional[int] = None,
+) -> Dict[str, Any]:
     """
-    ETL completo de booking events: extrae, transforma y carga directamente.
-    Evita el problema de límite de tamaño de Temporal al no retornar todos los datos.
-    Retorna solo un resumen: {"events_loaded": int}
+    Extrae los booking events (todos, o las páginas first_page..last_page) y los deja en
+    staging por lotes (ver stage_bookings).
+    Retorna: {"refs": [...], "rows": int, "total_pages": int, "page": int}
     """
-    logger.info("Starting etl_booking_events")
-    activity.heartbeat()
-    
-    # Extraer eventos página por página y procesar en lotes
-    all_events: List[Dict[str, Any]] = []
-    total_pages = 0
-    processed_count = 0
-    batch_size = 5000  # Procesar en lotes de 5000 para evitar problemas de memoria
-    
-    async with httpx.AsyncClient(timeout=300) as client:
-        page = 1
-        while True:
-            try:
-                logger.debug(f"Fetching booking events page {page}")
-                r = await client.get(f"{API_BASE_URL}/booking-events", params={"page": page, "page_size": page_size})
-                r.raise_for_status()
-                data = r.json()
-                items = data.get("items", [])
-                if not items:
-                    break
-                all_events.extend(items)
-                total_pages = int(data.get("total_pages", 1))
-                logger.debug(f"Booking events page {page}/{total_pages}, total so far: {len(all_events)}")
-                
-                # Procesar en lotes para evitar problemas de memoria y límite de tamaño
-                if len(all_events) >= batch_size:
-                    batch = all_events[:batch_size]
-                    all_events = all_events[batch_size:]
-                    
-                    # Transformar y cargar el lote
-                    batch = await transform_booking_events(batch)
-                    inserted = await load_booking_events(batch)
-                    processed_count += inserted
-                    logger.info(f"Processed batch: {inserted} events loaded (total so far: {processed_count})")
-                    activity.heartbeat()
-                
-                if page >= total_pages:
-                    break
-                page += 1
-                activity.heartbeat()
-            except Exception as e:
-                logger.error(f"Error fetching booking events page {page}: {e}", exc_info=True)
-                break
-    
-    # Procesar el último lote si queda algo
-    if all_events:
-        logger.info(f"Processing final batch of {len(all_events)} booking events")
-        all_events = await transform_booking_events(all_events)
-        inserted = await load_booking_events(all_events)
-        processed_count += inserted
-        activity.heartbeat()
-    
-    logger.info(f"Successfully loaded {processed_count} booking events from {total_pages} pages")
-    return {"events_loaded": processed_count}
+    cp = _stage_checkpoint(first_page)
+    logger.info(f"Starting stage_booking_events at page {cp['page'] + 1}")
+    activity.heartbeat(dict(cp))
+    async with http_client.client() as client:
+        pages = _entity_pages(client, source, "booking_events", f"{API_BASE_URL}/booking-events", page_size, cp, "booking events", (), strict)
+        return await _stage_pages("booking_events", _until_page(pages, last_page), cp)
 
 
 @activity.defn(name="transform_booking_events")
-async def transform_booking_events(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    """Convierte fechas de los eventos."""
-    valid_events = []
-    for e in events:
-        if not e.get("id"):
-            logger.warning(f"Booking event sin ID: {e}")
-            continue
-        if not e.get("booking_id"):
-            logger.warning(f"Booking event {e.get('id')} sin booking_id")
-            continue
-        if not e.get("event_type"):
-            logger.warning(f"Booking event {e.get('id')} sin event_type")
-            continue
-        if isinstance(e.get("created_at"), (datetime, date)):
-            e["created_at"] = e["created_at"].isoformat()
-        valid_events.append(e)
+async def transform_booking_events(events_in: Any) -> Any:
+    """Convierte fechas de los eventos. Acepta y devuelve lista o referencia de staging."""
+    events = await asyncio.to_thread(staging.get_rows, events_in)
+    valid_events = records.build(BookingEventRecord, events)
     logger.info(f"Transformed {len(valid_events)}/{len(events)} booking events")
-    return _to_json_safe(valid_events)
+    return await asyncio.to_thread(staging.restage, events_in, [e.to_dict() for e in valid_events])
 
 
 @activity.defn(name="load_booking_events")
-async def load_booking_events(events: List[Dict[str, Any]]) -> int:
-    """Carga los eventos en la tabla fact_booking_events."""
-    if not events:
-        return 0
+@_dw_limited
+def load_booking_events(events: Any, shadow: bool = False) -> int:
+    """
+    Carga los eventos en la tabla fact_booking_events (o en su sombra con `shadow`).
+    Acepta lista, referencia de staging o BookingEventRecord.
+    """
+    return _load_facts("booking_events", staging.get_rows(events), BookingEventRecord, (), 3000, shadow)["loaded"]
+
+# Hechos que carga load_staged: clase del registro y filas por INSERT del loader
+_FACTS: Dict[str, Tuple[type, int]] = {
+    "messages": (MessageRecord, 5000),
+    "reactions": (ReactionRecord, 5000),
+    "bookings": (BookingRecord, 2000),
+    "booking_events": (BookingEventRecord, 3000),
+}
+
+
+@_dw_limited
+def _load_staged_batch(entity: str, ref: Any, chat_id: Optional[int], shadow: bool) -> Dict[str, int]:
+    """
+    Transforma y carga un lote de staging en una transacción (ver _load_facts). "rejected" son
+    las filas que descartó la validación del transform.
+    """
+    cls, page_size = _FACTS[entity]
+    # Las reacciones no traen chat_id: lo agrega la transformación (columnar) o la fila
+    kwargs = {"chat_id": chat_id} if entity == "reactions" else {}
+    items = staging.get_rows(ref)
+    batch = _transform_batch(entity, cls, items, **kwargs)
+    stats = _load_facts(entity, batch, cls, tuple(kwargs.values()), page_size, shadow)
+    return {**stats, "rejected": len(items) - len(batch)}
+
+
+@activity.defn(name="load_staged")
+async def load_staged(
+    entity: str, refs: List[Any], chat_id: Optional[int] = None, shadow: bool = False,
+) -> Dict[str, int]:
+    """
+    Carga en el warehouse los lotes que dejó en staging una actividad stage_*. Corre en la
+    cola de load: ETL_LOAD_MAX_CONCURRENT y los workers de load gobiernan las escrituras.
+    Cada lote es una transacción; tras confirmarlo hace heartbeat de {"done", "loaded",
+    "quarantined", "rejected", "changed"} y un reintento sigue con el lote siguiente.
+    `chat_id`: el chat de las reacciones. `shadow`: cargar en las tablas sombra.
+    Retorna: {"loaded": int, "quarantined": int, "rejected": int, "changed": int}
+    """
+    counters = ("loaded", "quarantined", "rejected", "changed")
+    prev = _checkpoint()
+    cp = {k: int(prev.get(k, 0)) for k in ("done",) + counters}
+    for ref in refs[cp["done"]:]:
+        stats = await _load_staged_batch(entity, ref, chat_id, shadow)
+        for key in counters:
+            cp[key] += stats[key]
+        cp["done"] += 1
+        activity.heartbeat(dict(cp))
+    logger.info(f"Loaded {cp['loaded']} {entity} from {len(refs)} staged batches" + (f" (chat {chat_id})" if chat_id is not None else ""))
+    return {k: cp[k] for k in counters}
+
+
+# ---------- Full refresh (tablas sombra) ----------
+@activity.defn(name="prepare_shadow_tables")
+@_dw_limited
+def prepare_shadow_tables(entities: Optional[List[str]] = None) -> Dict[str, str]:
+    """Crea vacías las tablas sombra de los hechos antes de un full refresh. Devuelve {entidad: tabla}."""
     conn = _pg()
-    conn.autocommit = False
     try:
-        with conn.cursor() as cur:
-            # CORREGIDO: Usar INT PRIMARY KEY en lugar de SERIAL para usar el ID de la API
-            cur.execute("""
-            CREATE TABLE IF NOT EXISTS fact_booking_events(
-              event_id INT PRIMARY KEY,
-              booking_id INT NOT NULL,
-              event_type TEXT NOT NULL,
-              created_at TIMESTAMPTZ NOT NULL,
-              created_day DATE NOT NULL,
-              created_hour SMALLINT NOT NULL,
-              FOREIGN KEY (booking_id) REFERENCES fact_bookings(booking_id) ON DELETE CASCADE
-            );
-            CREATE INDEX IF NOT EXISTS idx_fact_booking_events_booking 
-              ON fact_booking_events(booking_id);
-            CREATE INDEX IF NOT EXISTS idx_fact_booking_events_date 
-              ON fact_booking_events(created_day);
-            """)
-            
-            def row(e):
-                created = _parse_ts(e.get("created_at"))
-                if not created:
-                    logger.warning(f"Booking event {e.get('id')} sin created_at válido, usando ahora")
-                    created = datetime.utcnow()
-                return (
-                    e.get("id"),  # Usar ID de la API
-                    e.get("booking_id"),
-                    e.get("event_type") or "",
-                    created,
-                    created.date(),
-                    created.hour
+        return shadow_tables.prepare(conn, entities or shadow_tables.ENTITIES)
+    finally:
+        _release(conn)
+
+
+@activity.defn(name="swap_shadow_tables")
+@_dw_limited
+def swap_shadow_tables(
+    expected: Dict[str, int],
+    max_shrink: Optional[float] = None,
+    sources: Optional[Dict[str, Dict[str, int]]] = None,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Cierra un full refresh: por entidad construye índices y claves en la sombra y valida los
+    conteos contra `expected` (filas cargadas), contra `sources` ({entidad: {"rows": extraídas
+    de la fuente, "discarded": descartadas por validación o cuarentena}}) y contra la tabla viva;
+    luego swap de todas en una transacción.
+    Si alguna entidad no valida no se reemplaza ninguna (ApplicationError no reintentable)
+    y las sombras se descartan.
+    """
+    entities = [e for e in shadow_tables.ENTITIES if e in expected]
+    shrink = shadow_tables.MAX_SHRINK if max_shrink is None else max_shrink
+    conn = _pg()
+    try:
+        stats = {}
+        try:
+            for entity in entities:
+                stats[entity] = shadow_tables.finalize(
+                    conn, entity, expected.get(entity), shrink, (sources or {}).get(entity),
                 )
-            
-            rows = [row(e) for e in events]
-            psycopg2.extras.execute_batch(
-                cur,
-                """INSERT INTO fact_booking_events
-                   (event_id, booking_id, event_type, created_at, created_day, created_hour)
-                   VALUES (%s,%s,%s,%s,%s,%s)
-                   ON CONFLICT (event_id) DO UPDATE SET
-                     booking_id=EXCLUDED.booking_id,
-                     event_type=EXCLUDED.event_type,
-                     created_at=EXCLUDED.created_at,
-                     created_day=EXCLUDED.created_day,
-                     created_hour=EXCLUDED.created_hour""",
-                rows,
-                page_size=3000
-            )
-        conn.commit()
-        logger.info(f"Loaded {len(rows)} booking events")
-        return len(rows)
-    except Exception as e:
-        conn.rollback()
-        logger.error(f"Error loading booking events: {e}", exc_info=True)
-        raise
+        except shadow_tables.ShadowValidationError as e:
+            shadow_tables.drop(conn, entities)
+            raise ApplicationError(str(e), type="ShadowValidationError", non_retryable=True)
+        shadow_tables.swap(conn, entities)
+        logger.info(f"Full refresh swapped: {stats}")
+        return stats
+    finally:
+        _release(conn)
+
+
+@activity.defn(name="drop_shadow_tables")
+@_dw_limited
+def drop_shadow_tables(entities: Optional[List[str]] = None) -> None:
+    """Descarta las tablas sombra de un full refresh abortado."""
+    conn = _pg()
+    try:
+        shadow_tables.drop(conn, entities or shadow_tables.ENTITIES)
     finally:
-        conn.close()
+        _release(conn)
+
+
+@activity.defn(name="rebuild_rollups")
+@_dw_limited
+def rebuild_rollups(tables: Optional[List[str]] = None) -> List[str]:
+    """
+    Recalcula completos los rollups de las tablas de hechos `tables` (default: todos), p. ej.
+    después del swap de un full refresh, que carga las sombras sin mantener rollups.
+    """
+    names = [n for t in tables for n in rollups.for_table(t)] if tables else None
+    conn = _pg()
+    try:
+        return rollups.rebuild(conn, names)
+    finally:
+        _release(conn)
+
+
+@activity.defn(name="refresh_materialized_views")
+@_dw_limited
+def refresh_materialized_views(tables: Optional[List[str]] = None, rebuilt: Optional[List[str]] = None) -> Dict[str, float]:
+    """
+    Último paso de una corrida: REFRESH MATERIALIZED VIEW CONCURRENTLY de las vistas de
+    matviews.py que leen alguna de `tables` (las que cambiaron; None: todas). Las vistas que
+    leen alguna tabla de `rebuilt` se recrearon y llenaron en el swap de un full refresh: solo
+    se refrescan si quedaron sin datos (falló el REFRESH posterior al swap).
+    Devuelve {vista: segundos}.
+    """
+    names = list(matviews.VIEWS) if tables is None else matviews.for_tables(tables)
+    swapped = matviews.for_tables(rebuilt or ())
+    names = [n for n in names if n not in swapped]
+    if not names and not swapped:
+        return {}
+    conn = _pg()
+    try:
+        durations = matviews.refresh(conn, swapped, unpopulated_only=True)
+        durations.update(matviews.refresh(conn, names))
+        return durations
+    finally:
+        _release(conn)
+
+
+@activity.defn(name="export_snapshots")
+@_dw_limited
+def export_snapshots(full: bool = False) -> Dict[str, Dict[str, int]]:
+    """
+    Exporta a Parquet en ETL_EXPORT_DIR (snapshots.py) las dimensiones y los días de hechos
+    que cambiaron desde el export anterior; `full` reescribe todos (después de un swap).
+    Sin ETL_EXPORT_DIR o sin pyarrow no hace nada.
+    """
+    if not snapshots.EXPORT_DIR:
+        return {}
+    if not snapshots.HAS_PYARROW:
+        logger.warning("ETL_EXPORT_DIR configurado pero pyarrow no está instalado, se omite el export a Parquet")
+        return {}
+    conn = _pg()
+    try:
+        return snapshots.export(conn, snapshots.EXPORT_DIR, full=full)
+    finally:
+        _release(conn)
+
 
 # ========== INCREMENTAL ETL ==========
 @activity.defn(name="extract_incremental_dimensions")
@@ -1279,75 +1093,42 @@ async def extract_incremental_dimensions(since: str | None, page_size: int = 250
     else:
         since_users = since_chats = since_members = datetime(1970, 1, 1)
 
-    users: List[Dict[str, Any]] = []
-    chats: List[Dict[str, Any]] = []
     members: List[Dict[str, Any]] = []
 
-    async with httpx.AsyncClient(timeout=30) as client:
+    async def chat_members(cid: int) -> List[Dict[str, Any]]:
+        url = f"{API_BASE_URL}/chats/{cid}/members"
+        try:
+            return await _fetch_items(client, url, page_size, {"since": since_members.isoformat()})
+        except Exception:
+            # Fallback: sin filtro
+            return await _fetch_items(client, url, page_size)
+
+    async with http_client.client() as client:
         # ---- USERS ----
-        page = 1
-        while True:
-            try:
-                r = await client.get(f"{API_BASE_URL}/users", params={"page_size": page_size, "page": page, "since": since_users.isoformat()})
-                r.raise_for_status()
-            except Exception:
-                # Fallback: extracción completa
-                users = await extract_users(page_size)
-                break
-            data = r.json()
-            users.extend(data.get("items", []))
-            if page >= data.get("total_pages", 1):
-                break
-            page += 1
-            activity.heartbeat()
+        try:
+            users = await _fetch_items(client, f"{API_BASE_URL}/users", page_size, {"since": since_users.isoformat()})
+        except Exception:
+            # Fallback: extracción completa
+            users = await _extract_users(page_size)
 
         # ---- CHATS ----
-        page = 1
-        while True:
-            try:
-                r = await client.get(f"{API_BASE_URL}/chats", params={"page_size": page_size, "page": page, "since": since_chats.isoformat()})
-                r.raise_for_status()
-            except Exception:
-                # Fallback: extracción completa
-                full_chats, full_members = await extract_chats_and_members(page_size)
-                chats = full_chats
-                members = full_members
-                break
-            data = r.json()
-            chats.extend(data.get("items", []))
-            if page >= data.get("total_pages", 1):
-                break
-            page += 1
-            activity.heartbeat()
+        try:
+            chats = await _fetch_items(client, f"{API_BASE_URL}/chats", page_size, {"since": since_chats.isoformat()})
+        except Exception:
+            # Fallback: extracción completa
+            chats, members = await _extract_chats_and_members(page_size)
 
         # ---- MEMBERS ----
         if not members:  # si no vino por fallback anterior
-            for c in chats:
-                cid = c["id"]
-                page = 1
-                while True:
-                    try:
-                        r = await client.get(
-                            f"{API_BASE_URL}/chats/{cid}/members",
-                            params={"page_size": page_size, "page": page, "since": since_members.isoformat()},
-                        )
-                        r.raise_for_status()
-                    except Exception:
-                        # Fallback: sin filtro
-                        r = await client.get(
-                            f"{API_BASE_URL}/chats/{cid}/members",
-                            params={"page": page, "page_size": page_size},
-                        )
-                        r.raise_for_status()
-                    data = r.json()
-                    members.extend(data.get("items", []))
-                    if page >= data.get("total_pages", 1):
-                        break
-                    page += 1
-                    activity.heartbeat()
+            per_chat = await map_bounded(lambda c: chat_members(c["id"]), chats)
+            members = [m for items in per_chat for m in items]
 
     logger.info(f"Extracted incremental: {len(users)} users, {len(chats)} chats, {len(members)} members")
-    return _to_json_safe(users), _to_json_safe(chats), _to_json_safe(members)
+    return (
+        await asyncio.to_thread(staging.put_rows, "users", _to_json_safe(users)),
+        await asyncio.to_thread(staging.put_rows, "chats", _to_json_safe(chats)),
+        await asyncio.to_thread(staging.put_rows, "members", _to_json_safe(members)),
+    )
 
 
 @activity.defn(name="plan_incremental_message_pages")
@@ -1367,34 +1148,38 @@ async def plan_incremental_message_pages(since: str | None, page_size: int = 250
         since_dt = datetime(1970, 1, 1)
 
     # Trae chats (sin necesidad de members)
-    chats, _members = await extract_chats_and_members(page_size)
+    chats, _members = await _extract_chats_and_members(page_size)
     pages: List[Dict[str, Any]] = []
 
-    async with httpx.AsyncClient(timeout=30) as client:
-        for c in chats:
-            cid = c["id"]
-            # Intentamos pedir meta con filtro 'since'
-            params = {"page": 1, "page_size": 1, "since": since_dt.isoformat()}
-            try:
-                r = await client.get(f"{API_BASE_URL}/chats/{cid}/messages", params=params)
-                r.raise_for_status()
-                total_pages = int(r.json().get("total_pages", 1))
-            except Exception:
-                # Fallback: sin filtro
-                r = await client.get(f"{API_BASE_URL}/chats/{cid}/messages", params={"page": 1, "page_size": 1})
-                r.raise_for_status()
-                total_pages = int(r.json().get("total_pages", 1))
-
-            for p in range(1, total_pages + 1):
-                pages.append({"chat_id": cid, "page": p})
-            activity.heartbeat()
+    async def chat_total_pages(cid: int) -> int:
+        # Intentamos pedir meta con filtro 'since'
+        params = {"page": 1, "page_size": 1, "since": since_dt.isoformat()}
+        try:
+            r = await _api_get(client, f"{API_BASE_URL}/chats/{cid}/messages", params=params)
+            r.raise_for_status()
+        except Exception:
+            # Fallback: sin filtro
+            r = await _api_get(client, f"{API_BASE_URL}/chats/{cid}/messages", params={"page": 1, "page_size": 1})
+            r.raise_for_status()
+        activity.heartbeat()
+        return int(r.json().get("total_pages", 1))
+
+    async with http_client.client() as client:
+        # Meta de varios chats en paralelo (acotado)
+        chat_ids = [c["id"] for c in chats]
+        totals = await map_bounded(chat_total_pages, chat_ids)
+
+    for cid, total_pages in zip(chat_ids, totals):
+        for p in range(1, total_pages + 1):
+            pages.append({"chat_id": cid, "page": p})
 
     logger.info(f"Planned {len(pages)} message pages for incremental ETL")
     return _to_json_safe(pages)
 
 
 @activity.defn(name="update_watermark")
-async def update_watermark(entity: str, ts_iso: str) -> None:
+@_dw_limited
+def update_watermark(entity: str, ts_iso: str) -> None:
     """
     Persiste un watermark específico por entidad para reusarlo en corridas incrementales.
     Entidades: 'users', 'chats', 'members', 'messages', 'bookings', 'booking_events'
@@ -1404,13 +1189,6 @@ async def update_watermark(entity: str, ts_iso: str) -> None:
     conn.autocommit = False
     try:
         with conn.cursor() as cur:
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS etl_watermarks(
-                    key TEXT PRIMARY KEY,
-                    value TIMESTAMPTZ NOT NULL,
-                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
             cur.execute("""
                 INSERT INTO etl_watermarks(key, value)
                 VALUES (%s, %s)
@@ -1425,18 +1203,117 @@ async def update_watermark(entity: str, ts_iso: str) -> None:
         logger.error(f"Error updating watermark for {entity}: {e}", exc_info=True)
         raise
     finally:
-        conn.close()
+        _release(conn)
 
 
 # ---------- Helpers internos para watermark ----------
-async def _get_watermark(key: str) -> datetime | None:
+@_dw_limited
+def _get_watermark(key: str) -> datetime | None:
     """Obtiene el watermark para una entidad específica."""
     conn = _pg()
     try:
         with conn.cursor() as cur:
-            cur.execute("CREATE TABLE IF NOT EXISTS etl_watermarks(key TEXT PRIMARY KEY, value TIMESTAMPTZ NOT NULL, updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW());")
             cur.execute("SELECT value FROM etl_watermarks WHERE key = %s;", (key,))
             row = cur.fetchone()
             return row[0] if row else None
     finally:
-        conn.close()
\ No newline at end of file
+        _release(conn)
+
+
+# ---------- Outbox (CDC) ----------
+@_dw_limited
+def _outbox_offset(consumer: str) -> int:
+    conn = _pg()
+    try:
+        return cdc.get_offset(conn, consumer)
+    finally:
+        _release(conn)
+
+
+@_dw_limited
+def _held_tables() -> List[str]:
+    conn = _pg()
+    try:
+        return shadow_tables.held(conn)
+    finally:
+        _release(conn)
+
+
+@_dw_limited
+def _commit_outbox(consumer: str, missing: Dict[str, List[Tuple[Any, ...]]], last_id: int) -> int:
+    conn = _pg()
+    conn.autocommit = False
+    try:
+        return cdc.apply_deletes_and_offset(conn, consumer, missing, last_id)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        _release(conn)
+
+
+@activity.defn(name="consume_outbox")
+async def consume_outbox(consumer: str = "warehouse", batch_size: int = 5000) -> Dict[str, Any]:
+    """
+    Consume el outbox de la base OLTP en orden de id desde el offset de `consumer`.
+    Las claves cambiadas se releen de OLTP y pasan por los mismos transform/load (upsert);
+    las que ya no existen se borran del warehouse. El offset avanza después de cargar,
+    así un reintento re-aplica el lote (at-least-once sobre cargas idempotentes).
+    Mientras un full refresh con sombras retiene tablas de hechos no se aplica nada: devuelve
+    "held" y caught_up, y el workflow vuelve a consultar después de poll_seconds.
+    """
+    after = await _outbox_offset(consumer)
+    idle = {"consumed": 0, "last_id": after, "caught_up": True, "loaded": {}, "deleted": 0, "quarantined": 0}
+    # Un full refresh con sombras retiene sus tablas vivas: se espera al swap sin leer el lote
+    held = await _held_tables()
+    if held:
+        logger.info(f"Outbox {consumer}: {', '.join(held)} in shadow refresh, waiting for the swap")
+        return {**idle, "held": held}
+    batch = await run_in_db_thread(cdc.read_changes, after, batch_size)
+    if not batch["consumed"]:
+        return idle
+
+    try:
+        current = {entity: _to_json_safe(rows) for entity, rows in batch["current"].items()}
+        loaded: Dict[str, int] = {}
+
+        users = await transform_users(current.get("users", []))
+        chats, members = await transform_chats_members(current.get("chats", []), current.get("members", []))
+        if users or chats or members:
+            await load_dimensions(users, chats, members)
+            loaded.update(users=len(users), chats=len(chats), members=len(members))
+        quarantined = 0
+
+        async def load_facts(entity: str, recs: List[Any], cls: type, row_args: Tuple[Any, ...], page_size: int) -> None:
+            nonlocal quarantined
+            stats = await _load_facts_limited(entity, recs, cls, row_args, page_size)
+            loaded[entity] = loaded.get(entity, 0) + stats["loaded"]
+            quarantined += stats["quarantined"]
+
+        if current.get("messages"):
+            await load_facts("messages", await transform_messages(current["messages"]), MessageRecord, (), 5000)
+        if current.get("reactions"):
+            by_chat: Dict[int, List[Dict[str, Any]]] = {}
+            for r in current["reactions"]:
+                by_chat.setdefault(r["chat_id"], []).append(r)
+            for chat_id, recs in by_chat.items():
+                await load_facts("reactions", await transform_reactions(recs), ReactionRecord, (chat_id,), 5000)
+        if current.get("bookings"):
+            await load_facts("bookings", await transform_bookings(current["bookings"]), BookingRecord, (), 2000)
+        if current.get("booking_events"):
+            await load_facts("booking_events", await transform_booking_events(current["booking_events"]), BookingEventRecord, (), 3000)
+
+        deleted = await _commit_outbox(consumer, batch["missing"], batch["last_id"])
+    except loader.LiveTableHeld as e:
+        # El refresh empezó a mitad del lote: el offset no avanza y el lote se repite después del swap
+        logger.info(f"Outbox {consumer}: {e}; batch after id {after} will be replayed after the swap")
+        return {**idle, "held": await _held_tables()}
+    logger.info(f"Outbox {consumer}: applied {batch['consumed']} changes up to id {batch['last_id']} (loaded={loaded}, deleted={deleted}, quarantined={quarantined})")
+    return {
+        "consumed": batch["consumed"],
+        "last_id": batch["last_id"],
+        "caught_up": batch["consumed"] < batch_size,
+        "loaded": loaded,
+        "deleted": deleted,
+        "quarantined": quarantined,
+    }
@@ -0,0 +1,224 @@
+from __future__ import annotations
+import os
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+import psycopg2.extras
+from prometheus_client import Counter, Gauge
+
+from app.temporal import loader, oltp, rollups, snapshots
+
+# Consumidor del outbox transaccional (`etl_outbox`, ver app/utils/outbox.py): el API
+# agrega la clave de cada fila escrita en la misma transacción y el ETL lo lee en
+# orden de id desde un offset guardado en el warehouse. Así el incremental ve
+# ediciones, cambios de status y borrados, y solo lee las claves que cambiaron.
+logger = logging.getLogger(__name__)
+
+# Solo se consumen filas con al menos esta antigüedad: ids de transacciones que
+# confirman fuera de orden (un id menor que aparece después) tienen tiempo de aparecer
+OUTBOX_SETTLE_SECONDS = float(os.getenv("ETL_OUTBOX_SETTLE_SECONDS", "5"))
+
+# Por entidad, en orden de claves foráneas del warehouse:
+# - key: (nombre en el outbox, expresión SQL en OLTP, tipo de Postgres) por columna de la clave
+# - select: estado actual en OLTP (mismas columnas que el API / oltp.QUERIES)
+# - dw: (tabla, columnas de la clave) para borrar en el warehouse
+# - cascade: (tabla hija, columna, "delete" | "set_null") entre tablas de hechos; las tablas
+#   particionadas no tienen FKs entre sí, así que el ON DELETE se aplica aquí
+ENTITIES: Dict[str, Dict[str, Any]] = {
+    "users": {
+        "key": (("id", "id", "int"),),
+        "select": "SELECT id, handle, display_name, created_at FROM users",
+        "dw": ("dim_users", ("user_id",)),
+    },
+    "chats": {
+        "key": (("id", "id", "int"),),
+        "select": "SELECT id, type::text AS type, title, created_at FROM chats",
+        "dw": ("dim_chats", ("chat_id",)),
+    },
+    "members": {
+        "key": (("chat_id", "chat_id", "int"), ("user_id", "user_id", "int")),
+        "select": "SELECT chat_id, user_id, role, joined_at FROM chat_members",
+        "dw": ("bridge_chat_members", ("chat_id", "user_id")),
+    },
+    "messages": {
+        "key": (("id", "id", "int"),),
+        "select": "SELECT id, chat_id, sender_id, body, created_at, edited_at, reply_to_id FROM messages",
+        "dw": ("fact_messages", ("message_id",)),
+        "cascade": (("fact_reactions", "message_id", "delete"), ("fact_bookings", "message_id", "set_null")),
+    },
+    "reactions": {
+        "key": (("message_id", "r.message_id", "int"), ("user_id", "r.user_id", "int"), ("emoji", "r.emoji", "text")),
+        "select": (
+            "SELECT r.message_id, r.user_id, r.emoji, r.created_at, m.chat_id "
+            "FROM reactions r JOIN messages m ON m.id = r.message_id"
+        ),
+        "dw": ("fact_reactions", ("message_id", "user_id", "emoji")),
+    },
+    "bookings": {
+        "key": (("id", "id", "int"),),
+        "select": (
+            "SELECT id, message_id, user_id, chat_id, booking_type, booking_date, status, created_at "
+            "FROM bookings"
+        ),
+        "dw": ("fact_bookings", ("booking_id",)),
+        "cascade": (("fact_booking_events", "booking_id", "delete"),),
+    },
+    "booking_events": {
+        "key": (("id", "id", "int"),),
+        "select": "SELECT id, booking_id, event_type, created_at FROM booking_events",
+        "dw": ("fact_booking_events", ("event_id",)),
+    },
+}
+
+Key = Tuple[Any, ...]
+
+# Métricas de Prometheus del consumidor de outbox
+outbox_changes_total = Counter(
+    'etl_outbox_changes_total',
+    'Outbox change records consumed by the ETL',
+    ['entity', 'result'],
+)
+
+outbox_offset = Gauge(
+    'etl_outbox_offset',
+    'Last outbox id applied to the warehouse',
+    ['consumer'],
+)
+
+
+def _key_filter(entity: str, columns: Sequence[str], keys: List[Key]) -> Tuple[str, List[List[Any]]]:
+    """`(c1, c2) IN (SELECT * FROM unnest(%s::int[], %s::int[]))` con un array por columna."""
+    types = [t for _, _, t in ENTITIES[entity]["key"]]
+    arrays = ", ".join(f"%s::{t}[]" for t in types)
+    sql = f"({', '.join(columns)}) IN (SELECT * FROM unnest({arrays}))"
+    return sql, [list(col) for col in zip(*keys)]
+
+
+def _key_of(entity: str, record: Dict[str, Any]) -> Key:
+    return tuple(record[name] for name, _, _ in ENTITIES[entity]["key"])
+
+
+def read_changes(after_id: int, limit: int) -> Dict[str, Any]:
+    """
+    Lee hasta `limit` cambios con id > `after_id` y el estado actual de sus claves, todo en
+    el mismo snapshot de la base OLTP. Devuelve:
+      {"consumed", "last_id", "current": {entity: filas}, "missing": {entity: claves borradas}}
+    Varias ediciones de la misma fila en el lote se leen una sola vez.
+    """
+    conn = oltp.connect()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute(
+                """
+                SELECT id, entity, key FROM etl_outbox
+                WHERE id > %s AND created_at <= now() - make_interval(secs => %s)
+                ORDER BY id LIMIT %s
+                """,
+                (after_id, OUTBOX_SETTLE_SECONDS, limit),
+            )
+            changes = cur.fetchall()
+
+            wanted: Dict[str, Dict[Key, None]] = {entity: {} for entity in ENTITIES}
+            for change in changes:
+                entity = change["entity"]
+                if entity not in ENTITIES:
+                    logger.warning(f"Outbox {change['id']}: entidad desconocida {entity}, se omite")
+                    continue
+                wanted[entity][_key_of(entity, change["key"])] = None
+
+            current: Dict[str, List[Dict[str, Any]]] = {}
+            missing: Dict[str, List[Key]] = {}
+            for entity, keys in wanted.items():
+                if not keys:
+                    continue
+                spec = ENTITIES[entity]
+                where, params = _key_filter(entity, [expr for _, expr, _ in spec["key"]], list(keys))
+                cur.execute(f"{spec['select']} WHERE {where}", params)
+                rows = [dict(r) for r in cur.fetchall()]
+                found = {_key_of(entity, r) for r in rows}
+                current[entity] = rows
+                missing[entity] = [k for k in keys if k not in found]
+                outbox_changes_total.labels(entity=entity, result="upsert").inc(len(rows))
+                outbox_changes_total.labels(entity=entity, result="delete").inc(len(missing[entity]))
+    finally:
+        oltp.close(conn)
+
+    last_id = changes[-1]["id"] if changes else after_id
+    logger.info(f"Outbox: {len(changes)} changes after id {after_id} (last_id={last_id})")
+    return {"consumed": len(changes), "last_id": last_id, "current": current, "missing": missing}
+
+
+def get_offset(conn, consumer: str) -> int:
+    """Último id del outbox aplicado por `consumer` (0 si nunca consumió)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT last_id FROM etl_outbox_offsets WHERE consumer = %s;", (consumer,))
+        row = cur.fetchone()
+    conn.commit()
+    return int(row[0]) if row else 0
+
+
+def _write(cur, table: str, statement: str, where: str, params: Any) -> int:
+    """
+    DELETE/UPDATE (`statement` ... WHERE `where`) sobre `table` que además recalcula los grupos
+    de sus rollups que tenían las filas afectadas y deja sus días pendientes del export a
+    Parquet. Los locks de esos grupos se toman antes de escribir, leyendo sus scopes.
+    """
+    scope = rollups.scope_columns(table)
+    if scope and rollups.ENABLED:
+        cur.execute(f"SELECT {', '.join(scope)} FROM {table} WHERE {where}", params)
+        rollups.lock(cur, table, scope, cur.fetchall())
+    if table in snapshots.FACTS and snapshots.PARTITION_COLUMN not in scope:
+        scope.append(snapshots.PARTITION_COLUMN)
+    returning = f" RETURNING {', '.join(scope)}" if scope else ""
+    cur.execute(f"{statement} WHERE {where}{returning}", params)
+    if not scope:
+        return cur.rowcount
+    touched = cur.fetchall()
+    rollups.refresh(cur, table, scope, touched)
+    snapshots.mark(cur, table, scope, touched)
+    return len(touched)
+
+
+def _delete(cur, table: str, where: str, params: Any) -> int:
+    return _write(cur, table, f"DELETE FROM {table}", where, params)
+
+
+def apply_deletes_and_offset(conn, consumer: str, missing: Dict[str, List[Key]], last_id: int) -> int:
+    """
+    Borra del warehouse las claves que ya no existen en OLTP y avanza el offset en la misma
+    transacción. Las tablas hijas se borran (o se les anula la referencia) primero, con los
+    mismos hooks de rollups y export que los borrados; el offset nunca retrocede.
+    LiveTableHeld (sin escribir nada) si alguna tabla a borrar está en un full refresh.
+    """
+    deleted = 0
+    tables = [
+        table
+        for entity, keys in missing.items() if keys
+        for table in [ENTITIES[entity]["dw"][0]] + [child for child, _, _ in ENTITIES[entity].get("cascade", ())]
+    ]
+    with conn.cursor() as cur:
+        if tables:
+            loader.check_live_write(cur, tables)
+        for entity in reversed(list(ENTITIES)):
+            keys = missing.get(entity)
+            if not keys:
+                continue
+            table, columns = ENTITIES[entity]["dw"]
+            ids = [k[0] for k in keys]
+            for child, column, action in ENTITIES[entity].get("cascade", ()):
+                if action == "delete":
+                    deleted += _delete(cur, child, f"{column} = ANY(%s::int[])", (ids,))
+                else:
+                    _write(cur, child, f"UPDATE {child} SET {column} = NULL", f"{column} = ANY(%s::int[])", (ids,))
+            where, params = _key_filter(entity, columns, [tuple(k) for k in keys])
+            deleted += _delete(cur, table, where, params)
+        cur.execute("""
+            INSERT INTO etl_outbox_offsets(consumer, last_id)
+            VALUES (%s, %s)
+            ON CONFLICT (consumer) DO UPDATE SET
+                last_id = GREATEST(etl_outbox_offsets.last_id, EXCLUDED.last_id),
+                updated_at = NOW();
+        """, (consumer, last_id))
+    conn.commit()
+    outbox_offset.labels(consumer=consumer).set(last_id)
+    return deleted
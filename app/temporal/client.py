@@ -0,0 +1,11 @@
+import os
+from temporalio.client import Client
+
+from app.temporal.codec import data_converter
+
+
+async def connect() -> Client:
+    """Conecta a Temporal con el data converter del ETL (orjson + compresión de payloads)."""
+    target = os.getenv("TEMPORAL_TARGET", "temporal:7233")
+    namespace = os.getenv("TEMPORAL_NAMESPACE", "default")
+    return await Client.connect(target, namespace=namespace, data_converter=data_converter())
@@ -0,0 +1,165 @@
+from __future__ import annotations
+import os
+import time
+import zlib
+import logging
+import dataclasses
+from typing import Any, List, Optional, Sequence, Type
+
+import orjson
+from prometheus_client import Counter, Histogram
+from temporalio.api.common.v1 import Payload
+from temporalio.converter import (
+    CompositePayloadConverter,
+    DataConverter,
+    DefaultPayloadConverter,
+    JSONPlainPayloadConverter,
+    PayloadCodec,
+    value_to_type,
+)
+
+try:  # zstd es opcional: si no está instalado se usa zlib
+    import zstandard
+except ImportError:  # pragma: no cover - depende del entorno
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Algoritmo: zlib | zstd | none. Los payloads menores a MIN_SIZE no se comprimen.
+PAYLOAD_CODEC = os.getenv("ETL_PAYLOAD_CODEC", "zlib").lower()
+PAYLOAD_COMPRESSION_LEVEL = int(os.getenv("ETL_PAYLOAD_COMPRESSION_LEVEL", "6"))
+PAYLOAD_MIN_SIZE = int(os.getenv("ETL_PAYLOAD_MIN_SIZE", "1024"))
+
+# Métricas de Prometheus para el codec
+payload_codec_seconds = Histogram(
+    'etl_payload_codec_seconds',
+    'Time spent encoding/decoding Temporal payloads',
+    ['op', 'algorithm'],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+payload_compression_ratio = Histogram(
+    'etl_payload_compression_ratio',
+    'Raw size / encoded size of compressed Temporal payloads',
+    ['algorithm'],
+    buckets=(1, 1.5, 2, 3, 4, 6, 8, 12, 16, 32),
+)
+
+payload_bytes_total = Counter(
+    'etl_payload_bytes_total',
+    'Bytes of Temporal payloads before and after the codec',
+    ['op', 'stage'],
+)
+
+
+class OrjsonPlainPayloadConverter(JSONPlainPayloadConverter):
+    """
+    'json/plain' serializado con orjson (mucho más rápido que json para listas de dicts).
+    Mantiene el mismo encoding, por lo que el historial sigue siendo legible por
+    otros SDKs y por el Temporal UI.
+    """
+
+    def to_payload(self, value: Any) -> Optional[Payload]:
+        try:
+            data = orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # Tipos que orjson no soporta: se delega al encoder avanzado de Temporal
+            return super().to_payload(value)
+        return Payload(metadata={"encoding": self.encoding.encode()}, data=data)
+
+    def from_payload(self, payload: Payload, type_hint: Optional[Type] = None) -> Any:
+        try:
+            obj = orjson.loads(payload.data)
+        except orjson.JSONDecodeError as err:
+            raise RuntimeError("Failed parsing") from err
+        if type_hint:
+            obj = value_to_type(type_hint, obj, self._custom_type_converters)
+        return obj
+
+
+class EtlPayloadConverter(CompositePayloadConverter):
+    """Converter por defecto de Temporal con 'json/plain' reemplazado por orjson."""
+
+    def __init__(self) -> None:
+        super().__init__(*(
+            OrjsonPlainPayloadConverter() if isinstance(c, JSONPlainPayloadConverter) else c
+            for c in DefaultPayloadConverter.default_encoding_payload_converters
+        ))
+
+
+class CompressionCodec(PayloadCodec):
+    """
+    Comprime cada payload completo (metadata + data) con zlib o zstd.
+    Decodifica cualquiera de los dos algoritmos y deja pasar payloads sin comprimir,
+    así que se puede activar/cambiar sin romper historiales existentes.
+    """
+
+    def __init__(self, algorithm: str = "zlib", level: int = 6, min_size: int = 1024) -> None:
+        if algorithm == "zstd" and zstandard is None:
+            logger.warning("zstandard no está instalado, usando zlib para los payloads")
+            algorithm = "zlib"
+        self.algorithm = algorithm
+        self.level = level
+        self.min_size = min_size
+        self._encoding = f"binary/{algorithm}".encode()
+
+    def _compress(self, data: bytes) -> bytes:
+        if self.algorithm == "zstd":
+            return zstandard.ZstdCompressor(level=self.level).compress(data)
+        return zlib.compress(data, self.level)
+
+    @staticmethod
+    def _decompress(encoding: bytes, data: bytes) -> bytes:
+        if encoding == b"binary/zstd":
+            if zstandard is None:
+                raise RuntimeError("Payload comprimido con zstd pero zstandard no está instalado")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    async def encode(self, payloads: Sequence[Payload]) -> List[Payload]:
+        start = time.perf_counter()
+        out: List[Payload] = []
+        for p in payloads:
+            raw = p.SerializeToString()
+            payload_bytes_total.labels(op="encode", stage="raw").inc(len(raw))
+            if len(raw) < self.min_size:
+                out.append(p)
+                payload_bytes_total.labels(op="encode", stage="encoded").inc(len(raw))
+                continue
+            compressed = self._compress(raw)
+            if len(compressed) >= len(raw):
+                out.append(p)
+                payload_bytes_total.labels(op="encode", stage="encoded").inc(len(raw))
+                continue
+            payload_compression_ratio.labels(algorithm=self.algorithm).observe(len(raw) / len(compressed))
+            payload_bytes_total.labels(op="encode", stage="encoded").inc(len(compressed))
+            out.append(Payload(metadata={"encoding": self._encoding}, data=compressed))
+        payload_codec_seconds.labels(op="encode", algorithm=self.algorithm).observe(time.perf_counter() - start)
+        return out
+
+    async def decode(self, payloads: Sequence[Payload]) -> List[Payload]:
+        start = time.perf_counter()
+        out: List[Payload] = []
+        for p in payloads:
+            encoding = p.metadata.get("encoding", b"")
+            if encoding not in (b"binary/zlib", b"binary/zstd"):
+                out.append(p)
+                continue
+            payload_bytes_total.labels(op="decode", stage="encoded").inc(len(p.data))
+            raw = self._decompress(encoding, p.data)
+            payload_bytes_total.labels(op="decode", stage="raw").inc(len(raw))
+            out.append(Payload.FromString(raw))
+        payload_codec_seconds.labels(op="decode", algorithm=self.algorithm).observe(time.perf_counter() - start)
+        return out
+
+
+def data_converter() -> DataConverter:
+    """DataConverter compartido por el worker y el cliente del API (ambos deben coincidir)."""
+    codec = None
+    if PAYLOAD_CODEC != "none":
+        codec = CompressionCodec(PAYLOAD_CODEC, PAYLOAD_COMPRESSION_LEVEL, PAYLOAD_MIN_SIZE)
+    return dataclasses.replace(
+        DataConverter.default,
+        payload_converter_class=EtlPayloadConverter,
+        payload_codec=codec,
+    )
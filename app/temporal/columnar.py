@@ -0,0 +1,201 @@
+from __future__ import annotations
+import os
+import logging
+import warnings
+from itertools import compress
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from app.temporal import records
+
+try:  # NumPy es opcional: sin él los pipelines usan los registros fila a fila (records.py)
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+# Transformación columnar por lote: cada columna del lote es un array y los timestamps
+# ISO se parsean de una sola vez (datetime64), igual que created_day / created_hour /
+# message_length y las validaciones (máscaras). El resultado es un ColumnBatch con las
+# columnas en el orden de la tabla del warehouse, que el loader consume directamente.
+logger = logging.getLogger(__name__)
+
+HAS_NUMPY = np is not None
+# Apagado por default: el loader necesita filas (ColumnBatch.rows) y con el COPY incluido no
+# gana frente a los registros (etl/bench_transform.py). auto: columnar si NumPy está instalado;
+# true lo fuerza (sin NumPy avisa y usa filas)
+COLUMNAR = os.getenv("ETL_COLUMNAR", "false").lower()
+
+ENTITIES = ("messages", "reactions", "bookings", "booking_events")
+
+
+def enabled() -> bool:
+    """True si los pipelines deben usar la transformación columnar."""
+    if COLUMNAR in ("0", "false", "no"):
+        return False
+    if not HAS_NUMPY:
+        if COLUMNAR in ("1", "true", "yes"):
+            logger.warning("ETL_COLUMNAR activo pero NumPy no está instalado, usando registros por fila")
+        return False
+    return True
+
+
+class ColumnBatch:
+    """
+    Lote columnar listo para cargar: `columns[i]` es la columna `names[i]` de la tabla
+    del warehouse (arrays de NumPy o listas de Python, ya filtradas por la máscara).
+    """
+    __slots__ = ("entity", "names", "columns")
+
+    def __init__(self, entity: str, names: Sequence[str], columns: Sequence[Any]) -> None:
+        self.entity = entity
+        self.names = tuple(names)
+        self.columns = list(columns)
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def column(self, name: str) -> Any:
+        return self.columns[self.names.index(name)]
+
+    def rows(self) -> List[Tuple[Any, ...]]:
+        """Filas con tipos de Python (psycopg2 no adapta escalares de NumPy; NaT -> None)."""
+        cols = [c.tolist() if hasattr(c, "tolist") else c for c in self.columns]
+        return list(zip(*cols))
+
+
+def _get(items: Sequence[Dict[str, Any]], key: str) -> List[Any]:
+    return [it.get(key) for it in items]
+
+
+def _present(values: Sequence[Any]) -> "np.ndarray":
+    return np.fromiter((bool(v) for v in values), dtype=bool, count=len(values))
+
+
+def _naive_utc(value: Any) -> Any:
+    return records.to_utc(records.parse_ts(value))
+
+
+def _timestamps(values: Sequence[Any]) -> "np.ndarray":
+    """
+    Parsea una columna de timestamps a datetime64[us] en bloque (vacíos -> NaT).
+    Si algún valor no es ISO sin zona horaria se cae al parseo por valor, normalizado a UTC.
+    """
+    cleaned = [v if v else None for v in values]
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            return np.array(cleaned, dtype="datetime64[us]")
+    except (ValueError, TypeError, Warning):
+        return np.array([_naive_utc(v) for v in cleaned], dtype="datetime64[us]")
+
+
+def _day_hour(ts: "np.ndarray") -> Tuple["np.ndarray", "np.ndarray"]:
+    day = ts.astype("datetime64[D]")
+    hour = (ts - day).astype("timedelta64[h]").astype(np.int16)
+    return day, hour
+
+
+def _batch(entity: str, mask: "np.ndarray", total: int, columns: Dict[str, Any]) -> ColumnBatch:
+    dropped = total - int(mask.sum())
+    if dropped:
+        logger.warning(f"{dropped}/{total} {entity} descartados por validación")
+    out = []
+    for col in columns.values():
+        if isinstance(col, np.ndarray):
+            out.append(col[mask])
+        else:
+            out.append(list(compress(col, mask)))
+    logger.info(f"Transformed {total - dropped}/{total} {entity} (columnar)")
+    return ColumnBatch(entity, list(columns), out)
+
+
+def messages(items: Sequence[Dict[str, Any]]) -> ColumnBatch:
+    """Columnas de fact_messages. Descarta items sin id, chat_id o created_at."""
+    n = len(items)
+    ids = _get(items, "id")
+    chat_ids = _get(items, "chat_id")
+    created = _timestamps(_get(items, "created_at"))
+    bodies = [b or "" for b in _get(items, "body")]
+    mask = _present(ids) & _present(chat_ids) & ~np.isnat(created)
+    day, hour = _day_hour(created)
+    return _batch("messages", mask, n, {
+        "message_id": ids,
+        "chat_id": chat_ids,
+        "sender_id": _get(items, "sender_id"),
+        "body": bodies,
+        "message_length": np.fromiter(map(len, bodies), dtype=np.int32, count=n),
+        "created_at": created,
+        "created_day": day,
+        "created_hour": hour,
+        "edited_at": _timestamps(_get(items, "edited_at")),
+        "reply_to_id": _get(items, "reply_to_id"),
+    })
+
+
+def reactions(items: Sequence[Dict[str, Any]], chat_id: Optional[int] = None) -> ColumnBatch:
+    """Columnas de fact_reactions. Descarta items sin message_id, user_id, emoji o created_at."""
+    n = len(items)
+    message_ids = _get(items, "message_id")
+    user_ids = _get(items, "user_id")
+    emojis = [(e or "").strip() for e in _get(items, "emoji")]
+    created = _timestamps(_get(items, "created_at"))
+    mask = _present(message_ids) & _present(user_ids) & _present(emojis) & ~np.isnat(created)
+    day, hour = _day_hour(created)
+    chat_ids = [chat_id] * n if chat_id is not None else _get(items, "chat_id")
+    return _batch("reactions", mask, n, {
+        "message_id": message_ids,
+        "chat_id": chat_ids,
+        "user_id": user_ids,
+        "emoji": emojis,
+        "created_at": created,
+        "created_day": day,
+        "created_hour": hour,
+    })
+
+
+def bookings(items: Sequence[Dict[str, Any]]) -> ColumnBatch:
+    """Columnas de fact_bookings. Descarta items sin id, status o created_at."""
+    n = len(items)
+    ids = _get(items, "id")
+    statuses = _get(items, "status")
+    created = _timestamps(_get(items, "created_at"))
+    mask = _present(ids) & _present(statuses) & ~np.isnat(created)
+    day, hour = _day_hour(created)
+    return _batch("bookings", mask, n, {
+        "booking_id": ids,
+        "chat_id": _get(items, "chat_id"),
+        "user_id": _get(items, "user_id"),
+        "message_id": _get(items, "message_id"),
+        "booking_type": _get(items, "booking_type"),
+        "booking_date": _timestamps(_get(items, "booking_date")),
+        "status": statuses,
+        "created_at": created,
+        "created_day": day,
+        "created_hour": hour,
+    })
+
+
+def booking_events(items: Sequence[Dict[str, Any]]) -> ColumnBatch:
+    """Columnas de fact_booking_events. Descarta items sin id, booking_id, event_type o created_at."""
+    n = len(items)
+    ids = _get(items, "id")
+    booking_ids = _get(items, "booking_id")
+    event_types = _get(items, "event_type")
+    created = _timestamps(_get(items, "created_at"))
+    mask = _present(ids) & _present(booking_ids) & _present(event_types) & ~np.isnat(created)
+    day, hour = _day_hour(created)
+    return _batch("booking_events", mask, n, {
+        "event_id": ids,
+        "booking_id": booking_ids,
+        "event_type": event_types,
+        "created_at": created,
+        "created_day": day,
+        "created_hour": hour,
+    })
+
+
+TRANSFORMS: Dict[str, Callable[..., ColumnBatch]] = {
+    "messages": messages,
+    "reactions": reactions,
+    "bookings": bookings,
+    "booking_events": booking_events,
+}
@@ -0,0 +1,123 @@
+from __future__ import annotations
+import os
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional
+
+import httpx
+from prometheus_client import REGISTRY
+from prometheus_client.core import GaugeMetricFamily
+
+try:  # HTTP/2 es opcional: httpx lo necesita vía el paquete h2
+    import h2  # noqa: F401
+    _H2_AVAILABLE = True
+except ImportError:  # pragma: no cover - depende del entorno
+    _H2_AVAILABLE = False
+
+# Un único httpx.AsyncClient por proceso: todas las actividades reutilizan sus
+# conexiones keep-alive en lugar de abrir un pool (y un handshake TCP) por llamada.
+logger = logging.getLogger(__name__)
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("ETL_HTTP_MAX_CONNECTIONS", "100"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("ETL_HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("ETL_HTTP_KEEPALIVE_EXPIRY", "30"))
+HTTP_TIMEOUT = float(os.getenv("ETL_HTTP_TIMEOUT", "300"))  # lectura de páginas grandes
+HTTP_CONNECT_TIMEOUT = float(os.getenv("ETL_HTTP_CONNECT_TIMEOUT", "10"))
+HTTP2 = os.getenv("ETL_HTTP2", "false").lower() in ("1", "true", "yes")
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def _build() -> httpx.AsyncClient:
+    http2 = HTTP2
+    if http2 and not _H2_AVAILABLE:
+        logger.warning("ETL_HTTP2 activo pero h2 no está instalado, usando HTTP/1.1")
+        http2 = False
+    logger.info(
+        f"HTTP client pool: max_connections={HTTP_MAX_CONNECTIONS} "
+        f"keepalive={HTTP_MAX_KEEPALIVE} http2={http2}"
+    )
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(HTTP_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+        limits=httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        ),
+        http2=http2,
+    )
+
+
+async def start() -> httpx.AsyncClient:
+    """Crea el cliente compartido (al arrancar el worker). Idempotente."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build()
+    return _client
+
+
+async def close() -> None:
+    """Cierra el cliente compartido (al apagar el worker)."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """
+    Devuelve el cliente compartido. Si el worker no lo creó (tests, scripts),
+    se crea de forma perezosa con la misma configuración.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = _build()
+    return _client
+
+
+@asynccontextmanager
+async def client() -> AsyncIterator[httpx.AsyncClient]:
+    """
+    Reemplazo de `async with httpx.AsyncClient() as client:` que entrega el cliente
+    compartido y NO lo cierra al salir.
+    """
+    yield get_client()
+
+
+class _PoolCollector:
+    """Exporta la utilización del pool de conexiones del cliente compartido al momento del scrape."""
+
+    def collect(self):
+        connections = GaugeMetricFamily(
+            'etl_http_pool_connections',
+            'Connections in the shared HTTP client pool',
+            labels=['state'],
+        )
+        waiting = GaugeMetricFamily(
+            'etl_http_pool_waiting_requests',
+            'Requests queued in the shared HTTP client pool waiting for a connection',
+        )
+        max_conn = GaugeMetricFamily(
+            'etl_http_pool_max_connections',
+            'Configured connection limit of the shared HTTP client pool',
+        )
+        max_conn.add_metric([], HTTP_MAX_CONNECTIONS)
+        active = idle = queued = 0
+        # Atributos internos de httpcore: si cambian, se reportan ceros en vez de fallar el scrape
+        pool = getattr(getattr(_client, "_transport", None), "_pool", None)
+        if pool is not None:
+            for conn in list(getattr(pool, "connections", [])):
+                if conn.is_idle():
+                    idle += 1
+                else:
+                    active += 1
+            queued = sum(1 for r in list(getattr(pool, "_requests", [])) if r.connection is None)
+        connections.add_metric(['active'], active)
+        connections.add_metric(['idle'], idle)
+        waiting.add_metric([], queued)
+        yield connections
+        yield waiting
+        yield max_conn
+
+
+REGISTRY.register(_PoolCollector())
@@ -0,0 +1,191 @@
+from __future__ import annotations
+import os
+import time
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Optional
+
+import httpx
+import psycopg2
+from prometheus_client import Counter, Gauge, Histogram
+
+logger = logging.getLogger(__name__)
+
+# Métricas de Prometheus para los limitadores
+limiter_limit = Gauge(
+    'etl_limiter_limit',
+    'Current concurrency limit of the adaptive limiter',
+    ['name']
+)
+
+limiter_inflight = Gauge(
+    'etl_limiter_inflight',
+    'Operations currently holding a limiter slot',
+    ['name']
+)
+
+limiter_wait_seconds = Histogram(
+    'etl_limiter_wait_seconds',
+    'Time spent waiting for a limiter slot',
+    ['name'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60),
+)
+
+limiter_overload_total = Counter(
+    'etl_limiter_overload_total',
+    'Operations flagged as overload (429/5xx, connection errors, high latency)',
+    ['name', 'reason']
+)
+
+
+class _Slot:
+    """Permiso adquirido. Permite marcar la operación como sobrecarga (p.ej. HTTP 429)."""
+
+    __slots__ = ("overloaded", "failed", "reason")
+
+    def __init__(self) -> None:
+        self.overloaded = False
+        self.failed = False
+        self.reason = ""
+
+    def overload(self, reason: str) -> None:
+        self.overloaded = True
+        self.reason = reason
+
+
+class AdaptiveLimiter:
+    """
+    Limitador de concurrencia AIMD compartido por todas las actividades del proceso.
+
+    - Incremento aditivo: +`increase` por cada ventana de `limit` operaciones exitosas
+      con latencia menor a `target_latency`.
+    - Decremento multiplicativo: `limit *= backoff` ante sobrecarga (429/5xx, errores de
+      conexión o latencia alta). Como mucho una vez por `cooldown` segundos, para que una
+      ráfaga de fallos simultáneos no colapse el límite al mínimo.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial: int,
+        min_limit: int,
+        max_limit: int,
+        target_latency: float,
+        is_overload: Optional[Callable[[BaseException], bool]] = None,
+        increase: float = 1.0,
+        backoff: float = 0.5,
+        cooldown: Optional[float] = None,
+    ) -> None:
+        self.name = name
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.target_latency = target_latency
+        self.increase = increase
+        self.backoff = backoff
+        self.cooldown = target_latency if cooldown is None else cooldown
+        self._is_overload = is_overload or (lambda e: False)
+        self._inflight = 0
+        self._last_decrease = 0.0
+        # La Condition se crea dentro del loop que la usa (los limitadores de proceso se
+        # construyen al importar el módulo, antes de que exista el loop del worker)
+        self._cond: Optional[asyncio.Condition] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        limiter_limit.labels(name=name).set(self.limit)
+
+    @property
+    def inflight(self) -> int:
+        return self._inflight
+
+    def _condition(self) -> asyncio.Condition:
+        """Condition del loop en curso; se recrea si el limitador pasa a otro loop (tests, asyncio.run)."""
+        loop = asyncio.get_running_loop()
+        if self._cond is None or self._loop is not loop:
+            self._cond = asyncio.Condition()
+            self._loop = loop
+            self._inflight = 0  # los permisos del loop anterior no se van a devolver en este
+        return self._cond
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[_Slot]:
+        """Adquiere un permiso; al salir ajusta el límite según latencia y errores."""
+        wait_start = time.perf_counter()
+        cond = self._condition()
+        async with cond:
+            await cond.wait_for(lambda: self._inflight < int(self.limit))
+            self._inflight += 1
+        limiter_wait_seconds.labels(name=self.name).observe(time.perf_counter() - wait_start)
+        limiter_inflight.labels(name=self.name).set(self._inflight)
+
+        slot = _Slot()
+        start = time.perf_counter()
+        try:
+            yield slot
+        except BaseException as e:
+            slot.failed = True
+            if self._is_overload(e):
+                slot.overload(type(e).__name__)
+            raise
+        finally:
+            self._feedback(slot, time.perf_counter() - start)
+            async with cond:
+                self._inflight -= 1
+                cond.notify_all()
+            limiter_inflight.labels(name=self.name).set(self._inflight)
+
+    def _feedback(self, slot: _Slot, latency: float) -> None:
+        if slot.overloaded:
+            self._decrease(slot.reason)
+        elif slot.failed:
+            return  # errores de datos/cancelaciones no dicen nada sobre la carga
+        elif latency > self.target_latency:
+            self._decrease("latency")
+        else:
+            self.limit = min(self.max_limit, self.limit + self.increase / self.limit)
+            limiter_limit.labels(name=self.name).set(self.limit)
+
+    def _decrease(self, reason: str) -> None:
+        limiter_overload_total.labels(name=self.name, reason=reason).inc()
+        now = time.monotonic()
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        previous = self.limit
+        self.limit = max(float(self.min_limit), self.limit * self.backoff)
+        limiter_limit.labels(name=self.name).set(self.limit)
+        logger.info(f"Limiter {self.name}: {reason}, limit {previous:.1f} -> {self.limit:.1f}")
+
+
+def _api_overload(e: BaseException) -> bool:
+    """Errores de transporte (conexión, timeouts) y 429/5xx cuentan como sobrecarga del API."""
+    if isinstance(e, httpx.TransportError):
+        return True
+    if isinstance(e, httpx.HTTPStatusError):
+        return e.response.status_code == 429 or e.response.status_code >= 500
+    return False
+
+
+def _dw_overload(e: BaseException) -> bool:
+    """Errores de conexión/recursos del warehouse (no errores de datos) cuentan como sobrecarga."""
+    return isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+# Limitadores de proceso: todas las actividades del worker comparten el mismo presupuesto
+API_LIMITER = AdaptiveLimiter(
+    "api",
+    initial=int(os.getenv("ETL_API_CONCURRENCY", "20")),
+    min_limit=int(os.getenv("ETL_API_CONCURRENCY_MIN", "2")),
+    max_limit=int(os.getenv("ETL_API_CONCURRENCY_MAX", "100")),
+    target_latency=float(os.getenv("ETL_API_TARGET_LATENCY", "2.0")),
+    is_overload=_api_overload,
+)
+
+DW_LIMITER = AdaptiveLimiter(
+    "warehouse",
+    initial=int(os.getenv("ETL_DW_CONCURRENCY", "4")),
+    min_limit=int(os.getenv("ETL_DW_CONCURRENCY_MIN", "1")),
+    max_limit=int(os.getenv("ETL_DW_CONCURRENCY_MAX", "16")),
+    target_latency=float(os.getenv("ETL_DW_TARGET_LATENCY", "15.0")),
+    is_overload=_dw_overload,
+)
@@ -0,0 +1,506 @@
+from __future__ import annotations
+import io
+import os
+import json
+import time
+import logging
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import psycopg2
+import psycopg2.extras
+from prometheus_client import Counter, Histogram
+
+from app.temporal import partitions, rollups, snapshots
+
+# Carga masiva al warehouse: las filas se envían con COPY a una tabla temporal y se
+# fusionan con un solo INSERT ... ON CONFLICT. Evita un round-trip y un plan por fila
+# (execute_batch). Ambos caminos (COPY o INSERT ... VALUES) solo reescriben las filas que
+# realmente cambiaron: una recarga completa sin cambios no genera WAL ni tuplas muertas.
+logger = logging.getLogger(__name__)
+
+# Tablas del warehouse: columnas en el orden de las filas que arman los load_*,
+# clave de conflicto y columnas que se actualizan si la fila ya existe. Las tablas de hechos
+# están particionadas por mes (partitions.py): su clave incluye created_day
+TABLES: Dict[str, Dict[str, Tuple[str, ...] | str]] = {
+    "users": {
+        "table": "dim_users",
+        "columns": ("user_id", "handle", "display_name", "created_at"),
+        "key": ("user_id",),
+        "update": ("handle", "display_name", "created_at"),
+    },
+    "chats": {
+        "table": "dim_chats",
+        "columns": ("chat_id", "type", "title", "created_at"),
+        "key": ("chat_id",),
+        "update": ("type", "title", "created_at"),
+    },
+    "members": {
+        "table": "bridge_chat_members",
+        "columns": ("chat_id", "user_id", "role", "joined_at"),
+        "key": ("chat_id", "user_id"),
+        "update": ("role", "joined_at"),
+    },
+    "messages": {
+        "table": "fact_messages",
+        "columns": (
+            "message_id", "chat_id", "sender_id", "body", "message_length",
+            "created_at", "created_day", "created_hour", "edited_at", "reply_to_id",
+        ),
+        "key": ("message_id", "created_day"),
+        "update": ("body", "message_length", "created_at", "created_hour", "edited_at", "reply_to_id"),
+    },
+    "reactions": {
+        "table": "fact_reactions",
+        "columns": ("message_id", "chat_id", "user_id", "emoji", "created_at", "created_day", "created_hour"),
+        "key": ("message_id", "user_id", "emoji", "created_day"),
+        "update": ("created_at", "created_hour"),
+    },
+    "bookings": {
+        "table": "fact_bookings",
+        "columns": (
+            "booking_id", "chat_id", "user_id", "message_id", "booking_type", "booking_date",
+            "status", "created_at", "created_day", "created_hour",
+        ),
+        "key": ("booking_id", "created_day"),
+        "update": ("booking_type", "booking_date", "status", "created_at", "created_hour"),
+    },
+    "booking_events": {
+        "table": "fact_booking_events",
+        "columns": ("event_id", "booking_id", "event_type", "created_at", "created_day", "created_hour"),
+        "key": ("event_id", "created_day"),
+        "update": ("booking_id", "event_type", "created_at", "created_hour"),
+    },
+}
+
+# Miembros inferidos (dimensiones que llegan tarde): si un hecho referencia un usuario o chat
+# que todavía no está en el warehouse, se inserta un stub `is_inferred` con estos valores en las
+# columnas no clave; la carga real de la dimensión lo sobrescribe (migración 4 de schema.py)
+INFERRED: Dict[str, Dict[str, str]] = {
+    "users": {"handle": "''", "display_name": "''", "created_at": "now()"},
+    "chats": {"type": "'unknown'", "title": "NULL", "created_at": "now()"},
+}
+
+# Claves foráneas de cada entidad hacia las dimensiones: (columna de la fila, dimensión)
+REFERENCES: Dict[str, Tuple[Tuple[str, str], ...]] = {
+    "members": (("chat_id", "chats"), ("user_id", "users")),
+    "messages": (("chat_id", "chats"), ("sender_id", "users")),
+    "reactions": (("chat_id", "chats"), ("user_id", "users")),
+    "bookings": (("chat_id", "chats"), ("user_id", "users")),
+}
+
+# Tipos de Postgres de las columnas de clave de los hechos sin created_day (ver move_keys)
+IDENTITY_TYPES: Dict[str, str] = {
+    "message_id": "int",
+    "user_id": "int",
+    "emoji": "text",
+    "booking_id": "int",
+    "event_id": "int",
+}
+
+# Entidades que cargan con COPY + merge: "all" (default), "none" o lista separada por comas
+COPY_ENTITIES = os.getenv("ETL_COPY_ENTITIES", "all").lower()
+
+SHADOW_SUFFIX = "__shadow"
+
+# Durante un full refresh con sombras (shadow.py) lo que se escriba en la tabla viva se pierde
+# con el DROP del swap. prepare registra las tablas en HOLDS_TABLE (migración 10) bajo el
+# advisory lock exclusivo, que espera a las escrituras en curso; cada escritura a una tabla
+# viva toma el lock compartido y falla con LiveTableHeld si su tabla está retenida (el CDC y
+# el incremental la repiten después del swap, que borra la retención).
+HOLDS_TABLE = "etl_shadow_holds"
+WRITE_LOCK_ID = 4_815_162_343
+
+# Filas que fallan solas (dato inválido, NOT NULL, FK) se aíslan partiendo el lote y se guardan
+# en esta tabla (migración 5) en lugar de revertir y reintentar el lote completo. Más de
+# ETL_QUARANTINE_MAX_ROWS filas malas en un lote no es una fila envenenada: el lote falla.
+QUARANTINE_TABLE = "etl_quarantine"
+QUARANTINE_MAX_ROWS = int(os.getenv("ETL_QUARANTINE_MAX_ROWS", "100"))
+
+# Errores atribuibles a los valores de una fila (el resto del lote se puede cargar igual)
+_ROW_ERRORS = (psycopg2.DataError, psycopg2.IntegrityError)
+
+# Métricas de Prometheus de la carga
+load_rows_total = Counter(
+    'etl_load_rows_total',
+    'Rows loaded into the warehouse by result (inserted, updated, unchanged, quarantined)',
+    ['entity', 'result'],
+)
+
+inferred_members_total = Counter(
+    'etl_inferred_members_total',
+    'Stub dimension rows inserted for facts that arrived before their dimension',
+    ['dimension'],
+)
+
+load_seconds = Histogram(
+    'etl_load_seconds',
+    'Time spent writing one batch to the warehouse',
+    ['entity', 'method'],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2, 5, 15, 60),
+)
+
+
+class LiveTableHeld(Exception):
+    """Escritura a una tabla viva que está en un full refresh con sombras: se repite después del swap."""
+
+
+def check_live_write(cur, tables: Iterable[str]) -> None:
+    """
+    Antes de escribir en `tables` (vivas) dentro de la transacción de `cur`: toma el advisory
+    lock compartido (hasta el commit) y falla con LiveTableHeld si alguna está retenida.
+    """
+    cur.execute(
+        f"SELECT pg_advisory_xact_lock_shared(%s); "
+        f"SELECT table_name, started_at FROM {HOLDS_TABLE} WHERE table_name = ANY(%s);",
+        (WRITE_LOCK_ID, sorted(set(tables))),
+    )
+    held = cur.fetchall()
+    if held:
+        raise LiveTableHeld(
+            ", ".join(f"{table} (desde {started:%Y-%m-%d %H:%M:%S})" for table, started in held)
+            + " en full refresh con tablas sombra"
+        )
+
+
+def shadow_table(table: str) -> str:
+    """Tabla sombra en la que un full refresh carga `table` antes del swap (shadow.py)."""
+    return f"{table}{SHADOW_SUFFIX}"
+
+
+def copy_enabled(entity: str) -> bool:
+    """True si `entity` carga con COPY + merge (ETL_COPY_ENTITIES)."""
+    if COPY_ENTITIES in ("all", "*", "true", "1"):
+        return True
+    if COPY_ENTITIES in ("", "none", "false", "0"):
+        return False
+    return entity in {e.strip() for e in COPY_ENTITIES.split(",")}
+
+
+_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
+
+
+def _copy_value(value: Any) -> str:
+    """Un valor en el formato text de COPY (NULL = \\N)."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, str):
+        return value.translate(_ESCAPES)
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+class _CopyStream(io.TextIOBase):
+    """Archivo de solo lectura que genera las líneas de COPY a medida que psycopg2 las pide."""
+
+    def __init__(self, rows: Iterable[Sequence[Any]]) -> None:
+        self._lines: Iterator[str] = ("\t".join(map(_copy_value, row)) + "\n" for row in rows)
+        self._buf = ""
+
+    def readable(self) -> bool:
+        return True
+
+    def read(self, size: Optional[int] = -1) -> str:
+        if size is None or size < 0:
+            out, self._buf = self._buf + "".join(self._lines), ""
+            return out
+        while len(self._buf) < size:
+            line = next(self._lines, None)
+            if line is None:
+                break
+            self._buf += line
+        out, self._buf = self._buf[:size], self._buf[size:]
+        return out
+
+    def readline(self, size: Optional[int] = -1) -> str:
+        if self._buf:
+            out, self._buf = self._buf, ""
+            return out
+        return next(self._lines, "")
+
+
+def _changed(update: Sequence[str]) -> str:
+    """Predicado del DO UPDATE: solo se reescribe la fila si alguna columna cambió."""
+    return (
+        f"({', '.join(f't.{c}' for c in update)}) "
+        f"IS DISTINCT FROM ({', '.join(f'EXCLUDED.{c}' for c in update)})"
+    )
+
+
+def _do_update(spec: Dict[str, Any], entity: str) -> str:
+    """SET ... WHERE del ON CONFLICT; en dimensiones con miembros inferidos la carga real reemplaza el stub."""
+    update = spec["update"]
+    sets = [f"{c} = EXCLUDED.{c}" for c in update]
+    where = _changed(update)
+    if entity in INFERRED:
+        sets.append("is_inferred = FALSE")
+        where = f"({where} OR t.is_inferred)"
+    return f"{', '.join(sets)} WHERE {where}"
+
+
+def _last_per_key(spec: Dict[str, Any], rows: Sequence[Sequence[Any]]) -> List[Sequence[Any]]:
+    """Una fila por clave (gana la última), como el DISTINCT ON del merge."""
+    key_idx = [spec["columns"].index(k) for k in spec["key"]]
+    by_key = {tuple(r[i] for i in key_idx): r for r in rows}
+    return list(by_key.values())
+
+
+def identity(entity: str) -> Tuple[str, ...]:
+    """Clave de la fila sin la columna de partición: única en la tabla aunque la PK incluya created_day."""
+    return tuple(k for k in TABLES[entity]["key"] if k != partitions.PARTITION_COLUMN)
+
+
+def move_keys(cur, entity: str, rows: Sequence[Sequence[Any]]) -> int:
+    """
+    Borra las filas de las claves del lote que están guardadas con otro created_day. La PK de
+    los hechos incluye la columna de partición, así que sin esto una fila cuyo día cambió se
+    insertaría como duplicado en otra partición en lugar de actualizarse. Los grupos de rollups
+    del día viejo se recalculan y el día queda pendiente del export. Devuelve las filas borradas.
+    """
+    spec = TABLES[entity]
+    ident = identity(entity)
+    if not rows or len(ident) == len(spec["key"]):
+        return 0
+    table, columns = spec["table"], spec["columns"]
+    idx = [columns.index(c) for c in ident + (partitions.PARTITION_COLUMN,)]
+    keys = sorted({tuple(r[i] for i in idx) for r in rows})
+    scope = rollups.scope_columns(table)
+    if partitions.PARTITION_COLUMN not in scope:
+        scope.append(partitions.PARTITION_COLUMN)
+    arrays = ", ".join(f"%s::{IDENTITY_TYPES[c]}[]" for c in ident)
+    cur.execute(f"""
+        DELETE FROM {table} t
+        USING unnest({arrays}, %s::date[]) AS v({", ".join(ident)}, new_day)
+        WHERE {" AND ".join(f"t.{c} = v.{c}" for c in ident)} AND t.created_day <> v.new_day
+        RETURNING {", ".join(f"t.{c}" for c in scope)}
+    """, [list(col) for col in zip(*keys)])
+    moved = cur.fetchall()
+    if moved:
+        rollups.refresh(cur, table, scope, moved)
+        snapshots.mark(cur, table, scope, moved)
+        logger.info(f"Moved {len(moved)} {entity} rows whose created_day changed")
+    return len(moved)
+
+
+def _counted(spec: Dict[str, Any], insert: str) -> str:
+    """
+    Envuelve un INSERT ... ON CONFLICT en una sentencia que devuelve (insertadas, actualizadas).
+    Postgres no deja leer xmax en el RETURNING de una tabla particionada: una fila devuelta cuya
+    clave ya estaba antes (la subconsulta ve el snapshot previo a la sentencia) es una actualización.
+    """
+    key = spec["key"]
+    existed = f"EXISTS (SELECT 1 FROM {spec['table']} e WHERE {' AND '.join(f'e.{k} = m.{k}' for k in key)})"
+    return f"""
+        WITH merged AS ({insert}
+            RETURNING {", ".join(key)}
+        )
+        SELECT count(*) FILTER (WHERE NOT {existed}), count(*) FILTER (WHERE {existed}) FROM merged m
+    """
+
+
+def _merge_sql(spec: Dict[str, Any], staging: str, entity: str) -> str:
+    table, cols, key = spec["table"], spec["columns"], spec["key"]
+    col_list = ", ".join(cols)
+    key_list = ", ".join(key)
+    return _counted(spec, f"""
+            INSERT INTO {table} AS t ({col_list})
+            SELECT DISTINCT ON ({key_list}) {col_list} FROM {staging}
+            ORDER BY {key_list}, ctid DESC
+            ON CONFLICT ({key_list}) DO UPDATE SET {_do_update(spec, entity)}""")
+
+
+def copy_merge(cur, entity: str, rows: Sequence[Sequence[Any]]) -> Dict[str, int]:
+    """
+    COPY de `rows` a una tabla temporal (se descarta al hacer commit) y merge en la tabla
+    del warehouse. Si una clave se repite en el lote gana la última fila. Las filas idénticas
+    a las existentes no se reescriben. Devuelve {"inserted", "updated", "unchanged"}.
+    """
+    spec = TABLES[entity]
+    staging = f"_stg_{spec['table']}"
+    cur.execute(
+        f"CREATE TEMP TABLE IF NOT EXISTS {staging} (LIKE {spec['table']} INCLUDING DEFAULTS) ON COMMIT DROP;"
+        f"TRUNCATE {staging};"
+    )
+    cur.copy_expert(
+        f"COPY {staging} ({', '.join(spec['columns'])}) FROM STDIN",
+        _CopyStream(rows),
+    )
+    cur.execute(_merge_sql(spec, staging, entity))
+    inserted, updated = cur.fetchone()
+    distinct = len(_last_per_key(spec, rows))
+    return {"inserted": inserted, "updated": updated, "unchanged": distinct - inserted - updated}
+
+
+def infer_missing(cur, entity: str, rows: Sequence[Sequence[Any]]) -> Dict[str, int]:
+    """
+    Inserta en bloque los miembros inferidos que necesitan `rows`: por dimensión, un solo
+    INSERT ... SELECT sobre las claves del lote con anti-join contra la dimensión (las que ya
+    existen no se tocan). Así un hecho que llega antes que su usuario o chat no viola la FK ni
+    dispara reintentos del lote completo. Devuelve {dimensión: stubs insertados}.
+    """
+    columns = TABLES[entity]["columns"]
+    wanted: Dict[str, set] = {}
+    for column, dimension in REFERENCES.get(entity, ()):
+        idx = columns.index(column)
+        wanted.setdefault(dimension, set()).update(r[idx] for r in rows if r[idx] is not None)
+    inferred = {}
+    for dimension, keys in wanted.items():
+        if not keys:
+            continue
+        spec = TABLES[dimension]
+        (key,) = spec["key"]
+        defaults = INFERRED[dimension]
+        cur.execute(f"""
+            INSERT INTO {spec['table']} AS d ({key}, {", ".join(defaults)}, is_inferred)
+            SELECT k, {", ".join(defaults.values())}, TRUE
+            FROM unnest(%s::int[]) AS k
+            WHERE NOT EXISTS (SELECT 1 FROM {spec['table']} e WHERE e.{key} = k)
+            ON CONFLICT ({key}) DO NOTHING
+        """, (sorted(keys),))
+        if cur.rowcount:
+            inferred[dimension] = cur.rowcount
+            inferred_members_total.labels(dimension=dimension).inc(cur.rowcount)
+            logger.warning(f"Inferred {cur.rowcount} {dimension} referenced by {entity} before their dimension load")
+    return inferred
+
+
+def copy_append(cur, entity: str, rows: Sequence[Sequence[Any]], table: str) -> Dict[str, int]:
+    """
+    COPY directo de `rows` a `table` sin merge: para tablas sombra de un full refresh, que no
+    tienen índices ni claves hasta el final (shadow.py deduplica antes de crear la PK).
+    """
+    cur.copy_expert(f"COPY {table} ({', '.join(TABLES[entity]['columns'])}) FROM STDIN", _CopyStream(rows))
+    return {"inserted": len(rows)}
+
+
+def _upsert_sql(spec: Dict[str, Any], entity: str) -> str:
+    return _counted(spec, f"""
+            INSERT INTO {spec['table']} AS t ({", ".join(spec['columns'])})
+            VALUES %s
+            ON CONFLICT ({", ".join(spec['key'])}) DO UPDATE SET {_do_update(spec, entity)}""")
+
+
+def values_upsert(cur, entity: str, rows: Sequence[Sequence[Any]], page_size: int = 1000) -> Dict[str, int]:
+    """
+    INSERT ... VALUES multi-fila (execute_values, `page_size` filas por sentencia) con el mismo
+    ON CONFLICT ... WHERE IS DISTINCT FROM que el merge. Las claves repetidas se reducen antes
+    (gana la última: un mismo INSERT no puede actualizar dos veces una fila).
+    Devuelve {"inserted", "updated", "unchanged"}.
+    """
+    spec = TABLES[entity]
+    rows = _last_per_key(spec, rows)
+    # Una fila (insertadas, actualizadas) por página
+    counts = psycopg2.extras.execute_values(cur, _upsert_sql(spec, entity), rows, page_size=page_size, fetch=True)
+    inserted = sum(i for i, _ in counts)
+    updated = sum(u for _, u in counts)
+    return {"inserted": inserted, "updated": updated, "unchanged": len(rows) - inserted - updated}
+
+
+def _write_isolating(
+    cur,
+    rows: Sequence[Sequence[Any]],
+    write: Callable[[Sequence[Sequence[Any]]], Dict[str, int]],
+    bad: List[Tuple[Sequence[Any], Exception]],
+    max_bad: int = QUARANTINE_MAX_ROWS,
+) -> Dict[str, int]:
+    """
+    `write(rows)` bajo un savepoint. Si falla por los datos, vuelve al savepoint y reintenta
+    cada mitad hasta aislar las filas que fallan solas, que se agregan a `bad` con su error:
+    una fila envenenada cuesta ~2·log2(n) sentencias extra, no el lote. Con más de `max_bad`
+    filas malas se propaga el error. Devuelve la suma de los conteos de las partes cargadas.
+    """
+    cur.execute("SAVEPOINT etl_rows;")
+    try:
+        stats = write(rows)
+    except _ROW_ERRORS as e:
+        cur.execute("ROLLBACK TO SAVEPOINT etl_rows; RELEASE SAVEPOINT etl_rows;")
+        if len(rows) == 1:
+            bad.append((rows[0], e))
+            if len(bad) > max_bad:
+                raise
+            return {}
+        mid = len(rows) // 2
+        stats = {}
+        for part in (rows[:mid], rows[mid:]):
+            for result, n in _write_isolating(cur, part, write, bad, max_bad).items():
+                stats[result] = stats.get(result, 0) + n
+        return stats
+    cur.execute("RELEASE SAVEPOINT etl_rows;")
+    return stats
+
+
+def quarantine(cur, entity: str, bad: Sequence[Tuple[Sequence[Any], Exception]]) -> int:
+    """Guarda en QUARANTINE_TABLE las filas aisladas (como JSON columna -> valor) con su error."""
+    columns = TABLES[entity]["columns"]
+    psycopg2.extras.execute_values(
+        cur,
+        f"INSERT INTO {QUARANTINE_TABLE} (entity, payload, error, sqlstate) VALUES %s",
+        [
+            (entity, json.dumps(dict(zip(columns, row)), default=str), str(e).strip(), getattr(e, "pgcode", None))
+            for row, e in bad
+        ],
+    )
+    for row, e in bad:
+        logger.warning(f"Quarantined {entity} row {row[0]}: {str(e).strip().splitlines()[0]}")
+    return len(bad)
+
+
+def upsert(
+    cur, entity: str, rows: Sequence[Sequence[Any]], page_size: int = 1000, shadow: bool = False,
+) -> Dict[str, int]:
+    """
+    Carga `rows` (tuplas en el orden de TABLES[entity]["columns"]) en el warehouse dentro de
+    la transacción de `cur`: COPY + merge si la entidad está en ETL_COPY_ENTITIES, si no
+    INSERT ... VALUES por páginas. En ambos casos las filas sin cambios no se reescriben
+    y se devuelve {"inserted", "updated", "unchanged"}, más "quarantined" si hubo filas que
+    fallaron solas y se apartaron a QUARANTINE_TABLE (el resto del lote se carga igual).
+    Si hubo cambios, los rollups de la tabla (rollups.py) se recalculan para las claves del lote en
+    la misma transacción (sus locks se toman antes de escribir) y sus días quedan pendientes del
+    export a Parquet (snapshots.py).
+    En las tablas de hechos una clave que cambió de created_day se borra de su día viejo antes
+    de cargarla (move_keys, "moved" en el resultado).
+    Con `shadow=True` (full refresh) las filas se agregan con COPY a la tabla sombra de la entidad;
+    sin él, LiveTableHeld si la tabla viva está retenida por un full refresh (check_live_write).
+    """
+    if not rows:
+        return {}
+    method = "shadow" if shadow else "copy" if copy_enabled(entity) else "values"
+    table = shadow_table(TABLES[entity]["table"]) if shadow else None
+    start = time.perf_counter()
+    if not shadow:
+        check_live_write(cur, [TABLES[entity]["table"]])
+        # Locks de los grupos de rollups antes de tocar los hechos (move_keys incluido)
+        rollups.lock(cur, TABLES[entity]["table"], TABLES[entity]["columns"], rows)
+    if identity(entity) != TABLES[entity]["key"]:
+        # Una clave con dos días en el lote dejaría dos filas: gana la última, como en el merge
+        rows = _last_per_key({**TABLES[entity], "key": identity(entity)}, rows)
+    partitions.ensure_for_rows(cur, entity, TABLES[entity]["columns"], rows, table=table)
+    infer_missing(cur, entity, rows)
+    moved = 0 if shadow else move_keys(cur, entity, rows)
+    if method == "shadow":
+        write = lambda part: copy_append(cur, entity, part, table)
+    elif method == "copy":
+        write = lambda part: copy_merge(cur, entity, part)
+    else:
+        write = lambda part: values_upsert(cur, entity, part, page_size=page_size)
+    bad: List[Tuple[Sequence[Any], Exception]] = []
+    stats = _write_isolating(cur, rows, write, bad)
+    if bad:
+        stats["quarantined"] = quarantine(cur, entity, bad)
+    if moved:
+        stats["moved"] = moved
+    # Las sombras no tienen rollups (se recalculan completos después del swap); un lote sin
+    # cambios no los toca
+    changed = stats.get("inserted") or stats.get("updated")
+    if not shadow and (changed or moved):
+        rollups.refresh(cur, TABLES[entity]["table"], TABLES[entity]["columns"], rows)
+        if changed:
+            snapshots.mark(cur, TABLES[entity]["table"], TABLES[entity]["columns"], rows)
+    load_seconds.labels(entity=entity, method=method).observe(time.perf_counter() - start)
+    for result, n in stats.items():
+        load_rows_total.labels(entity=entity, result=result).inc(n)
+    logger.info(f"Loaded {len(rows)} {entity} via {method}: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+    return stats
@@ -0,0 +1,202 @@
+from __future__ import annotations
+import sys
+import time
+import logging
+import argparse
+from typing import Any, Dict, Iterable, List, Optional
+
+import psycopg2
+from prometheus_client import Histogram
+
+from app.temporal import warehouse
+
+# Vistas materializadas del warehouse para analítica que es natural escribir en SQL (ranking de
+# usuarios, actividad por chat, funnel de bookings) pero cara de calcular en cada consulta.
+# Cada vista declara sus tablas de origen y un índice único: al final de cada corrida del ETL
+# se refrescan CONCURRENTLY (sin bloquear lecturas) solo las vistas cuyas tablas cambiaron.
+logger = logging.getLogger(__name__)
+
+# Vistas: tablas de origen, columnas del índice único (requisito de REFRESH ... CONCURRENTLY:
+# sin expresiones ni NULLs, por eso los COALESCE) y SELECT. Cambiar una vista existente
+# requiere una migración nueva (la 7 las crea).
+VIEWS: Dict[str, Dict[str, Any]] = {
+    "mv_top_users": {
+        "sources": ("dim_users", "fact_messages", "fact_reactions"),
+        "unique": ("user_id",),
+        "sql": """
+            SELECT u.user_id, u.handle, u.display_name,
+                   COALESCE(m.messages, 0) AS messages,
+                   COALESCE(m.chats, 0) AS chats,
+                   COALESCE(r.reactions, 0) AS reactions_given,
+                   m.last_message_at
+            FROM dim_users u
+            LEFT JOIN (
+                SELECT sender_id, count(*) AS messages, count(DISTINCT chat_id) AS chats,
+                       max(created_at) AS last_message_at
+                FROM fact_messages WHERE sender_id IS NOT NULL GROUP BY sender_id
+            ) m ON m.sender_id = u.user_id
+            LEFT JOIN (
+                SELECT user_id, count(*) AS reactions FROM fact_reactions GROUP BY user_id
+            ) r ON r.user_id = u.user_id
+        """,
+    },
+    "mv_chat_activity": {
+        "sources": ("dim_chats", "bridge_chat_members", "fact_messages", "fact_reactions"),
+        "unique": ("chat_id",),
+        "sql": """
+            SELECT c.chat_id, c.type, c.title,
+                   COALESCE(m.messages, 0) AS messages,
+                   COALESCE(m.senders, 0) AS senders,
+                   COALESCE(mb.members, 0) AS members,
+                   COALESCE(r.reactions, 0) AS reactions,
+                   COALESCE(r.messages_with_reactions, 0) AS messages_with_reactions,
+                   m.first_message_at, m.last_message_at,
+                   CASE
+                       WHEN COALESCE(m.messages, 0) = 0 THEN '0'
+                       WHEN m.messages <= 50 THEN '1-50'
+                       WHEN m.messages <= 200 THEN '51-200'
+                       WHEN m.messages <= 500 THEN '201-500'
+                       WHEN m.messages <= 1000 THEN '501-1000'
+                       ELSE '1000+'
+                   END AS size_bucket
+            FROM dim_chats c
+            LEFT JOIN (
+                SELECT chat_id, count(*) AS messages, count(DISTINCT sender_id) AS senders,
+                       min(created_at) AS first_message_at, max(created_at) AS last_message_at
+                FROM fact_messages GROUP BY chat_id
+            ) m ON m.chat_id = c.chat_id
+            LEFT JOIN (
+                SELECT chat_id, count(*) AS members FROM bridge_chat_members GROUP BY chat_id
+            ) mb ON mb.chat_id = c.chat_id
+            LEFT JOIN (
+                SELECT chat_id, count(*) AS reactions, count(DISTINCT message_id) AS messages_with_reactions
+                FROM fact_reactions GROUP BY chat_id
+            ) r ON r.chat_id = c.chat_id
+        """,
+    },
+    "mv_booking_funnel": {
+        "sources": ("fact_bookings", "fact_booking_events"),
+        "unique": ("month", "booking_type"),
+        "sql": """
+            SELECT date_trunc('month', b.created_day)::date AS month,
+                   COALESCE(b.booking_type, 'sin tipo') AS booking_type,
+                   count(*) AS bookings,
+                   count(*) FILTER (WHERE e.events > 0) AS with_events,
+                   count(*) FILTER (WHERE b.status = 'PENDING') AS pending,
+                   count(*) FILTER (WHERE b.status = 'CONFIRMED') AS confirmed,
+                   count(*) FILTER (WHERE b.status = 'CANCELLED') AS cancelled,
+                   round(count(*) FILTER (WHERE b.status = 'CONFIRMED')::numeric / count(*), 4) AS confirmation_rate
+            FROM fact_bookings b
+            LEFT JOIN (
+                SELECT booking_id, count(*) AS events FROM fact_booking_events GROUP BY booking_id
+            ) e ON e.booking_id = b.booking_id
+            GROUP BY 1, 2
+        """,
+    },
+}
+
+# Última duración de refresco por vista (migración 7)
+REFRESH_LOG_TABLE = "etl_matview_refreshes"
+
+matview_refresh_seconds = Histogram(
+    'etl_matview_refresh_seconds',
+    'Time spent refreshing one warehouse materialized view',
+    ['view'],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900),
+)
+
+
+def for_tables(tables: Iterable[str]) -> List[str]:
+    """Vistas que leen alguna de `tables`, en el orden del registro."""
+    tables = set(tables)
+    return [name for name, spec in VIEWS.items() if tables & set(spec["sources"])]
+
+
+def create_sql(name: str, with_data: bool = True) -> str:
+    """CREATE MATERIALIZED VIEW (con datos, o vacía con `with_data=False`) y su índice único."""
+    spec = VIEWS[name]
+    return (
+        f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {spec['sql'].strip()}"
+        f"{'' if with_data else ' WITH NO DATA'};\n"
+        f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({', '.join(spec['unique'])});"
+    )
+
+
+def refresh(conn, names: Iterable[str], unpopulated_only: bool = False) -> Dict[str, float]:
+    """
+    REFRESH MATERIALIZED VIEW CONCURRENTLY de cada vista (las lecturas siguen viendo la versión
+    anterior), una transacción por vista; sin CONCURRENTLY si nunca se pobló. Con
+    `unpopulated_only` solo llena las que están sin datos (recreadas en un swap). Registra la
+    duración en REFRESH_LOG_TABLE y en la métrica. Devuelve {vista: segundos}.
+    """
+    durations: Dict[str, float] = {}
+    for name in names:
+        with conn.cursor() as cur:
+            cur.execute("SELECT relispopulated FROM pg_class WHERE oid = to_regclass(%s);", (name,))
+            row = cur.fetchone()
+            if not row:
+                logger.warning(f"Materialized view {name} does not exist; run the schema migrations")
+                continue
+            if unpopulated_only and row[0]:
+                conn.rollback()
+                continue
+            concurrently = "CONCURRENTLY " if row[0] else ""
+            start = time.perf_counter()
+            cur.execute(f"REFRESH MATERIALIZED VIEW {concurrently}{name};")
+            seconds = time.perf_counter() - start
+            cur.execute(f"""
+                INSERT INTO {REFRESH_LOG_TABLE} (view_name, refreshed_at, seconds)
+                VALUES (%s, NOW(), %s)
+                ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at, seconds = EXCLUDED.seconds;
+            """, (name, seconds))
+        conn.commit()
+        matview_refresh_seconds.labels(view=name).observe(seconds)
+        logger.info(f"Refreshed {name} {'concurrently ' if concurrently else ''}in {seconds:.2f}s")
+        durations[name] = round(seconds, 3)
+    return durations
+
+
+def refresh_for_tables(conn, tables: Optional[Iterable[str]] = None) -> Dict[str, float]:
+    """Refresca las vistas que dependen de `tables` (None: todas)."""
+    return refresh(conn, list(VIEWS) if tables is None else for_tables(tables))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Vistas materializadas del warehouse")
+    sub = parser.add_subparsers(dest="command", required=True)
+    refresh_cmd = sub.add_parser("refresh", help="refrescar vistas (default: todas)")
+    refresh_cmd.add_argument("names", nargs="*", help="vistas a refrescar")
+    refresh_cmd.add_argument("--tables", nargs="+", help="refrescar las vistas que leen estas tablas")
+    sub.add_parser("status", help="último refresco de cada vista")
+    parser.add_argument("--url", default=None, help="DSN del warehouse (default: WAREHOUSE_URL)")
+    args = parser.parse_args(argv)
+
+    if args.command == "refresh":
+        unknown = set(args.names) - set(VIEWS)
+        if unknown:
+            parser.error(f"vistas desconocidas: {', '.join(sorted(unknown))}")
+    conn = psycopg2.connect(args.url or warehouse.WAREHOUSE_URL)
+    try:
+        if args.command == "refresh":
+            if args.names:
+                durations = refresh(conn, args.names)
+            else:
+                durations = refresh_for_tables(conn, args.tables)
+            for name, seconds in durations.items():
+                print(f"{name}: {seconds:.2f}s")
+        else:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT view_name, refreshed_at, seconds FROM {REFRESH_LOG_TABLE} ORDER BY view_name;")
+                last = {name: (at, seconds) for name, at, seconds in cur.fetchall()}
+            conn.rollback()
+            for name in VIEWS:
+                at, seconds = last.get(name, (None, None))
+                print(f"{name}: " + (f"{at:%Y-%m-%d %H:%M:%S} ({seconds:.2f}s)" if at else "sin refrescos"))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
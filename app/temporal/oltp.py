@@ -0,0 +1,121 @@
+from __future__ import annotations
+import os
+import uuid
+import logging
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple
+
+import psycopg2
+import psycopg2.extras
+
+from app.temporal.runtime import run_in_db_thread
+
+# Backend de extracción directo contra la base OLTP (`messaging`, o una réplica de
+# lectura): evita ORM + Pydantic + JSON + HTTP del API. Las filas tienen las mismas
+# claves que los items del API, así que alimentan el mismo transform/load.
+logger = logging.getLogger(__name__)
+
+# Sin ETL_OLTP_URL se usa DATABASE_URL (la misma base que el API) sin el driver de SQLAlchemy.
+# No hay default: sin ninguna de las dos, connect() falla con un error claro
+OLTP_URL = (os.getenv("ETL_OLTP_URL") or os.getenv("DATABASE_URL", "")).replace(
+    "postgresql+psycopg2://", "postgresql://"
+)
+
+SOURCES = ("api", "db")
+
+# Consultas por entidad: orden estable por clave primaria para que las páginas
+# (y el checkpoint por página) sean reproducibles en un reintento
+QUERIES: Dict[str, str] = {
+    "users": "SELECT id, handle, display_name, created_at FROM users ORDER BY id",
+    "chats": "SELECT id, type::text AS type, title, created_at FROM chats ORDER BY id",
+    "members": "SELECT chat_id, user_id, role, joined_at FROM chat_members ORDER BY chat_id, user_id",
+    "messages": (
+        "SELECT id, chat_id, sender_id, body, created_at, edited_at, reply_to_id "
+        "FROM messages WHERE chat_id = %s ORDER BY id"
+    ),
+    "reactions": (
+        "SELECT r.message_id, r.user_id, r.emoji, r.created_at "
+        "FROM reactions r JOIN messages m ON m.id = r.message_id "
+        "WHERE m.chat_id = %s ORDER BY r.message_id, r.user_id, r.emoji"
+    ),
+    "bookings": (
+        "SELECT id, message_id, user_id, chat_id, booking_type, booking_date, status, created_at "
+        "FROM bookings ORDER BY id"
+    ),
+    "booking_events": "SELECT id, booking_id, event_type, created_at FROM booking_events ORDER BY id",
+}
+
+
+def check_source(source: str) -> str:
+    """Valida el backend de extracción ('api' o 'db')."""
+    source = (source or "api").lower()
+    if source not in SOURCES:
+        raise ValueError(f"extract source desconocido: {source} (válidos: {', '.join(SOURCES)})")
+    return source
+
+
+def connect():
+    """Conexión de solo lectura a la base OLTP con snapshot consistente (REPEATABLE READ)."""
+    if not OLTP_URL:
+        raise RuntimeError("La extracción desde la base OLTP necesita ETL_OLTP_URL o DATABASE_URL")
+    conn = psycopg2.connect(OLTP_URL)
+    # Snapshot consistente y solo lectura: no bloquea ni compite con escrituras del API
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+    return conn
+
+
+def _open(entity: str, params: Sequence[Any], offset: int, page_size: int):
+    conn = connect()
+    # Cursor del lado del servidor: Postgres entrega las filas de a `itersize`,
+    # el worker nunca materializa la tabla completa
+    cur = conn.cursor(name=f"etl_{entity}_{uuid.uuid4().hex[:8]}", cursor_factory=psycopg2.extras.RealDictCursor)
+    cur.itersize = page_size
+    sql = QUERIES[entity]
+    if offset:
+        sql += " OFFSET %s"
+        params = (*params, offset)
+    cur.execute(sql, tuple(params))
+    return conn, cur
+
+
+def close(conn) -> None:
+    """Cierra una conexión de `connect()` (descarta el snapshot)."""
+    try:
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+async def iter_pages(
+    entity: str,
+    page_size: int,
+    params: Sequence[Any] = (),
+    first_page: int = 1,
+) -> AsyncIterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    Itera (page, rows) de una entidad leyendo la base OLTP con un cursor del lado del servidor.
+    `first_page` > 1 reanuda desde un checkpoint (mismo orden que la primera vez).
+    Las llamadas a Postgres corren en el pool de hilos de DB, no en el event loop.
+    """
+    offset = (first_page - 1) * page_size
+    conn, cur = await run_in_db_thread(_open, entity, params, offset, page_size)
+    try:
+        page = first_page
+        while True:
+            rows = await run_in_db_thread(cur.fetchmany, page_size)
+            if not rows:
+                return
+            yield page, [dict(r) for r in rows]
+            if len(rows) < page_size:
+                return
+            page += 1
+    finally:
+        await run_in_db_thread(close, conn)
+
+
+async def fetch_all(entity: str, page_size: int = 5000, params: Sequence[Any] = ()) -> List[Dict[str, Any]]:
+    """Todas las filas de una entidad (para los extract_* que dejan el lote en staging)."""
+    items: List[Dict[str, Any]] = []
+    async for _page, rows in iter_pages(entity, page_size, params):
+        items.extend(rows)
+    logger.info(f"Read {len(items)} {entity} rows from OLTP")
+    return items
@@ -0,0 +1,227 @@
+from __future__ import annotations
+import os
+import sys
+import logging
+import argparse
+from datetime import date, datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import psycopg2
+from prometheus_client import Counter
+
+from app.temporal import warehouse
+
+# Particiones mensuales por `created_day` de las tablas de hechos (migración 3 de schema.py).
+# Las consultas que filtran por created_day leen solo los meses necesarios (partition pruning)
+# y archivar un mes viejo es un DETACH/DROP de una tabla, no un DELETE masivo. Los loaders
+# crean la partición que falte antes de escribir; el worker precrea los meses siguientes.
+logger = logging.getLogger(__name__)
+
+# Tablas particionadas (entidad del loader -> tabla)
+TABLES: Dict[str, str] = {
+    "messages": "fact_messages",
+    "reactions": "fact_reactions",
+    "bookings": "fact_bookings",
+    "booking_events": "fact_booking_events",
+}
+PARTITION_COLUMN = "created_day"
+
+# Meses futuros que se precrean al arrancar el worker (el loader no toma locks en régimen normal)
+MONTHS_AHEAD = int(os.getenv("ETL_PARTITION_MONTHS_AHEAD", "3"))
+
+partitions_created_total = Counter(
+    'etl_partitions_created_total',
+    'Monthly fact table partitions created by the ETL',
+    ['table'],
+)
+
+# Caché por proceso: particiones que ya sabemos que existen, solo del mes actual en adelante
+# (`retention` en otro proceso puede sacar cualquier mes pasado, nunca el actual), y tablas que
+# ya están particionadas (la migración 3 puede aplicarla otro proceso después de consultar)
+_known: Set[str] = set()
+_is_partitioned: Dict[str, bool] = {}
+
+
+def month_start(value: Any) -> date:
+    if isinstance(value, datetime):
+        value = value.date()
+    elif isinstance(value, str):
+        value = date.fromisoformat(value[:10])
+    return value.replace(day=1)
+
+
+def add_months(month: date, n: int) -> date:
+    index = month.year * 12 + month.month - 1 + n
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y%m}"
+
+
+def _partitioned(cur, table: str) -> bool:
+    """True si `table` ya está particionada (la migración 3 puede no haberse aplicado)."""
+    if table not in _is_partitioned:
+        cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+        row = cur.fetchone()
+        if not (row and row[0]):
+            return False
+        _is_partitioned[table] = True
+    return _is_partitioned[table]
+
+
+def ensure_partitions(cur, table: str, months: Iterable[date]) -> List[str]:
+    """
+    Crea las particiones mensuales de `table` que falten para `months`, en la transacción de
+    `cur`. Un advisory lock por partición evita la carrera entre workers. Los meses pasados se
+    consultan siempre (la retención puede haberlos sacado); uno desacoplado por la retención no
+    se recrea y sus filas fallan en la carga (cuarentena). Devuelve las creadas.
+    """
+    missing = sorted({m for m in months if partition_name(table, m) not in _known})
+    if not missing or not _partitioned(cur, table):
+        return []
+    current = month_start(date.today())
+    created = []
+    for month in missing:
+        name = partition_name(table, month)
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (name,))
+        cur.execute(
+            "SELECT to_regclass(%s) IS NOT NULL, EXISTS ("
+            "SELECT 1 FROM pg_inherits WHERE inhrelid = to_regclass(%s) AND inhparent = to_regclass(%s));",
+            (name, name, table),
+        )
+        exists, attached = cur.fetchone()
+        if attached:
+            # Las tablas sombra se recrean en cada refresh: solo se cachean las definitivas
+            if table in TABLES.values() and month >= current:
+                _known.add(name)
+            continue
+        if exists:
+            logger.warning(f"Partition {name} was detached from {table} by retention; not recreating it")
+            continue
+        # No se cachea hasta verla confirmada: la transacción del load todavía puede revertirse
+        cur.execute(
+            f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s);",
+            (month, add_months(month, 1)),
+        )
+        partitions_created_total.labels(table=table).inc()
+        logger.info(f"Created partition {name}")
+        created.append(name)
+    return created
+
+
+def ensure_for_rows(
+    cur, entity: str, columns: Sequence[str], rows: Sequence[Sequence[Any]], table: Optional[str] = None,
+) -> List[str]:
+    """
+    Particiones que necesitan `rows` de `entity` (no hace nada si la entidad no se particiona).
+    `table` reemplaza a la tabla de la entidad (tablas sombra de shadow.py).
+    """
+    if entity not in TABLES:
+        return []
+    table = table or TABLES[entity]
+    idx = columns.index(PARTITION_COLUMN)
+    return ensure_partitions(cur, table, {month_start(r[idx]) for r in rows if r[idx] is not None})
+
+
+def ensure_upcoming(conn, months_ahead: int = MONTHS_AHEAD, today: Optional[date] = None) -> List[str]:
+    """Precrea el mes actual y los `months_ahead` siguientes de cada tabla (una transacción por tabla)."""
+    first = month_start(today or date.today())
+    created = []
+    for table in TABLES.values():
+        with conn.cursor() as cur:
+            created += ensure_partitions(cur, table, [add_months(first, i) for i in range(months_ahead + 1)])
+        conn.commit()
+    return created
+
+
+def ensure_upcoming_warehouse() -> List[str]:
+    """ensure_upcoming() con una conexión del pool del warehouse (arranque del worker)."""
+    with warehouse.connection() as conn:
+        return ensure_upcoming(conn)
+
+
+def list_partitions(cur, table: str) -> List[Tuple[str, date]]:
+    """(nombre, mes) de las particiones mensuales de `table`, de la más vieja a la más nueva."""
+    cur.execute("""
+        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s);
+    """, (table,))
+    prefix = f"{table}_p"
+    out = []
+    for (name,) in cur.fetchall():
+        suffix = name[len(prefix):]
+        if name.startswith(prefix) and len(suffix) == 6 and suffix.isdigit():
+            out.append((name, date(int(suffix[:4]), int(suffix[4:]), 1)))
+    return sorted(out, key=lambda p: p[1])
+
+
+def retention(
+    conn,
+    keep_months: int,
+    mode: str = "detach",
+    tables: Optional[Iterable[str]] = None,
+    today: Optional[date] = None,
+    dry_run: bool = False,
+) -> List[str]:
+    """
+    Saca de las tablas de hechos las particiones con datos anteriores a los últimos
+    `keep_months` meses (el actual incluido). `mode`: 'detach' (queda como tabla suelta para
+    archivar) o 'drop'. Devuelve las particiones afectadas.
+    """
+    if mode not in ("detach", "drop"):
+        raise ValueError(f"Modo de retención desconocido: {mode}")
+    cutoff = add_months(month_start(today or date.today()), -(keep_months - 1))
+    affected = []
+    for table in tables or TABLES.values():
+        with conn.cursor() as cur:
+            for name, month in list_partitions(cur, table):
+                if month >= cutoff:
+                    break
+                if not dry_run:
+                    if mode == "detach":
+                        cur.execute(f"ALTER TABLE {table} DETACH PARTITION {name};")
+                    else:
+                        cur.execute(f"DROP TABLE {name};")
+                    _known.discard(name)
+                logger.info(f"Retention: {'would ' if dry_run else ''}{mode} {name}")
+                affected.append(name)
+        conn.commit()
+    return affected
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Particiones mensuales de las tablas de hechos del warehouse")
+    sub = parser.add_subparsers(dest="command", required=True)
+    ensure = sub.add_parser("ensure", help="crear el mes actual y los siguientes")
+    ensure.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    keep = sub.add_parser("retention", help="detach/drop de particiones viejas")
+    keep.add_argument("--keep-months", type=int, required=True)
+    keep.add_argument("--mode", choices=("detach", "drop"), default="detach")
+    keep.add_argument("--dry-run", action="store_true")
+    sub.add_parser("list", help="particiones existentes")
+    parser.add_argument("--url", default=None, help="DSN del warehouse (default: WAREHOUSE_URL)")
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(args.url or warehouse.WAREHOUSE_URL)
+    try:
+        if args.command == "ensure":
+            created = ensure_upcoming(conn, args.months_ahead)
+            print(f"Creadas: {', '.join(created) or 'ninguna'}")
+        elif args.command == "retention":
+            affected = retention(conn, args.keep_months, args.mode, dry_run=args.dry_run)
+            print(f"{args.mode}{' (dry-run)' if args.dry_run else ''}: {', '.join(affected) or 'ninguna'}")
+        else:
+            with conn.cursor() as cur:
+                for table in TABLES.values():
+                    names = [name for name, _ in list_partitions(cur, table)]
+                    print(f"{table}: {', '.join(names) or 'sin particiones'}")
+            conn.rollback()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
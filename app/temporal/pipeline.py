@@ -0,0 +1,162 @@
+from __future__ import annotations
+import os
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterable, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from prometheus_client import Counter, Histogram
+
+# Pipeline de streaming source -> stages -> sink con colas acotadas entre etapas.
+# Cada etapa corre en su propia tarea: mientras se carga la página N ya se
+# transforma la N+1 y se descarga la N+2. Si el sink es lento las colas se
+# llenan y el source se detiene (backpressure), así la memoria queda acotada
+# a ~queue_size lotes por etapa sin importar el tamaño total de la entidad.
+logger = logging.getLogger(__name__)
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("ETL_PIPELINE_QUEUE_SIZE", "2"))
+
+# Métricas de Prometheus del pipeline
+pipeline_stage_seconds = Histogram(
+    'etl_pipeline_stage_seconds',
+    'Time spent by a pipeline stage processing one item',
+    ['pipeline', 'stage'],
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60),
+)
+
+pipeline_items_total = Counter(
+    'etl_pipeline_items_total',
+    'Items produced by each pipeline stage',
+    ['pipeline', 'stage'],
+)
+
+pipeline_blocked_seconds_total = Counter(
+    'etl_pipeline_blocked_seconds_total',
+    'Time a stage spent blocked on a full downstream queue (backpressure)',
+    ['pipeline', 'stage'],
+)
+
+_DONE = object()
+
+Stage = Callable[[Any], Awaitable[Any]]
+
+
+class Pipeline:
+    """
+    Uso:
+        stats = await (
+            Pipeline("messages", source)
+            .stage("transform", transform)
+            .run(load)
+        )
+
+    - `source`: iterable asíncrono (normalmente un async generator de páginas).
+    - Cada etapa es `async fn(item) -> item`; si devuelve None el item se descarta.
+    - El sink es la última etapa; su resultado se ignora.
+    Los items conservan el orden del source (una tarea por etapa). Si cualquier
+    etapa falla se cancelan las demás y la excepción se propaga.
+    """
+
+    def __init__(self, name: str, source: AsyncIterable[Any], queue_size: Optional[int] = None) -> None:
+        self.name = name
+        self.source = source
+        self.queue_size = max(1, PIPELINE_QUEUE_SIZE if queue_size is None else queue_size)
+        self._stages: List[Tuple[str, Stage]] = []
+
+    def stage(self, name: str, fn: Stage) -> "Pipeline":
+        self._stages.append((name, fn))
+        return self
+
+    async def run(self, sink: Stage, sink_name: str = "load") -> Dict[str, Dict[str, float]]:
+        """Ejecuta el pipeline hasta agotar el source. Devuelve items/segundos/bloqueo por etapa."""
+        stages: Sequence[Tuple[str, Stage]] = [*self._stages, (sink_name, sink)]
+        queues: List[asyncio.Queue] = [asyncio.Queue(self.queue_size) for _ in stages]
+        stats: Dict[str, Dict[str, float]] = {
+            name: {"items": 0, "seconds": 0.0, "blocked": 0.0}
+            for name in ["extract", *(n for n, _ in stages)]
+        }
+
+        def record(stage: str, elapsed: float) -> None:
+            stats[stage]["items"] += 1
+            stats[stage]["seconds"] += elapsed
+            pipeline_stage_seconds.labels(pipeline=self.name, stage=stage).observe(elapsed)
+            pipeline_items_total.labels(pipeline=self.name, stage=stage).inc()
+
+        async def put(queue: asyncio.Queue, item: Any, stage: str) -> None:
+            start = time.perf_counter()
+            await queue.put(item)
+            blocked = time.perf_counter() - start
+            stats[stage]["blocked"] += blocked
+            pipeline_blocked_seconds_total.labels(pipeline=self.name, stage=stage).inc(blocked)
+
+        async def produce() -> None:
+            it: AsyncIterator[Any] = self.source.__aiter__()
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = await it.__anext__()
+                except StopAsyncIteration:
+                    break
+                record("extract", time.perf_counter() - start)
+                await put(queues[0], item, "extract")
+            await queues[0].put(_DONE)
+
+        async def work(index: int, name: str, fn: Stage) -> None:
+            inbox = queues[index]
+            outbox = queues[index + 1] if index + 1 < len(queues) else None
+            while True:
+                item = await inbox.get()
+                if item is _DONE:
+                    if outbox is not None:
+                        await outbox.put(_DONE)
+                    return
+                start = time.perf_counter()
+                result = await fn(item)
+                record(name, time.perf_counter() - start)
+                if outbox is not None and result is not None:
+                    await put(outbox, result, name)
+
+        tasks = [asyncio.ensure_future(produce())]
+        tasks += [asyncio.ensure_future(work(i, n, f)) for i, (n, f) in enumerate(stages)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        finally:
+            aclose = getattr(self.source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        logger.info(
+            f"Pipeline {self.name}: "
+            + ", ".join(f"{n}={s['items']:.0f} items/{s['seconds']:.2f}s (blocked {s['blocked']:.2f}s)" for n, s in stats.items())
+        )
+        return stats
+
+
+async def rebatch(
+    source: AsyncIterable[Tuple[int, List[Any]]],
+    min_rows: int,
+) -> AsyncIterator[Tuple[int, List[Any]]]:
+    """
+    Agrupa páginas (page, rows) en lotes de al menos `min_rows` filas. Cada lote se emite
+    como (última_página, filas): solo contiene páginas completas, así que sirve de checkpoint.
+    """
+    pending: List[Any] = []
+    last_page: Optional[int] = None
+    try:
+        async for page, rows in source:
+            pending.extend(rows)
+            last_page = page
+            if len(pending) >= min_rows:
+                yield last_page, pending
+                pending = []
+        if pending:
+            yield last_page, pending
+    finally:
+        aclose = getattr(source, "aclose", None)
+        if aclose is not None:
+            await aclose()
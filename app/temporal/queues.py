@@ -0,0 +1,9 @@
+import os
+
+# Colas de Temporal del ETL. Los workflows usan una cola propia; las actividades se
+# separan por tipo de recurso para dimensionar y escalar cada etapa por separado:
+#  - extract: I/O HTTP contra el API (extract_*, transform_*, etl_* por chat)
+#  - load:    escrituras en el warehouse (load_*, watermarks)
+WORKFLOW_TASK_QUEUE = os.getenv("ETL_TASK_QUEUE", "etl-task-queue")
+EXTRACT_TASK_QUEUE = os.getenv("ETL_EXTRACT_TASK_QUEUE", "etl-extract-queue")
+LOAD_TASK_QUEUE = os.getenv("ETL_LOAD_TASK_QUEUE", "etl-load-queue")
@@ -0,0 +1,305 @@
+from __future__ import annotations
+import abc
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Type, TypeVar
+
+import orjson
+import dateutil.parser as dtp
+
+# Registros tipados y compactos para las entidades de alto volumen (mensajes, reacciones,
+# bookings y eventos). Cada item del API (o fila OLTP) se valida y se parsea UNA vez al
+# construir el registro; transform y load trabajan sobre atributos con __slots__ (sin
+# __dict__ por fila) y la carga arma la tupla del warehouse sin volver a recorrer dicts
+# ni parsear fechas con dateutil.
+logger = logging.getLogger(__name__)
+
+R = TypeVar("R", bound="Record")
+
+
+def loads(content: bytes) -> Any:
+    """Decodifica una respuesta JSON del API con orjson (varias veces más rápido que json/httpx)."""
+    return orjson.loads(content)
+
+
+def parse_ts(value: Any) -> Optional[datetime]:
+    """
+    Parsea un timestamp. Camino rápido con datetime.fromisoformat (el API serializa con
+    isoformat); dateutil solo para formatos no ISO.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    if not isinstance(value, str):
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    try:
+        return dtp.parse(value)
+    except (ValueError, OverflowError) as e:
+        logger.warning(f"Error parsing timestamp {value}: {e}")
+        return None
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def to_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """datetime naive en UTC (igual que el camino columnar): created_day es siempre el día UTC."""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _ts(value: Any) -> Optional[datetime]:
+    return to_utc(parse_ts(value))
+
+
+def _created(value: Any, what: str) -> Optional[datetime]:
+    """
+    created_at en UTC, o None si falta o no se puede parsear: el item se descarta. Inventar la
+    fecha (ahora) movería la fila de partición en cada recarga y duplicaría su clave.
+    """
+    created = _ts(value)
+    if created is None:
+        logger.warning(f"{what} sin created_at válido, se descarta")
+    return created
+
+
+class Record(abc.ABC):
+    """Base de los registros: from_dict valida (None si el item se descarta), row arma la tupla del DW."""
+    __slots__ = ()
+
+    @classmethod
+    @abc.abstractmethod
+    def from_dict(cls: Type[R], d: Dict[str, Any]) -> Optional[R]:
+        ...
+
+    @abc.abstractmethod
+    def row(self) -> Tuple[Any, ...]:
+        ...
+
+    @abc.abstractmethod
+    def to_dict(self) -> Dict[str, Any]:
+        """Representación JSON-safe (para cruzar el límite de una actividad o staging)."""
+
+    def __eq__(self, other: Any) -> bool:
+        return type(self) is type(other) and all(
+            getattr(self, s) == getattr(other, s) for s in self.__slots__
+        )
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{s}={getattr(self, s)!r}" for s in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+class MessageRecord(Record):
+    __slots__ = ("id", "chat_id", "sender_id", "body", "created_at", "edited_at", "reply_to_id")
+
+    def __init__(self, id, chat_id, sender_id, body, created_at, edited_at=None, reply_to_id=None):
+        self.id = id
+        self.chat_id = chat_id
+        self.sender_id = sender_id
+        self.body = body
+        self.created_at = created_at
+        self.edited_at = edited_at
+        self.reply_to_id = reply_to_id
+
+    @classmethod
+    def from_dict(cls, m: Dict[str, Any]) -> Optional["MessageRecord"]:
+        if not m.get("id"):
+            logger.warning(f"Message sin ID: {m}")
+            return None
+        if not m.get("chat_id"):
+            logger.warning(f"Message {m.get('id')} sin chat_id")
+            return None
+        if not m.get("body"):
+            logger.warning(f"Message {m.get('id')} sin body")
+        created = _created(m.get("created_at"), f"Message {m['id']}")
+        if created is None:
+            return None
+        return cls(
+            m["id"],
+            m["chat_id"],
+            m.get("sender_id"),
+            m.get("body") or "",
+            created,
+            _ts(m.get("edited_at")),
+            m.get("reply_to_id"),
+        )
+
+    def row(self) -> Tuple[Any, ...]:
+        created = self.created_at
+        return (
+            self.id, self.chat_id, self.sender_id, self.body, len(self.body),
+            created, created.date(), created.hour, self.edited_at, self.reply_to_id,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "chat_id": self.chat_id,
+            "sender_id": self.sender_id,
+            "body": self.body,
+            "message_length": len(self.body),
+            "created_at": _iso(self.created_at),
+            "edited_at": _iso(self.edited_at),
+            "reply_to_id": self.reply_to_id,
+        }
+
+
+class ReactionRecord(Record):
+    __slots__ = ("message_id", "user_id", "emoji", "created_at", "chat_id")
+
+    def __init__(self, message_id, user_id, emoji, created_at, chat_id=None):
+        self.message_id = message_id
+        self.user_id = user_id
+        self.emoji = emoji
+        self.created_at = created_at
+        self.chat_id = chat_id
+
+    @classmethod
+    def from_dict(cls, r: Dict[str, Any]) -> Optional["ReactionRecord"]:
+        if not r.get("message_id") or not r.get("user_id"):
+            logger.warning(f"Reaction sin message_id o user_id: {r}")
+            return None
+        emoji = (r.get("emoji") or "").strip()
+        if not emoji:
+            logger.warning(f"Reaction sin emoji: {r}")
+            return None
+        created = _created(r.get("created_at"), f"Reaction {r['message_id']}/{r['user_id']}")
+        if created is None:
+            return None
+        return cls(
+            r["message_id"],
+            r["user_id"],
+            emoji,
+            created,
+            r.get("chat_id"),
+        )
+
+    def row(self, chat_id: Optional[int] = None) -> Tuple[Any, ...]:
+        created = self.created_at
+        return (
+            self.message_id, self.chat_id if chat_id is None else chat_id, self.user_id,
+            self.emoji, created, created.date(), created.hour,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "message_id": self.message_id,
+            "user_id": self.user_id,
+            "emoji": self.emoji,
+            "created_at": _iso(self.created_at),
+            "chat_id": self.chat_id,
+        }
+
+
+class BookingRecord(Record):
+    __slots__ = ("id", "message_id", "user_id", "chat_id", "booking_type", "booking_date", "status", "created_at")
+
+    def __init__(self, id, message_id, user_id, chat_id, booking_type, booking_date, status, created_at):
+        self.id = id
+        self.message_id = message_id
+        self.user_id = user_id
+        self.chat_id = chat_id
+        self.booking_type = booking_type
+        self.booking_date = booking_date
+        self.status = status
+        self.created_at = created_at
+
+    @classmethod
+    def from_dict(cls, b: Dict[str, Any]) -> Optional["BookingRecord"]:
+        if not b.get("id"):
+            logger.warning(f"Booking sin ID: {b}")
+            return None
+        if not b.get("status"):
+            logger.warning(f"Booking {b.get('id')} sin status")
+            return None
+        created = _created(b.get("created_at"), f"Booking {b['id']}")
+        if created is None:
+            return None
+        return cls(
+            b["id"],
+            b.get("message_id"),
+            b.get("user_id"),
+            b.get("chat_id"),
+            b.get("booking_type"),
+            _ts(b.get("booking_date")),
+            b["status"],
+            created,
+        )
+
+    def row(self) -> Tuple[Any, ...]:
+        created = self.created_at
+        return (
+            self.id, self.chat_id, self.user_id, self.message_id, self.booking_type,
+            self.booking_date, self.status, created, created.date(), created.hour,
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "message_id": self.message_id,
+            "user_id": self.user_id,
+            "chat_id": self.chat_id,
+            "booking_type": self.booking_type,
+            "booking_date": _iso(self.booking_date),
+            "status": self.status,
+            "created_at": _iso(self.created_at),
+        }
+
+
+class BookingEventRecord(Record):
+    __slots__ = ("id", "booking_id", "event_type", "created_at")
+
+    def __init__(self, id, booking_id, event_type, created_at):
+        self.id = id
+        self.booking_id = booking_id
+        self.event_type = event_type
+        self.created_at = created_at
+
+    @classmethod
+    def from_dict(cls, e: Dict[str, Any]) -> Optional["BookingEventRecord"]:
+        if not e.get("id"):
+            logger.warning(f"Booking event sin ID: {e}")
+            return None
+        if not e.get("booking_id"):
+            logger.warning(f"Booking event {e.get('id')} sin booking_id")
+            return None
+        if not e.get("event_type"):
+            logger.warning(f"Booking event {e.get('id')} sin event_type")
+            return None
+        created = _created(e.get("created_at"), f"Booking event {e['id']}")
+        if created is None:
+            return None
+        return cls(e["id"], e["booking_id"], e["event_type"], created)
+
+    def row(self) -> Tuple[Any, ...]:
+        created = self.created_at
+        return (self.id, self.booking_id, self.event_type, created, created.date(), created.hour)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "booking_id": self.booking_id,
+            "event_type": self.event_type,
+            "created_at": _iso(self.created_at),
+        }
+
+
+def build(cls: Type[R], items: Iterable[Any]) -> List[R]:
+    """
+    Registros válidos de `cls` a partir de dicts (API, OLTP o payload de Temporal).
+    Los items que ya son registros se conservan tal cual: transform y load aceptan ambos.
+    """
+    out: List[R] = []
+    for item in items:
+        rec = item if isinstance(item, cls) else cls.from_dict(item)
+        if rec is not None:
+            out.append(rec)
+    return out
@@ -0,0 +1,256 @@
+from __future__ import annotations
+import os
+import sys
+import zlib
+import logging
+import argparse
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import psycopg2
+from prometheus_client import Histogram
+
+from app.temporal import warehouse
+
+# Tablas de agregados (rollups) para los dashboards: conteos por chat/día, usuario/día, hora,
+# emoji y estado de booking. Los loaders las mantienen en la misma transacción que cada lote de
+# hechos (loader.upsert) recalculando solo los grupos de las claves que tocó el lote, así que
+# Metabase lee miles de filas ya agregadas en lugar de escanear las tablas de hechos.
+logger = logging.getLogger(__name__)
+
+# Mantener los rollups en cada carga (false: p. ej. durante un backfill; luego `rebuild`)
+ENABLED = os.getenv("ETL_ROLLUPS", "true").lower() in ("1", "true", "yes")
+
+# Un recálculo a la vez por grupo: antes de escribir hechos, cada transacción toma (lock())
+# un advisory lock por slot de los scopes que va a recalcular, en orden de slot. El slot es un
+# hash del scope sin created_day (un move_keys al día viejo cae en el mismo slot) módulo
+# ETL_ROLLUP_LOCK_SLOTS, que acota los locks por transacción.
+LOCK_SLOTS = int(os.getenv("ETL_ROLLUP_LOCK_SLOTS", "256"))
+_LOCK_CLASS = 4815
+
+# Rollups: tabla de hechos de origen, `scope` (columnas estables del hecho que identifican los
+# grupos a recalcular cuando cambia una fila), columnas de agrupación (PK del rollup) y medidas
+# (nombre, tipo, expresión). Se recalcula el scope completo, no un delta: las cargas son
+# upserts idempotentes y un booking puede cambiar de estado, así que sumar no sería correcto.
+# Cambiar columnas de un rollup existente requiere una migración nueva (la 6 las crea).
+ROLLUPS: Dict[str, Dict[str, Any]] = {
+    "rollup_messages_chat_day": {
+        "source": "fact_messages",
+        "scope": ("chat_id", "created_day"),
+        "group": ("chat_id", "created_day"),
+        "measures": (
+            ("messages", "BIGINT", "count(*)"),
+            ("senders", "BIGINT", "count(DISTINCT sender_id)"),
+            ("chars", "BIGINT", "coalesce(sum(message_length), 0)"),
+            ("last_message_at", "TIMESTAMPTZ", "max(created_at)"),
+        ),
+    },
+    "rollup_messages_user_day": {
+        "source": "fact_messages",
+        "scope": ("sender_id", "created_day"),
+        "group": ("sender_id", "created_day"),
+        "where": "sender_id IS NOT NULL",
+        "measures": (
+            ("messages", "BIGINT", "count(*)"),
+            ("chats", "BIGINT", "count(DISTINCT chat_id)"),
+            ("chars", "BIGINT", "coalesce(sum(message_length), 0)"),
+        ),
+    },
+    "rollup_messages_chat_hour": {
+        "source": "fact_messages",
+        "scope": ("chat_id", "created_day"),
+        "group": ("chat_id", "created_day", "created_hour"),
+        "measures": (
+            ("messages", "BIGINT", "count(*)"),
+        ),
+    },
+    "rollup_reactions_emoji_day": {
+        "source": "fact_reactions",
+        "scope": ("chat_id", "created_day"),
+        "group": ("chat_id", "created_day", "emoji"),
+        "measures": (
+            ("reactions", "BIGINT", "count(*)"),
+            ("messages", "BIGINT", "count(DISTINCT message_id)"),
+            ("users", "BIGINT", "count(DISTINCT user_id)"),
+        ),
+    },
+    "rollup_bookings_status_day": {
+        "source": "fact_bookings",
+        "scope": ("created_day",),
+        "group": ("created_day", "status"),
+        "measures": (
+            ("bookings", "BIGINT", "count(*)"),
+        ),
+    },
+}
+
+# Tipos de las columnas de agrupación (los de las tablas de hechos)
+COLUMN_TYPES: Dict[str, str] = {
+    "chat_id": "int",
+    "sender_id": "int",
+    "created_day": "date",
+    "created_hour": "smallint",
+    "emoji": "text",
+    "status": "text",
+}
+
+rollup_refresh_seconds = Histogram(
+    'etl_rollup_refresh_seconds',
+    'Time spent recomputing the rollup groups touched by one fact batch',
+    ['rollup'],
+    buckets=(0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+
+
+def for_table(table: str) -> List[str]:
+    """Rollups que se alimentan de la tabla de hechos `table`."""
+    return [name for name, spec in ROLLUPS.items() if spec["source"] == table]
+
+
+def scope_columns(table: str) -> List[str]:
+    """Columnas de `table` que hacen falta para saber qué grupos de sus rollups recalcular."""
+    columns: List[str] = []
+    for name in for_table(table):
+        columns += [c for c in ROLLUPS[name]["scope"] if c not in columns]
+    return columns
+
+
+def create_sql(name: str) -> str:
+    """CREATE TABLE del rollup: columnas de agrupación como PK y las medidas."""
+    spec = ROLLUPS[name]
+    columns = [f"{c} {COLUMN_TYPES[c].upper()}" for c in spec["group"]]
+    columns += [f"{m} {type_} NOT NULL" if type_ == "BIGINT" else f"{m} {type_}" for m, type_, _ in spec["measures"]]
+    columns.append(f"PRIMARY KEY ({', '.join(spec['group'])})")
+    return f"CREATE TABLE IF NOT EXISTS {name} (\n    " + ",\n    ".join(columns) + "\n);"
+
+
+def _select(spec: Dict[str, Any], where: Sequence[str] = ()) -> str:
+    group = ", ".join(spec["group"])
+    measures = ", ".join(expr for _, _, expr in spec["measures"])
+    conditions = list(where) + ([spec["where"]] if spec.get("where") else [])
+    return (
+        f"SELECT {group}, {measures} FROM {spec['source']}"
+        + (f" WHERE {' AND '.join(conditions)}" if conditions else "")
+        + f" GROUP BY {group}"
+    )
+
+
+def _columns(spec: Dict[str, Any]) -> str:
+    return ", ".join(list(spec["group"]) + [m for m, _, _ in spec["measures"]])
+
+
+def rebuild_sql(name: str) -> str:
+    """Recalcula el rollup completo desde su tabla de hechos."""
+    spec = ROLLUPS[name]
+    return f"DELETE FROM {name};\nINSERT INTO {name} ({_columns(spec)})\n{_select(spec)};"
+
+
+def _slot(name: str, values: Sequence[Any]) -> int:
+    return zlib.crc32(f"{name}:{'|'.join(str(v) for v in values)}".encode()) % LOCK_SLOTS
+
+
+def lock(cur, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> int:
+    """
+    Bloquea, en la transacción de `cur` y antes de cualquier escritura en `table`, los slots de
+    los grupos de sus rollups que tocan `rows` (con `columns`). Todos en una sentencia y en
+    orden: dos cargas que comparten grupos se serializan sin esperarse en cruz, y la segunda
+    recalcula con los hechos ya confirmados de la primera. Devuelve los slots bloqueados.
+    """
+    if not ENABLED or not rows:
+        return 0
+    slots = set()
+    for name in for_table(table):
+        scope = ROLLUPS[name]["scope"]
+        idx = [columns.index(c) for c in scope if c != "created_day"]
+        nullable = [columns.index(c) for c in scope]
+        slots.update(_slot(name, [r[i] for i in idx]) for r in rows if all(r[i] is not None for i in nullable))
+    if slots:
+        cur.execute(
+            "SELECT count(pg_advisory_xact_lock(%s, slot)) FROM unnest(%s::int[]) AS slot;",
+            (_LOCK_CLASS, sorted(slots)),
+        )
+    return len(slots)
+
+
+def _lock_all(cur) -> None:
+    cur.execute(
+        "SELECT count(pg_advisory_xact_lock(%s, slot)) FROM generate_series(0, %s) AS slot;",
+        (_LOCK_CLASS, LOCK_SLOTS - 1),
+    )
+
+
+def refresh(cur, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> Dict[str, int]:
+    """
+    Recalcula, en la transacción de `cur`, los grupos de los rollups de `table` que tocan
+    `rows` (filas cargadas o borradas, con `columns`): DELETE de esos scopes e INSERT ... SELECT
+    agregado de los hechos actuales. Los slots de esos grupos se bloquearon con lock() antes
+    de escribir los hechos. Devuelve {rollup: scopes recalculados}.
+    """
+    touched: Dict[str, int] = {}
+    if not ENABLED or not rows:
+        return touched
+    for name in for_table(table):
+        spec = ROLLUPS[name]
+        scope = spec["scope"]
+        idx = [columns.index(c) for c in scope]
+        keys = sorted({tuple(r[i] for i in idx) for r in rows if all(r[i] is not None for i in idx)})
+        if not keys:
+            continue
+        arrays = [list(col) for col in zip(*keys)]
+        in_scope = f"({', '.join(scope)}) IN (SELECT * FROM unnest({', '.join(f'%s::{COLUMN_TYPES[c]}[]' for c in scope)}))"
+        where = [in_scope]
+        params: List[Any] = list(arrays)
+        if "created_day" in scope:
+            # Filtro explícito por día: poda de particiones en el plan, no solo en ejecución
+            where.append("created_day = ANY(%s::date[])")
+            params.append(sorted({k[scope.index("created_day")] for k in keys}))
+        with rollup_refresh_seconds.labels(rollup=name).time():
+            cur.execute(f"DELETE FROM {name} WHERE {in_scope};", arrays)
+            cur.execute(f"INSERT INTO {name} ({_columns(spec)}) {_select(spec, where)};", params)
+        touched[name] = len(keys)
+    return touched
+
+
+def rebuild(conn, names: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    Recalcula rollups completos (default: todos), una transacción por rollup: los dashboards
+    ven la versión anterior hasta el commit. Para después de un full refresh o un backfill
+    con ETL_ROLLUPS=false. Bloquea todos los slots: espera a las cargas en curso.
+    """
+    done = []
+    for name in names or ROLLUPS:
+        with conn.cursor() as cur:
+            _lock_all(cur)
+            cur.execute(rebuild_sql(name))
+        conn.commit()
+        logger.info(f"Rebuilt rollup {name}")
+        done.append(name)
+    return done
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Tablas de agregados (rollups) del warehouse")
+    sub = parser.add_subparsers(dest="command", required=True)
+    rebuild_cmd = sub.add_parser("rebuild", help="recalcular rollups completos desde las tablas de hechos")
+    rebuild_cmd.add_argument("names", nargs="*", help="rollups (default: todos)")
+    sub.add_parser("list", help="rollups y su tabla de origen")
+    parser.add_argument("--url", default=None, help="DSN del warehouse (default: WAREHOUSE_URL)")
+    args = parser.parse_args(argv)
+
+    if args.command == "list":
+        for name, spec in ROLLUPS.items():
+            print(f"{name}: {spec['source']} por {', '.join(spec['group'])}")
+        return 0
+    unknown = set(args.names) - set(ROLLUPS)
+    if unknown:
+        parser.error(f"rollups desconocidos: {', '.join(sorted(unknown))}")
+    conn = psycopg2.connect(args.url or warehouse.WAREHOUSE_URL)
+    try:
+        print(f"Recalculados: {', '.join(rebuild(conn, args.names or None))}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
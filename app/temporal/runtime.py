@@ -0,0 +1,87 @@
+from __future__ import annotations
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+from prometheus_client import Gauge, Histogram
+
+# Las actividades del worker son async y comparten un solo event loop: cualquier
+# llamada bloqueante (psycopg2, gzip/json de staging) congela heartbeats y fetches
+# HTTP de todas las demás. Este módulo concentra el pool de hilos para el
+# warehouse y la medición del lag del loop.
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Debe ser >= ETL_DW_CONCURRENCY_MAX para que el limitador, y no el pool, sea quien limite
+DB_THREADS = int(os.getenv("ETL_DB_THREADS", "16"))
+LOOP_LAG_INTERVAL = float(os.getenv("ETL_LOOP_LAG_INTERVAL", "0.5"))
+
+# Métricas de Prometheus del runtime del worker
+event_loop_lag_seconds = Histogram(
+    'etl_event_loop_lag_seconds',
+    'Delay between the scheduled and the actual wake-up of the event loop probe',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+event_loop_lag_max_seconds = Gauge(
+    'etl_event_loop_lag_max_seconds',
+    'Worst event loop lag observed in the last probe window',
+)
+
+db_threads_busy = Gauge(
+    'etl_db_threads_busy',
+    'Warehouse calls currently running in the DB thread pool',
+)
+
+DB_EXECUTOR = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="etl-db")
+
+
+async def run_in_db_thread(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Ejecuta `fn` en el pool de hilos del warehouse sin bloquear el event loop.
+    Copia el contexto (contextvars) para que el logging de la actividad siga funcionando.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+
+    def call() -> T:
+        db_threads_busy.inc()
+        try:
+            return ctx.run(fn, *args, **kwargs)
+        finally:
+            db_threads_busy.dec()
+
+    return await loop.run_in_executor(DB_EXECUTOR, call)
+
+
+async def monitor_event_loop_lag(interval: Optional[float] = None, window: int = 20) -> None:
+    """
+    Sonda del event loop: duerme `interval` segundos y mide cuánto tarda de más en despertar.
+    Ese exceso es el tiempo que algún callback bloqueó el loop. Corre hasta ser cancelada.
+    """
+    interval = LOOP_LAG_INTERVAL if interval is None else interval
+    worst = 0.0
+    probes = 0
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lag = max(0.0, time.perf_counter() - start - interval)
+        event_loop_lag_seconds.observe(lag)
+        worst = max(worst, lag)
+        probes += 1
+        if lag > 1.0:
+            logger.warning(f"Event loop bloqueado {lag:.2f}s")
+        if probes >= window:
+            event_loop_lag_max_seconds.set(worst)
+            worst = 0.0
+            probes = 0
+
+
+def shutdown() -> None:
+    """Libera el pool de hilos del warehouse (al apagar el worker)."""
+    DB_EXECUTOR.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,556 @@
+from __future__ import annotations
+import os
+import sys
+import logging
+import argparse
+from typing import Callable, List, Optional, Tuple, Union
+
+import psycopg2
+
+from app.temporal import warehouse
+
+# Esquema del warehouse con migraciones versionadas. Se aplican una sola vez (al arrancar el
+# worker o con `python -m app.temporal.schema migrate`) y quedan registradas en
+# `schema_version`; las actividades de carga solo ejecutan DML, sin CREATE ... IF NOT EXISTS
+# (locks de catálogo y round-trips extra) en cada llamada.
+logger = logging.getLogger(__name__)
+
+# Aplicar migraciones pendientes al arrancar el worker (false: solo por CLI/deploy)
+MIGRATE_ON_START = os.getenv("ETL_SCHEMA_MIGRATE", "true").lower() in ("1", "true", "yes")
+# Serializa migraciones de varios workers que arrancan a la vez
+ADVISORY_LOCK_ID = 4_815_162_342
+
+# Migración 1: el DDL original del warehouse (antes etl/ddl.sql), idempotente para adoptar
+# warehouses creados a mano. Usa TIMESTAMPTZ para manejo correcto de timezones.
+_BASE_SQL = """
+CREATE TABLE IF NOT EXISTS dim_users (
+  user_id INT PRIMARY KEY,
+  handle TEXT NOT NULL,
+  display_name TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS dim_chats (
+  chat_id INT PRIMARY KEY,
+  type TEXT NOT NULL,
+  title TEXT,
+  created_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS bridge_chat_members (
+  chat_id INT NOT NULL,
+  user_id INT NOT NULL,
+  role TEXT NOT NULL,
+  joined_at TIMESTAMPTZ NOT NULL,
+  PRIMARY KEY (chat_id, user_id),
+  FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
+  FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE
+);
+
+-- Tabla de hechos de mensajes
+CREATE TABLE IF NOT EXISTS fact_messages (
+  message_id INT PRIMARY KEY,
+  chat_id INT NOT NULL,
+  sender_id INT,
+  body TEXT NOT NULL,
+  message_length INT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL,
+  edited_at TIMESTAMPTZ NULL,
+  reply_to_id INT NULL,
+  created_day DATE NOT NULL,
+  created_hour SMALLINT NOT NULL,
+  FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
+  FOREIGN KEY (sender_id) REFERENCES dim_users(user_id) ON DELETE SET NULL
+);
+
+-- Índices para consultas analíticas comunes
+CREATE INDEX IF NOT EXISTS idx_fact_messages_chat_date
+  ON fact_messages(chat_id, created_day);
+CREATE INDEX IF NOT EXISTS idx_fact_messages_sender_date
+  ON fact_messages(sender_id, created_day) WHERE sender_id IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_fact_messages_created_at
+  ON fact_messages(created_at);
+
+-- Tabla de hechos de reacciones
+CREATE TABLE IF NOT EXISTS fact_reactions (
+  message_id INT NOT NULL,
+  chat_id INT NOT NULL,
+  user_id INT NOT NULL,
+  emoji TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL,
+  created_day DATE NOT NULL,
+  created_hour SMALLINT NOT NULL,
+  PRIMARY KEY (message_id, user_id, emoji),
+  FOREIGN KEY (message_id) REFERENCES fact_messages(message_id) ON DELETE CASCADE,
+  FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
+  FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_fact_reactions_chat_date
+  ON fact_reactions(chat_id, created_day);
+CREATE INDEX IF NOT EXISTS idx_fact_reactions_message
+  ON fact_reactions(message_id);
+
+-- Tabla de hechos de bookings
+CREATE TABLE IF NOT EXISTS fact_bookings (
+  booking_id INT PRIMARY KEY,
+  chat_id INT NOT NULL,
+  user_id INT NOT NULL,
+  message_id INT,
+  booking_type TEXT,
+  booking_date TIMESTAMPTZ,
+  status TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL,
+  created_day DATE NOT NULL,
+  created_hour SMALLINT NOT NULL,
+  FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE,
+  FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE,
+  FOREIGN KEY (message_id) REFERENCES fact_messages(message_id) ON DELETE SET NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_fact_bookings_date_status
+  ON fact_bookings(created_day, status);
+CREATE INDEX IF NOT EXISTS idx_fact_bookings_chat
+  ON fact_bookings(chat_id);
+
+-- Tabla de eventos de bookings
+CREATE TABLE IF NOT EXISTS fact_booking_events (
+  event_id INT PRIMARY KEY,
+  booking_id INT NOT NULL,
+  event_type TEXT NOT NULL,
+  created_at TIMESTAMPTZ NOT NULL,
+  created_day DATE NOT NULL,
+  created_hour SMALLINT NOT NULL,
+  FOREIGN KEY (booking_id) REFERENCES fact_bookings(booking_id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_fact_booking_events_booking
+  ON fact_booking_events(booking_id);
+CREATE INDEX IF NOT EXISTS idx_fact_booking_events_date
+  ON fact_booking_events(created_day);
+
+-- Tabla de watermarks para ETL incremental
+CREATE TABLE IF NOT EXISTS etl_watermarks (
+  key TEXT PRIMARY KEY,
+  value TIMESTAMPTZ NOT NULL,
+  updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+"""
+
+
+# Tablas de hechos particionadas por mes de created_day: (tabla, clave original, FKs a dimensiones).
+# La PK de una tabla particionada debe incluir la columna de partición, así que la clave pasa a
+# (clave, created_day) y las FKs entre hechos (que apuntaban a message_id / booking_id solos)
+# desaparecen; los borrados en cascada entre hechos los hace el consumidor del outbox (cdc.py).
+_PARTITIONED_FACTS = (
+    ("fact_messages", "message_id", (
+        "FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE",
+        "FOREIGN KEY (sender_id) REFERENCES dim_users(user_id) ON DELETE SET NULL",
+    ), (
+        "idx_fact_messages_chat_date ON fact_messages(chat_id, created_day)",
+        "idx_fact_messages_sender_date ON fact_messages(sender_id, created_day) WHERE sender_id IS NOT NULL",
+        "idx_fact_messages_created_at ON fact_messages(created_at)",
+    )),
+    ("fact_reactions", "message_id, user_id, emoji", (
+        "FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE",
+        "FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE",
+    ), (
+        "idx_fact_reactions_chat_date ON fact_reactions(chat_id, created_day)",
+        "idx_fact_reactions_message ON fact_reactions(message_id)",
+    )),
+    ("fact_bookings", "booking_id", (
+        "FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE",
+        "FOREIGN KEY (user_id) REFERENCES dim_users(user_id) ON DELETE CASCADE",
+    ), (
+        "idx_fact_bookings_date_status ON fact_bookings(created_day, status)",
+        "idx_fact_bookings_chat ON fact_bookings(chat_id)",
+        "idx_fact_bookings_message ON fact_bookings(message_id)",
+    )),
+    ("fact_booking_events", "event_id", (), (
+        "idx_fact_booking_events_booking ON fact_booking_events(booking_id)",
+        "idx_fact_booking_events_date ON fact_booking_events(created_day)",
+    )),
+)
+
+
+def _partition_facts_sql() -> str:
+    """
+    Convierte cada tabla de hechos en particionada por rango mensual de created_day: crea la
+    nueva con la misma estructura, una partición por mes con datos (más el actual y 3 siguientes),
+    copia las filas y reemplaza la vieja. Se ejecuta en una sola transacción.
+    """
+    parts = [
+        "ALTER TABLE fact_reactions DROP CONSTRAINT IF EXISTS fact_reactions_message_id_fkey;",
+        "ALTER TABLE fact_bookings DROP CONSTRAINT IF EXISTS fact_bookings_message_id_fkey;",
+        "ALTER TABLE fact_booking_events DROP CONSTRAINT IF EXISTS fact_booking_events_booking_id_fkey;",
+    ]
+    for table, key, fks, indexes in _PARTITIONED_FACTS:
+        old = f"{table}_unpartitioned"
+        parts.append(f"""
+        ALTER TABLE {table} RENAME TO {old};
+        CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (created_day);
+        DO $$
+        DECLARE m date;
+        BEGIN
+          FOR m IN
+            SELECT generate_series(lo, hi, interval '1 month')::date FROM (
+              SELECT date_trunc('month', LEAST(COALESCE(min(created_day), CURRENT_DATE), CURRENT_DATE)) AS lo,
+                     date_trunc('month', GREATEST(COALESCE(max(created_day), CURRENT_DATE), CURRENT_DATE)) + interval '3 month' AS hi
+              FROM {old}
+            ) bounds
+          LOOP
+            EXECUTE format('CREATE TABLE %I PARTITION OF {table} FOR VALUES FROM (%L) TO (%L)',
+                           '{table}_p' || to_char(m, 'YYYYMM'), m, (m + interval '1 month')::date);
+          END LOOP;
+        END $$;
+        INSERT INTO {table} SELECT * FROM {old};
+        DROP TABLE {old};
+        ALTER TABLE {table} ADD PRIMARY KEY ({key}, created_day);
+        """)
+        parts += [f"ALTER TABLE {table} ADD {fk};" for fk in fks]
+        parts += [f"CREATE INDEX IF NOT EXISTS {index};" for index in indexes]
+    return "\n".join(parts)
+
+
+# Las migraciones 6 a 8 quedan escritas tal como se aplicaron: no se generan desde
+# rollups.ROLLUPS, matviews.VIEWS ni snapshots.FACTS, que pueden crecer. Un rollup, vista o
+# tabla nueva va en una migración nueva (con rollups.create_sql / matviews.create_sql como
+# guía); test_schema comprueba que lo registrado coincide con alguna migración.
+_ROLLUPS_SQL = """
+    CREATE TABLE IF NOT EXISTS rollup_messages_chat_day (
+        chat_id INT,
+        created_day DATE,
+        messages BIGINT NOT NULL,
+        senders BIGINT NOT NULL,
+        chars BIGINT NOT NULL,
+        last_message_at TIMESTAMPTZ,
+        PRIMARY KEY (chat_id, created_day)
+    );
+    DELETE FROM rollup_messages_chat_day;
+    INSERT INTO rollup_messages_chat_day (chat_id, created_day, messages, senders, chars, last_message_at)
+    SELECT chat_id, created_day, count(*), count(DISTINCT sender_id), coalesce(sum(message_length), 0), max(created_at)
+    FROM fact_messages GROUP BY chat_id, created_day;
+
+    CREATE TABLE IF NOT EXISTS rollup_messages_user_day (
+        sender_id INT,
+        created_day DATE,
+        messages BIGINT NOT NULL,
+        chats BIGINT NOT NULL,
+        chars BIGINT NOT NULL,
+        PRIMARY KEY (sender_id, created_day)
+    );
+    DELETE FROM rollup_messages_user_day;
+    INSERT INTO rollup_messages_user_day (sender_id, created_day, messages, chats, chars)
+    SELECT sender_id, created_day, count(*), count(DISTINCT chat_id), coalesce(sum(message_length), 0)
+    FROM fact_messages WHERE sender_id IS NOT NULL GROUP BY sender_id, created_day;
+
+    CREATE TABLE IF NOT EXISTS rollup_messages_chat_hour (
+        chat_id INT,
+        created_day DATE,
+        created_hour SMALLINT,
+        messages BIGINT NOT NULL,
+        PRIMARY KEY (chat_id, created_day, created_hour)
+    );
+    DELETE FROM rollup_messages_chat_hour;
+    INSERT INTO rollup_messages_chat_hour (chat_id, created_day, created_hour, messages)
+    SELECT chat_id, created_day, created_hour, count(*) FROM fact_messages GROUP BY chat_id, created_day, created_hour;
+
+    CREATE TABLE IF NOT EXISTS rollup_reactions_emoji_day (
+        chat_id INT,
+        created_day DATE,
+        emoji TEXT,
+        reactions BIGINT NOT NULL,
+        messages BIGINT NOT NULL,
+        users BIGINT NOT NULL,
+        PRIMARY KEY (chat_id, created_day, emoji)
+    );
+    DELETE FROM rollup_reactions_emoji_day;
+    INSERT INTO rollup_reactions_emoji_day (chat_id, created_day, emoji, reactions, messages, users)
+    SELECT chat_id, created_day, emoji, count(*), count(DISTINCT message_id), count(DISTINCT user_id)
+    FROM fact_reactions GROUP BY chat_id, created_day, emoji;
+
+    CREATE TABLE IF NOT EXISTS rollup_bookings_status_day (
+        created_day DATE,
+        status TEXT,
+        bookings BIGINT NOT NULL,
+        PRIMARY KEY (created_day, status)
+    );
+    DELETE FROM rollup_bookings_status_day;
+    INSERT INTO rollup_bookings_status_day (created_day, status, bookings)
+    SELECT created_day, status, count(*) FROM fact_bookings GROUP BY created_day, status;
+"""
+
+_MATVIEWS_SQL = """
+    CREATE TABLE IF NOT EXISTS etl_matview_refreshes(
+        view_name TEXT PRIMARY KEY,
+        refreshed_at TIMESTAMPTZ NOT NULL,
+        seconds DOUBLE PRECISION NOT NULL
+    );
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_top_users AS
+    SELECT u.user_id, u.handle, u.display_name,
+           COALESCE(m.messages, 0) AS messages,
+           COALESCE(m.chats, 0) AS chats,
+           COALESCE(r.reactions, 0) AS reactions_given,
+           m.last_message_at
+    FROM dim_users u
+    LEFT JOIN (
+        SELECT sender_id, count(*) AS messages, count(DISTINCT chat_id) AS chats,
+               max(created_at) AS last_message_at
+        FROM fact_messages WHERE sender_id IS NOT NULL GROUP BY sender_id
+    ) m ON m.sender_id = u.user_id
+    LEFT JOIN (
+        SELECT user_id, count(*) AS reactions FROM fact_reactions GROUP BY user_id
+    ) r ON r.user_id = u.user_id;
+    CREATE UNIQUE INDEX IF NOT EXISTS mv_top_users_key ON mv_top_users (user_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_chat_activity AS
+    SELECT c.chat_id, c.type, c.title,
+           COALESCE(m.messages, 0) AS messages,
+           COALESCE(m.senders, 0) AS senders,
+           COALESCE(mb.members, 0) AS members,
+           COALESCE(r.reactions, 0) AS reactions,
+           COALESCE(r.messages_with_reactions, 0) AS messages_with_reactions,
+           m.first_message_at, m.last_message_at,
+           CASE
+               WHEN COALESCE(m.messages, 0) = 0 THEN '0'
+               WHEN m.messages <= 50 THEN '1-50'
+               WHEN m.messages <= 200 THEN '51-200'
+               WHEN m.messages <= 500 THEN '201-500'
+               WHEN m.messages <= 1000 THEN '501-1000'
+               ELSE '1000+'
+           END AS size_bucket
+    FROM dim_chats c
+    LEFT JOIN (
+        SELECT chat_id, count(*) AS messages, count(DISTINCT sender_id) AS senders,
+               min(created_at) AS first_message_at, max(created_at) AS last_message_at
+        FROM fact_messages GROUP BY chat_id
+    ) m ON m.chat_id = c.chat_id
+    LEFT JOIN (
+        SELECT chat_id, count(*) AS members FROM bridge_chat_members GROUP BY chat_id
+    ) mb ON mb.chat_id = c.chat_id
+    LEFT JOIN (
+        SELECT chat_id, count(*) AS reactions, count(DISTINCT message_id) AS messages_with_reactions
+        FROM fact_reactions GROUP BY chat_id
+    ) r ON r.chat_id = c.chat_id;
+    CREATE UNIQUE INDEX IF NOT EXISTS mv_chat_activity_key ON mv_chat_activity (chat_id);
+
+    CREATE MATERIALIZED VIEW IF NOT EXISTS mv_booking_funnel AS
+    SELECT date_trunc('month', b.created_day)::date AS month,
+           COALESCE(b.booking_type, 'sin tipo') AS booking_type,
+           count(*) AS bookings,
+           count(*) FILTER (WHERE e.events > 0) AS with_events,
+           count(*) FILTER (WHERE b.status = 'PENDING') AS pending,
+           count(*) FILTER (WHERE b.status = 'CONFIRMED') AS confirmed,
+           count(*) FILTER (WHERE b.status = 'CANCELLED') AS cancelled,
+           round(count(*) FILTER (WHERE b.status = 'CONFIRMED')::numeric / count(*), 4) AS confirmation_rate
+    FROM fact_bookings b
+    LEFT JOIN (
+        SELECT booking_id, count(*) AS events FROM fact_booking_events GROUP BY booking_id
+    ) e ON e.booking_id = b.booking_id
+    GROUP BY 1, 2;
+    CREATE UNIQUE INDEX IF NOT EXISTS mv_booking_funnel_key ON mv_booking_funnel (month, booking_type);
+"""
+
+# Días pendientes del export a Parquet: todos los que ya tienen datos (el primer export es completo)
+_EXPORT_PENDING_SQL = """
+    CREATE TABLE IF NOT EXISTS etl_export_pending(
+        table_name TEXT NOT NULL,
+        created_day DATE NOT NULL,
+        PRIMARY KEY (table_name, created_day)
+    );
+    INSERT INTO etl_export_pending (table_name, created_day)
+    SELECT DISTINCT 'fact_messages', created_day FROM fact_messages ON CONFLICT DO NOTHING;
+    INSERT INTO etl_export_pending (table_name, created_day)
+    SELECT DISTINCT 'fact_reactions', created_day FROM fact_reactions ON CONFLICT DO NOTHING;
+    INSERT INTO etl_export_pending (table_name, created_day)
+    SELECT DISTINCT 'fact_bookings', created_day FROM fact_bookings ON CONFLICT DO NOTHING;
+    INSERT INTO etl_export_pending (table_name, created_day)
+    SELECT DISTINCT 'fact_booking_events', created_day FROM fact_booking_events ON CONFLICT DO NOTHING;
+"""
+
+
+# (versión, nombre, SQL) en orden. Una migración aplicada no se edita: los cambios van en una nueva.
+# La 1 es el DDL base (idempotente, así que también adopta warehouses existentes). Todas son SQL
+# fijo (la 3 se arma solo con constantes de este módulo): nada de lo que se aplicó depende de
+# archivos o registros que cambian después.
+Migration = Tuple[int, str, Union[str, Callable[[], str]]]
+
+MIGRATIONS: List[Migration] = [
+    (1, "base", _BASE_SQL),
+    (2, "outbox_offsets", """
+        CREATE TABLE IF NOT EXISTS etl_outbox_offsets(
+            consumer TEXT PRIMARY KEY,
+            last_id BIGINT NOT NULL,
+            updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """),
+    (3, "partition_facts_by_month", _partition_facts_sql),
+    # Miembros inferidos: stubs de dimensiones que un hecho referenció antes de su carga (loader.INFERRED)
+    (4, "inferred_dimension_members", """
+        ALTER TABLE dim_users ADD COLUMN IF NOT EXISTS is_inferred BOOLEAN NOT NULL DEFAULT FALSE;
+        ALTER TABLE dim_chats ADD COLUMN IF NOT EXISTS is_inferred BOOLEAN NOT NULL DEFAULT FALSE;
+        CREATE INDEX IF NOT EXISTS idx_dim_users_inferred ON dim_users(user_id) WHERE is_inferred;
+        CREATE INDEX IF NOT EXISTS idx_dim_chats_inferred ON dim_chats(chat_id) WHERE is_inferred;
+    """),
+    # Filas que el loader aisló de un lote fallido (loader.QUARANTINE_TABLE), con el error de Postgres
+    (5, "etl_quarantine", """
+        CREATE TABLE IF NOT EXISTS etl_quarantine(
+            id BIGSERIAL PRIMARY KEY,
+            entity TEXT NOT NULL,
+            payload JSONB NOT NULL,
+            error TEXT NOT NULL,
+            sqlstate TEXT,
+            quarantined_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+        CREATE INDEX IF NOT EXISTS idx_etl_quarantine_entity ON etl_quarantine(entity, quarantined_at);
+    """),
+    (6, "dashboard_rollups", _ROLLUPS_SQL),
+    (7, "materialized_views", _MATVIEWS_SQL),
+    (8, "parquet_export_pending", _EXPORT_PENDING_SQL),
+    # Tablas resumen que reescriben los jobs de Spark (spark/apps/user_activity.py, reaction_distribution.py)
+    (9, "spark_summaries", """
+        CREATE TABLE IF NOT EXISTS spark_user_hourly_activity(
+            sender_id INT NOT NULL,
+            created_hour SMALLINT NOT NULL,
+            messages BIGINT NOT NULL,
+            chats BIGINT NOT NULL,
+            active_days BIGINT NOT NULL,
+            chars BIGINT,
+            computed_at TIMESTAMPTZ NOT NULL,
+            PRIMARY KEY (sender_id, created_hour)
+        );
+        CREATE TABLE IF NOT EXISTS spark_hourly_activity(
+            created_hour SMALLINT PRIMARY KEY,
+            messages BIGINT NOT NULL,
+            senders BIGINT NOT NULL,
+            chats BIGINT NOT NULL,
+            avg_length DOUBLE PRECISION,
+            computed_at TIMESTAMPTZ NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS spark_emoji_distribution(
+            emoji TEXT PRIMARY KEY,
+            reactions BIGINT NOT NULL,
+            messages BIGINT NOT NULL,
+            users BIGINT NOT NULL,
+            chats BIGINT NOT NULL,
+            share DOUBLE PRECISION NOT NULL,
+            computed_at TIMESTAMPTZ NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS spark_reactions_per_message(
+            reactions BIGINT PRIMARY KEY,
+            messages BIGINT NOT NULL,
+            computed_at TIMESTAMPTZ NOT NULL
+        );
+    """),
+    # Tablas vivas retenidas por un full refresh con sombras (loader.HOLDS_TABLE): sin escrituras hasta el swap
+    (10, "shadow_refresh_holds", """
+        CREATE TABLE IF NOT EXISTS etl_shadow_holds(
+            table_name TEXT PRIMARY KEY,
+            started_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """),
+]
+
+
+def _sql(migration: Migration) -> str:
+    sql = migration[2]
+    return sql() if callable(sql) else sql
+
+
+def _ensure_version_table(cur) -> None:
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_version(
+            version INT PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+        );
+    """)
+
+
+def applied_versions(conn) -> List[int]:
+    """Versiones ya aplicadas (vacío si el warehouse nunca se migró)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('schema_version') IS NOT NULL;")
+        if not cur.fetchone()[0]:
+            conn.rollback()
+            return []
+        cur.execute("SELECT version FROM schema_version ORDER BY version;")
+        versions = [row[0] for row in cur.fetchall()]
+    conn.rollback()
+    return versions
+
+
+def pending(conn) -> List[Migration]:
+    """Migraciones que faltan aplicar, en orden."""
+    done = set(applied_versions(conn))
+    return [m for m in MIGRATIONS if m[0] not in done]
+
+
+def migrate(conn, target: Optional[int] = None) -> List[int]:
+    """
+    Aplica las migraciones pendientes hasta `target` (todas por defecto), cada una en su propia
+    transacción junto con su fila en schema_version. Un advisory lock evita que dos procesos
+    migren a la vez; el que espera encuentra el trabajo hecho. Devuelve las versiones aplicadas.
+    """
+    conn.autocommit = False
+    applied: List[int] = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (ADVISORY_LOCK_ID,))
+    try:
+        with conn.cursor() as cur:
+            _ensure_version_table(cur)
+        conn.commit()
+        for migration in pending(conn):
+            version, name, _ = migration
+            if target is not None and version > target:
+                break
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(_sql(migration))
+                    cur.execute("INSERT INTO schema_version(version, name) VALUES (%s, %s);", (version, name))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Warehouse migration {version} ({name}) failed", exc_info=True)
+                raise
+            logger.info(f"Applied warehouse migration {version} ({name})")
+            applied.append(version)
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (ADVISORY_LOCK_ID,))
+        conn.commit()
+    if not applied:
+        logger.info(f"Warehouse schema up to date (version {MIGRATIONS[-1][0]})")
+    return applied
+
+
+def migrate_warehouse() -> List[int]:
+    """migrate() con una conexión del pool del warehouse (arranque del worker)."""
+    with warehouse.connection() as conn:
+        return migrate(conn)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Migraciones del esquema del warehouse")
+    parser.add_argument("command", choices=("migrate", "status"))
+    parser.add_argument("--target", type=int, default=None, help="aplicar solo hasta esta versión")
+    parser.add_argument("--url", default=None, help="DSN del warehouse (default: WAREHOUSE_URL)")
+    args = parser.parse_args(argv)
+
+    conn = psycopg2.connect(args.url or warehouse.WAREHOUSE_URL)
+    try:
+        if args.command == "migrate":
+            applied = migrate(conn, args.target)
+            print(f"Aplicadas: {', '.join(map(str, applied)) or 'ninguna'}")
+        done = set(applied_versions(conn))
+        for version, name, _ in MIGRATIONS:
+            print(f"{version:4d}  {name:20s}  {'aplicada' if version in done else 'pendiente'}")
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
@@ -0,0 +1,281 @@
+from __future__ import annotations
+import os
+import logging
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import psycopg2
+import psycopg2.errors
+from prometheus_client import Counter, Histogram
+
+from app.temporal import loader, matviews, partitions
+
+# Full refresh con tablas sombra: cada tabla de hechos se carga en `<tabla>__shadow` (sin
+# índices ni claves, solo COPY), al final se construyen índices y constraints de una vez, se
+# validan los conteos y se reemplaza la tabla viva con renames dentro de una transacción.
+# Dashboards ven la versión anterior completa hasta el commit del swap, nunca una a medio cargar.
+logger = logging.getLogger(__name__)
+
+# Entidades con refresh por tabla sombra (las dimensiones son chicas y las referencian los hechos)
+ENTITIES: Tuple[str, ...] = ("messages", "reactions", "bookings", "booking_events")
+
+# Fracción máxima en que la tabla nueva puede tener menos filas que la viva sin abortar el swap
+MAX_SHRINK = float(os.getenv("ETL_SHADOW_MAX_SHRINK", "0.1"))
+SUFFIX = loader.SHADOW_SUFFIX
+
+shadow_swaps_total = Counter(
+    'etl_shadow_swaps_total',
+    'Shadow table full refreshes by result (swapped, rejected)',
+    ['table', 'result'],
+)
+
+shadow_finalize_seconds = Histogram(
+    'etl_shadow_finalize_seconds',
+    'Time spent building keys and indexes on a shadow table before the swap',
+    ['table'],
+    buckets=(1, 5, 15, 60, 300, 900, 3600),
+)
+
+
+class ShadowValidationError(Exception):
+    """La tabla sombra no pasó la validación de conteos: la tabla viva queda intacta."""
+
+
+def _live(entity: str) -> str:
+    return loader.TABLES[entity]["table"]
+
+
+def _is_partitioned(cur, table: str) -> bool:
+    cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(%s);", (table,))
+    row = cur.fetchone()
+    return bool(row and row[0])
+
+
+def _release(cur, lives: List[str]) -> None:
+    cur.execute(f"DELETE FROM {loader.HOLDS_TABLE} WHERE table_name = ANY(%s);", (lives,))
+
+
+def held(conn) -> List[str]:
+    """Tablas vivas retenidas por un full refresh en curso (sus escrituras esperan al swap)."""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT table_name FROM {loader.HOLDS_TABLE} ORDER BY table_name;")
+        tables = [table for (table,) in cur.fetchall()]
+    conn.rollback()
+    return tables
+
+
+def prepare(conn, entities: Iterable[str] = ENTITIES) -> Dict[str, str]:
+    """
+    (Re)crea las tablas sombra vacías, con las columnas de la viva y sin índices ni constraints
+    (particionadas igual que la viva; las particiones las crea el loader). Devuelve {entidad: tabla}.
+    Antes espera a las escrituras en curso sobre tablas vivas (advisory lock exclusivo) y
+    retiene las vivas de `entities` hasta el swap o el drop: CDC, incremental y upserts no
+    escriben en ellas mientras tanto (loader.check_live_write), porque el swap lo descartaría.
+    """
+    entities = list(entities)
+    created = {}
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s);", (loader.WRITE_LOCK_ID,))
+        cur.execute(
+            f"INSERT INTO {loader.HOLDS_TABLE} (table_name) SELECT unnest(%s::text[]) "
+            f"ON CONFLICT (table_name) DO UPDATE SET started_at = NOW();",
+            ([_live(e) for e in entities],),
+        )
+        for entity in entities:
+            live = _live(entity)
+            shadow = loader.shadow_table(live)
+            partition_by = f" PARTITION BY RANGE ({partitions.PARTITION_COLUMN})" if _is_partitioned(cur, live) else ""
+            cur.execute(f"DROP TABLE IF EXISTS {shadow};")
+            cur.execute(f"CREATE TABLE {shadow} (LIKE {live} INCLUDING DEFAULTS){partition_by};")
+            created[entity] = shadow
+    conn.commit()
+    logger.info(f"Prepared shadow tables: {', '.join(created.values())}")
+    return created
+
+
+def drop(conn, entities: Iterable[str] = ENTITIES) -> None:
+    """Descarta las tablas sombra (refresh abortado) y libera la retención de las vivas."""
+    entities = list(entities)
+    with conn.cursor() as cur:
+        for entity in entities:
+            cur.execute(f"DROP TABLE IF EXISTS {loader.shadow_table(_live(entity))};")
+        _release(cur, [_live(e) for e in entities])
+    conn.commit()
+
+
+def _definition(cur, table: str) -> Tuple[List[Tuple[str, str, str]], List[Tuple[str, str]]]:
+    """Constraints (nombre, tipo, definición) e índices sueltos (nombre, definición) de `table`."""
+    cur.execute("""
+        SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = to_regclass(%s) AND contype IN ('p', 'u', 'f', 'c')
+        ORDER BY contype = 'f', conname;
+    """, (table,))
+    constraints = cur.fetchall()
+    cur.execute("""
+        SELECT i.relname, pg_get_indexdef(x.indexrelid) FROM pg_index x
+        JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(%s)
+          AND NOT EXISTS (
+            SELECT 1 FROM pg_constraint c WHERE c.conrelid = x.indrelid AND c.conindid = x.indexrelid
+          )
+        ORDER BY i.relname;
+    """, (table,))
+    return constraints, cur.fetchall()
+
+
+def _dedupe(cur, entity: str, shadow: str) -> int:
+    """
+    Deja una fila por clave (reintentos de actividades pueden haber agregado una página dos veces).
+    La clave es sin created_day: la misma fila no puede quedar en dos particiones.
+    """
+    key = ", ".join(loader.identity(entity))
+    cur.execute(f"""
+        DELETE FROM {shadow} WHERE (tableoid, ctid) IN (
+            SELECT tableoid, ctid FROM (
+                SELECT tableoid, ctid, row_number() OVER (PARTITION BY {key} ORDER BY ctid DESC) AS rn
+                FROM {shadow}
+            ) d WHERE rn > 1
+        );
+    """)
+    return cur.rowcount
+
+
+def _match_partitions(cur, live: str, shadow: str) -> None:
+    """
+    La sombra tiene solo los meses con datos: se le agregan los que tiene la viva (y los
+    próximos), así ninguna partición que los workers ya conocen desaparece con el swap.
+    """
+    months = {month for _, month in partitions.list_partitions(cur, live)}
+    first = partitions.month_start(date.today())
+    months.update(partitions.add_months(first, i) for i in range(partitions.MONTHS_AHEAD + 1))
+    partitions.ensure_partitions(cur, shadow, months)
+
+
+def finalize(
+    conn,
+    entity: str,
+    expected: Optional[int] = None,
+    max_shrink: float = MAX_SHRINK,
+    source: Optional[Dict[str, Any]] = None,
+) -> Dict[str, int]:
+    """
+    Construye sobre la sombra las constraints (PK, FKs) e índices de la viva, la analiza y
+    valida los conteos: al menos una fila si la viva tiene datos, no más filas que las cargadas
+    (`expected`), no menos que (1 - max_shrink) de la viva y, con `source` ({"rows": filas
+    extraídas, "discarded": descartadas por validación o cuarentena}), todas las filas de la
+    fuente presentes: cada una está en la sombra, se descartó o era una clave repetida.
+    Si falla, ShadowValidationError.
+    """
+    live = _live(entity)
+    shadow = loader.shadow_table(live)
+    with shadow_finalize_seconds.labels(table=live).time(), conn.cursor() as cur:
+        constraints, indexes = _definition(cur, live)
+        if _is_partitioned(cur, live):
+            _match_partitions(cur, live, shadow)
+        removed = 0
+        for name, contype, definition in constraints:
+            sql = f"ALTER TABLE {shadow} ADD CONSTRAINT {name}{SUFFIX} {definition};"
+            if contype not in ("p", "u"):
+                cur.execute(sql)
+                continue
+            cur.execute("SAVEPOINT shadow_key;")
+            try:
+                cur.execute(sql)
+            except psycopg2.errors.UniqueViolation:
+                cur.execute("ROLLBACK TO SAVEPOINT shadow_key;")
+                removed += _dedupe(cur, entity, shadow)
+                cur.execute(sql)
+            cur.execute("RELEASE SAVEPOINT shadow_key;")
+        for name, definition in indexes:
+            # "CREATE INDEX idx ON [ONLY] public.tabla USING ..." -> mismo índice sobre la sombra
+            head, _, tail = definition.partition(" USING ")
+            unique = "UNIQUE " if head.startswith("CREATE UNIQUE") else ""
+            cur.execute(f"CREATE {unique}INDEX {name}{SUFFIX} ON {shadow} USING {tail};")
+        cur.execute(f"ANALYZE {shadow};")
+        cur.execute(f"SELECT count(*) FROM {shadow};")
+        rows = cur.fetchone()[0]
+        cur.execute(f"SELECT count(*) FROM {live};")
+        previous = cur.fetchone()[0]
+    stats = {"rows": rows, "previous": previous, "duplicates_removed": removed}
+    problems = []
+    if previous and not rows:
+        problems.append("la tabla nueva está vacía")
+    if expected is not None and rows > expected:
+        problems.append(f"{rows} filas pero solo se cargaron {expected}")
+    if previous and rows < previous * (1 - max_shrink):
+        problems.append(f"{rows} filas contra {previous} en la tabla viva (máximo {max_shrink:.0%} menos)")
+    if source is not None:
+        accounted = rows + removed + int(source.get("discarded", 0))
+        if accounted < int(source.get("rows", 0)):
+            problems.append(f"{int(source['rows']) - accounted} de {source['rows']} filas de la fuente no llegaron a la tabla nueva")
+    if problems:
+        conn.rollback()
+        shadow_swaps_total.labels(table=live, result="rejected").inc()
+        raise ShadowValidationError(f"{shadow}: " + "; ".join(problems))
+    conn.commit()
+    return stats
+
+
+def _renames(cur, shadow: str, live: str) -> List[str]:
+    """ALTERs que quitan el sufijo de la sombra: constraints, índices y particiones."""
+    cur.execute("SELECT conname FROM pg_constraint WHERE conrelid = to_regclass(%s);", (shadow,))
+    sql = [
+        f"ALTER TABLE {live} RENAME CONSTRAINT {name} TO {name[:-len(SUFFIX)]};"
+        for (name,) in cur.fetchall() if name.endswith(SUFFIX)
+    ]
+    cur.execute("""
+        SELECT i.relname FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid
+        WHERE x.indrelid = to_regclass(%s)
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conrelid = x.indrelid AND c.conindid = x.indexrelid);
+    """, (shadow,))
+    sql += [
+        f"ALTER INDEX {name} RENAME TO {name[:-len(SUFFIX)]};"
+        for (name,) in cur.fetchall() if name.endswith(SUFFIX)
+    ]
+    sql += [
+        f"ALTER TABLE {name} RENAME TO {partitions.partition_name(live, month)};"
+        for name, month in partitions.list_partitions(cur, shadow)
+    ]
+    return sql
+
+
+def swap(conn, entities: Iterable[str]) -> None:
+    """
+    Reemplaza las tablas vivas por sus sombras en una sola transacción: lock de todas, DROP de
+    las vivas, rename de las sombras y de sus constraints, índices y particiones a los nombres
+    definitivos, y libera la retención de las vivas. Las lecturas concurrentes esperan solo lo
+    que dura el lock y luego ven todas las tablas nuevas completas (mensajes y reacciones de la
+    misma corrida).
+    Las vistas materializadas de matviews.py que leen esas tablas impedirían el DROP: se borran y
+    se recrean vacías (WITH NO DATA) en la misma transacción, para no calcularlas bajo el lock,
+    y se llenan con REFRESH después del commit. Si ese REFRESH falla quedan sin datos hasta
+    refresh_materialized_views, que las llena primero.
+    """
+    pairs = [(_live(e), loader.shadow_table(_live(e))) for e in entities]
+    views = matviews.for_tables(live for live, _ in pairs)
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"LOCK TABLE {', '.join(live for live, _ in pairs)} IN ACCESS EXCLUSIVE MODE;")
+            for name in views:
+                cur.execute(f"DROP MATERIALIZED VIEW IF EXISTS {name};")
+            for live, shadow in pairs:
+                renames = _renames(cur, shadow, live)
+                cur.execute(f"DROP TABLE {live};")
+                cur.execute(f"ALTER TABLE {shadow} RENAME TO {live};")
+                for sql in renames:
+                    cur.execute(sql)
+            for name in views:
+                cur.execute(matviews.create_sql(name, with_data=False))
+            _release(cur, [live for live, _ in pairs])
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    for live, shadow in pairs:
+        shadow_swaps_total.labels(table=live, result="swapped").inc()
+    logger.info(f"Swapped {', '.join(shadow for _, shadow in pairs)} into place")
+    try:
+        matviews.refresh(conn, views)
+    except Exception:
+        conn.rollback()
+        logger.warning(f"Could not populate {', '.join(views)} after the swap; refresh_materialized_views will", exc_info=True)
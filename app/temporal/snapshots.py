@@ -0,0 +1,256 @@
+from __future__ import annotations
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+from datetime import date
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import psycopg2
+from prometheus_client import Counter, Histogram
+
+from app.temporal import partitions, warehouse
+
+try:  # pyarrow es opcional: sin él no hay export a Parquet (el resto del ETL no lo usa)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - depende del entorno
+    pa = pq = None
+
+# Snapshot del warehouse en Parquet para Spark y análisis offline: cada tabla de hechos en
+# `<dir>/<tabla>/created_day=YYYY-MM-DD/part-0.parquet` (layout Hive, Spark poda por día y lee
+# solo las columnas que usa) y cada dimensión en un archivo. Es incremental: el loader y el
+# consumidor del outbox registran en la misma transacción los días que tocaron
+# (PENDING_TABLE) y el export reescribe solo esos días.
+logger = logging.getLogger(__name__)
+
+HAS_PYARROW = pa is not None
+# Directorio destino (en docker-compose, el volumen que montan los contenedores de Spark);
+# vacío: el export de cada corrida no hace nada
+EXPORT_DIR = os.getenv("ETL_EXPORT_DIR", "")
+# Filas por fetch del cursor del lado del servidor (= row group de Parquet)
+BATCH_ROWS = int(os.getenv("ETL_EXPORT_BATCH_ROWS", "50000"))
+COMPRESSION = os.getenv("ETL_EXPORT_COMPRESSION", "zstd")
+
+# Días pendientes de exportar por tabla de hechos (migración 8)
+PENDING_TABLE = "etl_export_pending"
+PARTITION_COLUMN = partitions.PARTITION_COLUMN
+FACTS: Tuple[str, ...] = tuple(partitions.TABLES.values())
+# Las dimensiones son chicas y no tienen día: se reescriben completas en cada export
+DIMENSIONS: Tuple[str, ...] = ("dim_users", "dim_chats", "bridge_chat_members")
+FILE_NAME = "part-0.parquet"
+
+export_rows_total = Counter(
+    'etl_export_rows_total',
+    'Rows written to Parquet snapshot files',
+    ['table'],
+)
+
+export_seconds = Histogram(
+    'etl_export_seconds',
+    'Time spent exporting the pending days of one warehouse table to Parquet',
+    ['table'],
+    buckets=(0.1, 0.5, 1, 5, 15, 60, 300, 900),
+)
+
+
+def mark(cur, table: str, columns: Sequence[str], rows: Sequence[Sequence[Any]]) -> int:
+    """
+    Registra como pendientes de export los días de `rows` (filas de la tabla de hechos
+    `table` con `columns`), en la transacción de `cur`. Devuelve la cantidad de días.
+    """
+    if table not in FACTS or not rows:
+        return 0
+    idx = columns.index(PARTITION_COLUMN)
+    days = sorted({r[idx] for r in rows if r[idx] is not None})
+    if days:
+        # Orden fijo: dos cargas que marcan los mismos días no se bloquean en cruz
+        cur.execute(f"""
+            INSERT INTO {PENDING_TABLE} (table_name, created_day)
+            SELECT %s, unnest(%s::date[]) ON CONFLICT DO NOTHING;
+        """, (table, days))
+    return len(days)
+
+
+def _arrow_type(pg_type: str) -> Any:
+    return {
+        "smallint": pa.int16(),
+        "integer": pa.int32(),
+        "bigint": pa.int64(),
+        "boolean": pa.bool_(),
+        "date": pa.date32(),
+        "double precision": pa.float64(),
+        "timestamp with time zone": pa.timestamp("us", tz="UTC"),
+        "timestamp without time zone": pa.timestamp("us"),
+    }.get(pg_type, pa.string())
+
+
+def _schema(cur, table: str, exclude: Iterable[str] = ()) -> Tuple[List[str], Any]:
+    """Columnas de `table` (sin `exclude`) y el schema de Arrow equivalente."""
+    cur.execute("""
+        SELECT attname, format_type(atttypid, atttypmod) FROM pg_attribute
+        WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped
+        ORDER BY attnum;
+    """, (table,))
+    columns = [(name, pg_type) for name, pg_type in cur.fetchall() if name not in exclude]
+    return [n for n, _ in columns], pa.schema([(n, _arrow_type(t)) for n, t in columns])
+
+
+def _write(conn, path: str, schema: Any, query: str, params: Any = None) -> int:
+    """
+    Escribe el resultado de `query` en `path` por lotes de BATCH_ROWS (cursor del lado del
+    servidor: nunca hay una tabla entera en memoria). Se escribe a un temporal y se renombra,
+    así un lector nunca ve un archivo a medias. El temporal empieza con "_", que Spark y
+    pyarrow ignoran al listar un directorio created_day=...: un export que se corta no deja
+    un archivo que rompa la lectura del dataset. Sin filas no deja archivo. Devuelve las filas.
+    """
+    directory, name = os.path.split(path)
+    os.makedirs(directory, exist_ok=True)
+    tmp = os.path.join(directory, f"_{name}.tmp")
+    rows = 0
+    with conn.cursor(name="etl_export") as cur, pq.ParquetWriter(tmp, schema, compression=COMPRESSION) as writer:
+        cur.itersize = BATCH_ROWS
+        cur.execute(query, params)
+        while True:
+            batch = cur.fetchmany(BATCH_ROWS)
+            if not batch:
+                break
+            arrays = [pa.array(list(col), type=field.type) for col, field in zip(zip(*batch), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            rows += len(batch)
+    if rows:
+        os.replace(tmp, path)
+    else:
+        os.remove(tmp)
+    return rows
+
+
+def day_dir(root: str, table: str, day: date) -> str:
+    return os.path.join(root, table, f"{PARTITION_COLUMN}={day:%Y-%m-%d}")
+
+
+def exported_days(root: str, table: str) -> Set[date]:
+    """Días que ya tienen directorio en el export de `table`."""
+    prefix = f"{PARTITION_COLUMN}="
+    base = os.path.join(root, table)
+    if not os.path.isdir(base):
+        return set()
+    return {date.fromisoformat(name[len(prefix):]) for name in os.listdir(base) if name.startswith(prefix)}
+
+
+def export_fact(conn, table: str, root: str, full: bool = False) -> Dict[str, int]:
+    """
+    Reescribe los días pendientes de `table` (con `full`: todos los del warehouse y los que
+    ya estaban exportados). Cada día va en su transacción: se borra su fila de PENDING_TABLE,
+    se escribe el archivo y se confirma; si falla, el día sigue pendiente. Una carga que marca
+    el día mientras se exporta espera al commit y lo deja pendiente para el próximo export.
+    Los días que quedaron sin filas (borrados) pierden su directorio.
+    """
+    with conn.cursor() as cur:
+        columns, schema = _schema(cur, table, exclude=(PARTITION_COLUMN,))
+        if full:
+            cur.execute(f"SELECT DISTINCT {PARTITION_COLUMN} FROM {table};")
+            days = {d for (d,) in cur.fetchall()} | exported_days(root, table)
+        else:
+            cur.execute(f"SELECT created_day FROM {PENDING_TABLE} WHERE table_name = %s;", (table,))
+            days = {d for (d,) in cur.fetchall()}
+    conn.commit()
+    query = f"SELECT {', '.join(columns)} FROM {table} WHERE {PARTITION_COLUMN} = %s;"
+    total = 0
+    with export_seconds.labels(table=table).time():
+        for day in sorted(days):
+            target = day_dir(root, table, day)
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"DELETE FROM {PENDING_TABLE} WHERE table_name = %s AND created_day = %s;", (table, day))
+                rows = _write(conn, os.path.join(target, FILE_NAME), schema, query, (day,))
+                if not rows:
+                    shutil.rmtree(target, ignore_errors=True)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            total += rows
+    export_rows_total.labels(table=table).inc(total)
+    logger.info(f"Exported {table}: {len(days)} days, {total} rows")
+    return {"days": len(days), "rows": total}
+
+
+def export_dimension(conn, table: str, root: str) -> Dict[str, int]:
+    """Reescribe el archivo completo de la dimensión `table`."""
+    with export_seconds.labels(table=table).time():
+        with conn.cursor() as cur:
+            columns, schema = _schema(cur, table)
+        rows = _write(conn, os.path.join(root, table, FILE_NAME), schema, f"SELECT {', '.join(columns)} FROM {table};")
+        conn.commit()
+    export_rows_total.labels(table=table).inc(rows)
+    logger.info(f"Exported {table}: {rows} rows")
+    return {"rows": rows}
+
+
+def export(
+    conn, root: str, tables: Optional[Iterable[str]] = None, full: bool = False,
+) -> Dict[str, Dict[str, int]]:
+    """
+    Exporta a `root` las dimensiones y los días pendientes de las tablas de hechos (default:
+    todas; `full` reescribe todos los días, p. ej. después del swap de un full refresh).
+    Devuelve {tabla: {"days", "rows"}}.
+    """
+    if not HAS_PYARROW:
+        raise RuntimeError("El export a Parquet necesita pyarrow (pip install pyarrow)")
+    start = time.perf_counter()
+    result: Dict[str, Dict[str, int]] = {}
+    for table in tables or DIMENSIONS + FACTS:
+        if table in FACTS:
+            result[table] = export_fact(conn, table, root, full=full)
+        else:
+            result[table] = export_dimension(conn, table, root)
+    logger.info(f"Parquet export to {root} finished in {time.perf_counter() - start:.1f}s")
+    return result
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Snapshot del warehouse en Parquet particionado por día")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("export", help="exportar dimensiones y días pendientes")
+    run.add_argument("tables", nargs="*", help=f"tablas (default: todas): {', '.join(DIMENSIONS + FACTS)}")
+    run.add_argument("--full", action="store_true", help="reescribir todos los días, no solo los pendientes")
+    run.add_argument("--dir", default=EXPORT_DIR or None, help="directorio destino (default: ETL_EXPORT_DIR)")
+    sub.add_parser("pending", help="días pendientes por tabla")
+    parser.add_argument("--url", default=None, help="DSN del warehouse (default: WAREHOUSE_URL)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        unknown = set(args.tables) - set(DIMENSIONS + FACTS)
+        if unknown:
+            parser.error(f"tablas desconocidas: {', '.join(sorted(unknown))}")
+        if not args.dir:
+            parser.error("falta el directorio destino (--dir o ETL_EXPORT_DIR)")
+        if not HAS_PYARROW:
+            parser.error("el export a Parquet necesita pyarrow (pip install pyarrow)")
+    conn = psycopg2.connect(args.url or warehouse.WAREHOUSE_URL)
+    try:
+        if args.command == "export":
+            for table, stats in export(conn, args.dir, args.tables or None, full=args.full).items():
+                print(f"{table}: " + ", ".join(f"{k}={v}" for k, v in stats.items()))
+        else:
+            with conn.cursor() as cur:
+                cur.execute(f"""
+                    SELECT table_name, count(*), min(created_day), max(created_day)
+                    FROM {PENDING_TABLE} GROUP BY table_name ORDER BY table_name;
+                """)
+                pending = {table: (n, first, last) for table, n, first, last in cur.fetchall()}
+            conn.rollback()
+            for table in FACTS:
+                n, first, last = pending.get(table, (0, None, None))
+                print(f"{table}: " + (f"{n} días ({first} a {last})" if n else "al día"))
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(main())
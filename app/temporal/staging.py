@@ -0,0 +1,124 @@
+from __future__ import annotations
+import os
+import gzip
+import json
+import time
+import uuid
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+# Claim-check: las actividades de extracción escriben los lotes en un
+# directorio de staging y devuelven solo una referencia pequeña. Así el
+# historial del workflow no crece con el número de filas.
+logger = logging.getLogger(__name__)
+
+STAGING_DIR = os.getenv("ETL_STAGING_DIR", "/tmp/etl-staging")
+# Lotes con más antigüedad se consideran huérfanos (corrida que falló o se canceló antes de
+# limpiar); tiene que superar la duración de la corrida más larga
+TTL_HOURS = float(os.getenv("ETL_STAGING_TTL_HOURS", "24"))
+
+
+def is_ref(value: Any) -> bool:
+    """Indica si un valor es una referencia de staging (y no un payload inline)."""
+    return isinstance(value, dict) and "staging_ref" in value
+
+
+def _path(ref_id: str) -> str:
+    return os.path.join(STAGING_DIR, f"{ref_id}.json.gz")
+
+
+def put_rows(entity: str, rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Guarda una lista de dicts en formato columnar comprimido y devuelve la referencia:
+      {"staging_ref": <id>, "entity": <entidad>, "rows": <n>}
+    """
+    columns = list(dict.fromkeys(k for r in rows for k in r))
+    doc = {
+        "entity": entity,
+        "columns": columns,
+        "values": [[r.get(c) for r in rows] for c in columns],
+        "rows": len(rows),
+    }
+    os.makedirs(STAGING_DIR, exist_ok=True)
+    ref_id = f"{entity}-{uuid.uuid4().hex}"
+    path = _path(ref_id)
+    tmp = f"{path}.tmp"
+    with gzip.open(tmp, "wt", encoding="utf-8", compresslevel=6) as fh:
+        json.dump(doc, fh, separators=(",", ":"))
+    os.replace(tmp, path)  # escritura atómica: nunca se lee un archivo a medias
+    logger.debug(f"Staged {len(rows)} {entity} rows in {path}")
+    return {"staging_ref": ref_id, "entity": entity, "rows": len(rows)}
+
+
+def _read(ref: Dict[str, Any]) -> Dict[str, Any]:
+    with gzip.open(_path(ref["staging_ref"]), "rt", encoding="utf-8") as fh:
+        return json.load(fh)
+
+
+def get_rows(value: Any) -> List[Dict[str, Any]]:
+    """Resuelve una referencia a su lista de filas. Los payloads inline se devuelven tal cual."""
+    if not is_ref(value):
+        return value or []
+    doc = _read(value)
+    columns = doc["columns"]
+    return [dict(zip(columns, vals)) for vals in zip(*doc["values"])]
+
+
+def get_column(value: Any, column: str) -> List[Any]:
+    """Devuelve una sola columna de un lote (p.ej. los ids de chats) sin reconstruir las filas."""
+    if not is_ref(value):
+        return [r.get(column) for r in (value or [])]
+    doc = _read(value)
+    if column not in doc["columns"]:
+        return [None] * doc["rows"]
+    return doc["values"][doc["columns"].index(column)]
+
+
+def restage(original: Any, rows: List[Dict[str, Any]]) -> Any:
+    """
+    Devuelve `rows` con la misma forma que la entrada: si llegó una referencia,
+    se escribe un nuevo lote en staging; si llegó una lista, se devuelve la lista.
+    """
+    if is_ref(original):
+        return put_rows(original.get("entity", "rows"), rows)
+    return rows
+
+
+def count(value: Any) -> int:
+    """Número de filas de una referencia o lista."""
+    if is_ref(value):
+        return int(value.get("rows", 0))
+    return len(value or [])
+
+
+def drop(refs: Iterable[Any]) -> int:
+    """Elimina los archivos de staging de las referencias dadas. Devuelve cuántos se borraron."""
+    removed = 0
+    for ref in refs:
+        if not is_ref(ref):
+            continue
+        try:
+            os.remove(_path(ref["staging_ref"]))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def sweep(max_age_hours: float = TTL_HOURS, now: Optional[float] = None) -> int:
+    """Borra los lotes (y temporales) de STAGING_DIR más viejos que `max_age_hours`. Devuelve cuántos."""
+    if not os.path.isdir(STAGING_DIR):
+        return 0
+    cutoff = (now if now is not None else time.time()) - max_age_hours * 3600
+    removed = 0
+    for name in os.listdir(STAGING_DIR):
+        path = os.path.join(STAGING_DIR, name)
+        try:
+            if name.endswith((".json.gz", ".tmp")) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info(f"Swept {removed} orphaned staging files older than {max_age_hours}h")
+    return removed
@@ -0,0 +1,194 @@
+from __future__ import annotations
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.pool import ThreadedConnectionPool
+from prometheus_client import Counter, Gauge, Histogram
+
+# Pool de conexiones al warehouse compartido por todas las actividades del proceso:
+# evita un handshake TCP/TLS + auth por cada load, watermark o página, y acota las
+# conexiones que el worker abre contra el DW. Las llamadas corren en el pool de hilos
+# de DB (runtime.py), así que esperar un permiso del pool no bloquea el event loop.
+logger = logging.getLogger(__name__)
+
+WAREHOUSE_URL = os.getenv("WAREHOUSE_URL", "postgresql://postgres:tes$a5410@dw:5432/warehouse")
+# Debe ser >= ETL_DW_CONCURRENCY_MAX (el limitador, no el pool, es quien limita)
+DW_POOL_MIN = int(os.getenv("ETL_DW_POOL_MIN", "1"))
+DW_POOL_MAX = int(os.getenv("ETL_DW_POOL_MAX", "16"))
+DW_POOL_TIMEOUT = float(os.getenv("ETL_DW_POOL_TIMEOUT", "30"))
+# Conexiones ociosas por más de esto se verifican con SELECT 1 antes de entregarlas
+DW_POOL_CHECK_IDLE = float(os.getenv("ETL_DW_POOL_CHECK_IDLE", "30"))
+
+# Métricas de Prometheus del pool
+dw_pool_wait_seconds = Histogram(
+    'etl_dw_pool_wait_seconds',
+    'Time spent waiting for a warehouse connection from the pool',
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+
+dw_pool_connections = Gauge(
+    'etl_dw_pool_connections',
+    'Warehouse connections in the pool',
+    ['state'],
+)
+
+dw_pool_discarded_total = Counter(
+    'etl_dw_pool_discarded_total',
+    'Warehouse connections closed instead of returned to the pool',
+    ['reason'],
+)
+
+dw_pool_max_connections = Gauge(
+    'etl_dw_pool_max_connections',
+    'Configured size of the warehouse connection pool',
+)
+
+
+class PoolTimeout(Exception):
+    """No se obtuvo una conexión del pool dentro de ETL_DW_POOL_TIMEOUT."""
+
+
+class WarehousePool:
+    """
+    ThreadedConnectionPool que espera (con timeout) en lugar de fallar con PoolError cuando
+    todas las conexiones están en uso, verifica conexiones ociosas antes de entregarlas y
+    descarta las que vuelven rotas.
+    """
+
+    def __init__(self, dsn: str, minconn: int, maxconn: int) -> None:
+        self.maxconn = maxconn
+        # Sesiones en UTC: los timestamps naive de los transforms son UTC (como created_day)
+        self._pool = ThreadedConnectionPool(minconn, maxconn, dsn, options="-c timezone=UTC")
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._lock = threading.Lock()
+        self._last_used: Dict[int, float] = {}
+        self._in_use = 0
+        dw_pool_max_connections.set(maxconn)
+        self._report()
+
+    def _report(self) -> None:
+        idle = len(getattr(self._pool, "_pool", []))
+        dw_pool_connections.labels(state="in_use").set(self._in_use)
+        dw_pool_connections.labels(state="idle").set(idle)
+
+    def _healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        last_used = self._last_used.get(id(conn))
+        # Recién abierta (nunca devuelta) o usada hace poco: no hace falta el round-trip
+        if last_used is None or time.monotonic() - last_used < DW_POOL_CHECK_IDLE:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def getconn(self, timeout: Optional[float] = None):
+        timeout = DW_POOL_TIMEOUT if timeout is None else timeout
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=timeout):
+            raise PoolTimeout(f"Sin conexiones libres en el pool del warehouse tras {timeout:.0f}s ({self.maxconn} en uso)")
+        try:
+            while True:
+                conn = self._pool.getconn()
+                if self._healthy(conn):
+                    break
+                logger.warning("Conexión del pool del warehouse rota, se reemplaza")
+                dw_pool_discarded_total.labels(reason="health_check").inc()
+                self._last_used.pop(id(conn), None)
+                self._pool.putconn(conn, close=True)
+        except BaseException:
+            self._slots.release()
+            raise
+        dw_pool_wait_seconds.observe(time.perf_counter() - start)
+        with self._lock:
+            self._in_use += 1
+            self._report()
+        return conn
+
+    def putconn(self, conn) -> None:
+        close = bool(conn.closed)
+        if not close:
+            try:
+                # Nada de transacciones abiertas ni autocommit heredado entre actividades
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if conn.autocommit:
+                    conn.autocommit = False
+            except psycopg2.Error:
+                close = True
+        if close:
+            dw_pool_discarded_total.labels(reason="broken").inc()
+            self._last_used.pop(id(conn), None)
+        else:
+            self._last_used[id(conn)] = time.monotonic()
+        try:
+            self._pool.putconn(conn, close=close)
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._in_use -= 1
+                self._report()
+
+    def closeall(self) -> None:
+        self._pool.closeall()
+        self._last_used.clear()
+        self._report()
+
+
+_pool: Optional[WarehousePool] = None
+_pool_lock = threading.Lock()
+
+
+def start() -> WarehousePool:
+    """Crea el pool (al arrancar el worker). Idempotente."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = WarehousePool(WAREHOUSE_URL, min(DW_POOL_MIN, DW_POOL_MAX), DW_POOL_MAX)
+            logger.info(f"Warehouse pool: min={DW_POOL_MIN} max={DW_POOL_MAX}")
+    return _pool
+
+
+def close() -> None:
+    """Cierra todas las conexiones del pool (al apagar el worker)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+def acquire():
+    """
+    Conexión del pool (lo crea de forma perezosa si el worker no lo hizo: tests, scripts).
+    Debe devolverse con release() en un finally.
+    """
+    return (_pool or start()).getconn()
+
+
+def release(conn) -> None:
+    """Devuelve la conexión al pool (se descarta si quedó rota)."""
+    if _pool is None:
+        conn.close()
+        return
+    _pool.putconn(conn)
+
+
+@contextmanager
+def connection() -> Iterator[psycopg2.extensions.connection]:
+    """`with warehouse.connection() as conn:`: acquire/release con una conexión del pool."""
+    conn = acquire()
+    try:
+        yield conn
+    finally:
+        release(conn)
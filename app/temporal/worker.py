@@ -1,69 +1,158 @@
 import os
 import asyncio
-from temporalio.client import Client
+import argparse
+from typing import List
+from prometheus_client import start_http_server
 from temporalio.worker import Worker
 
+from app.temporal.client import connect
+from app.temporal import queues, runtime, http_client, warehouse, schema, partitions, staging
+
 # Workflows
-from app.temporal.workflows import ( EtlWorkflow, EtlIncrementalWorkflow, BackfillMessagesWorkflow,)
+from app.temporal.workflows import ( EtlWorkflow, EtlIncrementalWorkflow, BackfillMessagesWorkflow, EtlCdcWorkflow,)
 
 # Activities
 from app.temporal import activities as A
 
+ROLES = ("workflow", "extract", "load")
 
-async def main() -> None:
-    target = os.getenv("TEMPORAL_TARGET", "temporal:7233")
-    namespace = os.getenv("TEMPORAL_NAMESPACE", "default")
-    task_queue = os.getenv("ETL_TASK_QUEUE", "etl-task-queue")
-
-    client = await Client.connect(target, namespace=namespace)
-
-    worker = Worker(
-        client,
-        task_queue=task_queue,
-        workflows=[
-            EtlWorkflow,
-            EtlIncrementalWorkflow,
-            BackfillMessagesWorkflow,
-        ],
-        activities=[
-            # Extract
-            A.extract_users,
-            A.extract_chats_and_members,
-            A.extract_bookings,
-            A.extract_booking_events,
-            A.extract_incremental_dimensions,
-            # Transform
-            A.transform_users,
-            A.transform_chats_members,
-            A.transform_messages,
-            A.transform_reactions,
-            A.transform_bookings,
-            A.transform_booking_events,
-            # Load
-            A.load_dimensions,
-            A.load_bookings,
-            A.load_booking_events,
-            # Meta/paginadas (legacy - mantenidas para compatibilidad)
-            A.get_chat_meta,
-            A.etl_messages_page,
-            A.etl_reactions_page,
-            A.plan_incremental_message_pages,
-            # Nuevas actividades optimizadas (procesan por chat completo)
-            A.etl_messages_chat,
-            A.etl_reactions_chat,
-            # Nuevas actividades optimizadas para bookings (evitan límite de tamaño)
-            A.etl_bookings,
-            A.etl_booking_events,
-            # Watermark
-            A.update_watermark,
-        ],
-        max_concurrent_activities=100,
-        max_concurrent_workflow_tasks=50,
-    )
+# Actividades ligadas al API (HTTP) y transformaciones en memoria
+EXTRACT_ACTIVITIES = [
+    # Extract
+    A.extract_users,
+    A.extract_chats_and_members,
+    A.extract_bookings,
+    A.extract_booking_events,
+    A.extract_incremental_dimensions,
+    # Transform
+    A.transform_users,
+    A.transform_chats_members,
+    A.transform_messages,
+    A.transform_reactions,
+    A.transform_bookings,
+    A.transform_booking_events,
+    # Meta/paginadas
+    A.get_chat_meta,
+    A.plan_incremental_message_pages,
+    # Hechos por chat completo / por entidad: lotes a staging (los carga load_staged)
+    A.stage_messages_chat,
+    A.stage_reactions_chat,
+    A.stage_bookings,
+    A.stage_booking_events,
+    # Staging (claim-check)
+    A.read_staged_column,
+    A.drop_staged,
+]
+
+# Actividades ligadas al warehouse (Postgres)
+LOAD_ACTIVITIES = [
+    A.load_dimensions,
+    A.load_bookings,
+    A.load_booking_events,
+    # Hechos en staging de las actividades stage_*
+    A.load_staged,
+    # Outbox (CDC): aplica los cambios en el warehouse y el offset en la misma transacción
+    A.consume_outbox,
+    # Watermark
+    A.update_watermark,
+    # Full refresh con tablas sombra
+    A.prepare_shadow_tables,
+    A.swap_shadow_tables,
+    A.drop_shadow_tables,
+    A.rebuild_rollups,
+    # Vistas materializadas al final de cada corrida
+    A.refresh_materialized_views,
+    # Snapshot en Parquet de los días que cambiaron (ETL_EXPORT_DIR)
+    A.export_snapshots,
+]
+
+
+async def _sweep_staging(interval: float = 3600) -> None:
+    """Cada hora borra los lotes de staging huérfanos (ETL_STAGING_TTL_HOURS)."""
+    while True:
+        await asyncio.to_thread(staging.sweep)
+        await asyncio.sleep(interval)
+
+
+def _parse_roles(value: str) -> List[str]:
+    roles = [r.strip() for r in value.split(",") if r.strip()]
+    if not roles or roles == ["all"]:
+        return list(ROLES)
+    unknown = set(roles) - set(ROLES)
+    if unknown:
+        raise SystemExit(f"Roles desconocidos: {', '.join(sorted(unknown))} (válidos: all, {', '.join(ROLES)})")
+    return roles
 
-    print(f"ETL Worker polling task queue: {task_queue}")
-    await worker.run()
+
+async def main(roles: List[str]) -> None:
+    metrics_port = int(os.getenv("ETL_METRICS_PORT", "9464"))
+
+    # Métricas del worker (codec, etc.) para Prometheus
+    start_http_server(metrics_port)
+
+    client = await connect()
+    # Cliente HTTP con pool de conexiones keep-alive compartido por todas las actividades
+    await http_client.start()
+    if "extract" in roles or "load" in roles:
+        # Pool de conexiones al warehouse compartido por todas las actividades
+        await runtime.run_in_db_thread(warehouse.start)
+        # Migraciones del esquema una sola vez aquí: las actividades de carga solo hacen DML
+        if schema.MIGRATE_ON_START:
+            await runtime.run_in_db_thread(schema.migrate_warehouse)
+        # Particiones del mes actual y siguientes: los loads no crean particiones en régimen normal
+        await runtime.run_in_db_thread(partitions.ensure_upcoming_warehouse)
+
+    workers: List[Worker] = []
+    if "workflow" in roles:
+        workers.append(Worker(
+            client,
+            task_queue=queues.WORKFLOW_TASK_QUEUE,
+            workflows=[
+                EtlWorkflow,
+                EtlIncrementalWorkflow,
+                BackfillMessagesWorkflow,
+                EtlCdcWorkflow,
+            ],
+            max_concurrent_workflow_tasks=int(os.getenv("ETL_MAX_CONCURRENT_WORKFLOW_TASKS", "50")),
+        ))
+    if "extract" in roles:
+        workers.append(Worker(
+            client,
+            task_queue=queues.EXTRACT_TASK_QUEUE,
+            activities=EXTRACT_ACTIVITIES,
+            max_concurrent_activities=int(os.getenv("ETL_EXTRACT_MAX_CONCURRENT", "50")),
+        ))
+    if "load" in roles:
+        workers.append(Worker(
+            client,
+            task_queue=queues.LOAD_TASK_QUEUE,
+            activities=LOAD_ACTIVITIES,
+            max_concurrent_activities=int(os.getenv("ETL_LOAD_MAX_CONCURRENT", "10")),
+        ))
+
+    polled = [w.task_queue for w in workers]
+    print(f"ETL Worker ({','.join(roles)}) polling task queues: {', '.join(polled)} (metrics on :{metrics_port})")
+    # Sonda de lag del event loop: detecta actividades que bloquean el loop
+    lag_monitor = asyncio.create_task(runtime.monitor_event_loop_lag())
+    # Lotes que quedaron de corridas que fallaron antes de limpiar (los demás se borran al terminar)
+    sweeper = asyncio.create_task(_sweep_staging()) if "extract" in roles or "load" in roles else None
+    try:
+        await asyncio.gather(*(w.run() for w in workers))
+    finally:
+        lag_monitor.cancel()
+        if sweeper:
+            sweeper.cancel()
+        await http_client.close()
+        warehouse.close()
+        runtime.shutdown()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Worker del ETL (Temporal)")
+    parser.add_argument(
+        "--roles",
+        default=os.getenv("ETL_WORKER_ROLES", "all"),
+        help="Colas a atender: all o lista separada por comas de workflow,extract,load",
+    )
+    args = parser.parse_args()
+    asyncio.run(main(_parse_roles(args.roles)))
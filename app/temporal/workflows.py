@@ -1,9 +1,10 @@
 from __future__ import annotations
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Tuple
 from datetime import timedelta
 import asyncio
 from temporalio import workflow
 from temporalio.common import RetryPolicy
+from temporalio.exceptions import ApplicationError
 
 retry_policy = RetryPolicy(
     maximum_attempts=5,
@@ -14,9 +15,18 @@ retry_policy = RetryPolicy(
 
 with workflow.unsafe.imports_passed_through():
     from app.temporal import activities as A
+    from app.temporal import queues, staging
 
 PARALLEL = 8
-CONTINUE_EVERY = 5000 
+# Lotes del outbox por ejecución de EtlCdcWorkflow: cada lote (actividad + timer de sondeo +
+# workflow tasks) suma ~11 eventos, así 500 lotes quedan muy por debajo del límite de historial
+CONTINUE_EVERY = 500
+# Actividades largas con checkpoint por heartbeat: si dejan de latir se reintentan
+# (desde el último checkpoint) sin esperar al start_to_close_timeout
+CHECKPOINT_HEARTBEAT_TIMEOUT = timedelta(minutes=5)
+# Páginas de la fuente por actividad stage_* en _stage_and_load: la carga de un tramo corre
+# mientras se extrae el siguiente
+STAGE_CHUNK_PAGES = 20
 
 
 def _chunks(seq: List[Any], size: int):
@@ -24,185 +34,445 @@ def _chunks(seq: List[Any], size: int):
         yield seq[i : i + size]
 
 
-async def _map_activities(
-    items: List[Any],
-    fn_name: str,
-    args_builder,
-    timeout: timedelta,
-    parallel: int = PARALLEL,
-) -> List[Any]:
+def _quarantined(results: List[Any]) -> int:
+    """Filas apartadas a etl_quarantine según los resultados de las actividades de carga."""
+    return sum(int(r.get("quarantined", 0)) for r in results if isinstance(r, dict))
+
+
+# Tabla del warehouse de cada dimensión que devuelve load_dimensions
+_DIMENSION_TABLES = {"users": "dim_users", "chats": "dim_chats", "members": "bridge_chat_members"}
+
+
+def _changed_tables(dimensions: Any, facts: Dict[str, List[Any]]) -> List[str]:
     """
-    Ejecuta actividades en paralelo con manejo robusto de errores.
-    Si una actividad falla o se cuelga, las demás continúan.
+    Tablas con filas insertadas o actualizadas en la corrida según los resultados de las
+    actividades de carga: solo se refrescan las vistas materializadas que leen alguna.
     """
-    results: List[Any] = []
-    for batch in _chunks(items, parallel):
-        handles = [
-            workflow.start_activity(
-                getattr(A, fn_name),
-                args=args_builder(item),
+    tables = [
+        _DIMENSION_TABLES[dim] for dim, stats in (dimensions or {}).items()
+        if isinstance(stats, dict) and (stats.get("inserted") or stats.get("updated"))
+    ]
+    for table, results in facts.items():
+        if any((r.get("changed", 0) if isinstance(r, dict) else r) for r in results if r):
+            tables.append(table)
+    return tables
+
+
+def _task_queues(config: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Colas de actividades (extract, load). Viajan en el input del workflow para que
+    el replay no dependa de las variables de entorno del worker.
+    """
+    return (
+        config.get("extract_task_queue", queues.EXTRACT_TASK_QUEUE),
+        config.get("load_task_queue", queues.LOAD_TASK_QUEUE),
+    )
+
+
+async def _chat_ids(chats: Any, extract_q: str) -> List[int]:
+    """Obtiene solo los ids de chats del lote en staging, sin traer las filas al historial."""
+    return await workflow.execute_activity(
+        A.read_staged_column,
+        args=[chats, "id"],
+        start_to_close_timeout=timedelta(minutes=1),
+        retry_policy=retry_policy,
+        task_queue=extract_q,
+    )
+
+
+async def _drop_staged(refs: List[Any], extract_q: str) -> None:
+    """Limpia los lotes de staging de la corrida. Un fallo aquí no invalida el ETL (los borra el sweep por TTL)."""
+    if not any(staging.is_ref(r) for r in refs):
+        return
+    try:
+        await workflow.execute_activity(
+            A.drop_staged,
+            args=[refs],
+            start_to_close_timeout=timedelta(minutes=1),
+            retry_policy=retry_policy,
+            task_queue=extract_q,
+        )
+    except Exception as e:
+        workflow.logger.warning(f"Could not drop staged batches: {e}")
+
+
+async def _drop_shadow(load_q: str) -> None:
+    """
+    Descarta las sombras de un full refresh que falló antes del swap y libera sus tablas vivas
+    (el CDC y el incremental esperan mientras estén retenidas).
+    """
+    try:
+        await workflow.execute_activity(
+            A.drop_shadow_tables,
+            args=[None],
+            start_to_close_timeout=timedelta(minutes=5),
+            retry_policy=retry_policy,
+            task_queue=load_q,
+        )
+    except Exception as e:
+        workflow.logger.error(f"Could not drop shadow tables; live fact tables stay held: {e}")
+
+
+def _add_counts(total: Dict[str, int], part: Dict[str, Any]) -> None:
+    for key, value in part.items():
+        total[key] = max(total.get(key, 0), value) if key == "total_pages" else total.get(key, 0) + value
+
+
+async def _stage_and_load(
+    entity: str,
+    stage_fn: str,
+    stage_args: Callable[[int, Optional[int]], List[Any]],
+    extract_q: str,
+    load_q: str,
+    chat_id: Optional[int] = None,
+    shadow: bool = False,
+    first_page: int = 1,
+    last_page: Optional[int] = None,
+    timeout: timedelta = timedelta(minutes=30),
+) -> Dict[str, Any]:
+    """
+    Extracción y carga de una entidad (o de un chat), páginas first_page..last_page (None:
+    hasta el final), por tramos de STAGE_CHUNK_PAGES: stage_* (args de `stage_args(first, last)`)
+    deja los lotes del tramo en staging en la cola de extract y load_staged los escribe en el
+    warehouse en la cola de load (su límite de concurrencia gobierna las escrituras) mientras
+    se extrae el tramo siguiente. Las cargas van en orden, una a la vez. Los lotes se borran
+    al terminar, también si algo falla.
+    Devuelve {"rows", "total_pages", ..., "loaded", "quarantined", "changed"}.
+    """
+    staged: Dict[str, int] = {}
+    loaded: Dict[str, int] = {}
+    refs: List[Any] = []
+    load = None
+    try:
+        while True:
+            last = first_page + STAGE_CHUNK_PAGES - 1
+            if last_page is not None:
+                last = min(last, last_page)
+            chunk = await workflow.execute_activity(
+                getattr(A, stage_fn),
+                args=stage_args(first_page, last),
                 start_to_close_timeout=timeout,
                 retry_policy=retry_policy,
+                task_queue=extract_q,
+                heartbeat_timeout=CHECKPOINT_HEARTBEAT_TIMEOUT,  # reintento rápido si el worker muere
             )
-            for item in batch
-        ]
-        # Esperar todas las actividades del batch en paralelo
-        # Temporal maneja el paralelismo, pero esperamos todas juntas
-        # para que si una falla, las demás continúen
-        for h in handles:
-            try:
-                result = await h
-                results.append(result)
-            except Exception as e:
-                # Si una actividad falla, registramos el error pero continuamos
-                # con las demás actividades del batch
-                workflow.logger.warning(f"Activity failed: {e}")
-                results.append(None)  # Valor por defecto para actividades fallidas
+            chunk_refs = chunk.pop("refs")
+            refs += chunk_refs
+            done = chunk.pop("page") < last or last == last_page
+            _add_counts(staged, chunk)
+            if load is not None:
+                _add_counts(loaded, await load)
+                load = None
+            if chunk_refs:
+                load = workflow.start_activity(
+                    A.load_staged,
+                    args=[entity, chunk_refs, chat_id, shadow],
+                    start_to_close_timeout=timeout,
+                    retry_policy=retry_policy,
+                    task_queue=load_q,
+                    heartbeat_timeout=CHECKPOINT_HEARTBEAT_TIMEOUT,
+                )
+            if done:
+                break
+            first_page = last + 1
+        if load is not None:
+            _add_counts(loaded, await load)
+            load = None
+    finally:
+        if load is not None:
+            # Falló la extracción: la carga en curso termina antes de borrar sus lotes
+            await workflow.wait([load])
+        await _drop_staged(refs, extract_q)
+    return {**staged, **loaded}
+
+
+async def _map_chats(chat_ids: List[int], run, parallel: int = PARALLEL) -> List[Any]:
+    """
+    Ejecuta `run(chat_id)` para todos los chats, de a `parallel` a la vez.
+    Si un chat falla o se cuelga, los demás continúan y su resultado queda en None.
+    """
+    results: List[Any] = []
+    for batch in _chunks(chat_ids, parallel):
+        outcomes = await asyncio.gather(*(run(cid) for cid in batch), return_exceptions=True)
+        for cid, outcome in zip(batch, outcomes):
+            if isinstance(outcome, asyncio.CancelledError):
+                raise outcome
+            if isinstance(outcome, BaseException):
+                workflow.logger.warning(f"Chat {cid} failed: {outcome}")
+                results.append(None)  # Valor por defecto para chats fallidos
+            else:
+                results.append(outcome)
     return results
 
 
+def _loaded(results: List[Any]) -> int:
+    """Filas cargadas según los resultados de _stage_and_load (None: chat fallido)."""
+    return sum(int(r.get("loaded", 0)) for r in results if isinstance(r, dict))
+
+
+def _source_counts(results: List[Any]) -> Dict[str, int]:
+    """Filas extraídas de la fuente y descartadas (transform o cuarentena) según _stage_and_load."""
+    done = [r for r in results if isinstance(r, dict)]
+    return {
+        "rows": sum(int(r.get("rows", 0)) for r in done),
+        "discarded": sum(int(r.get("rejected", 0)) + int(r.get("quarantined", 0)) for r in done),
+    }
+
+
 @workflow.defn
 class EtlWorkflow:
     @workflow.run
     async def run(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        # Lotes de staging de la corrida: se borran al terminar, también si falla o se cancela
+        staged: List[Any] = []
+        # Tablas sombra preparadas y todavía sin swap: retienen las escrituras a las vivas
+        self._shadow_pending = False
+        try:
+            return await self._run(config, staged)
+        except BaseException:
+            if self._shadow_pending:
+                await _drop_shadow(_task_queues(config)[1])
+            raise
+        finally:
+            await _drop_staged(staged, _task_queues(config)[0])
+
+    async def _run(self, config: Dict[str, Any], staged: List[Any]) -> Dict[str, Any]:
         page_size = int(config.get("page_size", 250))
+        # Backend de extracción: "api" (REST) o "db" (lectura directa de la base OLTP)
+        source = str(config.get("extract_source", "api"))
         parallel = int(config.get("parallel", PARALLEL))
+        extract_q, load_q = _task_queues(config)
+        # "upsert" (default): upsert sobre las tablas vivas. "shadow": los hechos se cargan en
+        # tablas sombra sin índices y se reemplazan de una vez al final (ver shadow.py)
+        shadow = config.get("refresh", "upsert") == "shadow"
 
-        users = await workflow.execute_activity(
+        # Claim-check: extract/transform devuelven referencias de staging, no las filas
+        raw_users = await workflow.execute_activity(
             A.extract_users,
-            args=[page_size],
+            args=[page_size, source],
             start_to_close_timeout=timedelta(minutes=5),
             retry_policy=retry_policy,
+            task_queue=extract_q,
         )
-        chats, members = await workflow.execute_activity(
+        staged.append(raw_users)
+        raw_chats, raw_members = await workflow.execute_activity(
             A.extract_chats_and_members,
-            args=[page_size],
+            args=[page_size, source],
             start_to_close_timeout=timedelta(minutes=10),
             retry_policy=retry_policy,
+            task_queue=extract_q,
         )
+        staged += [raw_chats, raw_members]
 
         users = await workflow.execute_activity(
             A.transform_users,
-            args=[users],
+            args=[raw_users],
             start_to_close_timeout=timedelta(minutes=2),
             retry_policy=retry_policy,
+            task_queue=extract_q,
         )
         chats, members = await workflow.execute_activity(
             A.transform_chats_members,
-            args=[chats, members],
+            args=[raw_chats, raw_members],
             start_to_close_timeout=timedelta(minutes=2),
             retry_policy=retry_policy,
+            task_queue=extract_q,
         )
+        staged += [users, chats, members]
 
-        await workflow.execute_activity(
+        dimensions = await workflow.execute_activity(
             A.load_dimensions,
             args=[users, chats, members],
             start_to_close_timeout=timedelta(minutes=10),
             retry_policy=retry_policy,
+            task_queue=load_q,
         )
 
+        if shadow:
+            # Espera a las escrituras en curso y retiene las tablas vivas hasta el swap
+            self._shadow_pending = True
+            await workflow.execute_activity(
+                A.prepare_shadow_tables,
+                args=[None],
+                start_to_close_timeout=timedelta(minutes=5),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
+
         # REFACTORIZADO: Procesar por chat completo en lugar de página por página
         # Esto reduce drásticamente el número de actividades y eventos en el historial
-        chat_ids = [c["id"] for c in chats]
+        chat_ids = await _chat_ids(chats, extract_q)
         
-        # Procesar mensajes: una actividad por chat (no por página)
-        msg_results = await _map_activities(
+        # Procesar mensajes: por chat, extracción a staging (extract) y carga (load)
+        msg_results = await _map_chats(
             chat_ids,
-            "etl_messages_chat",
-            args_builder=lambda cid: [cid, page_size],
-            timeout=timedelta(minutes=30),  # Timeout más largo para chats grandes
-            parallel=parallel,
+            lambda cid: _stage_and_load(
+                "messages", "stage_messages_chat",
+                lambda first, last: [cid, page_size, source, first, last, shadow],
+                extract_q, load_q, shadow=shadow,
+            ),
+            parallel,
         )
-        total_msgs = sum(int(r.get("messages_loaded", 0) if isinstance(r, dict) else 0) for r in msg_results)
+        total_msgs = _loaded(msg_results)
         
-        # Procesar reacciones: una actividad por chat (no por página)
-        react_results = await _map_activities(
+        # Procesar reacciones: por chat, igual que los mensajes
+        react_results = await _map_chats(
             chat_ids,
-            "etl_reactions_chat",
-            args_builder=lambda cid: [cid, page_size],
-            timeout=timedelta(minutes=30),  # Timeout más largo para chats grandes
-            parallel=parallel,
-        )
-        # Manejar resultados None (actividades fallidas) de forma segura
-        total_reacts = sum(
-            int(r.get("reactions_loaded", 0) if isinstance(r, dict) else 0) 
-            for r in react_results 
-            if r is not None
+            lambda cid: _stage_and_load(
+                "reactions", "stage_reactions_chat",
+                lambda first, last: [cid, page_size, source, first, last, shadow],
+                extract_q, load_q, chat_id=cid, shadow=shadow,
+            ),
+            parallel,
         )
+        # Los chats fallidos quedan en None
+        total_reacts = _loaded(react_results)
 
         result: Dict[str, Any] = {
-            "users": len(users),
-            "chats": len(chats),
-            "members": len(members),
+            "users": staging.count(users),
+            "chats": staging.count(chats),
+            "members": staging.count(members),
             "messages_loaded": total_msgs,
             "reactions_loaded": total_reacts,
+            "quarantined": _quarantined(msg_results + react_results),
         }
+        facts: Dict[str, List[Any]] = {"fact_messages": msg_results, "fact_reactions": react_results}
 
-        # REFACTORIZADO: Usar etl_bookings que procesa directamente sin retornar todos los datos
-        # Esto evita el error "Complete result exceeds size limit" de Temporal
-        if hasattr(A, "etl_bookings"):
-            bookings_result = await workflow.execute_activity(
-                A.etl_bookings,
-                args=[page_size],
-                start_to_close_timeout=timedelta(minutes=30),  # Timeout más largo para grandes volúmenes
-                retry_policy=retry_policy,
+        # Bookings por lotes en staging: el historial solo ve referencias (evita el error
+        # "Complete result exceeds size limit" de Temporal) y la carga corre en la cola de load
+        if hasattr(A, "stage_bookings"):
+            bookings_result = await _stage_and_load(
+                "bookings", "stage_bookings", lambda first, last: [page_size, source, shadow, first, last],
+                extract_q, load_q, shadow=shadow,
             )
-            result["bookings_loaded"] = int(bookings_result.get("bookings_loaded", 0) if isinstance(bookings_result, dict) else 0)
+            result["bookings_loaded"] = int(bookings_result.get("loaded", 0))
+            result["quarantined"] += _quarantined([bookings_result])
+            facts["fact_bookings"] = [bookings_result]
         elif all(hasattr(A, n) for n in ("extract_bookings", "transform_bookings", "load_bookings")):
-            # Fallback al método antiguo si etl_bookings no existe
-            bookings = await workflow.execute_activity(
+            # Fallback al método antiguo si stage_bookings no existe
+            raw_bookings = await workflow.execute_activity(
                 A.extract_bookings,
                 args=[page_size],
                 start_to_close_timeout=timedelta(minutes=5),
                 retry_policy=retry_policy,
+                task_queue=extract_q,
             )
+            staged.append(raw_bookings)
             bookings = await workflow.execute_activity(
                 A.transform_bookings,
-                args=[bookings],
+                args=[raw_bookings],
                 start_to_close_timeout=timedelta(minutes=2),
                 retry_policy=retry_policy,
+                task_queue=extract_q,
             )
+            staged.append(bookings)
             loaded = await workflow.execute_activity(
                 A.load_bookings,
-                args=[bookings],
+                args=[bookings, shadow],
                 start_to_close_timeout=timedelta(minutes=10),
                 retry_policy=retry_policy,
+                task_queue=load_q,
             )
             result["bookings_loaded"] = int(loaded or 0)
+            facts["fact_bookings"] = [loaded]
 
-        # REFACTORIZADO: Usar etl_booking_events que procesa directamente sin retornar todos los datos
-        if hasattr(A, "etl_booking_events"):
-            events_result = await workflow.execute_activity(
-                A.etl_booking_events,
-                args=[page_size],
-                start_to_close_timeout=timedelta(minutes=30),  # Timeout más largo para grandes volúmenes
-                retry_policy=retry_policy,
+        # Booking events: igual que los bookings
+        if hasattr(A, "stage_booking_events"):
+            events_result = await _stage_and_load(
+                "booking_events", "stage_booking_events", lambda first, last: [page_size, source, shadow, first, last],
+                extract_q, load_q, shadow=shadow,
             )
-            result["booking_events_loaded"] = int(events_result.get("events_loaded", 0) if isinstance(events_result, dict) else 0)
+            result["booking_events_loaded"] = int(events_result.get("loaded", 0))
+            result["quarantined"] += _quarantined([events_result])
+            facts["fact_booking_events"] = [events_result]
         elif all(
             hasattr(A, n)
             for n in ("extract_booking_events", "transform_booking_events", "load_booking_events")
         ):
-            # Fallback al método antiguo si etl_booking_events no existe
-            bevents = await workflow.execute_activity(
+            # Fallback al método antiguo si stage_booking_events no existe
+            raw_bevents = await workflow.execute_activity(
                 A.extract_booking_events,
                 args=[page_size],
                 start_to_close_timeout=timedelta(minutes=5),
                 retry_policy=retry_policy,
+                task_queue=extract_q,
             )
+            staged.append(raw_bevents)
             bevents = await workflow.execute_activity(
                 A.transform_booking_events,
-                args=[bevents],
+                args=[raw_bevents],
                 start_to_close_timeout=timedelta(minutes=2),
                 retry_policy=retry_policy,
+                task_queue=extract_q,
             )
+            staged.append(bevents)
             loaded = await workflow.execute_activity(
                 A.load_booking_events,
-                args=[bevents],
+                args=[bevents, shadow],
                 start_to_close_timeout=timedelta(minutes=10),
                 retry_policy=retry_policy,
+                task_queue=load_q,
             )
             result["booking_events_loaded"] = int(loaded or 0)
+            facts["fact_booking_events"] = [loaded]
+
+        if shadow:
+            # Un chat fallido dejaría la tabla nueva incompleta: no se hace el swap
+            failed = sum(r is None for r in msg_results + react_results)
+            if failed:
+                # run() descarta las sombras y libera las tablas vivas
+                raise ApplicationError(f"Full refresh aborted: {failed} chat activities failed; live tables unchanged")
+            result["refresh"] = await workflow.execute_activity(
+                A.swap_shadow_tables,
+                args=[{
+                    "messages": total_msgs,
+                    "reactions": total_reacts,
+                    "bookings": result.get("bookings_loaded", 0),
+                    "booking_events": result.get("booking_events_loaded", 0),
+                }, config.get("max_shrink"), {
+                    # Con strict las extracciones fallan en vez de cortar: cada fila extraída
+                    # tiene que estar en la sombra o figurar como descartada
+                    entity: _source_counts(facts[table])
+                    for entity, table in (
+                        ("messages", "fact_messages"), ("reactions", "fact_reactions"),
+                        ("bookings", "fact_bookings"), ("booking_events", "fact_booking_events"),
+                    )
+                    if facts.get(table) and all(isinstance(r, dict) for r in facts[table])
+                }],
+                start_to_close_timeout=timedelta(hours=2),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
+            self._shadow_pending = False
+            if hasattr(A, "rebuild_rollups"):
+                # Las sombras se cargaron sin rollups: se recalculan sobre las tablas nuevas
+                result["rollups"] = await workflow.execute_activity(
+                    A.rebuild_rollups,
+                    args=[None],
+                    start_to_close_timeout=timedelta(hours=1),
+                    retry_policy=retry_policy,
+                    task_queue=load_q,
+                )
+
+        if hasattr(A, "refresh_materialized_views"):
+            # Con shadow las vistas de las tablas de hechos se recrearon y llenaron en el swap
+            result["views"] = await workflow.execute_activity(
+                A.refresh_materialized_views,
+                args=[_changed_tables(dimensions, facts), list(facts) if shadow else None],
+                start_to_close_timeout=timedelta(hours=1),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
+
+        if hasattr(A, "export_snapshots"):
+            # Las sombras no marcan días pendientes: después del swap se reescribe todo
+            result["exported"] = await workflow.execute_activity(
+                A.export_snapshots,
+                args=[shadow],
+                start_to_close_timeout=timedelta(hours=2),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
 
         return result
 
@@ -211,65 +481,80 @@ class EtlWorkflow:
 class EtlIncrementalWorkflow:
     @workflow.run
     async def run(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        # Lotes de staging de la corrida: se borran al terminar, también si falla o se cancela
+        staged: List[Any] = []
+        try:
+            return await self._run(config, staged)
+        finally:
+            await _drop_staged(staged, _task_queues(config)[0])
+
+    async def _run(self, config: Dict[str, Any], staged: List[Any]) -> Dict[str, Any]:
         page_size = int(config.get("page_size", 250))
+        # Backend de extracción: "api" (REST) o "db" (lectura directa de la base OLTP)
+        source = str(config.get("extract_source", "api"))
         parallel = int(config.get("parallel", PARALLEL))
+        extract_q, load_q = _task_queues(config)
         since: Optional[str] = config.get("since", "watermark:auto")
 
-        users, chats, members = await workflow.execute_activity(
+        raw_users, raw_chats, raw_members = await workflow.execute_activity(
             A.extract_incremental_dimensions,
             args=[since, page_size],
             start_to_close_timeout=timedelta(minutes=10),
             retry_policy=retry_policy,
+            task_queue=extract_q,
         )
+        staged += [raw_users, raw_chats, raw_members]
 
         users = await workflow.execute_activity(
             A.transform_users,
-            args=[users],
+            args=[raw_users],
             start_to_close_timeout=timedelta(minutes=2),
             retry_policy=retry_policy,
+            task_queue=extract_q,
         )
         chats, members = await workflow.execute_activity(
             A.transform_chats_members,
-            args=[chats, members],
+            args=[raw_chats, raw_members],
             start_to_close_timeout=timedelta(minutes=2),
             retry_policy=retry_policy,
+            task_queue=extract_q,
         )
+        staged += [users, chats, members]
 
-        await workflow.execute_activity(
+        dimensions = await workflow.execute_activity(
             A.load_dimensions,
             args=[users, chats, members],
             start_to_close_timeout=timedelta(minutes=10),
             retry_policy=retry_policy,
+            task_queue=load_q,
         )
 
         # REFACTORIZADO: Procesar por chat completo en lugar de página por página
         # Esto reduce drásticamente el número de actividades y eventos en el historial
-        chat_ids = [c["id"] for c in chats]
+        chat_ids = await _chat_ids(chats, extract_q)
         
-        # Procesar mensajes: una actividad por chat (no por página)
-        msg_results = await _map_activities(
+        # Procesar mensajes: por chat, extracción a staging (extract) y carga (load)
+        msg_results = await _map_chats(
             chat_ids,
-            "etl_messages_chat",
-            args_builder=lambda cid: [cid, page_size],
-            timeout=timedelta(minutes=30),  # Timeout más largo para chats grandes
-            parallel=parallel,
+            lambda cid: _stage_and_load(
+                "messages", "stage_messages_chat", lambda first, last: [cid, page_size, source, first, last],
+                extract_q, load_q,
+            ),
+            parallel,
         )
-        total_msgs = sum(int(r.get("messages_loaded", 0) if isinstance(r, dict) else 0) for r in msg_results)
+        total_msgs = _loaded(msg_results)
         
-        # Procesar reacciones: una actividad por chat (no por página)
-        react_results = await _map_activities(
+        # Procesar reacciones: por chat, igual que los mensajes
+        react_results = await _map_chats(
             chat_ids,
-            "etl_reactions_chat",
-            args_builder=lambda cid: [cid, page_size],
-            timeout=timedelta(minutes=30),  # Timeout más largo para chats grandes
-            parallel=parallel,
-        )
-        # Manejar resultados None (actividades fallidas) de forma segura
-        total_reacts = sum(
-            int(r.get("reactions_loaded", 0) if isinstance(r, dict) else 0) 
-            for r in react_results 
-            if r is not None
+            lambda cid: _stage_and_load(
+                "reactions", "stage_reactions_chat", lambda first, last: [cid, page_size, source, first, last],
+                extract_q, load_q, chat_id=cid,
+            ),
+            parallel,
         )
+        # Los chats fallidos quedan en None
+        total_reacts = _loaded(react_results)
 
         # Actualizar watermarks específicos por entidad
         now_iso = workflow.now().isoformat()
@@ -278,33 +563,61 @@ class EtlIncrementalWorkflow:
             args=["users", now_iso],
             start_to_close_timeout=timedelta(minutes=1),
             retry_policy=retry_policy,
+            task_queue=load_q,
         )
         await workflow.execute_activity(
             A.update_watermark,
             args=["chats", now_iso],
             start_to_close_timeout=timedelta(minutes=1),
             retry_policy=retry_policy,
+            task_queue=load_q,
         )
         await workflow.execute_activity(
             A.update_watermark,
             args=["members", now_iso],
             start_to_close_timeout=timedelta(minutes=1),
             retry_policy=retry_policy,
+            task_queue=load_q,
         )
-        await workflow.execute_activity(
-            A.update_watermark,
-            args=["messages", now_iso],
-            start_to_close_timeout=timedelta(minutes=1),
-            retry_policy=retry_policy,
-        )
+        # Con chats fallidos (p. ej. tablas retenidas por un full refresh con sombras) el
+        # watermark de mensajes no avanza: la próxima corrida vuelve a cargar desde el anterior
+        failed = sum(r is None for r in msg_results + react_results)
+        if failed:
+            workflow.logger.warning(f"{failed} chat activities failed; keeping the messages watermark")
+        else:
+            await workflow.execute_activity(
+                A.update_watermark,
+                args=["messages", now_iso],
+                start_to_close_timeout=timedelta(minutes=1),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
 
-        return {
-            "users": len(users),
-            "chats": len(chats),
-            "members": len(members),
+        result: Dict[str, Any] = {
+            "users": staging.count(users),
+            "chats": staging.count(chats),
+            "members": staging.count(members),
             "messages_loaded": total_msgs,
             "reactions_loaded": total_reacts,
+            "quarantined": _quarantined(msg_results + react_results),
         }
+        if hasattr(A, "refresh_materialized_views"):
+            result["views"] = await workflow.execute_activity(
+                A.refresh_materialized_views,
+                args=[_changed_tables(dimensions, {"fact_messages": msg_results, "fact_reactions": react_results}), None],
+                start_to_close_timeout=timedelta(hours=1),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
+        if hasattr(A, "export_snapshots"):
+            result["exported"] = await workflow.execute_activity(
+                A.export_snapshots,
+                args=[False],
+                start_to_close_timeout=timedelta(hours=2),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
+        return result
 
 
 @workflow.defn
@@ -315,24 +628,56 @@ class BackfillMessagesWorkflow:
         page_size = int(params.get("page_size", 250))
         start_page = int(params.get("start_page", 1))
         end_page = int(params.get("end_page", start_page))
+        extract_q, load_q = _task_queues(params)
 
-        pages = [{"chat_id": chat_id, "page": p} for p in range(start_page, end_page + 1)]
-        msg_inserted_list = await _map_activities(
-            pages,
-            "etl_messages_page",
-            args_builder=lambda t: [t["chat_id"], t["page"], page_size],
-            timeout=timedelta(minutes=5),
-            parallel=min(PARALLEL, 4),
-        )
-        react_inserted_list = await _map_activities(
-            pages,
-            "etl_reactions_page",
-            args_builder=lambda t: [t["chat_id"], t["page"], page_size],
-            timeout=timedelta(minutes=5),
-            parallel=min(PARALLEL, 4),
+        # Páginas start_page..end_page de mensajes del API: extracción a staging y carga
+        args = lambda first, last: [chat_id, page_size, "api", first, last]
+        pages = {"first_page": start_page, "last_page": end_page}
+        messages = await _stage_and_load("messages", "stage_messages_chat", args, extract_q, load_q, **pages)
+        reactions = await _stage_and_load(
+            "reactions", "stage_reactions_chat", args, extract_q, load_q, chat_id=chat_id, **pages,
         )
         return {
             "chat_id": chat_id,
-            "messages_loaded": sum(int(x or 0) for x in msg_inserted_list),
-            "reactions_loaded": sum(int(x or 0) for x in react_inserted_list),
-        }
\ No newline at end of file
+            "messages_loaded": int(messages.get("loaded", 0)),
+            "reactions_loaded": int(reactions.get("loaded", 0)),
+        }
+
+@workflow.defn
+class EtlCdcWorkflow:
+    """
+    Aplica el outbox de la base OLTP al warehouse por lotes hasta alcanzarlo.
+    Con follow=True sigue consultando cada `poll_seconds` (carga casi en tiempo real)
+    y hace continue_as_new cada CONTINUE_EVERY lotes (o antes, si el servidor lo sugiere por el
+    tamaño del historial) para acotar el historial.
+    """
+
+    @workflow.run
+    async def run(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        consumer = str(config.get("consumer", "warehouse"))
+        batch_size = int(config.get("batch_size", 5000))
+        follow = bool(config.get("follow", False))
+        poll_seconds = int(config.get("poll_seconds", 30))
+        _extract_q, load_q = _task_queues(config)
+        totals: Dict[str, int] = dict(config.get("totals", {"consumed": 0, "deleted": 0}))
+        last_id = int(config.get("last_id", 0))
+
+        for _ in range(CONTINUE_EVERY):
+            result = await workflow.execute_activity(
+                A.consume_outbox,
+                args=[consumer, batch_size],
+                start_to_close_timeout=timedelta(minutes=10),
+                retry_policy=retry_policy,
+                task_queue=load_q,
+            )
+            totals["consumed"] += int(result["consumed"])
+            totals["deleted"] += int(result["deleted"])
+            last_id = int(result["last_id"])
+            if result["caught_up"]:
+                if not follow:
+                    return {"consumer": consumer, "last_id": last_id, **totals}
+                await asyncio.sleep(poll_seconds)
+            if workflow.info().is_continue_as_new_suggested():
+                break
+
+        workflow.continue_as_new({**config, "totals": totals, "last_id": last_id})
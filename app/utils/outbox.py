@@ -0,0 +1,19 @@
+from sqlalchemy.orm import Session
+from app import models
+
+# Outbox transaccional: el registro de cambio se agrega a la sesión del request y se
+# confirma con el mismo commit, así el ETL nunca ve un cambio que no existe (ni pierde
+# uno que sí). Solo guarda la clave: el consumidor relee el estado actual de la fila.
+UPSERT = "upsert"
+DELETE = "delete"
+
+ENTITIES = ("users", "chats", "members", "messages", "reactions", "bookings", "booking_events")
+
+
+def record_change(db: Session, entity: str, op: str = UPSERT, **key) -> None:
+    """Agrega un cambio de `entity` con su clave (p.ej. id=..., o chat_id=..., user_id=...) al outbox."""
+    if entity not in ENTITIES:
+        raise ValueError(f"entidad de outbox desconocida: {entity}")
+    if op not in (UPSERT, DELETE):
+        raise ValueError(f"operación de outbox desconocida: {op}")
+    db.add(models.EtlOutbox(entity=entity, op=op, key=key))
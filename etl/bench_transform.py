@@ -0,0 +1,105 @@
+"""
+Benchmark de la etapa de transformación de mensajes (sin red ni warehouse):
+  - dateutil:  camino anterior (dateutil.parser fila a fila sobre dicts)
+  - records:   registros tipados con __slots__ (app/temporal/records.py)
+  - columnar:  arrays de NumPy por lote (app/temporal/columnar.py), columnas y filas
+  - + COPY:    records y columnar hasta el texto de COPY que arma el loader (loader._CopyStream)
+
+Uso:
+  python -m etl.bench_transform --rows 200000 --repeat 3
+"""
+import time
+import argparse
+from datetime import datetime, timedelta
+
+import dateutil.parser as dtp
+
+from app.temporal import records, columnar
+from app.temporal.loader import _CopyStream
+from app.temporal.records import MessageRecord
+
+
+def make_items(n):
+    base = datetime(2024, 1, 1)
+    return [
+        {
+            "id": i + 1,
+            "chat_id": i % 50 + 1,
+            "sender_id": i % 1000 + 1,
+            "body": "mensaje de prueba " * (i % 5 + 1),
+            "created_at": (base + timedelta(seconds=37 * i)).isoformat(),
+            "edited_at": None,
+            "reply_to_id": None,
+        }
+        for i in range(n)
+    ]
+
+
+def dateutil_rows(items):
+    out = []
+    for m in items:
+        created = dtp.parse(m["created_at"])
+        body = m.get("body") or ""
+        edited = dtp.parse(m["edited_at"]) if m.get("edited_at") else None
+        out.append((m["id"], m["chat_id"], m.get("sender_id"), body, len(body),
+                    created, created.date(), created.hour, edited, m.get("reply_to_id")))
+    return out
+
+
+def records_rows(items):
+    return [m.row() for m in records.build(MessageRecord, items)]
+
+
+def columnar_columns(items):
+    return columnar.messages(items)
+
+
+def columnar_rows(items):
+    return columnar.messages(items).rows()
+
+
+def records_copy(items):
+    return _CopyStream(records_rows(items)).read()
+
+
+def columnar_copy(items):
+    return _CopyStream(columnar_rows(items)).read()
+
+
+def bench(name, fn, items, repeat):
+    best = min(_timed(fn, items) for _ in range(repeat))
+    print(f"{name:18s} {best:8.3f} s   {len(items) / best:12,.0f} rows/s")
+    return best
+
+
+def _timed(fn, items):
+    start = time.perf_counter()
+    fn(items)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transform fila a fila vs columnar")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    items = make_items(args.rows)
+    print(f"{args.rows:,} mensajes, mejor de {args.repeat}")
+    base = bench("dateutil", dateutil_rows, items, args.repeat)
+    rec = bench("records", records_rows, items, args.repeat)
+    print(f"  records vs dateutil: x{base / rec:.1f}")
+    if not columnar.HAS_NUMPY:
+        print("NumPy no está instalado: se omite el camino columnar (pip install numpy)")
+        return
+    assert columnar_rows(items) == records_rows(items), "columnar y records difieren"
+    col = bench("columnar (cols)", columnar_columns, items, args.repeat)
+    col_rows = bench("columnar (rows)", columnar_rows, items, args.repeat)
+    print(f"  columnar vs records: x{rec / col:.1f} (columnas), x{rec / col_rows:.1f} (filas)")
+    rec_copy = bench("records + COPY", records_copy, items, args.repeat)
+    col_copy = bench("columnar + COPY", columnar_copy, items, args.repeat)
+    print(f"  columnar vs records con COPY: x{rec_copy / col_copy:.2f}")
+
+
+if __name__ == "__main__":
+    main()
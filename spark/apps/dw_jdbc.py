@@ -0,0 +1,139 @@
+from __future__ import annotations
+import os
+from datetime import date, timedelta
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# Lecturas del warehouse para los jobs de Spark. `spark.read.jdbc(table=...)` sin
+# partitionColumn lee la tabla entera por una sola conexión (un executor, un scan completo).
+# Aquí cada lectura consulta primero los límites de la columna de partición (min/max con el
+# mismo filtro) y los reparte en `numPartitions` rangos: cada task lee su rango en paralelo.
+# El SELECT que recibe Postgres trae solo las columnas pedidas y el WHERE del job (pushdown
+# de columnas y predicados); con created_day como columna, Postgres además poda sus
+# particiones mensuales. pyspark se importa solo dentro de las funciones que lo usan.
+
+JDBC_URL = os.getenv("DW_JDBC_URL", "jdbc:postgresql://dw:5432/warehouse")
+JDBC_USER = os.getenv("DW_USER", "postgres")
+JDBC_PASSWORD = os.getenv("DW_PASSWORD", "postgres")
+JDBC_DRIVER = "org.postgresql.Driver"
+# Paquete del driver si la sesión no lo trae (spark-submit --packages / --jars)
+JDBC_PACKAGE = os.getenv("DW_JDBC_PACKAGE", "org.postgresql:postgresql:42.7.3")
+# Rangos (tasks) por lectura y filas por round-trip del driver
+PARTITIONS = int(os.getenv("DW_JDBC_PARTITIONS", "8"))
+FETCH_SIZE = int(os.getenv("DW_JDBC_FETCH_SIZE", "10000"))
+BATCH_SIZE = int(os.getenv("DW_JDBC_BATCH_SIZE", "5000"))
+
+
+def session(app_name: str, local: bool = False):
+    """
+    SparkSession con el driver de Postgres. `local` (o SPARK_LOCAL=1) corre en modo local
+    con todos los cores, para probar los jobs sin el cluster de docker-compose.
+    """
+    from pyspark.sql import SparkSession
+
+    builder = SparkSession.builder.appName(app_name)
+    if local or os.getenv("SPARK_LOCAL", "").lower() in ("1", "true", "yes"):
+        builder = builder.master("local[*]")
+    if JDBC_PACKAGE:
+        builder = builder.config("spark.jars.packages", JDBC_PACKAGE)
+    return builder.getOrCreate()
+
+
+def _properties() -> Dict[str, str]:
+    return {"user": JDBC_USER, "password": JDBC_PASSWORD, "driver": JDBC_DRIVER}
+
+
+def subquery(table: str, columns: Sequence[str], where: Optional[str] = None) -> str:
+    """SELECT con solo `columns` y el filtro del job, como tabla derivada para `dbtable`."""
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        sql += f" WHERE {where}"
+    return f"({sql}) AS {table}_q"
+
+
+def bounds(spark, table: str, column: str, where: Optional[str] = None) -> Tuple[Any, Any]:
+    """(min, max) de `column` en las filas de `table` que cumplen `where` (una consulta chica)."""
+    condition = f" WHERE {where}" if where else ""
+    dbtable = f"(SELECT min({column}) AS lo, max({column}) AS hi FROM {table}{condition}) AS {table}_bounds"
+    row = spark.read.jdbc(url=JDBC_URL, table=dbtable, properties=_properties()).first()
+    return (row["lo"], row["hi"]) if row else (None, None)
+
+
+def partition_options(column: str, lo: Any, hi: Any, partitions: int = PARTITIONS) -> Dict[str, str]:
+    """
+    Opciones de lectura particionada para los límites `lo`/`hi` (enteros o fechas). Spark
+    parte [lo, hi] en `partitions` rangos iguales; no se piden más rangos que valores hay.
+    Sin límites (filtro vacío) la lectura es de una sola partición.
+    """
+    if lo is None or hi is None:
+        return {"numPartitions": "1"}
+    if isinstance(lo, date):
+        span = (hi - lo).days + 1
+        # upperBound es exclusivo en los rangos de Spark: se corre un día para incluir hi
+        lower, upper = lo.isoformat(), (hi + timedelta(days=1)).isoformat()
+    else:
+        span = int(hi) - int(lo) + 1
+        lower, upper = str(int(lo)), str(int(hi) + 1)
+    return {
+        "partitionColumn": column,
+        "lowerBound": lower,
+        "upperBound": upper,
+        "numPartitions": str(max(1, min(partitions, span))),
+    }
+
+
+def read(
+    spark,
+    table: str,
+    columns: Sequence[str],
+    where: Optional[str] = None,
+    partition_column: str = "created_day",
+    partitions: int = PARTITIONS,
+):
+    """
+    DataFrame de `columns` de `table` (filtrado por `where`) leído en paralelo por rangos de
+    `partition_column`, con los límites consultados antes. La columna de partición tiene que
+    estar en `columns`.
+    """
+    if partition_column not in columns:
+        raise ValueError(f"{partition_column} tiene que estar entre las columnas leídas de {table}")
+    lo, hi = bounds(spark, table, partition_column, where)
+    options = partition_options(partition_column, lo, hi, partitions)
+    reader = (
+        spark.read.format("jdbc")
+        .option("url", JDBC_URL)
+        .option("dbtable", subquery(table, columns, where))
+        .option("fetchsize", str(FETCH_SIZE))
+    )
+    for key, value in {**_properties(), **options}.items():
+        reader = reader.option(key, value)
+    return reader.load()
+
+
+def read_parquet(spark, root: str, table: str, columns: Sequence[str], where: Optional[str] = None):
+    """
+    Misma lectura desde el snapshot en Parquet del ETL (app/temporal/snapshots.py):
+    Spark poda los directorios created_day=... con `where` y lee solo `columns`.
+    """
+    df = spark.read.parquet(os.path.join(root, table))
+    if where:
+        df = df.where(where)
+    return df.select(*columns)
+
+
+def write(df, table: str, mode: str = "overwrite") -> None:
+    """
+    Escribe `df` en una tabla resumen del warehouse (creada por la migración 9 de
+    app/temporal/schema.py). `overwrite` usa TRUNCATE: conserva la tabla, su PK y sus permisos.
+    """
+    (
+        df.write.format("jdbc")
+        .option("url", JDBC_URL)
+        .option("dbtable", table)
+        .option("user", JDBC_USER)
+        .option("password", JDBC_PASSWORD)
+        .option("driver", JDBC_DRIVER)
+        .option("truncate", "true")
+        .option("batchsize", str(BATCH_SIZE))
+        .mode(mode)
+        .save()
+    )
@@ -1,23 +1,25 @@
-# from pyspark.sql import SparkSession
-# from pyspark.sql.functions import hour, count
+from pyspark.sql.functions import count
 
-# spark = SparkSession.builder.appName("quick-demo").getOrCreate()
+from dw_jdbc import read, session
 
-# url = "jdbc:postgresql://dw:5432/warehouse"
-# props = {"user":"postgres","password":"postgres","driver":"org.postgresql.Driver"}
+# Demo: lectura particionada de fact_messages (ver dw_jdbc.py) y dos agregados rápidos.
+# Los jobs que escriben resultados en el warehouse son user_activity.py y reaction_distribution.py.
+#   spark-submit --packages org.postgresql:postgresql:42.7.3 /opt/spark-apps/quick_demo.py
 
-# df = spark.read.jdbc(url=url, table="fact_messages", properties=props)
+spark = session("quick-demo")
 
-# # 1) mensajes por usuario
-# by_user = df.groupBy("sender_id").agg(count("*").alias("messages")).orderBy("messages", ascending=False)
-# by_user.show(10)
+df = read(spark, "fact_messages", ["message_id", "sender_id", "created_day", "created_hour"])
 
-# # 2) heatmap por hora (simple)
-# by_hour = df.withColumn("h", hour("created_at")).groupBy("h").agg(count("*").alias("messages")).orderBy("h")
-# by_hour.show(24)
+# 1) mensajes por usuario
+by_user = df.groupBy("sender_id").agg(count("*").alias("messages")).orderBy("messages", ascending=False)
+by_user.show(10)
 
-# # opcional: guarda resultados en parquet dentro del contenedor (visible en Spark UI)
+# 2) heatmap por hora (created_hour ya viene calculada por el ETL)
+by_hour = df.groupBy("created_hour").agg(count("*").alias("messages")).orderBy("created_hour")
+by_hour.show(24)
+
+# opcional: guarda resultados en parquet dentro del contenedor (visible en Spark UI)
 # by_user.write.mode("overwrite").parquet("/opt/spark-data/out/messages_by_user")
 # by_hour.write.mode("overwrite").parquet("/opt/spark-data/out/messages_by_hour")
 
-# spark.stop()
\ No newline at end of file
+spark.stop()
@@ -0,0 +1,71 @@
+from __future__ import annotations
+import sys
+import argparse
+from typing import List, Optional
+
+from dw_jdbc import PARTITIONS, read, read_parquet, session, write
+
+# Distribución de reacciones desde fact_reactions: uso de cada emoji (reacciones, mensajes,
+# usuarios, participación) y cuántos mensajes tienen 1, 2, 3... reacciones. Lee en paralelo
+# por rangos de message_id (ver dw_jdbc.py) y escribe spark_emoji_distribution y
+# spark_reactions_per_message (migración 9).
+#
+#   spark-submit --master spark://spark-master:7077 --packages org.postgresql:postgresql:42.7.3 \
+#       /opt/spark-apps/reaction_distribution.py
+#   python spark/apps/reaction_distribution.py --local      # modo local (pip install pyspark)
+
+COLUMNS = ["message_id", "chat_id", "user_id", "emoji", "created_day"]
+
+
+def where(since: Optional[str], until: Optional[str]) -> Optional[str]:
+    conditions = []
+    if since:
+        conditions.append(f"created_day >= DATE '{since}'")
+    if until:
+        conditions.append(f"created_day < DATE '{until}'")
+    return " AND ".join(conditions) or None
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Distribución de reacciones (fact_reactions)")
+    parser.add_argument("--since", help="primer día (YYYY-MM-DD, incluido)")
+    parser.add_argument("--until", help="último día (YYYY-MM-DD, excluido)")
+    parser.add_argument("--parquet", help="leer el snapshot en Parquet de este directorio en lugar del DW")
+    parser.add_argument("--partitions", type=int, default=PARTITIONS, help="lecturas JDBC en paralelo")
+    parser.add_argument("--local", action="store_true", help="Spark en modo local")
+    args = parser.parse_args(argv)
+
+    from pyspark.sql import Window, functions as F
+
+    spark = session("reaction-distribution", local=args.local)
+    condition = where(args.since, args.until)
+    if args.parquet:
+        reactions = read_parquet(spark, args.parquet, "fact_reactions", COLUMNS, condition)
+    else:
+        reactions = read(spark, "fact_reactions", COLUMNS, condition, "message_id", args.partitions)
+    reactions = reactions.cache()
+
+    by_emoji = reactions.groupBy("emoji").agg(
+        F.count("*").alias("reactions"),
+        F.countDistinct("message_id").alias("messages"),
+        F.countDistinct("user_id").alias("users"),
+        F.countDistinct("chat_id").alias("chats"),
+    )
+    by_emoji = by_emoji.withColumn(
+        "share", F.col("reactions") / F.sum("reactions").over(Window.partitionBy())
+    ).withColumn("computed_at", F.current_timestamp())
+    per_message = (
+        reactions.groupBy("message_id").agg(F.count("*").alias("reactions"))
+        .groupBy("reactions").agg(F.count("*").alias("messages"))
+        .withColumn("computed_at", F.current_timestamp())
+    )
+
+    write(by_emoji, "spark_emoji_distribution")
+    write(per_message, "spark_reactions_per_message")
+    by_emoji.orderBy(F.desc("reactions")).show(20)
+    spark.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
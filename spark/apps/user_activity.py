@@ -0,0 +1,69 @@
+from __future__ import annotations
+import sys
+import argparse
+from typing import List, Optional
+
+from dw_jdbc import PARTITIONS, read, read_parquet, session, write
+
+# Actividad por usuario y hora del día desde fact_messages. Lee en paralelo por rangos de
+# created_day (ver dw_jdbc.py) solo las columnas que agrega y escribe dos tablas resumen del
+# warehouse (migración 9): spark_user_hourly_activity y spark_hourly_activity.
+#
+#   spark-submit --master spark://spark-master:7077 --packages org.postgresql:postgresql:42.7.3 \
+#       /opt/spark-apps/user_activity.py --since 2024-01-01
+#   python spark/apps/user_activity.py --local      # modo local (pip install pyspark)
+
+COLUMNS = ["message_id", "chat_id", "sender_id", "message_length", "created_day", "created_hour"]
+
+
+def where(since: Optional[str], until: Optional[str]) -> str:
+    """Filtro que llega a Postgres (y poda sus particiones mensuales)."""
+    conditions = ["sender_id IS NOT NULL"]
+    if since:
+        conditions.append(f"created_day >= DATE '{since}'")
+    if until:
+        conditions.append(f"created_day < DATE '{until}'")
+    return " AND ".join(conditions)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Actividad por usuario y hora (fact_messages)")
+    parser.add_argument("--since", help="primer día (YYYY-MM-DD, incluido)")
+    parser.add_argument("--until", help="último día (YYYY-MM-DD, excluido)")
+    parser.add_argument("--parquet", help="leer el snapshot en Parquet de este directorio en lugar del DW")
+    parser.add_argument("--partitions", type=int, default=PARTITIONS, help="lecturas JDBC en paralelo")
+    parser.add_argument("--local", action="store_true", help="Spark en modo local")
+    args = parser.parse_args(argv)
+
+    from pyspark.sql import functions as F
+
+    spark = session("user-activity", local=args.local)
+    condition = where(args.since, args.until)
+    if args.parquet:
+        messages = read_parquet(spark, args.parquet, "fact_messages", COLUMNS, condition)
+    else:
+        messages = read(spark, "fact_messages", COLUMNS, condition, "created_day", args.partitions)
+    messages = messages.cache()
+
+    by_user_hour = messages.groupBy("sender_id", "created_hour").agg(
+        F.count("*").alias("messages"),
+        F.countDistinct("chat_id").alias("chats"),
+        F.countDistinct("created_day").alias("active_days"),
+        F.sum("message_length").alias("chars"),
+    ).withColumn("computed_at", F.current_timestamp())
+    by_hour = messages.groupBy("created_hour").agg(
+        F.count("*").alias("messages"),
+        F.countDistinct("sender_id").alias("senders"),
+        F.countDistinct("chat_id").alias("chats"),
+        F.avg("message_length").alias("avg_length"),
+    ).withColumn("computed_at", F.current_timestamp())
+
+    write(by_user_hour, "spark_user_hourly_activity")
+    write(by_hour, "spark_hourly_activity")
+    by_hour.orderBy("created_hour").show(24)
+    spark.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -59,3 +59,118 @@ def sample_message_data():
         "reply_to_id": None
     }
 
+
+class FakeCursor:
+    """
+    Cursor de psycopg2 de mentira: anota cada sentencia en su conexión y el resultado es lo que
+    devuelva `conn.respond(sql, params)` (filas; un int es el rowcount de una sentencia sin filas).
+    """
+
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.itersize = 2000
+        self.rowcount = 0
+        self._result = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    @property
+    def sql(self):
+        return self.conn.sql
+
+    @property
+    def params(self):
+        return self.conn.params
+
+    @property
+    def copied(self):
+        return self.conn.copied
+
+    def execute(self, sql, params=None):
+        self.conn.calls.append((sql, params))
+        result = self.conn.respond(sql, params)
+        if isinstance(result, int):
+            self._result, self.rowcount = [], result
+        else:
+            self._result = list(result or [])
+            self.rowcount = len(self._result)
+
+    def copy_expert(self, sql, file):
+        self.conn.calls.append((sql, None))
+        # En trozos chicos, como psycopg2: el stream no puede depender de leerse de una vez
+        chunks = []
+        while True:
+            chunk = file.read(7)
+            if not chunk:
+                break
+            chunks.append(chunk)
+        self.conn.copied = "".join(chunks)
+
+    def fetchone(self):
+        return self._result.pop(0) if self._result else None
+
+    def fetchmany(self, size):
+        batch, self._result = self._result[:size], self._result[size:]
+        return batch
+
+    def fetchall(self):
+        rows, self._result = self._result, []
+        return rows
+
+
+class FakeConn:
+    """
+    Conexión de psycopg2 de mentira para los tests del warehouse: registra las sentencias en
+    `calls` ((sql, params); `sql` y `params` por separado) y cuenta commits y rollbacks.
+    Las respuestas salen de `respond(sql, params)` (el callable del constructor, o el método en
+    una subclase con su propio catálogo). `state` queda como atributos de la conexión.
+    """
+
+    def __init__(self, respond=None, **state):
+        self.calls = []
+        self.copied = None
+        self.commits = self.rollbacks = 0
+        self.autocommit = False
+        self.closed = False
+        self._respond = respond
+        self.__dict__.update(state)
+
+    @property
+    def sql(self):
+        return [sql for sql, _ in self.calls]
+
+    @property
+    def params(self):
+        return [params for _, params in self.calls]
+
+    def respond(self, sql, params):
+        return self._respond(sql, params) if self._respond else None
+
+    def cursor(self, name=None):
+        return FakeCursor(self, name)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_conn():
+    """Clase FakeConn: se instancia o se extiende con el catálogo que necesita cada test."""
+    return FakeConn
+
+
+@pytest.fixture
+def fake_cursor():
+    """Cursor de una FakeConn nueva, para las funciones que reciben un cursor suelto."""
+    return lambda respond=None, **state: FakeConn(respond, **state).cursor()
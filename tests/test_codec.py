@@ -0,0 +1,25 @@
+import pytest
+from temporalio.api.common.v1 import Payload
+from app.temporal.codec import CompressionCodec, data_converter
+
+
+@pytest.mark.asyncio
+async def test_data_converter_roundtrip_compresses_large_payloads():
+    """Test que una lista grande de dicts se comprime y vuelve intacta"""
+    converter = data_converter()
+    rows = [{"id": i, "chat_id": 1, "body": "hola " * 20, "created_at": "2025-01-01T00:00:00"} for i in range(2000)]
+
+    payloads = await converter.encode([rows, 42])
+    assert payloads[0].metadata["encoding"] == b"binary/zlib"
+    assert payloads[1].metadata["encoding"] == b"json/plain"  # payload pequeño: sin comprimir
+    assert len(payloads[0].data) < len(rows) * 20
+
+    decoded = await converter.decode(payloads, [list, int])
+    assert decoded == [rows, 42]
+
+@pytest.mark.asyncio
+async def test_codec_passes_through_uncompressed_payloads():
+    """Test que el codec decodifica payloads previos al codec (historiales existentes)"""
+    codec = CompressionCodec("zlib", min_size=0)
+    legacy = Payload(metadata={"encoding": b"json/plain"}, data=b'{"a":1}')
+    assert await codec.decode([legacy]) == [legacy]
@@ -0,0 +1,63 @@
+import pytest
+from datetime import date, datetime
+
+np = pytest.importorskip("numpy")
+
+from app.temporal import columnar, records
+from app.temporal.records import MessageRecord, ReactionRecord, BookingRecord, BookingEventRecord
+
+
+MSGS = [
+    {"id": 1, "chat_id": 1, "sender_id": 2, "body": "hola", "created_at": "2024-05-01T10:30:00", "edited_at": None, "reply_to_id": None},
+    {"id": 2, "chat_id": 1, "sender_id": None, "body": None, "created_at": "2024-05-01T23:59:59.5", "edited_at": "2024-05-02T00:00:00", "reply_to_id": 1},
+    {"id": 3, "chat_id": None, "body": "sin chat", "created_at": "2024-05-01T10:30:00"},
+    {"id": 4, "chat_id": 1, "body": "sin fecha", "created_at": None},
+]
+
+def test_messages_columns_match_row_path():
+    """Test que el camino columnar produce las mismas filas que los registros"""
+    batch = columnar.messages(MSGS)
+    assert len(batch) == 2
+    assert batch.rows() == [m.row() for m in records.build(MessageRecord, MSGS)]
+    assert batch.column("created_hour").tolist() == [10, 23]
+    assert batch.column("message_length").tolist() == [4, 0]
+
+def test_rows_are_python_types():
+    """Test que las filas no contienen escalares de NumPy (psycopg2 no los adapta)"""
+    row = columnar.messages(MSGS[:1]).rows()[0]
+    assert type(row[4]) is int
+    assert type(row[5]) is datetime and type(row[6]) is date
+    assert row[8] is None
+
+def test_timezone_aware_timestamps_fall_back_to_utc():
+    """Test timestamps con zona horaria: parseo por valor normalizado a UTC"""
+    ts = columnar._timestamps(["2024-05-01T10:30:00+02:00", "2024-05-01T10:30:00Z", None])
+    assert ts.tolist() == [datetime(2024, 5, 1, 8, 30), datetime(2024, 5, 1, 10, 30), None]
+
+def test_reactions_drop_missing_created_at():
+    """Test reacciones: chat_id del chat cargado y sin created_at se descartan (no se inventa la fecha)"""
+    items = [
+        {"message_id": 1, "user_id": 2, "emoji": " 👍 ", "created_at": "2024-05-01T10:00:00"},
+        {"message_id": 1, "user_id": 3, "emoji": "", "created_at": "2024-05-01T10:00:00"},
+        {"message_id": 1, "user_id": 4, "emoji": "🎉", "created_at": None},
+    ]
+    rows = columnar.reactions(items, chat_id=9).rows()
+    assert len(rows) == 1
+    assert rows[0][:4] == (1, 9, 2, "👍")
+    assert rows == [r.row(9) for r in records.build(ReactionRecord, items)]
+
+def test_created_day_is_utc_on_both_paths():
+    """Test que un created_at con zona cae en el mismo día UTC en columnar y en registros"""
+    items = [{"id": 1, "booking_id": 1, "event_type": "created", "created_at": "2024-05-01T23:30:00-03:00"}]
+    expected = (1, 1, "created", datetime(2024, 5, 2, 2, 30), date(2024, 5, 2), 2)
+    assert columnar.booking_events(items).rows() == [expected]
+    assert [e.row() for e in records.build(BookingEventRecord, items)] == [expected]
+
+def test_bookings_columns_match_row_path():
+    """Test bookings columnar vs registros"""
+    items = [
+        {"id": 1, "message_id": 3, "user_id": 2, "chat_id": 4, "booking_type": "room",
+         "booking_date": "2024-06-01T09:00:00", "status": "PENDING", "created_at": "2024-05-01T10:00:00"},
+        {"id": 2, "status": None, "created_at": "2024-05-01T10:00:00"},
+    ]
+    assert columnar.bookings(items).rows() == [b.row() for b in records.build(BookingRecord, items)]
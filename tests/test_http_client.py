@@ -0,0 +1,46 @@
+import pytest
+from prometheus_client import REGISTRY
+from app.temporal import http_client
+
+
+@pytest.fixture(autouse=True)
+async def reset_client():
+    await http_client.close()
+    yield
+    await http_client.close()
+
+@pytest.mark.asyncio
+async def test_shared_client_is_reused_and_not_closed():
+    """Test que todas las llamadas reciben el mismo cliente y salir del contexto no lo cierra"""
+    async with http_client.client() as c1:
+        pass
+    async with http_client.client() as c2:
+        pass
+
+    assert c1 is c2
+    assert not c1.is_closed
+    assert await http_client.start() is c1
+
+    await http_client.close()
+    assert c1.is_closed
+    assert http_client.get_client() is not c1
+
+@pytest.mark.asyncio
+async def test_pool_limits_from_config(monkeypatch):
+    """Test que el pool usa los límites configurados y cae a HTTP/1.1 sin h2"""
+    monkeypatch.setattr(http_client, "HTTP_MAX_CONNECTIONS", 7)
+    monkeypatch.setattr(http_client, "HTTP2", True)
+    monkeypatch.setattr(http_client, "_H2_AVAILABLE", False)
+
+    client = await http_client.start()
+    pool = client._transport._pool
+    assert pool._max_connections == 7
+    assert pool._http2 is False
+
+@pytest.mark.asyncio
+async def test_pool_metrics_exported():
+    """Test que las métricas de utilización del pool se exportan aunque no haya conexiones"""
+    http_client.get_client()
+    assert REGISTRY.get_sample_value("etl_http_pool_connections", {"state": "active"}) == 0
+    assert REGISTRY.get_sample_value("etl_http_pool_waiting_requests") == 0
+    assert REGISTRY.get_sample_value("etl_http_pool_max_connections") == http_client.HTTP_MAX_CONNECTIONS
@@ -0,0 +1,75 @@
+import asyncio
+import httpx
+import pytest
+from app.temporal.limiter import AdaptiveLimiter, _api_overload
+
+
+@pytest.mark.asyncio
+async def test_limiter_bounds_concurrency():
+    """Test que nunca hay más operaciones en vuelo que el límite"""
+    limiter = AdaptiveLimiter("test-bound", initial=3, min_limit=1, max_limit=3, target_latency=10)
+    peak = 0
+
+    async def op():
+        nonlocal peak
+        async with limiter.slot():
+            peak = max(peak, limiter.inflight)
+            await asyncio.sleep(0.01)
+
+    await asyncio.gather(*(op() for _ in range(20)))
+    assert peak == 3
+    assert limiter.inflight == 0
+
+def test_limiter_created_outside_loop_works_across_loops():
+    """Test que un limitador creado sin loop (como los de proceso) sirve en loops sucesivos"""
+    limiter = AdaptiveLimiter("test-loops", initial=2, min_limit=1, max_limit=2, target_latency=10)
+
+    async def use():
+        async def op():
+            async with limiter.slot():
+                await asyncio.sleep(0.001)
+        await asyncio.gather(*(op() for _ in range(5)))
+        return limiter.inflight
+
+    assert asyncio.run(use()) == 0
+    assert asyncio.run(use()) == 0
+
+@pytest.mark.asyncio
+async def test_limiter_aimd_adjusts_limit():
+    """Test incremento aditivo con éxitos y decremento multiplicativo con sobrecarga"""
+    limiter = AdaptiveLimiter(
+        "test-aimd", initial=10, min_limit=2, max_limit=50, target_latency=10,
+        is_overload=_api_overload, cooldown=0,
+    )
+
+    for _ in range(10):
+        async with limiter.slot():
+            pass
+    assert 10.9 < limiter.limit < 11.1  # ~ +1 por ventana de `limit` éxitos
+
+    before = limiter.limit
+    async with limiter.slot() as slot:
+        slot.overload("http_429")
+    assert limiter.limit == pytest.approx(before * 0.5)
+
+    before = limiter.limit
+    with pytest.raises(httpx.ConnectError):
+        async with limiter.slot():
+            raise httpx.ConnectError("boom")
+    assert limiter.limit == pytest.approx(before * 0.5)
+
+    before = limiter.limit
+    with pytest.raises(ValueError):
+        async with limiter.slot():
+            raise ValueError("dato inválido")
+    assert limiter.limit == before
+
+def test_api_overload_classification():
+    """Test que 429/5xx y errores de conexión son sobrecarga, pero no un 404"""
+    req = httpx.Request("GET", "http://api/x")
+    def status_error(code):
+        return httpx.HTTPStatusError("e", request=req, response=httpx.Response(code, request=req))
+    assert _api_overload(status_error(429))
+    assert _api_overload(status_error(503))
+    assert not _api_overload(status_error(404))
+    assert _api_overload(httpx.ReadTimeout("t"))
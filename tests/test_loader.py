@@ -0,0 +1,190 @@
+import json
+import pytest
+import psycopg2
+from datetime import date, datetime
+from app.temporal import loader
+
+
+def test_copy_value_text_format():
+    """Test escapado del formato text de COPY"""
+    assert loader._copy_value(None) == "\\N"
+    assert loader._copy_value("a\tb\nc\\d") == "a\\tb\\nc\\\\d"
+    assert loader._copy_value(True) == "t"
+    assert loader._copy_value(datetime(2024, 5, 1, 10, 30)) == "2024-05-01T10:30:00"
+    assert loader._copy_value(date(2024, 5, 1)) == "2024-05-01"
+    assert loader._copy_value(7) == "7"
+
+def test_copy_enabled_per_entity(monkeypatch):
+    """Test selección de entidades con COPY (ETL_COPY_ENTITIES)"""
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "messages, reactions")
+    assert loader.copy_enabled("messages") and loader.copy_enabled("reactions")
+    assert not loader.copy_enabled("users")
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "none")
+    assert not loader.copy_enabled("messages")
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "all")
+    assert loader.copy_enabled("users")
+
+def test_copy_merge_counts(monkeypatch, fake_cursor):
+    """Test COPY + merge: filas en streaming y conteo insertadas/actualizadas/sin cambios"""
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "all")
+    monkeypatch.setattr(loader.partitions, "ensure_for_rows", lambda *args, **kwargs: [])
+    monkeypatch.setattr(loader, "infer_missing", lambda *args, **kwargs: {})
+    cur = fake_cursor(lambda sql, params: [(1, 1)] if "WITH merged AS" in sql else None)
+    rows = [
+        (1, 10, 5, "👍", datetime(2024, 5, 1, 10), date(2024, 5, 1), 10),
+        (1, 10, 5, "👍", datetime(2024, 5, 1, 11), date(2024, 5, 1), 11),  # clave repetida
+        (2, 10, 5, "👍", datetime(2024, 5, 1, 10), date(2024, 5, 1), 10),
+        (3, 10, None, "🎉", datetime(2024, 5, 1, 10), date(2024, 5, 1), 10),
+    ]
+    stats = loader.upsert(cur, "reactions", rows)
+    assert stats == {"inserted": 1, "updated": 1, "unchanged": 1}
+    assert cur.copied.splitlines()[2] == "3\t10\t\\N\t🎉\t2024-05-01T10:00:00\t2024-05-01\t10"
+    assert cur.sql[0].startswith("SELECT pg_advisory_xact_lock_shared") and cur.params[0][1] == ["fact_reactions"]
+    assert cur.sql[1].startswith("SELECT count(pg_advisory_xact_lock(%s, slot))")
+    assert "DELETE FROM fact_reactions t" in cur.sql[2] and "t.created_day <> v.new_day" in cur.sql[2]
+    assert cur.sql[3] == "SAVEPOINT etl_rows;" and cur.sql[7] == "RELEASE SAVEPOINT etl_rows;"
+    assert cur.sql[-3].startswith("DELETE FROM rollup_reactions_emoji_day")
+    assert "INSERT INTO etl_export_pending" in cur.sql[-1]
+    assert "COPY _stg_fact_reactions (message_id, chat_id, user_id, emoji" in cur.sql[5]
+    merge = cur.sql[6]
+    assert "ON CONFLICT (message_id, user_id, emoji, created_day)" in merge
+    assert "IS DISTINCT FROM" in merge and "xmax" not in merge
+    assert "RETURNING message_id, user_id, emoji, created_day" in merge
+    assert "EXISTS (SELECT 1 FROM fact_reactions e WHERE e.message_id = m.message_id AND e.user_id = m.user_id" in merge
+
+def test_unchanged_batch_skips_rollups(monkeypatch, fake_cursor):
+    """Test lote sin inserciones, actualizaciones ni moves: no recalcula rollups ni marca export"""
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "all")
+    monkeypatch.setattr(loader.rollups, "ENABLED", True)
+    monkeypatch.setattr(loader.partitions, "ensure_for_rows", lambda *args, **kwargs: [])
+    monkeypatch.setattr(loader, "infer_missing", lambda *args, **kwargs: {})
+    cur = fake_cursor(lambda sql, params: [(0, 0)] if "WITH merged AS" in sql else None)
+    rows = [(1, 10, 5, "👍", datetime(2024, 5, 1, 10), date(2024, 5, 1), 10)]
+    assert loader.upsert(cur, "reactions", rows) == {"inserted": 0, "updated": 0, "unchanged": 1}
+    assert not any("rollup_" in sql or "etl_export_pending" in sql for sql in cur.sql)
+
+def test_move_keys_deletes_old_day_and_refreshes_it(monkeypatch, fake_cursor):
+    """Test que una clave que cambió de created_day se borra de su día viejo (rollups y export incluidos)"""
+    monkeypatch.setattr(loader.rollups, "ENABLED", True)
+    cur = fake_cursor(lambda sql, params: [(date(2024, 4, 30),)] if "DELETE FROM fact_bookings t" in sql else None)
+    rows = [(7, 1, 2, None, "room", None, "PENDING", datetime(2024, 5, 1, 2), date(2024, 5, 1), 2)]
+
+    assert loader.move_keys(cur, "bookings", rows) == 1
+    assert "USING unnest(%s::int[], %s::date[]) AS v(booking_id, new_day)" in cur.sql[0]
+    assert "RETURNING t.created_day" in cur.sql[0]
+    assert cur.params[0] == [[7], [date(2024, 5, 1)]]
+    assert any("rollup_bookings_status_day" in sql for sql in cur.sql[1:])
+    assert "INSERT INTO etl_export_pending" in cur.sql[-1] and cur.params[-1][1] == [date(2024, 4, 30)]
+    assert loader.move_keys(cur, "users", [(1, "a", "A", datetime(2024, 5, 1))]) == 0
+
+def test_values_fallback_skips_unchanged(monkeypatch, fake_cursor):
+    """Test carga con INSERT ... VALUES: claves repetidas reducidas y conteo de filas sin cambios"""
+    calls = []
+
+    def fake_execute_values(cur, sql, rows, page_size, fetch):
+        calls.append((sql, list(rows), page_size))
+        return [(1, 0)]  # 1 insertada, 0 actualizadas: la otra no cambió
+
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "none")
+    monkeypatch.setattr(loader.psycopg2.extras, "execute_values", fake_execute_values)
+    rows = [
+        (1, "a", "A", datetime(2024, 1, 1)),
+        (2, "b", "B", datetime(2024, 1, 1)),
+        (1, "a2", "A", datetime(2024, 1, 1)),  # clave repetida: gana la última
+    ]
+    stats = loader.upsert(fake_cursor(), "users", rows, page_size=10)
+    assert stats == {"inserted": 1, "updated": 0, "unchanged": 1}
+    sql, sent, page_size = calls[0]
+    assert sent == [rows[2], rows[1]] and page_size == 10
+    assert "INSERT INTO dim_users AS t (user_id, handle, display_name, created_at)" in sql
+    assert "IS DISTINCT FROM" in sql and "xmax" not in sql
+
+def test_bisection_isolates_poison_rows(fake_cursor):
+    """Test lote con una fila inválida: se parte hasta aislarla y el resto se carga"""
+    cur = fake_cursor()
+    writes = []
+
+    def write(part):
+        writes.append(len(part))
+        if any(row[0] == 5 for row in part):
+            raise psycopg2.DataError("value too long for type character varying(8)")
+        return {"inserted": len(part)}
+
+    bad = []
+    stats = loader._write_isolating(cur, [(i,) for i in range(8)], write, bad)
+    assert stats == {"inserted": 7}
+    assert [(row, str(e)) for row, e in bad] == [((5,), "value too long for type character varying(8)")]
+    assert writes == [8, 4, 4, 2, 1, 1, 2]
+    assert cur.sql.count("ROLLBACK TO SAVEPOINT etl_rows; RELEASE SAVEPOINT etl_rows;") == 4
+
+def test_bisection_gives_up_on_systemic_errors(fake_cursor):
+    """Test que si fallan más filas que el máximo el lote falla (no es una fila envenenada)"""
+    def write(part):
+        raise psycopg2.IntegrityError("violates foreign key constraint")
+
+    with pytest.raises(psycopg2.IntegrityError):
+        loader._write_isolating(fake_cursor(), [(i,) for i in range(8)], write, [], max_bad=2)
+
+def test_upsert_quarantines_bad_rows(monkeypatch, fake_cursor):
+    """Test upsert con filas en cuarentena: conteo en el resultado y fila + error en etl_quarantine"""
+    quarantined = []
+
+    def fake_values_upsert(cur, entity, rows, page_size):
+        if any(not row[1] for row in rows):
+            raise psycopg2.IntegrityError('null value in column "handle" violates not-null constraint')
+        return {"inserted": len(rows), "updated": 0, "unchanged": 0}
+
+    def fake_execute_values(cur, sql, rows):
+        quarantined.append((sql, rows))
+
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "none")
+    monkeypatch.setattr(loader, "values_upsert", fake_values_upsert)
+    monkeypatch.setattr(loader.psycopg2.extras, "execute_values", fake_execute_values)
+    rows = [(1, "a", "A", datetime(2024, 1, 1)), (2, None, "B", datetime(2024, 1, 1)), (3, "c", "C", datetime(2024, 1, 1))]
+    stats = loader.upsert(fake_cursor(), "users", rows)
+    assert stats == {"inserted": 2, "updated": 0, "unchanged": 0, "quarantined": 1}
+    sql, sent = quarantined[0]
+    assert sql.startswith("INSERT INTO etl_quarantine (entity, payload, error, sqlstate)")
+    entity, payload, error, _ = sent[0]
+    assert entity == "users" and "not-null" in error
+    assert json.loads(payload) == {"user_id": 2, "handle": None, "display_name": "B", "created_at": "2024-01-01 00:00:00"}
+
+def test_empty_batch_is_noop(fake_cursor):
+    """Test lote vacío no toca la base"""
+    cur = fake_cursor()
+    assert loader.upsert(cur, "messages", []) == {}
+    assert cur.sql == []
+
+def test_infer_missing_dimensions_in_bulk(fake_cursor):
+    """Test miembros inferidos: un INSERT con anti-join por dimensión con las claves del lote"""
+    cur = fake_cursor(lambda sql, params: 2)
+    rows = [
+        (1, 10, 5, "a", 1, datetime(2024, 5, 1), date(2024, 5, 1), 0, None, None),
+        (2, 10, None, "b", 1, datetime(2024, 5, 1), date(2024, 5, 1), 0, None, None),
+        (3, 11, 7, "c", 1, datetime(2024, 5, 1), date(2024, 5, 1), 0, None, None),
+    ]
+    assert loader.infer_missing(cur, "messages", rows) == {"chats": 2, "users": 2}
+    chats_sql, users_sql = cur.sql
+    assert "INSERT INTO dim_chats AS d (chat_id, type, title, created_at, is_inferred)" in chats_sql
+    assert "WHERE NOT EXISTS (SELECT 1 FROM dim_chats e WHERE e.chat_id = k)" in chats_sql
+    assert "INSERT INTO dim_users" in users_sql
+    assert cur.params == [([10, 11],), ([5, 7],)]
+    assert loader.infer_missing(fake_cursor(), "users", rows) == {}
+
+def test_dimension_load_replaces_inferred_stub():
+    """Test que la carga real de una dimensión sobrescribe el stub inferido aunque no haya cambios"""
+    sql = loader._upsert_sql(loader.TABLES["users"], "users")
+    assert "is_inferred = FALSE" in sql and "OR t.is_inferred" in sql
+    assert "is_inferred" not in loader._upsert_sql(loader.TABLES["messages"], "messages")
+
+def test_live_writes_wait_for_shadow_refresh(fake_cursor):
+    """Test que una tabla viva retenida por un full refresh rechaza el upsert antes de escribir; la sombra no"""
+    held = lambda sql, params: [("fact_bookings", datetime(2024, 5, 1, 10))] if "etl_shadow_holds" in sql else None
+    cur = fake_cursor(held)
+    row = (1, 2, 3, None, "room", None, "PENDING", datetime(2024, 5, 1, 10), date(2024, 5, 1), 10)
+    with pytest.raises(loader.LiveTableHeld, match="fact_bookings"):
+        loader.upsert(cur, "bookings", [row])
+    assert len(cur.sql) == 1
+    cur = fake_cursor(held)
+    loader.upsert(cur, "bookings", [row], shadow=True)
+    assert not any("pg_advisory_xact_lock_shared" in sql for sql in cur.sql)
@@ -0,0 +1,34 @@
+from app.temporal import matviews
+
+
+def test_for_tables_and_create_sql():
+    """Test vistas que leen las tablas cambiadas y DDL con índice único"""
+    assert matviews.for_tables(["fact_bookings"]) == ["mv_booking_funnel"]
+    assert matviews.for_tables(["dim_users", "fact_booking_events"]) == ["mv_top_users", "mv_booking_funnel"]
+    assert matviews.for_tables([]) == []
+    sql = matviews.create_sql("mv_booking_funnel")
+    assert sql.startswith("CREATE MATERIALIZED VIEW IF NOT EXISTS mv_booking_funnel AS SELECT")
+    assert sql.endswith("CREATE UNIQUE INDEX IF NOT EXISTS mv_booking_funnel_key ON mv_booking_funnel (month, booking_type);")
+    assert "WITH NO DATA" not in sql and "GROUP BY 1, 2 WITH NO DATA;" in matviews.create_sql("mv_booking_funnel", with_data=False)
+
+def test_refresh_concurrently_only_when_populated(fake_conn):
+    """Test CONCURRENTLY si la vista tiene datos, refresco normal si no, y vistas faltantes se omiten"""
+    populated = {"mv_top_users": True, "mv_chat_activity": False}
+    conn = fake_conn(lambda sql, params: [(populated[params[0]],)] if "relispopulated" in sql and params[0] in populated else None)
+    durations = matviews.refresh(conn, ["mv_top_users", "mv_chat_activity", "mv_booking_funnel"])
+    assert list(durations) == ["mv_top_users", "mv_chat_activity"]
+    refreshes = [sql for sql in conn.sql if sql.startswith("REFRESH")]
+    assert refreshes == [
+        "REFRESH MATERIALIZED VIEW CONCURRENTLY mv_top_users;",
+        "REFRESH MATERIALIZED VIEW mv_chat_activity;",
+    ]
+    logged = [params[0] for sql, params in conn.calls if matviews.REFRESH_LOG_TABLE in sql]
+    assert logged == ["mv_top_users", "mv_chat_activity"]
+    assert conn.commits == 2
+
+def test_refresh_unpopulated_only_skips_populated_views(fake_conn):
+    """Test que unpopulated_only solo llena las vistas sin datos (recreadas en un swap)"""
+    populated = {"mv_top_users": True, "mv_booking_funnel": False}
+    conn = fake_conn(lambda sql, params: [(populated[params[0]],)] if "relispopulated" in sql else None)
+    assert list(matviews.refresh(conn, list(populated), unpopulated_only=True)) == ["mv_booking_funnel"]
+    assert [sql for sql in conn.sql if sql.startswith("REFRESH")] == ["REFRESH MATERIALIZED VIEW mv_booking_funnel;"]
@@ -0,0 +1,40 @@
+import pytest
+from app.temporal import oltp
+
+
+def test_check_source():
+    """Test validación del backend de extracción"""
+    assert oltp.check_source("DB") == "db"
+    assert oltp.check_source(None) == "api"
+    with pytest.raises(ValueError):
+        oltp.check_source("kafka")
+
+@pytest.mark.asyncio
+async def test_iter_pages_server_side_cursor(monkeypatch, fake_conn):
+    """Test paginación sobre el cursor, reanudación por offset y cierre de la conexión"""
+    opened = {}
+    conn = fake_conn(lambda sql, params: [{"id": i} for i in range(params[0] + 1, 26)])
+
+    def fake_open(entity, params, offset, page_size):
+        opened.update(entity=entity, params=params, offset=offset)
+        cur = conn.cursor(name="etl_extract")
+        cur.execute("SELECT * FROM messages OFFSET %s;", (offset,))
+        return conn, cur
+
+    monkeypatch.setattr(oltp, "_open", fake_open)
+    pages = [(p, len(rows)) async for p, rows in oltp.iter_pages("messages", 10, (7,), first_page=2)]
+
+    assert opened == {"entity": "messages", "params": (7,), "offset": 10}
+    assert pages == [(2, 10), (3, 5)]
+    assert conn.closed
+
+def test_router_rejects_unknown_source(client):
+    """Test que el endpoint del ETL valida el parámetro source antes de contactar a Temporal"""
+    response = client.post("/etl/full?source=kafka")
+    assert response.status_code == 400
+
+def test_connect_requires_dsn(monkeypatch):
+    """Test que sin ETL_OLTP_URL ni DATABASE_URL la conexión falla con un error claro"""
+    monkeypatch.setattr(oltp, "OLTP_URL", "")
+    with pytest.raises(RuntimeError, match="ETL_OLTP_URL"):
+        oltp.connect()
@@ -0,0 +1,78 @@
+import pytest
+from app import models
+from app.temporal import cdc
+from app.utils.outbox import record_change
+
+
+def _outbox(db):
+    return [(o.entity, o.op, o.key) for o in db.query(models.EtlOutbox).order_by(models.EtlOutbox.id)]
+
+def test_writes_append_to_outbox(client, db, sample_user_data):
+    """Test que cada escritura del API agrega su cambio al outbox en la misma transacción"""
+    user_id = client.post("/users", json=sample_user_data).json()["id"]
+    chat_id = client.post("/chats", json={"type": "group", "title": "T", "members": [user_id]}).json()["id"]
+    msg_id = client.post(f"/chats/{chat_id}/messages", json={"body": "hola", "sender_id": user_id}).json()["id"]
+    client.post(f"/messages/{msg_id}/reactions", json={"user_id": user_id, "emoji": "👍"})
+    client.delete(f"/messages/{msg_id}/reactions", params={"user_id": user_id, "emoji": "👍"})
+
+    reaction = {"message_id": msg_id, "user_id": user_id, "emoji": "👍"}
+    assert _outbox(db) == [
+        ("users", "upsert", {"id": user_id}),
+        ("chats", "upsert", {"id": chat_id}),
+        ("members", "upsert", {"chat_id": chat_id, "user_id": user_id}),
+        ("messages", "upsert", {"id": msg_id}),
+        ("reactions", "upsert", reaction),
+        ("reactions", "delete", reaction),
+    ]
+
+def test_failed_write_does_not_append(client, db):
+    """Test que una escritura rechazada no deja cambios en el outbox"""
+    assert client.delete("/messages/1/reactions", params={"user_id": 1, "emoji": "x"}).status_code == 404
+    assert client.post("/chats/999/messages", json={"body": "x", "sender_id": 1}).status_code == 404
+    assert _outbox(db) == []
+
+def test_record_change_rejects_unknown_entity(db):
+    """Test validación de entidad y operación del outbox"""
+    with pytest.raises(ValueError):
+        record_change(db, "payments", id=1)
+    with pytest.raises(ValueError):
+        record_change(db, "users", "merge", id=1)
+
+def test_key_filter_one_array_per_column():
+    """Test filtro por clave compuesta con unnest de un array por columna"""
+    sql, params = cdc._key_filter("reactions", ["message_id", "user_id", "emoji"], [(1, 2, "a"), (3, 4, "b")])
+    assert sql == "(message_id, user_id, emoji) IN (SELECT * FROM unnest(%s::int[], %s::int[], %s::text[]))"
+    assert params == [[1, 3], [2, 4], ["a", "b"]]
+
+def test_outbox_entities_match_cdc():
+    """Test que el consumidor conoce todas las entidades que escribe el API"""
+    from app.utils.outbox import ENTITIES
+    assert set(ENTITIES) == set(cdc.ENTITIES)
+
+def test_set_null_cascade_refreshes_rollups_and_export(monkeypatch, fake_conn):
+    """Test que anular message_id en fact_bookings al borrar un mensaje pasa por rollups y export"""
+    from datetime import date
+    monkeypatch.setattr(cdc.rollups, "ENABLED", True)
+    # Solo la cascada a fact_bookings encuentra filas; los DELETE no encuentran nada
+    touched = ("UPDATE fact_bookings", "SELECT created_day FROM fact_bookings")
+    conn = fake_conn(lambda sql, params: [(date(2024, 5, 1),)] if sql.lstrip().startswith(touched) else None)
+    cdc.apply_deletes_and_offset(conn, "warehouse", {"messages": [(7,)]}, 10)
+
+    statements = [" ".join(sql.split()) for sql in conn.sql]
+    update = next(i for i, sql in enumerate(statements) if sql.startswith("UPDATE fact_bookings"))
+    assert "RETURNING created_day" in statements[update]
+    # El lock del grupo se toma antes del UPDATE
+    assert statements[update - 1].startswith("SELECT count(pg_advisory_xact_lock(%s, slot))")
+    after = statements[update + 1:]
+    assert any("rollup_bookings_status_day" in sql for sql in after)
+    assert any("INSERT INTO etl_export_pending" in sql for sql in after)
+
+def test_deletes_wait_for_shadow_refresh(fake_conn):
+    """Test que los borrados del outbox no tocan tablas retenidas por un full refresh ni avanzan el offset"""
+    from datetime import datetime
+    from app.temporal import loader
+    conn = fake_conn(lambda sql, params: [("fact_reactions", datetime(2024, 5, 1))] if "etl_shadow_holds" in sql else None)
+    with pytest.raises(loader.LiveTableHeld):
+        cdc.apply_deletes_and_offset(conn, "warehouse", {"messages": [(7,)]}, 10)
+    assert sorted(conn.params[0][1]) == ["fact_bookings", "fact_messages", "fact_reactions"]
+    assert len(conn.sql) == 1 and conn.commits == 0
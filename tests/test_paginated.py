@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from app.temporal.paginated import iter_pages, map_bounded
+
+
+def make_fetch(total_pages, delays=None, log=None):
+    """Fetch falso: página N devuelve items [N] tras delays[N] segundos"""
+    state = {"inflight": 0, "peak": 0}
+
+    async def fetch(page):
+        state["inflight"] += 1
+        state["peak"] = max(state["peak"], state["inflight"])
+        try:
+            await asyncio.sleep((delays or {}).get(page, 0.01))
+            if log is not None:
+                log.append(page)
+            return {"items": [page], "total_pages": total_pages}
+        finally:
+            state["inflight"] -= 1
+
+    return fetch, state
+
+@pytest.mark.asyncio
+async def test_iter_pages_ordered_and_concurrent():
+    """Test entrega en orden de página con fan-out acotado"""
+    fetch, state = make_fetch(20, delays={2: 0.05})
+    pages = [p async for p, _ in iter_pages(fetch, concurrency=4)]
+
+    assert pages == list(range(1, 21))
+    assert state["peak"] == 4
+
+@pytest.mark.asyncio
+async def test_iter_pages_latency_bound_by_slowest_page():
+    """Test que N páginas tardan ~ la más lenta y no la suma"""
+    fetch, _ = make_fetch(10, delays={p: 0.05 for p in range(1, 11)})
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    pages = [p async for p, _ in iter_pages(fetch, concurrency=10)]
+    elapsed = loop.time() - start
+
+    assert len(pages) == 10
+    assert elapsed < 0.3  # secuencial serían ~0.5s
+
+@pytest.mark.asyncio
+async def test_iter_pages_unordered_yields_as_completed():
+    """Test entrega desordenada: una página lenta no bloquea a las demás"""
+    fetch, _ = make_fetch(4, delays={2: 0.1})
+    pages = [p async for p, _ in iter_pages(fetch, concurrency=3, ordered=False)]
+
+    assert pages[0] == 1
+    assert pages[-1] == 2
+    assert sorted(pages) == [1, 2, 3, 4]
+
+@pytest.mark.asyncio
+async def test_iter_pages_resume_and_early_exit_cancels():
+    """Test reanudar desde una página y cancelar las pendientes al salir antes"""
+    log = []
+    fetch, state = make_fetch(10, log=log)
+    pages = iter_pages(fetch, first_page=6, concurrency=3)
+    async for page, data in pages:
+        assert data["items"] == [page]
+        if page == 7:
+            break
+    await pages.aclose()
+    await asyncio.sleep(0.02)
+
+    assert 5 not in log
+    assert state["inflight"] == 0
+    assert 10 not in log
+
+@pytest.mark.asyncio
+async def test_map_bounded_keeps_order():
+    """Test que map_bounded respeta el límite y conserva el orden"""
+    inflight = peak = 0
+
+    async def work(i):
+        nonlocal inflight, peak
+        inflight += 1
+        peak = max(peak, inflight)
+        await asyncio.sleep(0.01 * (5 - i % 5))
+        inflight -= 1
+        return i * 2
+
+    assert await map_bounded(work, range(10), concurrency=3) == [i * 2 for i in range(10)]
+    assert peak == 3
@@ -0,0 +1,86 @@
+import pytest
+from datetime import date, datetime
+from app.temporal import partitions
+
+
+@pytest.fixture
+def catalog(fake_conn):
+    """Conexión con un catálogo de particiones: `existing` ya creadas, `detached` por la retención, `partitioned` o no."""
+    def make(existing=(), partitioned=True, detached=()):
+        existing = set(existing)
+
+        def respond(sql, params):
+            if "relkind" in sql:
+                return [(partitioned,)]
+            if "to_regclass(%s) IS NOT NULL" in sql:
+                return [(params[0] in existing or params[0] in detached, params[0] in existing)]
+            if "pg_inherits" in sql:
+                return [(name,) for name in sorted(existing) if name.startswith(params[0])]
+        return fake_conn(respond)
+    return make
+
+@pytest.fixture(autouse=True)
+def clean_cache(monkeypatch):
+    monkeypatch.setattr(partitions, "_known", set())
+    monkeypatch.setattr(partitions, "_is_partitioned", {})
+
+def test_month_helpers():
+    """Test cálculo de meses y nombres de partición"""
+    assert partitions.month_start("2024-05-17") == date(2024, 5, 1)
+    assert partitions.month_start(datetime(2024, 5, 17, 10)) == date(2024, 5, 1)
+    assert partitions.add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert partitions.add_months(date(2024, 1, 1), -1) == date(2023, 12, 1)
+    assert partitions.partition_name("fact_messages", date(2024, 5, 1)) == "fact_messages_p202405"
+
+def test_ensure_for_rows_creates_missing_months(catalog):
+    """Test que el loader crea solo las particiones que faltan y cachea las existentes del mes actual en adelante"""
+    this_month = partitions.month_start(date.today())
+    next_month = partitions.add_months(this_month, 1)
+    current = partitions.partition_name("fact_messages", this_month)
+    upcoming = partitions.partition_name("fact_messages", next_month)
+    conn = catalog(existing={current})
+    cur = conn.cursor()
+    columns = ("message_id", "created_day")
+    rows = [(1, this_month), (2, this_month.replace(day=28)), (3, next_month)]
+    assert partitions.ensure_for_rows(cur, "messages", columns, rows) == [upcoming]
+    create = [s for s in cur.sql if s.startswith("CREATE TABLE")]
+    assert create == [f"CREATE TABLE {upcoming} PARTITION OF fact_messages FOR VALUES FROM (%s) TO (%s);"]
+    assert cur.params[-1] == (next_month, partitions.add_months(next_month, 1))
+    # El mes existente quedó en caché: ya no se consulta el catálogo
+    conn.calls.clear()
+    partitions.ensure_for_rows(cur, "messages", columns, rows[:2])
+    assert cur.sql == []
+
+def test_past_months_rechecked_after_retention(catalog):
+    """Test que los meses pasados no se cachean y uno desacoplado por la retención no se recrea"""
+    conn = catalog(existing={"fact_messages_p202405"}, detached={"fact_messages_p202404"})
+    cur = conn.cursor()
+    columns = ("message_id", "created_day")
+    rows = [(1, date(2024, 4, 3)), (2, date(2024, 5, 3))]
+    assert partitions.ensure_for_rows(cur, "messages", columns, rows) == []
+    assert not any(s.startswith("CREATE") for s in cur.sql)
+    assert partitions._known == set()
+    # La siguiente carga vuelve a consultar el catálogo: otro proceso pudo desacoplarlo
+    conn.calls.clear()
+    partitions.ensure_for_rows(cur, "messages", columns, rows[1:])
+    assert any("pg_inherits" in s for s in cur.sql)
+
+def test_ensure_skips_unpartitioned_tables_and_dimensions(catalog):
+    """Test no-op para dimensiones y para tablas aún sin particionar"""
+    cur = catalog(partitioned=False).cursor()
+    assert partitions.ensure_for_rows(cur, "users", ("user_id",), [(1,)]) == []
+    assert partitions.ensure_for_rows(cur, "messages", ("created_day",), [(date(2024, 5, 1),)]) == []
+    assert not any(s.startswith("CREATE") for s in cur.sql)
+
+def test_retention_detaches_old_months(catalog):
+    """Test retención: meses anteriores a los últimos N se desacoplan (o solo se listan en dry-run)"""
+    conn = catalog(existing={f"fact_messages_p2024{m:02d}" for m in range(1, 7)})
+    dry = partitions.retention(conn, keep_months=3, tables=["fact_messages"], today=date(2024, 6, 15), dry_run=True)
+    assert dry == ["fact_messages_p202401", "fact_messages_p202402", "fact_messages_p202403"]
+    assert not any("DETACH" in s for s in conn.sql)
+    partitions.retention(conn, keep_months=3, tables=["fact_messages"], today=date(2024, 6, 15))
+    detached = [s for s in conn.sql if "DETACH" in s]
+    assert detached[0] == "ALTER TABLE fact_messages DETACH PARTITION fact_messages_p202401;"
+    assert len(detached) == 3
+    with pytest.raises(ValueError):
+        partitions.retention(conn, keep_months=3, mode="truncate")
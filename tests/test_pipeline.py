@@ -0,0 +1,83 @@
+import asyncio
+import pytest
+from app.temporal.pipeline import Pipeline, rebatch
+
+
+async def pages(n, rows_per_page=10, log=None):
+    for page in range(1, n + 1):
+        if log is not None:
+            log.append(("extract", page))
+        yield page, list(range(rows_per_page))
+
+@pytest.mark.asyncio
+async def test_pipeline_preserves_order_and_runs_stages():
+    """Test que los items pasan por todas las etapas en orden y se reportan stats"""
+    loaded = []
+
+    async def double(item):
+        page, rows = item
+        return page, [r * 2 for r in rows]
+
+    async def sink(item):
+        loaded.append(item[0])
+
+    stats = await Pipeline("test", pages(6)).stage("transform", double).run(sink)
+
+    assert loaded == [1, 2, 3, 4, 5, 6]
+    assert stats["extract"]["items"] == 6
+    assert stats["transform"]["items"] == 6
+    assert stats["load"]["items"] == 6
+
+@pytest.mark.asyncio
+async def test_pipeline_backpressure_bounds_memory():
+    """Test que un sink lento frena al source: nunca hay más de ~queue_size items adelantados"""
+    log = []
+    max_ahead = 0
+
+    async def sink(item):
+        nonlocal max_ahead
+        extracted = sum(1 for kind, _ in log if kind == "extract")
+        max_ahead = max(max_ahead, extracted - item[0])
+        await asyncio.sleep(0.01)
+
+    async def noop(item):
+        return item
+
+    await Pipeline("test", pages(20, log=log), queue_size=1).stage("noop", noop).run(sink)
+
+    # 1 en la cola del sink + 1 en la etapa + 1 en la cola de entrada + 1 en manos del producer
+    assert max_ahead <= 4
+
+@pytest.mark.asyncio
+async def test_pipeline_error_cancels_and_propagates():
+    """Test que un error en una etapa cancela el resto y se propaga"""
+    async def sink(item):
+        if item[0] == 3:
+            raise RuntimeError("boom")
+
+    source = pages(100)
+    with pytest.raises(RuntimeError, match="boom"):
+        await Pipeline("test", source).run(sink)
+    # El source quedó cerrado
+    with pytest.raises(StopAsyncIteration):
+        await source.__anext__()
+
+@pytest.mark.asyncio
+async def test_pipeline_none_filters_items():
+    """Test que una etapa que devuelve None descarta el item"""
+    loaded = []
+
+    async def only_even(item):
+        return item if item[0] % 2 == 0 else None
+
+    async def sink(item):
+        loaded.append(item[0])
+
+    await Pipeline("test", pages(5)).stage("filter", only_even).run(sink)
+    assert loaded == [2, 4]
+
+@pytest.mark.asyncio
+async def test_rebatch_groups_full_pages():
+    """Test que rebatch agrupa páginas completas y emite la última página del lote"""
+    batches = [(page, len(rows)) async for page, rows in rebatch(pages(7, rows_per_page=10), 25)]
+    assert batches == [(3, 30), (6, 30), (7, 10)]
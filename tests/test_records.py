@@ -0,0 +1,73 @@
+import pytest
+from datetime import date, datetime, timezone
+from app.temporal import records
+from app.temporal.records import MessageRecord, ReactionRecord, BookingRecord, BookingEventRecord
+
+
+def test_parse_ts_iso_and_fallback():
+    """Test parseo de timestamps ISO (camino rápido) y no ISO (dateutil)"""
+    assert records.parse_ts("2024-05-01T10:30:00") == datetime(2024, 5, 1, 10, 30)
+    assert records.parse_ts("2024-05-01T10:30:00Z") == datetime(2024, 5, 1, 10, 30, tzinfo=timezone.utc)
+    assert records.parse_ts("May 1 2024 10:30") == datetime(2024, 5, 1, 10, 30)
+    assert records.parse_ts("no es fecha") is None
+    assert records.parse_ts(None) is None
+
+def test_message_record_row_and_dict():
+    """Test que un mensaje se parsea una vez y arma la fila del warehouse"""
+    m = MessageRecord.from_dict({
+        "id": 7, "chat_id": 1, "sender_id": 2, "body": "hola",
+        "created_at": "2024-05-01T10:30:00", "edited_at": None, "reply_to_id": None, "extra": "x",
+    })
+    assert m.row() == (7, 1, 2, "hola", 4, datetime(2024, 5, 1, 10, 30), date(2024, 5, 1), 10, None, None)
+    assert m.to_dict()["message_length"] == 4
+    assert m.to_dict()["created_at"] == "2024-05-01T10:30:00"
+    assert not hasattr(m, "__dict__")
+
+def test_build_drops_invalid_and_keeps_records():
+    """Test validación: items inválidos se descartan, registros ya construidos se conservan"""
+    ok = MessageRecord(1, 1, 1, "a", datetime(2024, 1, 1))
+    built = records.build(MessageRecord, [
+        ok,
+        {"id": 2, "chat_id": 1, "body": "b", "created_at": datetime(2024, 1, 2)},
+        {"id": 3, "body": "sin chat", "created_at": "2024-01-01T00:00:00"},
+        {"id": 4, "chat_id": 1, "body": "sin fecha"},
+    ])
+    assert [m.id for m in built] == [1, 2]
+    assert built[0] is ok
+
+def test_reaction_record_uses_load_chat_id():
+    """Test reacciones: emoji normalizado y chat_id del load"""
+    r = ReactionRecord.from_dict({"message_id": 5, "user_id": 2, "emoji": " 👍 ", "created_at": "2024-05-01T23:00:00"})
+    assert r.row(9) == (5, 9, 2, "👍", datetime(2024, 5, 1, 23), date(2024, 5, 1), 23)
+    assert ReactionRecord.from_dict({"message_id": 5, "user_id": 2, "emoji": "  "}) is None
+    assert ReactionRecord.from_dict({"message_id": 5, "user_id": 2, "emoji": "👍"}) is None  # sin created_at
+    utc = ReactionRecord.from_dict({"message_id": 5, "user_id": 2, "emoji": "👍", "created_at": "2024-05-01T23:00:00-03:00"})
+    assert utc.row(9)[4:] == (datetime(2024, 5, 2, 2), date(2024, 5, 2), 2)
+
+def test_booking_records():
+    """Test bookings y eventos: validación y round-trip por to_dict"""
+    b = BookingRecord.from_dict({
+        "id": 1, "message_id": 3, "user_id": 2, "chat_id": 4, "booking_type": "room",
+        "booking_date": "2024-06-01T09:00:00", "status": "PENDING", "created_at": "2024-05-01T10:00:00",
+    })
+    assert b.row()[5] == datetime(2024, 6, 1, 9)
+    assert BookingRecord.from_dict(b.to_dict()) == b
+    assert BookingRecord.from_dict({"id": 1, "created_at": "2024-05-01"}) is None
+    e = BookingEventRecord.from_dict({"id": 1, "booking_id": 1, "event_type": "created", "created_at": "2024-05-01T10:00:00"})
+    assert e.row() == (1, 1, "created", datetime(2024, 5, 1, 10), date(2024, 5, 1), 10)
+    assert BookingEventRecord.from_dict({"id": 2, "booking_id": 1}) is None
+
+def test_record_base_is_abstract():
+    """Test que Record no se instancia y un registro sin row/to_dict tampoco"""
+    class Partial(records.Record):
+        __slots__ = ()
+
+        @classmethod
+        def from_dict(cls, d):
+            return cls()
+
+    with pytest.raises(TypeError):
+        records.Record()
+    with pytest.raises(TypeError):
+        Partial.from_dict({})
+    assert not hasattr(MessageRecord(1, 2, 3, "x", datetime(2024, 5, 1)), "__dict__")
@@ -0,0 +1,48 @@
+from datetime import date
+from app.temporal import rollups
+
+
+def test_refresh_recomputes_touched_scopes(fake_cursor):
+    """Test recálculo de los grupos tocados por un lote: DELETE del scope e INSERT agregado"""
+    cur = fake_cursor()
+    columns = ("booking_id", "status", "created_day")
+    rows = [(1, "PENDING", date(2024, 5, 2)), (2, "CONFIRMED", date(2024, 5, 1)), (3, "PENDING", date(2024, 5, 2))]
+    assert rollups.refresh(cur, "fact_bookings", columns, rows) == {"rollup_bookings_status_day": 2}
+    delete, insert = cur.conn.calls
+    assert delete == (
+        "DELETE FROM rollup_bookings_status_day WHERE (created_day) IN (SELECT * FROM unnest(%s::date[]));",
+        [[date(2024, 5, 1), date(2024, 5, 2)]],
+    )
+    assert insert[0].startswith("INSERT INTO rollup_bookings_status_day (created_day, status, bookings) SELECT")
+    assert "created_day = ANY(%s::date[])" in insert[0] and "GROUP BY created_day, status" in insert[0]
+
+def test_refresh_skips_null_scopes_and_other_tables(fake_cursor):
+    """Test mensajes sin sender no tocan el rollup por usuario; tablas sin rollups no hacen nada"""
+    cur = fake_cursor()
+    columns = ("message_id", "chat_id", "sender_id", "created_day")
+    touched = rollups.refresh(cur, "fact_messages", columns, [(1, 10, None, date(2024, 5, 1))])
+    assert touched == {"rollup_messages_chat_day": 1, "rollup_messages_chat_hour": 1}
+    assert rollups.refresh(cur, "fact_booking_events", ("event_id",), [(1,)]) == {}
+
+def test_rebuild_one_transaction_per_rollup(fake_conn):
+    """Test rebuild completo y columnas de scope que necesita el outbox para los borrados"""
+    conn = fake_conn()
+    assert rollups.rebuild(conn, ["rollup_messages_user_day"]) == ["rollup_messages_user_day"]
+    sql = conn.sql[-1]
+    assert sql.startswith("DELETE FROM rollup_messages_user_day;")
+    assert "WHERE sender_id IS NOT NULL GROUP BY sender_id, created_day" in sql
+    assert conn.commits == 1
+    assert rollups.scope_columns("fact_messages") == ["chat_id", "created_day", "sender_id"]
+
+def test_lock_sorted_slots_shared_across_days(monkeypatch, fake_cursor):
+    """Test locks por slot de scope en orden, en una sentencia; otro día del mismo chat cae en el mismo slot"""
+    monkeypatch.setattr(rollups, "ENABLED", True)
+    cur = fake_cursor()
+    columns = ("message_id", "chat_id", "sender_id", "created_day")
+    rows = [(1, 10, 5, date(2024, 5, 1)), (2, 10, 5, date(2024, 4, 30)), (3, 11, None, date(2024, 5, 1))]
+    assert rollups.lock(cur, "fact_messages", columns, rows) == 5
+    assert cur.conn.sql == ["SELECT count(pg_advisory_xact_lock(%s, slot)) FROM unnest(%s::int[]) AS slot;"]
+    slots = cur.conn.params[0][1]
+    assert slots == sorted(slots) and all(0 <= s < rollups.LOCK_SLOTS for s in slots)
+    assert rollups.lock(cur, "fact_booking_events", ("event_id",), [(1,)]) == 0
+    assert len(cur.conn.sql) == 1
@@ -0,0 +1,41 @@
+import time
+import asyncio
+import threading
+import pytest
+from app.temporal import runtime
+
+
+@pytest.mark.asyncio
+async def test_run_in_db_thread_does_not_block_loop():
+    """Test que trabajo bloqueante en el pool de DB se solapa con el event loop"""
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.01)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    names = await asyncio.gather(*(
+        runtime.run_in_db_thread(lambda: (time.sleep(0.2), threading.current_thread().name)[1])
+        for _ in range(4)
+    ))
+    task.cancel()
+
+    assert all(n.startswith("etl-db") for n in names)
+    assert ticks >= 5
+
+@pytest.mark.asyncio
+async def test_monitor_event_loop_lag_detects_blocking(monkeypatch):
+    """Test que la sonda registra el lag cuando el loop se bloquea"""
+    observed = []
+    monkeypatch.setattr(runtime.event_loop_lag_seconds, "observe", observed.append)
+
+    task = asyncio.create_task(runtime.monitor_event_loop_lag(interval=0.01))
+    await asyncio.sleep(0.02)
+    time.sleep(0.1)  # bloqueo deliberado del loop
+    await asyncio.sleep(0.03)
+    task.cancel()
+
+    assert max(observed) >= 0.05
@@ -0,0 +1,102 @@
+import pytest
+from app.temporal import schema
+
+
+@pytest.fixture
+def schema_conn(fake_conn):
+    """FakeConn con el catálogo de schema_version: las versiones quedan registradas al commit."""
+    class SchemaConn(fake_conn):
+        def __init__(self, versions=()):
+            super().__init__(autocommit=True, versions=set(versions), has_table=bool(versions), pending=[])
+
+        def respond(self, sql, params):
+            if "FAIL" in sql:
+                raise RuntimeError("syntax error")
+            if "to_regclass" in sql:
+                return [(self.has_table,)]
+            if sql.startswith("SELECT version FROM schema_version"):
+                return [(v,) for v in sorted(self.versions)]
+            if "CREATE TABLE IF NOT EXISTS schema_version" in sql:
+                self.has_table = True
+            elif sql.startswith("INSERT INTO schema_version"):
+                self.pending.append(params[0])
+
+        def commit(self):
+            super().commit()
+            self.versions.update(self.pending)
+            self.pending = []
+
+        def rollback(self):
+            super().rollback()
+            self.pending = []
+    return SchemaConn
+
+MIGRATIONS = [
+    (1, "base", lambda: "CREATE TABLE a();"),
+    (2, "b", "CREATE TABLE b();"),
+    (3, "c", "CREATE TABLE c();"),
+]
+
+def test_migrate_applies_pending_in_order(monkeypatch, schema_conn):
+    """Test que solo se aplican las migraciones pendientes, en orden y bajo advisory lock"""
+    monkeypatch.setattr(schema, "MIGRATIONS", MIGRATIONS)
+    conn = schema_conn(versions=[1])
+    assert schema.migrate(conn) == [2, 3]
+    assert conn.versions == {1, 2, 3}
+    assert not any("TABLE a()" in s for s in conn.sql)
+    assert "pg_advisory_lock" in conn.sql[0] and "pg_advisory_unlock" in conn.sql[-1]
+    assert schema.migrate(conn) == []
+
+def test_migrate_fresh_warehouse_up_to_target(monkeypatch, schema_conn):
+    """Test warehouse sin schema_version y migración parcial con target"""
+    monkeypatch.setattr(schema, "MIGRATIONS", MIGRATIONS)
+    conn = schema_conn()
+    assert schema.applied_versions(conn) == []
+    assert schema.migrate(conn, target=2) == [1, 2]
+    assert [m[0] for m in schema.pending(conn)] == [3]
+
+def test_failed_migration_is_not_recorded(monkeypatch, schema_conn):
+    """Test que una migración fallida se revierte, no se registra y libera el lock"""
+    monkeypatch.setattr(schema, "MIGRATIONS", MIGRATIONS[:1] + [(2, "broken", "FAIL")])
+    conn = schema_conn()
+    with pytest.raises(RuntimeError):
+        schema.migrate(conn)
+    assert conn.versions == {1}
+    assert "pg_advisory_unlock" in conn.sql[-1]
+
+def test_base_migration_is_ddl():
+    """Test que la migración 1 trae el DDL base y las versiones son únicas y ordenadas"""
+    assert "CREATE TABLE IF NOT EXISTS fact_messages" in schema._sql(schema.MIGRATIONS[0])
+    assert [m[0] for m in schema.MIGRATIONS] == sorted({m[0] for m in schema.MIGRATIONS})
+
+def _norm(sql):
+    return " ".join(sql.split())
+
+def _every_migration():
+    return _norm("\n".join(schema._sql(m) for m in schema.MIGRATIONS))
+
+def test_rollup_migrations_match_registry():
+    """Test que cada rollup registrado tiene en alguna migración el mismo SQL que genera rollups"""
+    from app.temporal import rollups
+    every = _every_migration()
+    for name in rollups.ROLLUPS:
+        assert _norm(f"{rollups.create_sql(name)}\n{rollups.rebuild_sql(name)}") in every, name
+
+def test_matview_migrations_match_registry():
+    """Test que cada vista registrada tiene en alguna migración el mismo SQL que genera matviews"""
+    from app.temporal import matviews
+    every = _every_migration()
+    assert f"CREATE TABLE IF NOT EXISTS {matviews.REFRESH_LOG_TABLE}(" in every
+    for name in matviews.VIEWS:
+        assert _norm(matviews.create_sql(name)) in every, name
+
+def test_export_pending_migrations_match_registry():
+    """Test que cada tabla de snapshots.FACTS tiene sus días pendientes sembrados por alguna migración"""
+    from app.temporal import snapshots
+    every = _every_migration()
+    assert f"CREATE TABLE IF NOT EXISTS {snapshots.PENDING_TABLE}(" in every
+    for table in snapshots.FACTS:
+        assert _norm(
+            f"INSERT INTO {snapshots.PENDING_TABLE} (table_name, created_day) "
+            f"SELECT DISTINCT '{table}', created_day FROM {table} ON CONFLICT DO NOTHING;"
+        ) in every, table
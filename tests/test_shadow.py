@@ -0,0 +1,105 @@
+import pytest
+import psycopg2.errors
+from datetime import date, datetime
+from app.temporal import loader, partitions, shadow
+
+
+@pytest.fixture
+def bookings(fake_conn):
+    """FakeConn con un catálogo mínimo: fact_bookings sin particionar con PK, FK e índices."""
+    class BookingsConn(fake_conn):
+        def __init__(self, rows=100, previous=100, duplicates=0):
+            super().__init__(rows=rows, previous=previous, duplicates=duplicates)
+
+        def respond(self, sql, params):
+            if "relkind" in sql or "relispopulated" in sql:
+                return [(False,)]
+            if "FROM pg_constraint" in sql and "contype IN" in sql:
+                return [
+                    ("fact_bookings_pkey", "p", "PRIMARY KEY (booking_id, created_day)"),
+                    ("fact_bookings_chat_id_fkey", "f", "FOREIGN KEY (chat_id) REFERENCES dim_chats(chat_id) ON DELETE CASCADE"),
+                ]
+            if "FROM pg_constraint WHERE conrelid" in sql:
+                return [("fact_bookings_pkey__shadow",), ("fact_bookings_chat_id_fkey__shadow",)]
+            if "FROM pg_index" in sql:
+                name = "idx_fact_bookings_chat" + ("__shadow" if params[0].endswith("__shadow") else "")
+                definition = f"CREATE INDEX {name} ON public.{params[0]} USING btree (chat_id)"
+                return [(name, definition) if "pg_get_indexdef" in sql else (name,)]
+            if sql.startswith("ALTER TABLE fact_bookings__shadow ADD CONSTRAINT fact_bookings_pkey") and self.duplicates:
+                self.duplicates = 0
+                raise psycopg2.errors.UniqueViolation("could not create unique index")
+            if sql.strip().startswith("DELETE FROM fact_bookings__shadow"):
+                return 2
+            if sql.startswith("SELECT count(*) FROM fact_bookings__shadow"):
+                return [(self.rows,)]
+            if sql.startswith("SELECT count(*) FROM fact_bookings"):
+                return [(self.previous,)]
+    return BookingsConn
+
+def test_prepare_creates_unindexed_copy(bookings):
+    """Test tabla sombra vacía con las columnas de la viva y sin índices, con la viva retenida"""
+    conn = bookings()
+    assert shadow.prepare(conn, ["bookings"]) == {"bookings": "fact_bookings__shadow"}
+    assert conn.calls[0] == ("SELECT pg_advisory_xact_lock(%s);", (loader.WRITE_LOCK_ID,))
+    assert conn.sql[1].startswith("INSERT INTO etl_shadow_holds") and conn.params[1] == (["fact_bookings"],)
+    assert "DROP TABLE IF EXISTS fact_bookings__shadow;" in conn.sql
+    assert "CREATE TABLE fact_bookings__shadow (LIKE fact_bookings INCLUDING DEFAULTS);" in conn.sql
+
+def test_finalize_dedupes_and_builds_keys_once(bookings):
+    """Test PK con filas duplicadas por reintentos: se deduplica y se reintenta; índices con sufijo"""
+    conn = bookings(rows=98, duplicates=2)
+    stats = shadow.finalize(conn, "bookings", expected=100)
+    assert stats == {"rows": 98, "previous": 100, "duplicates_removed": 2}
+    pk = "ALTER TABLE fact_bookings__shadow ADD CONSTRAINT fact_bookings_pkey__shadow PRIMARY KEY (booking_id, created_day);"
+    assert conn.sql.count(pk) == 2
+    assert "ROLLBACK TO SAVEPOINT shadow_key;" in conn.sql
+    assert "CREATE INDEX idx_fact_bookings_chat__shadow ON fact_bookings__shadow USING btree (chat_id);" in conn.sql
+    assert conn.commits == 1
+
+@pytest.mark.parametrize("rows,previous,expected", [(0, 100, None), (50, 100, None), (120, 100, 110)])
+def test_finalize_rejects_suspicious_counts(bookings, rows, previous, expected):
+    """Test validación: tabla vacía, demasiado chica o con más filas que las cargadas"""
+    conn = bookings(rows=rows, previous=previous)
+    with pytest.raises(shadow.ShadowValidationError):
+        shadow.finalize(conn, "bookings", expected=expected, max_shrink=0.1)
+    assert conn.rollbacks == 1 and conn.commits == 0
+
+def test_finalize_checks_source_counts(bookings):
+    """Test que las filas de la fuente que no están en la sombra ni descartadas abortan el swap"""
+    ok = shadow.finalize(bookings(rows=95), "bookings", source={"rows": 100, "discarded": 5})
+    assert ok["rows"] == 95
+    conn = bookings(rows=95)
+    with pytest.raises(shadow.ShadowValidationError, match="5 de 100 filas de la fuente"):
+        shadow.finalize(conn, "bookings", source={"rows": 100, "discarded": 0})
+    assert conn.rollbacks == 1
+
+def test_swap_renames_in_one_transaction(bookings):
+    """Test swap: lock, drop de la viva y renames en un solo commit; las vistas se llenan después"""
+    conn = bookings()
+    shadow.swap(conn, ["bookings"])
+    ddl = [s for s in conn.sql if s.startswith(("LOCK", "DROP", "ALTER"))]
+    assert ddl == [
+        "LOCK TABLE fact_bookings IN ACCESS EXCLUSIVE MODE;",
+        "DROP MATERIALIZED VIEW IF EXISTS mv_booking_funnel;",
+        "DROP TABLE fact_bookings;",
+        "ALTER TABLE fact_bookings__shadow RENAME TO fact_bookings;",
+        "ALTER TABLE fact_bookings RENAME CONSTRAINT fact_bookings_pkey__shadow TO fact_bookings_pkey;",
+        "ALTER TABLE fact_bookings RENAME CONSTRAINT fact_bookings_chat_id_fkey__shadow TO fact_bookings_chat_id_fkey;",
+        "ALTER INDEX idx_fact_bookings_chat__shadow RENAME TO idx_fact_bookings_chat;",
+    ]
+    create = next(i for i, s in enumerate(conn.sql) if s.startswith("CREATE MATERIALIZED VIEW IF NOT EXISTS mv_booking_funnel"))
+    assert "WITH NO DATA;" in conn.sql[create]
+    assert conn.sql.index("REFRESH MATERIALIZED VIEW mv_booking_funnel;") > create
+    release = conn.sql.index("DELETE FROM etl_shadow_holds WHERE table_name = ANY(%s);")
+    assert create < release < conn.sql.index("REFRESH MATERIALIZED VIEW mv_booking_funnel;")
+    assert conn.commits == 2
+
+def test_loader_shadow_appends_with_copy(monkeypatch, fake_cursor):
+    """Test carga en modo shadow: COPY directo a la sombra, sin merge"""
+    monkeypatch.setattr(partitions, "ensure_for_rows", lambda *args, **kwargs: [])
+    cur = fake_cursor()
+    row = (1, 2, 3, None, "room", None, "PENDING", datetime(2024, 5, 1, 10), date(2024, 5, 1), 10)
+    assert loader.upsert(cur, "bookings", [row], shadow=True) == {"inserted": 1}
+    assert any(sql.startswith("COPY fact_bookings__shadow (booking_id, chat_id") for sql in cur.sql)
+    assert not any("WITH merged AS" in sql for sql in cur.sql)
+    assert cur.copied.count("\n") == 1
@@ -0,0 +1,122 @@
+import os
+from datetime import date, datetime, timezone
+import pytest
+from app.temporal import snapshots
+
+
+@pytest.fixture
+def warehouse(fake_conn):
+    """FakeConn con días pendientes, días con datos, columnas de la tabla y filas por día."""
+    class WarehouseConn(fake_conn):
+        def __init__(self, pending=(), days=(), columns=(), rows=None):
+            super().__init__(pending=list(pending), days=list(days), columns=list(columns), rows=rows or {})
+
+        def respond(self, sql, params):
+            if f"FROM {snapshots.PENDING_TABLE}" in sql and sql.lstrip().startswith("SELECT"):
+                return [(d,) for d in self.pending]
+            if "SELECT DISTINCT" in sql:
+                return [(d,) for d in self.days]
+            if "FROM pg_attribute" in sql:
+                return self.columns
+            if "WHERE created_day = %s" in sql:
+                return self.rows.get(params[0], [])
+    return WarehouseConn
+
+def test_mark_registers_touched_days(warehouse):
+    """Test días distintos y ordenados de las filas; las dimensiones no se marcan"""
+    conn = warehouse()
+    cur = conn.cursor()
+    columns = ("booking_id", "created_day")
+    rows = [(1, date(2024, 5, 2)), (2, date(2024, 5, 1)), (3, date(2024, 5, 2))]
+    assert snapshots.mark(cur, "fact_bookings", columns, rows) == 2
+    sql, params = conn.calls[0]
+    assert "INSERT INTO etl_export_pending" in sql and "ON CONFLICT DO NOTHING" in sql
+    assert params == ("fact_bookings", [date(2024, 5, 1), date(2024, 5, 2)])
+    assert snapshots.mark(cur, "dim_users", ("user_id",), [(1,)]) == 0
+
+def test_export_fact_rewrites_pending_days(monkeypatch, tmp_path, warehouse):
+    """Test un día por transacción: se saca de pendientes, se escribe y un día vacío pierde su directorio"""
+    monkeypatch.setattr(snapshots, "_schema", lambda cur, table, exclude=(): (["booking_id", "status"], None))
+    written = []
+
+    def fake_write(conn, path, schema, query, params=None):
+        written.append((path, query, params))
+        return 0 if params == (date(2024, 5, 1),) else 3
+
+    monkeypatch.setattr(snapshots, "_write", fake_write)
+    stale = tmp_path / "fact_bookings" / "created_day=2024-05-01"
+    stale.mkdir(parents=True)
+    conn = warehouse(pending=[date(2024, 5, 2), date(2024, 5, 1)])
+    assert snapshots.export_fact(conn, "fact_bookings", str(tmp_path)) == {"days": 2, "rows": 3}
+    assert [p for _, _, p in written] == [(date(2024, 5, 1),), (date(2024, 5, 2),)]
+    assert written[1][0] == os.path.join(str(tmp_path), "fact_bookings", "created_day=2024-05-02", "part-0.parquet")
+    assert written[1][1] == "SELECT booking_id, status FROM fact_bookings WHERE created_day = %s;"
+    deletes = [params for sql, params in conn.calls if sql.lstrip().startswith("DELETE")]
+    assert deletes == [("fact_bookings", date(2024, 5, 1)), ("fact_bookings", date(2024, 5, 2))]
+    assert not stale.exists()
+    assert conn.commits == 3
+
+def test_export_fact_full_includes_exported_days(monkeypatch, tmp_path, warehouse):
+    """Test export completo: días del warehouse más los ya exportados (que pueden haber quedado vacíos)"""
+    monkeypatch.setattr(snapshots, "_schema", lambda cur, table, exclude=(): (["event_id"], None))
+    monkeypatch.setattr(snapshots, "_write", lambda conn, path, schema, query, params=None: 1)
+    (tmp_path / "fact_booking_events" / "created_day=2024-04-30").mkdir(parents=True)
+    conn = warehouse(days=[date(2024, 5, 1)])
+    stats = snapshots.export_fact(conn, "fact_booking_events", str(tmp_path), full=True)
+    assert stats == {"days": 2, "rows": 2}
+
+def test_export_fact_parquet_round_trip(monkeypatch, tmp_path, warehouse):
+    """Test export real con pyarrow: el dataset Hive se lee de vuelta con tipos, días y sin temporales"""
+    pa = pytest.importorskip("pyarrow")
+    import pyarrow.dataset as ds
+    monkeypatch.setattr(snapshots, "BATCH_ROWS", 2)
+    columns = [
+        ("booking_id", "integer"), ("status", "text"), ("created_day", "date"),
+        ("created_at", "timestamp with time zone"), ("created_hour", "smallint"),
+    ]
+    may1, may2 = date(2024, 5, 1), date(2024, 5, 2)
+    at = datetime(2024, 5, 1, 10, tzinfo=timezone.utc)
+    rows = {
+        may1: [(1, "PENDING", at, 10), (2, "CONFIRMED", at, 10), (3, None, at, 10)],
+        may2: [(4, "CANCELLED", at.replace(day=2), 10)],
+    }
+    conn = warehouse(pending=[may1, may2], columns=columns, rows=rows)
+    assert snapshots.export_fact(conn, "fact_bookings", str(tmp_path)) == {"days": 2, "rows": 4}
+
+    base = tmp_path / "fact_bookings"
+    assert sorted(os.listdir(base / "created_day=2024-05-01")) == ["part-0.parquet"]
+    table = ds.dataset(str(base), format="parquet", partitioning="hive").to_table()
+    assert table.schema.field("booking_id").type == pa.int32()
+    assert table.schema.field("created_hour").type == pa.int16()
+    assert table.schema.field("created_at").type == pa.timestamp("us", tz="UTC")
+    got = sorted(zip(*(table.column(c).to_pylist() for c in ("booking_id", "status", "created_at", "created_day"))))
+    assert [(b, s, str(d)) for b, s, _, d in got] == [
+        (1, "PENDING", "2024-05-01"), (2, "CONFIRMED", "2024-05-01"), (3, None, "2024-05-01"), (4, "CANCELLED", "2024-05-02"),
+    ]
+    assert got[0][2] == at
+
+def test_write_temp_file_is_hidden_from_readers(monkeypatch, tmp_path, warehouse):
+    """Test que el temporal de un export cortado empieza con "_" y no rompe la lectura del dataset"""
+    pytest.importorskip("pyarrow")
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.dataset as ds
+    seen = []
+
+    class Boom(pq.ParquetWriter):
+        def __init__(self, where, *args, **kwargs):
+            seen.append(where)
+            super().__init__(where, *args, **kwargs)
+
+        def write_table(self, table, *args, **kwargs):
+            raise RuntimeError("conexión perdida")
+
+    monkeypatch.setattr(pq, "ParquetWriter", Boom)
+    schema = pa.schema([("booking_id", pa.int32())])
+    day = tmp_path / "fact_bookings" / "created_day=2024-05-01"
+    conn = warehouse(rows={date(2024, 5, 1): [(1,)]})
+    with pytest.raises(RuntimeError):
+        snapshots._write(conn, str(day / "part-0.parquet"), schema, "SELECT booking_id FROM fact_bookings WHERE created_day = %s;", (date(2024, 5, 1),))
+    assert os.path.basename(seen[0]) == "_part-0.parquet.tmp"
+    assert os.listdir(day) == ["_part-0.parquet.tmp"]
+    assert ds.dataset(str(tmp_path / "fact_bookings"), format="parquet", partitioning="hive").to_table().num_rows == 0
@@ -0,0 +1,24 @@
+import os
+import importlib.util
+from datetime import date
+
+_spec = importlib.util.spec_from_file_location(
+    "dw_jdbc", os.path.join(os.path.dirname(os.path.dirname(__file__)), "spark", "apps", "dw_jdbc.py"),
+)
+dw_jdbc = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(dw_jdbc)
+
+def test_partition_options_by_id_and_day():
+    """Test rangos de lectura: upperBound corrido para incluir el máximo y no más tasks que valores"""
+    assert dw_jdbc.partition_options("message_id", 1, 1000, 8) == {
+        "partitionColumn": "message_id", "lowerBound": "1", "upperBound": "1001", "numPartitions": "8",
+    }
+    days = dw_jdbc.partition_options("created_day", date(2024, 5, 1), date(2024, 5, 3), 8)
+    assert days["lowerBound"] == "2024-05-01" and days["upperBound"] == "2024-05-04"
+    assert days["numPartitions"] == "3"
+    assert dw_jdbc.partition_options("message_id", None, None) == {"numPartitions": "1"}
+
+def test_subquery_pushes_columns_and_filter():
+    """Test la tabla derivada trae solo las columnas pedidas y el filtro del job"""
+    sql = dw_jdbc.subquery("fact_messages", ["sender_id", "created_day"], "created_day >= DATE '2024-05-01'")
+    assert sql == "(SELECT sender_id, created_day FROM fact_messages WHERE created_day >= DATE '2024-05-01') AS fact_messages_q"
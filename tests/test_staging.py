@@ -0,0 +1,131 @@
+import os
+import time
+import pytest
+from app.temporal import staging
+
+
+@pytest.fixture(autouse=True)
+def staging_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(staging, "STAGING_DIR", str(tmp_path))
+    return tmp_path
+
+def test_put_and_get_rows_roundtrip():
+    """Test que un lote en staging se reconstruye igual y la referencia es pequeña"""
+    rows = [{"id": i, "handle": f"user{i}", "display_name": f"User {i}"} for i in range(1, 501)]
+    ref = staging.put_rows("users", rows)
+
+    assert staging.is_ref(ref)
+    assert ref["rows"] == 500
+    assert set(ref) == {"staging_ref", "entity", "rows"}
+    assert staging.get_rows(ref) == rows
+
+def test_get_column_and_inline_payloads():
+    """Test leer una columna y aceptar payloads inline (compatibilidad)"""
+    rows = [{"id": 1, "type": "dm"}, {"id": 2, "type": "group", "title": "G"}]
+    ref = staging.put_rows("chats", rows)
+
+    assert staging.get_column(ref, "id") == [1, 2]
+    assert staging.get_column(ref, "title") == [None, "G"]
+    assert staging.get_rows(rows) is rows
+    assert staging.count(ref) == staging.count(rows) == 2
+
+def test_restage_keeps_shape_and_drop(staging_dir):
+    """Test que restage conserva la forma de la entrada y drop limpia los archivos"""
+    ref = staging.put_rows("users", [{"id": 1}])
+    new_ref = staging.restage(ref, [{"id": 1, "handle": "a"}])
+    assert staging.is_ref(new_ref) and new_ref["entity"] == "users"
+    assert staging.restage([{"id": 1}], []) == []
+
+    assert staging.drop([ref, new_ref, [{"id": 1}]]) == 2
+    assert list(staging_dir.iterdir()) == []
+
+def test_sweep_removes_only_old_batches(staging_dir):
+    """Test TTL: solo se borran los lotes huérfanos más viejos que el límite"""
+    old = staging.put_rows("users", [{"id": 1}])
+    new = staging.put_rows("users", [{"id": 2}])
+    old_path = staging._path(old["staging_ref"])
+    os.utime(old_path, (time.time() - 7200, time.time() - 7200))
+    assert staging.sweep(max_age_hours=1) == 1
+    assert not os.path.exists(old_path)
+    assert staging.get_rows(new) == [{"id": 2}]
+
+@pytest.mark.asyncio
+async def test_stage_pages_then_load_staged(monkeypatch):
+    """Test que stage_* deja lotes de páginas completas en staging y load_staged los carga en orden"""
+    from temporalio.testing import ActivityEnvironment
+    from app.temporal import activities as A
+
+    monkeypatch.setattr(A, "STAGE_ROWS", 25)
+    monkeypatch.setattr(A.columnar, "enabled", lambda: False)
+
+    async def pages():
+        for page in range(1, 5):
+            yield page, [
+                {"id": page * 100 + i, "status": "PENDING", "created_at": "2024-05-01T10:00:00+00:00"}
+                for i in range(10)
+            ]
+
+    beats = []
+    env = ActivityEnvironment()
+    env.on_heartbeat = lambda *details: beats.append(details[0])
+    cp = {"page": 0, "refs": [], "rows": 0, "total_pages": 4}
+    staged = await env.run(A._stage_pages, "bookings", pages(), cp)
+
+    assert staged["rows"] == 40 and staged["page"] == 4
+    assert [r["rows"] for r in staged["refs"]] == [30, 10]
+    assert [b["page"] for b in beats] == [3, 4]
+
+    loaded = []
+
+    def fake_load(entity, batch, cls, row_args, page_size, shadow=False):
+        loaded.append([r.id for r in batch])
+        return {"loaded": len(batch), "quarantined": 0, "changed": len(batch)}
+
+    monkeypatch.setattr(A, "_load_facts", fake_load)
+    beats.clear()
+    result = await env.run(A.load_staged, "bookings", staged["refs"])
+
+    assert result == {"loaded": 40, "quarantined": 0, "rejected": 0, "changed": 40}
+    assert loaded[0][0] == 100 and loaded[1][-1] == 409
+    assert [b["done"] for b in beats] == [1, 2]
+
+@pytest.mark.asyncio
+async def test_strict_api_source_raises_instead_of_truncating(monkeypatch):
+    """Test que con strict un error del API falla la actividad en vez de terminar la entidad sin aviso"""
+    import httpx
+    from temporalio.testing import ActivityEnvironment
+    from app.temporal import activities as A
+
+    async def failing_pages(client, url, page_size, first_page=1):
+        yield 1, {"items": [{"id": 1}], "total_pages": 3}
+        raise httpx.ConnectError("API caída")
+
+    monkeypatch.setattr(A, "_api_pages", failing_pages)
+
+    async def drain(strict):
+        cp = {"page": 0}
+        return [p async for p, _ in A._api_page_items(None, "http://api/x", 10, cp, "x", strict)]
+
+    env = ActivityEnvironment()
+    assert await env.run(drain, False) == [1]
+    with pytest.raises(httpx.ConnectError):
+        await env.run(drain, True)
+
+@pytest.mark.asyncio
+async def test_staging_io_runs_off_the_event_loop(monkeypatch):
+    """Test que las actividades async leen, reescriben y borran staging en un hilo, no en el event loop"""
+    import threading
+    from temporalio.testing import ActivityEnvironment
+    from app.temporal import activities as A
+
+    threads = []
+    for name in ("get_rows", "restage", "get_column", "drop"):
+        real = getattr(staging, name)
+        monkeypatch.setattr(staging, name, lambda *a, _real=real: (threads.append(threading.current_thread()), _real(*a))[1])
+
+    env = ActivityEnvironment()
+    ref = staging.put_rows("users", [{"id": 1, "handle": " ana ", "display_name": "Ana", "created_at": "2024-05-01T10:00:00"}])
+    out = await env.run(A.transform_users, ref)
+    assert await env.run(A.read_staged_column, out, "handle") == ["ana"]
+    assert await env.run(A.drop_staged, [out]) == 1
+    assert len(threads) == 4 and threading.main_thread() not in threads
@@ -0,0 +1,97 @@
+import threading
+import pytest
+import psycopg2
+import psycopg2.extensions
+from app.temporal import warehouse
+
+
+class FakePool:
+    connection_class = None  # la pone el fixture `pool`
+
+    def __init__(self, minconn, maxconn, dsn, **kwargs):
+        self._pool = []
+        self.created = []
+        self.discarded = []
+
+    def getconn(self):
+        if self._pool:
+            return self._pool.pop()
+        conn = self.connection_class()
+        self.created.append(conn)
+        return conn
+
+    def putconn(self, conn, close=False):
+        if close:
+            self.discarded.append(conn)
+        else:
+            self._pool.append(conn)
+
+    def closeall(self):
+        self._pool.clear()
+
+@pytest.fixture
+def pool(monkeypatch, fake_conn):
+    idle = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    class PoolConn(fake_conn):
+        """Conexión con estado de transacción; el health check falla si el servidor se cayó."""
+
+        def __init__(self):
+            super().__init__(status=idle, alive=True)
+
+        def get_transaction_status(self):
+            return self.status
+
+        def rollback(self):
+            super().rollback()
+            self.status = idle
+
+        def respond(self, sql, params):
+            if not self.alive:
+                raise psycopg2.OperationalError("server closed the connection")
+
+    monkeypatch.setattr(FakePool, "connection_class", PoolConn)
+    monkeypatch.setattr(warehouse, "ThreadedConnectionPool", FakePool)
+    return warehouse.WarehousePool("dsn", 1, 2)
+
+def test_connections_are_reused(pool):
+    """Test que una conexión devuelta se reutiliza en lugar de abrir otra"""
+    c1 = pool.getconn()
+    pool.putconn(c1)
+    c2 = pool.getconn()
+    assert c1 is c2
+    assert len(pool._pool.created) == 1
+
+def test_waits_then_times_out_when_exhausted(pool):
+    """Test que el pool agotado espera y falla con PoolTimeout (no PoolError inmediato)"""
+    c1, c2 = pool.getconn(), pool.getconn()
+    with pytest.raises(warehouse.PoolTimeout):
+        pool.getconn(timeout=0.05)
+    timer = threading.Timer(0.05, pool.putconn, args=[c1])
+    timer.start()
+    assert pool.getconn(timeout=2) is c1
+    timer.join()
+
+def test_open_transaction_is_rolled_back_on_release(pool):
+    """Test que una conexión vuelve al pool sin transacción abierta ni autocommit"""
+    conn = pool.getconn()
+    conn.status = psycopg2.extensions.TRANSACTION_STATUS_INERROR
+    conn.autocommit = True
+    pool.putconn(conn)
+    assert conn.rollbacks == 1 and conn.autocommit is False
+    assert pool._pool._pool == [conn]
+
+def test_broken_connections_are_discarded(pool, monkeypatch):
+    """Test descarte de conexiones cerradas y reemplazo de ociosas que no pasan el health check"""
+    conn = pool.getconn()
+    conn.closed = 2
+    pool.putconn(conn)
+    assert pool._pool.discarded == [conn]
+
+    monkeypatch.setattr(warehouse, "DW_POOL_CHECK_IDLE", 0)
+    stale = pool.getconn()
+    pool.putconn(stale)
+    stale.alive = False
+    fresh = pool.getconn()
+    assert fresh is not stale
+    assert stale in pool._pool.discarded
@@ -0,0 +1,111 @@
+import os
+import uuid
+from datetime import date, datetime, timezone
+import pytest
+import psycopg2
+from app.temporal import loader, partitions, schema, shadow
+
+# Contra un Postgres real (p. ej. el `dw` de docker-compose): cada test aplica las migraciones
+# en un schema propio y lo borra al terminar. Sin WAREHOUSE_URL se omiten.
+WAREHOUSE_URL = os.getenv("WAREHOUSE_URL", "")
+pytestmark = pytest.mark.skipif(not WAREHOUSE_URL, reason="sin WAREHOUSE_URL no hay Postgres contra el que probar")
+
+AT = datetime(2031, 1, 15, 10, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def dw(monkeypatch):
+    name = f"etl_test_{uuid.uuid4().hex[:8]}"
+    admin = psycopg2.connect(WAREHOUSE_URL)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {name};")
+    conn = psycopg2.connect(WAREHOUSE_URL, options=f"-c search_path={name} -c timezone=UTC")
+    monkeypatch.setattr(partitions, "_known", set())
+    monkeypatch.setattr(partitions, "_is_partitioned", {})
+    monkeypatch.setattr(loader, "COPY_ENTITIES", "all")
+    try:
+        schema.migrate(conn)
+        yield conn
+    finally:
+        conn.close()
+        with admin.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {name} CASCADE;")
+        admin.close()
+
+
+def message(message_id, body, at=AT):
+    return (message_id, 10, 5, body, len(body), at, at.date(), at.hour, None, None)
+
+
+def booking(booking_id, status):
+    return (booking_id, 10, 5, None, "room", None, status, AT, AT.date(), AT.hour)
+
+
+@pytest.mark.parametrize("copy_entities", ["all", "none"])
+def test_upsert_creates_partition_and_moves_keys(dw, monkeypatch, copy_entities):
+    """Test COPY + merge (e INSERT ... VALUES) reales: partición del mes nuevo, filas iguales sin reescribir y clave que cambia de día"""
+    monkeypatch.setattr(loader, "COPY_ENTITIES", copy_entities)
+    with dw.cursor() as cur:
+        assert loader.upsert(cur, "messages", [message(1, "hola"), message(2, "chau")]) == {
+            "inserted": 2, "updated": 0, "unchanged": 0,
+        }
+    dw.commit()
+    with dw.cursor() as cur:
+        cur.execute("SELECT to_regclass('fact_messages_p203101') IS NOT NULL, count(*) FROM dim_chats WHERE is_inferred;")
+        assert cur.fetchone() == (True, 1)
+        stats = loader.upsert(cur, "messages", [message(1, "hola"), message(2, "chau!")])
+        assert stats == {"inserted": 0, "updated": 1, "unchanged": 1}
+        stats = loader.upsert(cur, "messages", [message(1, "hola", AT.replace(month=2))])
+        assert stats == {"inserted": 1, "updated": 0, "unchanged": 0, "moved": 1}
+        cur.execute("SELECT message_id, body, created_day FROM fact_messages ORDER BY message_id;")
+        assert cur.fetchall() == [(1, "hola", date(2031, 2, 15)), (2, "chau!", date(2031, 1, 15))]
+        cur.execute("SELECT created_day, messages FROM rollup_messages_chat_day ORDER BY created_day;")
+        assert cur.fetchall() == [(date(2031, 1, 15), 1), (date(2031, 2, 15), 1)]
+    dw.commit()
+
+
+def test_shadow_refresh_swaps_in_new_table(dw):
+    """Test full refresh real: sombra con una fila repetida por reintento, validación y swap con nombres definitivos"""
+    with dw.cursor() as cur:
+        loader.upsert(cur, "bookings", [booking(1, "PENDING"), booking(2, "PENDING")])
+    dw.commit()
+
+    shadow.prepare(dw, ["bookings"])
+    with dw.cursor() as cur:
+        loader.upsert(cur, "bookings", [booking(1, "CONFIRMED"), booking(2, "CANCELLED"), booking(3, "PENDING")], shadow=True)
+        loader.upsert(cur, "bookings", [booking(3, "PENDING")], shadow=True)
+    dw.commit()
+    stats = shadow.finalize(dw, "bookings", expected=4, source={"rows": 4, "discarded": 0})
+    assert stats == {"rows": 3, "previous": 2, "duplicates_removed": 1}
+    shadow.swap(dw, ["bookings"])
+
+    with dw.cursor() as cur:
+        cur.execute("SELECT booking_id, status FROM fact_bookings ORDER BY booking_id;")
+        assert cur.fetchall() == [(1, "CONFIRMED"), (2, "CANCELLED"), (3, "PENDING")]
+        cur.execute("SELECT conname FROM pg_constraint WHERE conrelid = 'fact_bookings'::regclass AND contype = 'p';")
+        assert cur.fetchall() == [("fact_bookings_pkey",)]
+        cur.execute("SELECT to_regclass('fact_bookings__shadow'), to_regclass('fact_bookings_p203101') IS NOT NULL;")
+        assert cur.fetchone() == (None, True)
+        cur.execute("SELECT sum(bookings) FROM mv_booking_funnel;")
+        assert cur.fetchone() == (3,)
+    dw.rollback()
+
+
+def test_shadow_refresh_holds_live_writes(dw):
+    """Test que mientras hay sombras preparadas las escrituras a la viva fallan sin escribir y el swap las libera"""
+    shadow.prepare(dw, ["bookings"])
+    with dw.cursor() as cur:
+        with pytest.raises(loader.LiveTableHeld):
+            loader.upsert(cur, "bookings", [booking(1, "PENDING")])
+    dw.rollback()
+    assert shadow.held(dw) == ["fact_bookings"]
+    with dw.cursor() as cur:
+        loader.upsert(cur, "bookings", [booking(1, "CONFIRMED")], shadow=True)
+    dw.commit()
+    shadow.finalize(dw, "bookings", expected=1)
+    shadow.swap(dw, ["bookings"])
+    assert shadow.held(dw) == []
+    with dw.cursor() as cur:
+        assert loader.upsert(cur, "bookings", [booking(2, "PENDING")])["inserted"] == 1
+    dw.commit()